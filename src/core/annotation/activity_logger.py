@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+activity_logger.py
+Registrazione delle attività utente in blocchi, fuori dal percorso delle richieste.
+
+ActivityLogger raccoglie in memoria le righe di user_activity e un thread in background
+le scrive con un solo executemany per transazione, quando il buffer raggiunge batch_size
+righe o ogni flush_interval secondi; close() (registrato con atexit dall'app) scrive
+quanto resta. Finché un ActivityLogger è avviato, AnnotationDBManager.log_user_activity
+accoda l'evento invece di scriverlo con una connessione e un commit propri: le statistiche
+sulle attività possono quindi essere indietro al massimo di flush_interval secondi.
+
+Senza spool, un arresto brusco del processo (kill -9, crash) perde gli eventi non ancora
+scritti. Con spool_path ogni evento viene anche aggiunto a un file JSON Lines e passato al
+sistema operativo prima di tornare al chiamante; a ogni scrittura il file viene ruotato
+(.pending) e rimosso dopo il commit. Ogni processo usa file propri (spool_path.<pid>),
+così più processi sullo stesso database (ad esempio il reloader di Flask in debug) non
+si ruotano o cancellano i file a vicenda. All'avvio vengono reinserite le righe rimaste
+nei file di processi terminati: gli ID delle attività sono unici, quindi reinserire righe
+già scritte non crea duplicati.
+
+Lo spool è un aiuto alla durabilità, non un requisito: se il file non è scrivibile o
+viene rimosso, gli eventi restano in memoria e vengono scritti comunque.
+"""
+
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+# Setup del logger
+logger = logging.getLogger("activity_logger")
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+logger.addHandler(handler)
+
+BATCH_SIZE = 200
+FLUSH_INTERVAL = 1.0
+
+
+def _owned_by_live_process(pid: int) -> bool:
+    """
+    True se i file di spool del processo pid appartengono a un altro processo ancora attivo.
+    """
+    if pid == os.getpid():
+        # Stesso pid di un'esecuzione precedente (ad esempio in un container): file orfani
+        return False
+    if os.name == 'nt':
+        # Su Windows os.kill(pid, 0) termina il processo: i file degli altri pid restano
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ActivityLogger:
+    """
+    Buffer delle attività utente scritto in blocchi da un thread in background.
+    """
+
+    def __init__(self, manager, batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL,
+                 spool_path: Optional[str] = None):
+        """
+        Args:
+            manager: AnnotationDBManager su cui scrivere le attività
+            batch_size: Righe in attesa che avviano subito una scrittura
+            flush_interval: Secondi massimi di attesa prima di una scrittura
+            spool_path: Prefisso dei file JSON Lines in cui annotare gli eventi non ancora
+                scritti (None per tenerli solo in memoria)
+        """
+        self.manager = manager
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_path = str(spool_path) if spool_path else None
+        # File di questo processo (il pid è fissato alla creazione del logger)
+        self.spool_file = f"{self.spool_path}.{os.getpid()}" if self.spool_path else None
+
+        self._rows: Deque[tuple] = deque()
+        self._pending_files: List[str] = []
+        self._spool = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # Una sola scrittura alla volta (thread in background, flush() e close())
+        self._flush_lock = threading.Lock()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.logged = 0
+        self.written = 0
+        self.flushes = 0
+        self.failures = 0
+
+    # ---- Ciclo di vita ----
+
+    def start(self) -> 'ActivityLogger':
+        """
+        Reinserisce gli eventi rimasti nello spool, avvia il thread e collega il logger al manager.
+
+        Returns:
+            Il logger stesso
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        if self.spool_path:
+            self._recover_spool()
+            with self._lock:
+                self._spool = self._open_spool()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="activity-logger", daemon=True)
+        self._thread.start()
+        self.manager.activity_logger = self
+        logger.info(f"Log delle attività in blocchi avviato (batch: {self.batch_size}, intervallo: {self.flush_interval}s)")
+        return self
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Scrive gli eventi in attesa, ferma il thread e scollega il logger dal manager.
+
+        Gli eventi registrati dopo close() tornano a essere scritti direttamente dal manager.
+        """
+        if getattr(self.manager, 'activity_logger', None) is self:
+            self.manager.activity_logger = None
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+        with self._lock:
+            self._close_spool()
+            if self.spool_file and not self._rows:
+                try:
+                    os.remove(self.spool_file)
+                except FileNotFoundError:
+                    pass
+
+    # ---- Registrazione ----
+
+    def log(self, user_id: str, action_type: str, document_id: str = None,
+            annotation_id: str = None, details: str = None) -> None:
+        """
+        Accoda un'attività; il timestamp è quello della chiamata, non della scrittura.
+
+        Non solleva eccezioni per errori dello spool: l'evento resta comunque in memoria.
+        """
+        row = self.manager._activity_row(user_id, action_type, document_id, annotation_id, details)
+        with self._lock:
+            if self._spool is not None:
+                try:
+                    self._spool.write(json.dumps(row, ensure_ascii=False) + "\n")
+                    # Nel sistema operativo: sopravvive alla terminazione del processo
+                    self._spool.flush()
+                except (OSError, ValueError) as e:
+                    # Fino alla prossima rotazione gli eventi restano solo in memoria
+                    logger.warning(f"Spool {self.spool_file} non scrivibile, eventi solo in memoria: {e}")
+                    self._close_spool()
+            self._rows.append(row)
+            self.logged += 1
+            if len(self._rows) >= self.batch_size:
+                self._wakeup.notify()
+
+    def pending(self) -> int:
+        """Numero di eventi non ancora scritti."""
+        with self._lock:
+            return len(self._rows)
+
+    def flush(self) -> int:
+        """
+        Scrive subito tutti gli eventi in attesa in un'unica transazione.
+
+        Le righe lasciano il buffer solo dopo il commit: se la scrittura fallisce restano in
+        attesa, nello stesso ordine, per il prossimo tentativo.
+
+        Returns:
+            Numero di righe scritte (0 se non c'era nulla o la scrittura è fallita)
+        """
+        with self._flush_lock:
+            try:
+                with self._lock:
+                    if not self._rows:
+                        return 0
+                    rows = list(self._rows)
+                    # Gli eventi del blocco restano nel file ruotato fino al commit
+                    self._rotate_spool()
+                self.manager.insert_activity_rows(rows)
+            except Exception as e:
+                with self._lock:
+                    self.failures += 1
+                    pending = len(self._rows)
+                logger.error(f"Errore nella scrittura di {pending} attività: {e}")
+                return 0
+
+            with self._lock:
+                # Solo flush() toglie righe dal buffer: le prime len(rows) sono quelle scritte
+                for _ in range(len(rows)):
+                    self._rows.popleft()
+                done, self._pending_files = self._pending_files, []
+                self.written += len(rows)
+                self.flushes += 1
+            for path in done:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "logged": self.logged,
+                "written": self.written,
+                "pending": len(self._rows),
+                "flushes": self.flushes,
+                "failures": self.failures,
+            }
+
+    # ---- Interni ----
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._stopping and len(self._rows) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._wakeup.wait(remaining)
+                if self._stopping:
+                    return
+                failures = self.failures
+            try:
+                self.flush()
+                failed = self.failures > failures
+            except Exception:
+                # Nessun errore deve fermare il thread: gli eventi resterebbero in memoria
+                logger.exception("Errore imprevisto nel thread del log delle attività")
+                failed = True
+            if failed:
+                # Database non disponibile: si riprova al prossimo intervallo
+                time.sleep(self.flush_interval)
+
+    def _open_spool(self):
+        try:
+            return open(self.spool_file, 'a', encoding='utf-8')
+        except OSError as e:
+            logger.warning(f"Impossibile aprire lo spool {self.spool_file}, eventi solo in memoria: {e}")
+            return None
+
+    def _close_spool(self) -> None:
+        if self._spool is not None:
+            try:
+                self._spool.close()
+            except OSError:
+                pass
+            self._spool = None
+
+    def _rotate_spool(self) -> None:
+        """Sposta lo spool corrente in un file .pending e ne apre uno nuovo (con self._lock)."""
+        if not self.spool_file:
+            return
+        self._close_spool()
+        pending_file = f"{self.spool_file}.{uuid.uuid4().hex}.pending"
+        try:
+            os.replace(self.spool_file, pending_file)
+            self._pending_files.append(pending_file)
+        except FileNotFoundError:
+            # File rimosso dall'esterno: le righe del blocco sono comunque in memoria
+            logger.warning(f"Spool {self.spool_file} non trovato, viene ricreato")
+        except OSError as e:
+            logger.warning(f"Impossibile ruotare lo spool {self.spool_file}: {e}")
+        self._spool = self._open_spool()
+
+    def _recover_spool(self) -> None:
+        """Reinserisce le righe rimaste nei file di spool di processi terminati."""
+        prefix = self.spool_path + "."
+        files: Dict[int, List[str]] = {}
+        for path in glob.glob(glob.escape(self.spool_path) + ".*"):
+            pid = path[len(prefix):].split(".", 1)[0]
+            if pid.isdigit():
+                files.setdefault(int(pid), []).append(path)
+
+        for pid, paths in files.items():
+            if _owned_by_live_process(pid):
+                continue
+            # I .pending sono più vecchi dello spool corrente dello stesso processo
+            for path in sorted(paths, key=lambda p: (not p.endswith(".pending"), os.path.getmtime(p))):
+                self._recover_file(path)
+
+    def _recover_file(self, path: str) -> None:
+        rows = []
+        try:
+            with open(path, encoding='utf-8') as spool:
+                for line in spool:
+                    try:
+                        rows.append(tuple(json.loads(line)))
+                    except json.JSONDecodeError:
+                        # Ultima riga troncata da un arresto durante la scrittura
+                        logger.warning(f"Riga non valida ignorata nello spool {path}")
+            if rows:
+                self.manager.insert_activity_rows(rows)
+                logger.info(f"Recuperate {len(rows)} attività dallo spool {path}")
+            os.remove(path)
+        except FileNotFoundError:
+            # Recuperato nel frattempo da un altro processo
+            pass
+        except Exception as e:
+            # Il file resta per il prossimo avvio
+            logger.error(f"Errore nel recupero dello spool {path}: {e}")
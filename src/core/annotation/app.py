@@ -5,6 +5,7 @@ File completo con implementazioni strutturate e robuste, ottimizzato e corretto.
 File completo con implementazioni strutturate e robuste, ottimizzato e corretto.
 """
 
+import atexit
 import functools
 import os
 import sys
@@ -13,15 +14,20 @@ import logging
 import datetime
 import importlib.util
 import re
+import tempfile
+import threading
 import time
 from functools import wraps
 from pathlib import Path
 from typing import List, Dict, Any
-from flask import Flask, render_template, request, jsonify, redirect, url_for, send_file, session, flash, g, abort, make_response
+from flask import Flask, render_template, request, jsonify, redirect, url_for, send_file, session, flash, g, abort, make_response, Response, stream_with_context
 from werkzeug.utils import secure_filename
 import configparser
 from pathlib import Path
+from .backup_service import BackupService
+from .activity_logger import ActivityLogger
 from .db_manager import AnnotationDBManager
+from .export_stream import stream_json, stream_jsonl, stream_spacy_json, write_docbin
 from ..ner_giuridico.entities.entity_manager import get_entity_manager, EntityType
 import uuid
 
@@ -579,6 +585,7 @@ def api_get_next_document():
 
 @app.route('/api/document_batch_assign', methods=['POST'])
 @admin_required
+@api_error_handler
 def api_batch_assign_documents():
     """API endpoint per assegnare documenti in batch a un utente."""
     data = request.json
@@ -596,20 +603,14 @@ def api_batch_assign_documents():
     if not user:
         raise FileNotFoundError(f"Utente con ID {user_id} non trovato.")
     
+    # Verifica, assegnazione e log delle attività in un'unica transazione
+    outcome = db_manager.bulk_assign_documents(doc_ids, user_id, g.user['id'])
     results = {
-        "success": [],
-        "failed": []
+        "success": outcome["assigned"],
+        "failed": [{"id": doc_id, "reason": "Documento non trovato"} for doc_id in outcome["not_found"]],
+        "previous_assignees": outcome["previous_assignees"]
     }
-    
-    for doc_id in doc_ids:
-        try:
-            success = db_manager.assign_document(doc_id, user_id, g.user['id'])
-            if success:
-                results["success"].append(doc_id)
-            else:
-                results["failed"].append({"id": doc_id, "reason": "Errore durante l'assegnazione"})
-        except Exception as e:
-            results["failed"].append({"id": doc_id, "reason": str(e)})
+    record_database_change(len(outcome["assigned"]))
     
     annotation_logger.info(f"Admin '{g.user['username']}' batch assigned {len(results['success'])} documents to user '{user.get('username')}'.")
     
@@ -1206,6 +1207,23 @@ db_path = DB_PATH
 backup_dir = BACKUP_DIR
 max_backups = 10 # Puoi rendere questo configurabile in altro modo se necessario
 
+# Backup online in background: ogni BACKUP_INTERVAL secondi o dopo BACKUP_CHANGE_THRESHOLD modifiche
+BACKUP_INTERVAL = 6 * 3600
+BACKUP_CHANGE_THRESHOLD = 500
+
+# Log delle attività utente in blocchi: scrittura ogni ACTIVITY_FLUSH_INTERVAL secondi
+# o dopo ACTIVITY_BATCH_SIZE eventi, con spool su file per non perderli in caso di arresto
+ACTIVITY_BATCH_SIZE = 200
+ACTIVITY_FLUSH_INTERVAL = 1.0
+
+# Paginazione di /api/documents
+DOCUMENTS_PAGE_SIZE = 50
+DOCUMENTS_MAX_PAGE_SIZE = 500
+
+# Paginazione di /api/search
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
 try:
     from .db_migrations import run_migrations
 except ImportError:
@@ -1219,8 +1237,46 @@ annotation_logger.info(f"Directory backup: {backup_dir}")
 # Initialize database manager
 # (db_path e backup_dir sono già definiti sopra)
 db_manager = AnnotationDBManager(db_path=db_path, backup_dir=backup_dir)
+atexit.register(db_manager.close)
 ensure_admin_exists(db_manager)
 
+backup_service = BackupService(
+    db_path, backup_dir,
+    interval=BACKUP_INTERVAL,
+    change_threshold=BACKUP_CHANGE_THRESHOLD,
+    keep_last=max_backups,
+)
+# Registrato dopo db_manager.close: atexit esegue in ordine inverso, il backup in corso termina prima
+atexit.register(backup_service.stop)
+
+activity_logger = ActivityLogger(
+    db_manager,
+    batch_size=ACTIVITY_BATCH_SIZE,
+    flush_interval=ACTIVITY_FLUSH_INTERVAL,
+    spool_path=os.path.join(os.path.dirname(db_path), "activity_spool.jsonl"),
+)
+# Registrato per ultimo: le attività in attesa vengono scritte prima di chiudere il pool
+atexit.register(activity_logger.close)
+
+_services_lock = threading.Lock()
+_services_started = False
+
+
+def start_background_services() -> None:
+    """
+    Avvia il servizio di backup e il log delle attività in blocchi (idempotente).
+
+    Chiamata all'avvio del server o alla prima richiesta, non all'importazione del modulo:
+    importare l'app (test, script) non avvia thread che scrivono nella directory dei dati.
+    """
+    global _services_started
+    with _services_lock:
+        if _services_started:
+            return
+        backup_service.start()
+        activity_logger.start()
+        _services_started = True
+
 # Run migrations before initializing db_manager
 if run_migrations:
     try:
@@ -1234,6 +1290,8 @@ def update_context():
     """Aggiorna il contesto dell'applicazione prima di ogni richiesta."""
     # Assicurati che il gestore delle entità sia sempre aggiornato
     app.config['ENTITY_MANAGER'] = get_entity_manager()
+    if not _services_started:
+        start_background_services()
 
 # -----------------------------------------------------------------------------
 # Funzioni helper per la persistenza dei documenti e delle annotazioni
@@ -1293,28 +1351,25 @@ def save_annotations(annotations: Dict[str, List[Dict[str, Any]]]) -> bool:
         True se salvate con successo, False altrimenti
     """
     try:
-        for doc_id, doc_annotations in annotations.items():
-            for annotation in doc_annotations:
-                db_manager.save_annotation(doc_id, annotation)
-        return True
+        return db_manager.import_from_json(annotations)
     except Exception as e:
         annotation_logger.error(f"Errore nel salvataggio delle annotazioni: {e}")
         return False
 
-def cleanup_backups(max_backups: int = None):
+def record_database_change(count: int = 1) -> None:
     """
-    Effettua la pulizia dei backup più vecchi.
+    Segnala al servizio di backup delle modifiche al database.
+    
+    Il backup e la pulizia dei vecchi backup avvengono nel thread del servizio,
+    fuori dal percorso della richiesta.
     
     Args:
-        max_backups: Numero massimo di backup da mantenere
+        count: Numero di modifiche effettuate
     """
-    if max_backups is None:
-        max_backups = config.getint('Database', 'max_backups', fallback=10)
-    
     try:
-        db_manager.cleanup_backups(max_backups)
+        backup_service.record_change(count)
     except Exception as e:
-        annotation_logger.error(f"Errore nella pulizia dei backup: {e}")
+        annotation_logger.error(f"Errore nella segnalazione delle modifiche al servizio di backup: {e}")
 
 
 # -----------------------------------------------------------------------------
@@ -1416,7 +1471,7 @@ def save_annotation():
         if not saved_annotation:
             return jsonify({"status": "error", "message": "Errore nel salvataggio dell'annotazione"}), 500
         
-        cleanup_backups()
+        record_database_change()
         return jsonify({"status": "success", "annotation": saved_annotation})
     except Exception as e:
         annotation_logger.error(f"Errore nel salvataggio dell'annotazione: {e}")
@@ -1545,7 +1600,7 @@ def update_annotation():
         if not saved_annotation:
             return jsonify({"status": "error", "message": f"Errore nell'aggiornamento dell'annotazione {annotation_id}"}), 500
         
-        cleanup_backups()
+        record_database_change()
         return jsonify({"status": "success", "message": "Annotazione aggiornata con successo"})
     except Exception as e:
         annotation_logger.error(f"Errore nell'aggiornamento dell'annotazione: {e}")
@@ -1567,7 +1622,7 @@ def delete_document():
         if not success:
             return jsonify({"status": "error", "message": f"Errore nell'eliminazione del documento {doc_id}"}), 500
         
-        cleanup_backups()
+        record_database_change()
         return jsonify({
             "status": "success", 
             "message": f"Documento {doc_id} e relative annotazioni eliminati con successo"
@@ -1611,42 +1666,94 @@ def update_document():
 
 @app.route('/api/documents', methods=['GET'])
 @login_required
+@api_error_handler
 def api_get_documents():
-    """API endpoint per ottenere la lista dei documenti con metadati."""
-    # Filtra per stato se specificato
+    """
+    API endpoint per ottenere la lista dei documenti con metadati, una pagina alla volta.
+    
+    Parametri: status, assigned_to (solo admin), limit, cursor (next_cursor della pagina precedente).
+    """
     status = request.args.get('status')
+    cursor = request.args.get('cursor')
+    try:
+        limit = int(request.args.get('limit', DOCUMENTS_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("Il parametro 'limit' deve essere un intero.")
+    limit = max(1, min(limit, DOCUMENTS_MAX_PAGE_SIZE))
     
     # Admin può vedere tutti i documenti, altrimenti filtra per quelli assegnati
-    user_id = None if g.user.get('role') == 'admin' else g.user['id']
+    if g.user.get('role') == 'admin':
+        user_id = request.args.get('assigned_to')
+    else:
+        user_id = g.user['id']
     
-    documents = db_manager.get_documents(status=status, assigned_to=user_id)
-    all_annotations_map = db_manager.get_annotations()  # Fetch all once
+    page = db_manager.list_documents(status=status, assigned_to=user_id, limit=limit, cursor_token=cursor)
+    documents = page['documents']
 
     for doc in documents:
-        doc_id = doc['id']
-        doc_annotations = all_annotations_map.get(doc_id, [])
-        doc['annotation_count'] = len(doc_annotations)
-        word_count = doc.get('word_count', 0)
+        annotation_count = doc['annotation_count']
+        word_count = doc.get('word_count') or 0
         
         # Calcolo progresso annotazioni
         if word_count > 0:
-            annotated_chars = sum(ann['end'] - ann['start'] for ann in doc_annotations)
             avg_ann_len = 15  # Stima caratteri medi per annotazione
-            estimated_annotated_chars = len(doc_annotations) * avg_ann_len
-            progress = min(round((estimated_annotated_chars / (word_count * 5)) * 100), 100) if word_count else 0
-            doc['annotated_percent'] = progress
+            estimated_annotated_chars = annotation_count * avg_ann_len
+            doc['annotated_percent'] = min(round((estimated_annotated_chars / (word_count * 5)) * 100), 100)
         else:
-            doc['annotated_percent'] = 100 if doc['annotation_count'] > 0 else 0
+            doc['annotated_percent'] = 100 if annotation_count > 0 else 0
     
-    return jsonify({"status": "success", "documents": documents})
-      
+    return jsonify({"status": "success", "documents": documents, "next_cursor": page['next_cursor']})
+
+@app.route('/api/search', methods=['GET'])
+@login_required
+@api_error_handler
+def api_search():
+    """
+    API di ricerca full-text su documenti o annotazioni, in ordine di rilevanza.
+
+    Parametri: q (testo cercato; "frase esatta" e prefisso* supportati), scope
+    (documents, predefinito, o annotations), type (tipo di entità), status,
+    assigned_to (solo admin), limit, offset (next_offset della pagina precedente).
+    Titoli e snippet evidenziati sono HTML con i termini trovati in <mark>.
+    """
+    query = request.args.get('q', '')
+    scope = request.args.get('scope', 'documents')
+    if scope not in ('documents', 'annotations'):
+        raise ValueError("Il parametro 'scope' deve essere 'documents' o 'annotations'.")
+    try:
+        limit = int(request.args.get('limit', SEARCH_PAGE_SIZE))
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        raise ValueError("I parametri 'limit' e 'offset' devono essere interi.")
+    limit = max(1, min(limit, SEARCH_MAX_PAGE_SIZE))
+    offset = max(0, offset)
+
+    # Come per /api/documents: gli annotatori cercano solo nei documenti assegnati
+    if g.user.get('role') == 'admin':
+        user_id = request.args.get('assigned_to')
+    else:
+        user_id = g.user['id']
+
+    search = db_manager.search_documents if scope == 'documents' else db_manager.search_annotations
+    page = search(
+        query,
+        status=request.args.get('status'),
+        entity_type=request.args.get('type'),
+        assigned_to=user_id,
+        limit=limit,
+        offset=offset,
+    )
+    return jsonify({"status": "success", "scope": scope, **page})
+
 @app.route('/api/bulk_delete_documents', methods=['POST'])
 @login_required
 def bulk_delete_documents():
     """
     API per eliminare più documenti in blocco.
     
-    Richiede un array di ID di documenti nel body della richiesta.
+    Richiede un array di ID di documenti nel body della richiesta. Permessi, eliminazioni
+    e log delle attività avvengono in un'unica transazione; la risposta riporta l'esito
+    per ogni ID in results (success: ID eliminati, failed: {id, reason}).
     """
     try:
         data = request.json
@@ -1654,59 +1761,44 @@ def bulk_delete_documents():
         
         if not doc_ids:
             return jsonify({"status": "error", "message": "Nessun ID documento fornito"}), 400
-        
-        # Controllo di autorizzazione
-        if session.get('user_role') != 'admin':
-            # Per utenti non-admin, verifica che possano eliminare tutti i documenti richiesti
-            # Ad esempio, controlla se sono i creatori o assegnatari
-            for doc_id in doc_ids:
-                document = db_manager.get_document(doc_id)
-                if not document:
-                    continue  # Salta i documenti che non esistono
-                
-                # Se l'utente non è né creatore né assegnatario del documento
-                if (document.get('created_by') != session.get('user_id') and 
-                    document.get('assigned_to') != session.get('user_id')):
-                    return jsonify({
-                        "status": "error", 
-                        "message": "Non hai l'autorizzazione per eliminare alcuni di questi documenti"
-                    }), 403
-        
-        deleted_count = 0
-        errors = []
-        
-        # Elimina ogni documento
-        for doc_id in doc_ids:
-            try:
-                success = db_manager.delete_document(doc_id)
-                if success:
-                    deleted_count += 1
-                    # Log dell'attività
-                    db_manager.log_user_activity(
-                        user_id=session.get('user_id'),
-                        action_type="delete_document",
-                        document_id=doc_id
-                    )
-                else:
-                    errors.append(f"Errore nell'eliminazione del documento {doc_id}")
-            except Exception as e:
-                errors.append(f"Errore per documento {doc_id}: {str(e)}")
-        
-        # Esegui pulizia dei backup dopo bulk delete
-        cleanup_backups()
+        if not isinstance(doc_ids, list):
+            return jsonify({"status": "error", "message": "'doc_ids' deve essere una lista di ID documento"}), 400
+        
+        # Gli utenti non admin possono eliminare solo i documenti che hanno creato o che sono loro assegnati
+        outcome = db_manager.bulk_delete_documents(
+            doc_ids,
+            user_id=session.get('user_id'),
+            is_admin=session.get('user_role') == 'admin'
+        )
+        deleted = outcome["deleted"]
+        
+        # Segnala le eliminazioni al servizio di backup
+        record_database_change(len(deleted))
+        
+        results = {
+            "success": deleted,
+            "failed": (
+                [{"id": doc_id, "reason": "Documento non trovato"} for doc_id in outcome["not_found"]] +
+                [{"id": doc_id, "reason": "Non hai l'autorizzazione per eliminare questo documento"}
+                 for doc_id in outcome["forbidden"]]
+            ),
+            "annotations_deleted": outcome["annotations_deleted"]
+        }
         
         # Prepara la risposta
         response = {
             "status": "success",
-            "message": f"Eliminati {deleted_count} documenti su {len(doc_ids)} richiesti"
+            "message": f"Eliminati {len(deleted)} documenti su {len(doc_ids)} richiesti",
+            "results": results
         }
         
-        # Aggiungi informazioni sugli errori se presenti
-        if errors:
-            response["errors"] = errors
-            response["message"] += f" con {len(errors)} errori"
-            if deleted_count == 0:
+        if results["failed"]:
+            response["message"] += f" con {len(results['failed'])} errori"
+            if not deleted:
                 response["status"] = "error"
+                # Nessun documento eliminabile: come in precedenza la richiesta è rifiutata
+                if outcome["forbidden"]:
+                    return jsonify(response), 403
         
         return jsonify(response)
         
@@ -1719,30 +1811,62 @@ def bulk_delete_documents():
 def export_annotations():
     """
     API per esportare le annotazioni in vari formati.
+    
+    Formati: json (predefinito), jsonl, spacy e docbin. I formati testuali sono inviati
+    in streaming man mano che i documenti vengono letti; docbin produce un file .spacy.
     """
     try:
         format_type = request.args.get('format', 'json')
+        download = request.args.get('download', 'false').lower() == 'true'
+        
+        if format_type == 'docbin':
+            fd, output_file = tempfile.mkstemp(suffix='.spacy')
+            os.close(fd)
+            try:
+                write_docbin(db_manager.iter_export_documents(), output_file)
+            except ImportError:
+                os.remove(output_file)
+                return jsonify({"status": "error", "message": "spaCy non è installato: formato docbin non disponibile"}), 501
+            except Exception:
+                os.remove(output_file)
+                raise
+            response = send_file(output_file, as_attachment=True, download_name='annotations.spacy')
+            response.call_on_close(lambda: os.path.exists(output_file) and os.remove(output_file))
+            return response
         
-        if format_type == 'spacy':
-            spacy_data = db_manager.export_spacy()
-            output_file = os.path.join(DATA_DIR, 'spacy_annotations.json')
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(spacy_data, f, indent=2, ensure_ascii=False)
-            if request.args.get('download', 'false').lower() == 'true':
-                return send_file(output_file, as_attachment=True, download_name='spacy_annotations.json')
-            return jsonify({"status": "success", "file": output_file, "data": spacy_data})
+        if format_type == 'jsonl':
+            body, mimetype, filename = stream_jsonl, 'application/x-ndjson', 'annotations_export.jsonl'
+        elif format_type == 'spacy':
+            # Senza download la lista è racchiusa in {"status", "data"} come in precedenza
+            body = lambda documents: stream_spacy_json(documents, wrap=not download)
+            mimetype, filename = 'application/json', 'spacy_annotations.json'
         else:
-            annotations = db_manager.export_json()
-            if request.args.get('download', 'false').lower() == 'true':
-                output_file = os.path.join(DATA_DIR, 'annotations_export.json')
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    json.dump(annotations, f, indent=2, ensure_ascii=False)
-                return send_file(output_file, as_attachment=True, download_name='annotations_export.json')
-            return jsonify(annotations)
+            body, mimetype, filename = stream_json, 'application/json', 'annotations_export.json'
+        
+        response = Response(stream_with_context(body(db_manager.iter_export_documents())), mimetype=mimetype)
+        if download:
+            response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+        return response
     except Exception as e:
         annotation_logger.error(f"Errore nell'esportazione delle annotazioni: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/backups', methods=['GET'])
+@login_required
+@admin_required
+def api_backup_status():
+    """API per lo stato del servizio di backup."""
+    return jsonify({"status": "success", "backup": backup_service.status()})
+
+@app.route('/api/backups', methods=['POST'])
+@login_required
+@admin_required
+def api_trigger_backup():
+    """API per richiedere un backup; viene eseguito in background dal servizio di backup."""
+    backup_service.trigger()
+    annotation_logger.info(f"Backup richiesto da {session.get('username')}")
+    return jsonify({"status": "success", "message": "Backup avviato in background"}), 202
+
 @app.route('/api/recognize', methods=['POST'])
 @login_required
 def recognize_entities():
@@ -1823,7 +1947,7 @@ def clear_annotations():
         else:
             message = "Tutte le annotazioni eliminate con successo"
         
-        cleanup_backups()
+        record_database_change()
         return jsonify({
             "status": "success", 
             "message": message
@@ -1840,54 +1964,7 @@ def annotation_stats():
     API per ottenere statistiche sulle annotazioni.
     """
     try:
-        annotations = load_annotations()
-        documents = load_documents()
-        doc_map = {doc['id']: doc for doc in documents}
-        total_documents = len(documents)
-        total_annotated = len(annotations)
-        total_annotations = sum(len(anns) for anns in annotations.values())
-        entity_counts = {}
-        for doc_id, doc_annotations in annotations.items():
-            for ann in doc_annotations:
-                entity_type = ann.get('type')
-                if entity_type not in entity_counts:
-                    entity_counts[entity_type] = 0
-                entity_counts[entity_type] += 1
-        doc_stats = []
-        for doc_id, doc_annotations in annotations.items():
-            if doc_id in doc_map:
-                doc = doc_map[doc_id]
-                doc_stats.append({
-                    "id": doc_id,
-                    "title": doc.get('title', 'Documento senza titolo'),
-                    "annotation_count": len(doc_annotations),
-                    "word_count": doc.get('word_count', 0),
-                    "annotation_density": len(doc_annotations) / doc.get('word_count', 1) * 100
-                })
-        temporal_stats = {}
-        for doc in documents:
-            if 'date_created' in doc:
-                try:
-                    date = doc['date_created'].split('T')[0]
-                    if date not in temporal_stats:
-                        temporal_stats[date] = {"documents": 0, "annotations": 0}
-                    temporal_stats[date]["documents"] += 1
-                    doc_id = doc['id']
-                    if doc_id in annotations:
-                        temporal_stats[date]["annotations"] += len(annotations[doc_id])
-                except Exception:
-                    pass
-        return jsonify({
-            "general": {
-                "total_documents": total_documents,
-                "annotated_documents": total_annotated,
-                "total_annotations": total_annotations,
-                "annotation_coverage": (total_annotated / total_documents * 100) if total_documents > 0 else 0
-            },
-            "entity_stats": entity_counts,
-            "document_stats": doc_stats,
-            "temporal_stats": [{"date": k, **v} for k, v in temporal_stats.items()]
-        })
+        return jsonify(db_manager.get_annotation_stats())
     except Exception as e:
         annotation_logger.error(f"Errore nel calcolo delle statistiche: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -2409,6 +2486,7 @@ if __name__ == '__main__':
     # if not os.path.exists(os.path.join(DATA_DIR, 'annotations.json')):
     #     with open(os.path.join(DATA_DIR, 'annotations.json'), 'w', encoding='utf-8') as f:
     #         json.dump({}, f)
+    start_background_services()
     annotation_logger.info("Interfaccia di annotazione inizializzata e pronta all'avvio")
     # Non più necessario ottenere ENTITY_TYPES qui se entity_manager li gestisce
     # annotation_logger.info(f"Tipi di entità disponibili: {', '.join(entity['id'] for entity in ENTITY_TYPES)}")
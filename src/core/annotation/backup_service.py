@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+backup_service.py
+Backup online del database delle annotazioni, fuori dal percorso delle richieste.
+
+backup_database copia il database con l'API di backup di sqlite3 a blocchi di pagine,
+con una breve pausa tra un blocco e l'altro per lasciare spazio alle scritture. La
+connessione sorgente tiene aperta una transazione di lettura per tutta la copia: in
+modalità WAL le scritture proseguono e il backup resta una fotografia coerente, senza
+ripartire da capo ogni volta che un'altra connessione modifica il database (cosa che,
+senza la transazione, con scritture continue può impedire al backup di terminare).
+Il file viene scritto con estensione temporanea e rinominato solo a copia completata,
+eventualmente compresso con gzip. Al termine la stessa connessione esegue un checkpoint
+del WAL accumulato durante la copia, che altrimenti ricadrebbe su una scrittura.
+
+BackupService esegue i backup in un thread in background, a intervalli regolari, su
+richiesta (trigger) o dopo un certo numero di modifiche, e applica poi la politica di
+conservazione di apply_retention.
+"""
+
+import datetime
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# Setup del logger
+logger = logging.getLogger("backup_service")
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+logger.addHandler(handler)
+
+BACKUP_PREFIX = "annotations_backup_"
+BACKUP_SUFFIXES = (".db", ".db.gz")
+
+# Pagine copiate per ogni passo e pausa tra i passi
+PAGES_PER_STEP = 1024
+STEP_PAUSE = 0.005
+
+# Politica di conservazione predefinita
+KEEP_LAST = 10
+KEEP_DAILY = 7
+KEEP_WEEKLY = 4
+
+
+def backup_database(db_path: str, backup_dir: str, compress: bool = False,
+                    pages_per_step: int = PAGES_PER_STEP, step_pause: float = STEP_PAUSE) -> str:
+    """
+    Crea un backup coerente del database con l'API di backup di sqlite3.
+
+    Args:
+        db_path: Percorso del database da copiare
+        backup_dir: Directory di destinazione
+        compress: True per comprimere il backup con gzip (.db.gz)
+        pages_per_step: Pagine copiate per ogni passo
+        step_pause: Secondi di pausa tra un passo e l'altro
+
+    Returns:
+        Percorso del file di backup
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    # Millisecondi: due backup nello stesso secondo non si sovrascrivono
+    name = f"{BACKUP_PREFIX}{int(time.time() * 1000)}.db"
+    final_path = os.path.join(backup_dir, name + (".gz" if compress else ""))
+    partial_path = os.path.join(backup_dir, name + ".partial")
+
+    def pause(status, remaining, total):
+        if remaining and step_pause:
+            time.sleep(step_pause)
+
+    source = sqlite3.connect(str(db_path), timeout=5)
+    target = sqlite3.connect(partial_path)
+    try:
+        # Nessun fsync sul file di destinazione, come la vecchia copia con shutil.copy2: la
+        # sincronizzazione dell'intero file ritarderebbe le scritture concorrenti; la
+        # rinomina finale garantisce comunque che un backup visibile sia completo
+        target.execute("PRAGMA journal_mode=OFF")
+        target.execute("PRAGMA synchronous=OFF")
+        # Transazione di lettura: fotografia coerente senza riavvii del backup
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        source.backup(target, pages=pages_per_step, progress=pause)
+        source.rollback()
+        # Durante la copia il WAL non può essere riportato nel database e cresce: il checkpoint
+        # si fa qui, altrimenti lo pagherebbe il primo commit di una richiesta
+        source.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        target.close()
+
+        if compress:
+            with open(partial_path, 'rb') as raw, gzip.open(partial_path + ".gz", 'wb', compresslevel=6) as packed:
+                shutil.copyfileobj(raw, packed, 1024 * 1024)
+            os.remove(partial_path)
+            os.replace(partial_path + ".gz", final_path)
+        else:
+            os.replace(partial_path, final_path)
+    except BaseException:
+        target.close()
+        for leftover in (partial_path, partial_path + ".gz"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+    finally:
+        source.close()
+
+    return final_path
+
+
+def list_backups(backup_dir: str) -> List[Tuple[str, float]]:
+    """
+    Elenca i backup completi, dal più recente.
+
+    Returns:
+        Lista di (percorso, mtime)
+    """
+    backups = []
+    for filename in os.listdir(backup_dir):
+        if filename.startswith(BACKUP_PREFIX) and filename.endswith(BACKUP_SUFFIXES):
+            path = os.path.join(backup_dir, filename)
+            backups.append((path, os.path.getmtime(path)))
+    backups.sort(key=lambda item: item[1], reverse=True)
+    return backups
+
+
+def apply_retention(backup_dir: str, keep_last: int = KEEP_LAST, keep_daily: int = KEEP_DAILY,
+                    keep_weekly: int = KEEP_WEEKLY) -> List[str]:
+    """
+    Applica la politica di conservazione dei backup e rimuove gli altri.
+
+    Si conservano gli ultimi keep_last backup, il più recente di ciascuno degli ultimi
+    keep_daily giorni e il più recente di ciascuna delle ultime keep_weekly settimane.
+
+    Args:
+        backup_dir: Directory dei backup
+        keep_last: Backup più recenti da conservare
+        keep_daily: Giorni per cui conservare un backup giornaliero
+        keep_weekly: Settimane per cui conservare un backup settimanale
+
+    Returns:
+        Percorsi dei backup rimossi
+    """
+    backups = list_backups(backup_dir)
+    keep = {path for path, _ in backups[:keep_last]}
+
+    days, weeks = [], []
+    for path, mtime in backups:
+        moment = datetime.datetime.fromtimestamp(mtime)
+        day = moment.date()
+        week = tuple(moment.isocalendar()[:2])
+        # I backup sono in ordine decrescente: il primo di ogni giorno/settimana è il più recente
+        if day not in days and len(days) < keep_daily:
+            days.append(day)
+            keep.add(path)
+        if week not in weeks and len(weeks) < keep_weekly:
+            weeks.append(week)
+            keep.add(path)
+
+    removed = []
+    for path, _ in backups:
+        if path not in keep:
+            os.remove(path)
+            removed.append(path)
+            logger.debug(f"Backup rimosso: {path}")
+    return removed
+
+
+class BackupService:
+    """
+    Esegue backup online in un thread in background.
+
+    Un backup parte allo scadere di `interval` secondi, quando viene chiamato trigger()
+    oppure quando record_change() ha contato `change_threshold` modifiche dall'ultimo
+    backup. Dopo ogni backup viene applicata la politica di conservazione.
+    """
+
+    def __init__(self, db_path: str, backup_dir: str, interval: Optional[float] = 6 * 3600,
+                 compress: bool = True, change_threshold: Optional[int] = None,
+                 pages_per_step: int = PAGES_PER_STEP, step_pause: float = STEP_PAUSE,
+                 keep_last: int = KEEP_LAST, keep_daily: int = KEEP_DAILY, keep_weekly: int = KEEP_WEEKLY):
+        """
+        Args:
+            db_path: Percorso del database
+            backup_dir: Directory dei backup
+            interval: Secondi tra due backup programmati (None per disattivare la programmazione)
+            compress: True per comprimere i backup con gzip
+            change_threshold: Modifiche dopo cui avviare un backup (None per disattivare)
+            pages_per_step: Pagine copiate per ogni passo
+            step_pause: Secondi di pausa tra un passo e l'altro
+            keep_last, keep_daily, keep_weekly: Politica di conservazione (vedi apply_retention)
+        """
+        self.db_path = str(db_path)
+        self.backup_dir = str(backup_dir)
+        self.interval = interval
+        self.compress = compress
+        self.change_threshold = change_threshold
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+        self.retention = {"keep_last": keep_last, "keep_daily": keep_daily, "keep_weekly": keep_weekly}
+
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._changes = 0
+
+        self.running = False
+        self.last_backup: Optional[str] = None
+        self.last_backup_at: Optional[str] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.backups_created = 0
+
+    def start(self) -> None:
+        """Avvia il thread in background (idempotente)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="annotation-backup", daemon=True)
+        self._thread.start()
+        logger.info(f"Servizio di backup avviato (intervallo: {self.interval}s, compressione: {self.compress})")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Ferma il thread, attendendo il termine dell'eventuale backup in corso."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def trigger(self) -> None:
+        """Richiede un backup appena possibile, senza attenderlo."""
+        self._wakeup.set()
+
+    def record_change(self, count: int = 1) -> None:
+        """Conta delle modifiche al database; oltre la soglia richiede un backup."""
+        if not self.change_threshold:
+            return
+        with self._lock:
+            self._changes += count
+            due = self._changes >= self.change_threshold
+        if due:
+            self.trigger()
+
+    def backup_now(self) -> Optional[str]:
+        """
+        Esegue subito un backup nel thread chiamante e applica la conservazione.
+
+        Returns:
+            Percorso del backup o None in caso di errore
+        """
+        with self._lock:
+            self._changes = 0
+        self.running = True
+        started = time.perf_counter()
+        try:
+            path = backup_database(
+                self.db_path, self.backup_dir, compress=self.compress,
+                pages_per_step=self.pages_per_step, step_pause=self.step_pause
+            )
+            self.last_backup = path
+            self.last_backup_at = datetime.datetime.now().isoformat()
+            self.last_error = None
+            self.backups_created += 1
+            logger.info(f"Backup creato: {path}")
+            apply_retention(self.backup_dir, **self.retention)
+            return path
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"Errore nella creazione del backup: {e}")
+            return None
+        finally:
+            self.last_duration = time.perf_counter() - started
+            self.running = False
+
+    def status(self) -> Dict[str, Any]:
+        """Stato del servizio e dell'ultimo backup."""
+        return {
+            "running": self.running,
+            "last_backup": self.last_backup,
+            "last_backup_at": self.last_backup_at,
+            "last_duration": self.last_duration,
+            "last_error": self.last_error,
+            "backups_created": self.backups_created,
+            "pending_changes": self._changes,
+            "interval": self.interval,
+            "compress": self.compress,
+            "retention": dict(self.retention),
+        }
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.interval)
+            if self._stopping.is_set():
+                break
+            self._wakeup.clear()
+            self.backup_now()
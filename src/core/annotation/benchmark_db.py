@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Benchmark delle connessioni persistenti di AnnotationDBManager.
+
+Su due database temporanei popolati con gli stessi documenti e annotazioni esegue lo
+stesso carico di salvataggi (save_annotation con log dell'attività) e letture
+(get_document + get_document_annotations), con uno o più thread:
+
+* pool_size=0: una nuova connessione per ogni operazione (comportamento precedente);
+* pool_size>0: connessioni persistenti con WAL, synchronous=NORMAL e mmap.
+
+Con --mode import confronta invece l'importazione di annotazioni: save_annotation per
+ogni riga (il vecchio import_from_json, misurato su --legacy-rows righe con connessioni
+per operazione e persistenti) e bulk_import_annotations (executemany in un'unica
+transazione) su ciascuna dimensione di --import-rows.
+
+Con --mode backup misura la latenza di save_annotation (una ogni --write-interval ms)
+mentre un thread esegue un backup ogni --backup-interval secondi: nessun backup, copia
+del file con shutil.copy2 (il vecchio create_backup) e backup online a passi di pagine
+(backup_service.backup_database).
+
+Con --mode search costruisce un corpus sintetico di --search-documents documenti (con
+annotazioni) e misura la latenza delle ricerche full-text (search_documents e
+search_annotations) su termini frequenti, rari, frasi, prefissi e con filtri, rispetto
+a una scansione LIKE della tabella documents.
+
+Esempi:
+    python -m src.core.annotation.benchmark_db --documents 200 --annotations 20 --operations 2000 --threads 4
+    python -m src.core.annotation.benchmark_db --mode import --import-rows 10000 100000
+    python -m src.core.annotation.benchmark_db --mode backup --documents 3000 --operations 5000
+    python -m src.core.annotation.benchmark_db --mode search --search-documents 100000
+"""
+
+import argparse
+import itertools
+import logging
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from .backup_service import backup_database
+from .db_manager import AnnotationDBManager, DEFAULT_POOL_SIZE
+from .db_migrations import run_migrations
+
+ENTITY_TYPES = ["ARTICOLO_CODICE", "LEGGE", "DECRETO", "SENTENZA", "GIUDICE"]
+TEXT = "Ai sensi dell'art. 2043 c.c. qualunque fatto doloso o colposo obbliga al risarcimento. " * 20
+
+
+def seed(manager: AnnotationDBManager, documents: int, annotations: int) -> List[str]:
+    """Popola il database e restituisce gli ID dei documenti."""
+    manager.create_user({"id": "bench_user", "username": "bench", "password": "bench"})
+    doc_ids = []
+    for d in range(documents):
+        doc_id = f"doc_{d}"
+        manager.save_document({"id": doc_id, "title": f"Documento {d}", "text": TEXT, "word_count": 260})
+        for a in range(annotations):
+            manager.save_annotation(doc_id, {
+                "id": f"seed_{d}_{a}",
+                "start": a * 10,
+                "end": a * 10 + 8,
+                "text": "art. 2043",
+                "type": ENTITY_TYPES[a % len(ENTITY_TYPES)],
+            })
+        doc_ids.append(doc_id)
+    return doc_ids
+
+
+def _run(operation: Callable[[int], None], operations: int, threads: int) -> Dict[str, float]:
+    timings: List[float] = []
+
+    def one(i: int) -> None:
+        start = time.perf_counter()
+        operation(i)
+        timings.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(one, range(operations)))
+    wall = time.perf_counter() - start
+
+    ordered = sorted(timings)
+    return {
+        "op/s": operations / wall,
+        "p50 ms": ordered[len(ordered) // 2] * 1000,
+        "p95 ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "media ms": statistics.mean(ordered) * 1000,
+    }
+
+
+def run_benchmark(args: argparse.Namespace) -> List[Dict[str, object]]:
+    results = []
+    for name, pool_size in (("per-operazione", 0), ("persistente", args.pool_size)):
+        with tempfile.TemporaryDirectory() as tmp:
+            manager = AnnotationDBManager(
+                db_path=os.path.join(tmp, "annotations.db"),
+                backup_dir=os.path.join(tmp, "backup"),
+                pool_size=pool_size,
+            )
+            doc_ids = seed(manager, args.documents, args.annotations)
+            rng = random.Random(42)
+            targets = [rng.choice(doc_ids) for _ in range(args.operations)]
+
+            def save(i: int) -> None:
+                manager.save_annotation(targets[i], {
+                    "id": f"bench_{i}",
+                    "start": i % 500,
+                    "end": i % 500 + 9,
+                    "text": "art. 2043",
+                    "type": ENTITY_TYPES[i % len(ENTITY_TYPES)],
+                }, user_id="bench_user")
+
+            def read(i: int) -> None:
+                manager.get_document(targets[i])
+                manager.get_document_annotations(targets[i])
+
+            for label, operation in (("salvataggio", save), ("lettura", read)):
+                results.append({"strategia": name, "operazione": label,
+                                **_run(operation, args.operations, args.threads)})
+            manager.close()
+    return results
+
+
+def _import_payload(doc_ids: List[str], rows: int) -> Dict[str, List[Dict[str, object]]]:
+    payload: Dict[str, List[Dict[str, object]]] = {doc_id: [] for doc_id in doc_ids}
+    for i in range(rows):
+        payload[doc_ids[i % len(doc_ids)]].append({
+            "start": i % 1000,
+            "end": i % 1000 + 9,
+            "text": "art. 2043",
+            "type": ENTITY_TYPES[i % len(ENTITY_TYPES)],
+        })
+    return payload
+
+
+def run_import_benchmark(args: argparse.Namespace) -> List[Dict[str, object]]:
+    results = []
+    cases = [("per-annotazione", 0, args.legacy_rows), ("per-ann. pool", args.pool_size, args.legacy_rows)]
+    cases += [("bulk", args.pool_size, rows) for rows in args.import_rows]
+    for name, pool_size, rows in cases:
+        with tempfile.TemporaryDirectory() as tmp:
+            manager = AnnotationDBManager(
+                db_path=os.path.join(tmp, "annotations.db"),
+                backup_dir=os.path.join(tmp, "backup"),
+                pool_size=pool_size,
+            )
+            doc_ids = seed(manager, args.documents, 0)
+            payload = _import_payload(doc_ids, rows)
+
+            start = time.perf_counter()
+            if name == "bulk":
+                manager.bulk_import_annotations(payload, user_id="bench_user")
+            else:
+                for doc_id, annotations in payload.items():
+                    for annotation in annotations:
+                        manager.save_annotation(doc_id, annotation, user_id="bench_user")
+            wall = time.perf_counter() - start
+
+            with manager._get_db() as (conn, cursor):
+                stored = cursor.execute("SELECT COUNT(*) FROM annotations").fetchone()[0]
+            manager.close()
+            results.append({"strategia": name, "righe": rows, "secondi": wall,
+                            "righe/s": rows / wall, "salvate": stored})
+    return results
+
+
+def _copy_backup(db_path: str, backup_dir: str) -> None:
+    shutil.copy2(db_path, os.path.join(backup_dir, f"annotations_backup_{time.time_ns()}.db"))
+
+
+def run_backup_benchmark(args: argparse.Namespace) -> List[Dict[str, object]]:
+    results = []
+    cases = (("nessun backup", None), ("copia file", _copy_backup), ("online", backup_database))
+    for name, backup in cases:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "annotations.db")
+            backup_dir = os.path.join(tmp, "backup")
+            manager = AnnotationDBManager(db_path=db_path, backup_dir=backup_dir, pool_size=args.pool_size)
+            doc_ids = seed(manager, args.documents, args.annotations)
+            rng = random.Random(42)
+            targets = [rng.choice(doc_ids) for _ in range(args.operations)]
+
+            # Backup periodici in un thread separato per tutta la durata delle scritture
+            stop = threading.Event()
+            durations: List[float] = []
+
+            def backup_loop() -> None:
+                while not stop.wait(args.backup_interval):
+                    start = time.perf_counter()
+                    backup(db_path, backup_dir)
+                    durations.append(time.perf_counter() - start)
+                    for filename in os.listdir(backup_dir):
+                        os.remove(os.path.join(backup_dir, filename))
+
+            worker = threading.Thread(target=backup_loop) if backup else None
+            if worker:
+                worker.start()
+
+            timings = []
+            for i, doc_id in enumerate(targets):
+                start = time.perf_counter()
+                manager.save_annotation(doc_id, {
+                    "id": f"bench_{i}",
+                    "start": i % 500,
+                    "end": i % 500 + 9,
+                    "text": "art. 2043",
+                    "type": ENTITY_TYPES[i % len(ENTITY_TYPES)],
+                }, user_id="bench_user")
+                timings.append(time.perf_counter() - start)
+                time.sleep(args.write_interval / 1000)
+
+            stop.set()
+            if worker:
+                worker.join()
+            manager.close()
+
+            ordered = sorted(timings)
+            results.append({
+                "backup": name,
+                "p50 ms": ordered[len(ordered) // 2] * 1000,
+                "p99 ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+                "max ms": ordered[-1] * 1000,
+                "backup eseguiti": len(durations),
+                "s per backup": statistics.mean(durations) if durations else 0.0,
+            })
+    return results
+
+
+# Lessico del corpus sintetico: parole frequenti e termini rari numerati, con frequenze decrescenti
+VOCABULARY = (
+    "il la di che in del della al un una per con non ai sensi dell art codice civile contratto "
+    "parte parti danno responsabilità obbligazione risarcimento sentenza tribunale corte appello "
+    "cassazione giudice ricorso legge decreto norma diritto dovere termine prescrizione colpa dolo "
+    "fatto atto nullità annullamento inadempimento creditore debitore proprietà possesso successione"
+).split()
+RARE_TERMS = [f"lemma{i}" for i in range(20000)]
+STATUSES = ["pending", "completed", "skipped"]
+
+
+def _synthetic_corpus(manager: AnnotationDBManager, documents: int, words: int, rng: random.Random) -> None:
+    """Inserisce documenti sintetici in blocco (con i trigger FTS e delle statistiche) e tre annotazioni ciascuno."""
+    vocabulary = VOCABULARY + RARE_TERMS
+    # Pesi cumulativi calcolati una volta: choices() li ricalcolerebbe a ogni chiamata
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(vocabulary))))
+    columns = manager.schema.document_upsert_columns
+    batch = 5000
+    for first in range(0, documents, batch):
+        rows = []
+        for d in range(first, min(first + batch, documents)):
+            text = " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=words))
+            values = {
+                "id": f"doc_{d}", "title": f"Sentenza n. {d} " + " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=4)),
+                "text": text, "word_count": words, "date_created": f"2024-01-01T00:00:{d:09d}",
+                "date_modified": None, "created_by": None, "assigned_to": None, "metadata": None,
+            }
+            rows.append(tuple(values[col] for col in columns))
+        with manager._get_db() as (conn, cursor):
+            cursor.executemany(manager.schema.upsert_document, rows)
+            cursor.executemany("UPDATE documents SET status = ? WHERE id = ?",
+                               [(rng.choice(STATUSES), row[0]) for row in rows])
+
+    annotations = {
+        f"doc_{d}": [{
+            "start": a * 20, "end": a * 20 + 9,
+            "text": " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=3)),
+            "type": ENTITY_TYPES[(d + a) % len(ENTITY_TYPES)],
+        } for a in range(3)]
+        for d in range(documents)
+    }
+    manager.bulk_import_annotations(annotations, user_id="bench_user")
+
+
+def _like_scan(manager: AnnotationDBManager, term: str, limit: int = 20) -> None:
+    with manager._get_db() as (conn, cursor):
+        cursor.execute("SELECT id, title FROM documents WHERE title LIKE ? OR text LIKE ? LIMIT ?",
+                       (f"%{term}%", f"%{term}%", limit))
+        cursor.fetchall()
+
+
+def run_search_benchmark(args: argparse.Namespace) -> List[Dict[str, object]]:
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "annotations.db")
+        manager = AnnotationDBManager(db_path=db_path, backup_dir=os.path.join(tmp, "backup"), pool_size=args.pool_size)
+        run_migrations(db_path)
+        manager.create_user({"id": "bench_user", "username": "bench", "password": "bench"})
+
+        start = time.perf_counter()
+        _synthetic_corpus(manager, args.search_documents, args.search_words, rng)
+        build = time.perf_counter() - start
+        print(f"Corpus: {args.search_documents} documenti, {args.search_words} parole ciascuno, "
+              f"costruito (con indici) in {build:.1f} s; database {os.path.getsize(db_path) / 1e6:.0f} MB")
+
+        rare = lambda: rng.choice(RARE_TERMS[5000:])
+        cases = [
+            ("doc frequente", lambda: manager.search_documents("contratto")),
+            ("doc raro", lambda: manager.search_documents(rare())),
+            ("doc frase", lambda: manager.search_documents('"codice civile"')),
+            ("doc prefisso", lambda: manager.search_documents("risarc*")),
+            ("doc 2 termini", lambda: manager.search_documents(f"cassazione {rng.choice(RARE_TERMS[:500])}")),
+            ("doc + tipo", lambda: manager.search_documents("contratto", entity_type="SENTENZA")),
+            ("doc + stato", lambda: manager.search_documents("contratto", status="completed")),
+            ("doc pagina 10", lambda: manager.search_documents("contratto", offset=200)),
+            ("ann frequente", lambda: manager.search_annotations("danno")),
+            ("ann + tipo", lambda: manager.search_annotations("danno", entity_type="LEGGE")),
+            ("LIKE frequente", lambda: _like_scan(manager, "contratto")),
+            ("LIKE raro", lambda: _like_scan(manager, rare())),
+        ]
+        results = []
+        for name, query in cases:
+            timings = []
+            for _ in range(args.search_queries):
+                start = time.perf_counter()
+                query()
+                timings.append(time.perf_counter() - start)
+            ordered = sorted(timings)
+            results.append({
+                "ricerca": name,
+                "p50 ms": ordered[len(ordered) // 2] * 1000,
+                "p95 ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+                "max ms": ordered[-1] * 1000,
+            })
+        manager.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark connessioni SQLite persistenti vs per operazione")
+    parser.add_argument("--documents", type=int, default=200, help="Documenti nel database di prova")
+    parser.add_argument("--annotations", type=int, default=20, help="Annotazioni per documento")
+    parser.add_argument("--operations", type=int, default=2000, help="Operazioni per misura")
+    parser.add_argument("--threads", type=int, default=4, help="Thread concorrenti")
+    parser.add_argument("--pool-size", type=int, default=DEFAULT_POOL_SIZE, help="Connessioni inattive nel pool")
+    parser.add_argument("--mode", choices=["connections", "import", "backup", "search"], default="connections", help="Carico da misurare")
+    parser.add_argument("--import-rows", type=int, nargs="+", default=[10000, 100000], help="Righe per l'importazione in blocco")
+    parser.add_argument("--legacy-rows", type=int, default=1000, help="Righe per l'importazione una alla volta")
+    parser.add_argument("--write-interval", type=float, default=2, help="Millisecondi tra due salvataggi (backup)")
+    parser.add_argument("--backup-interval", type=float, default=1, help="Secondi tra due backup (backup)")
+    parser.add_argument("--search-documents", type=int, default=100000, help="Documenti del corpus sintetico (search)")
+    parser.add_argument("--search-words", type=int, default=200, help="Parole per documento (search)")
+    parser.add_argument("--search-queries", type=int, default=30, help="Ripetizioni di ogni ricerca (search)")
+    args = parser.parse_args()
+
+    # Il logging per singola operazione falserebbe le misure
+    logging.disable(logging.INFO)
+    if args.mode == "import":
+        results = run_import_benchmark(args)
+        columns = ["strategia", "righe", "secondi", "righe/s", "salvate"]
+    elif args.mode == "backup":
+        results = run_backup_benchmark(args)
+        columns = ["backup", "p50 ms", "p99 ms", "max ms", "backup eseguiti", "s per backup"]
+    elif args.mode == "search":
+        results = run_search_benchmark(args)
+        columns = ["ricerca", "p50 ms", "p95 ms", "max ms"]
+    else:
+        results = run_benchmark(args)
+        columns = ["strategia", "operazione", "op/s", "p50 ms", "p95 ms", "media ms"]
+    print(" | ".join(f"{c:>14}" for c in columns))
+    print("-" * (17 * len(columns)))
+    for row in results:
+        print(" | ".join(f"{row[c]:>14.2f}" if isinstance(row[c], float) else f"{row[c]:>14}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,9 +9,17 @@ import sqlite3
 import json
 import logging
 import datetime
-from typing import List, Dict, Any, Tuple, Optional
+import base64
+import threading
+import uuid
+from typing import List, Dict, Any, Tuple, Optional, Iterator
 from pathlib import Path
 
+from .backup_service import backup_database, apply_retention, KEEP_LAST, KEEP_DAILY, KEEP_WEEKLY
+from .db_migrations import register_schema_listener
+from .db_search import ensure_search_schema, build_match_query, render_highlight, MATCH_START, MATCH_END, ELLIPSIS
+from .db_stats import ensure_stats_schema, rebuild_stats as rebuild_stats_tables
+
 # Setup del logger
 logger = logging.getLogger("db_manager")
 logger.setLevel(logging.INFO)
@@ -19,36 +27,199 @@ handler = logging.StreamHandler()
 handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
 logger.addHandler(handler)
 
+# Impostazioni delle connessioni persistenti
+DEFAULT_POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+MMAP_SIZE = 256 * 1024 * 1024
+STATEMENT_CACHE_SIZE = 256
+
+# Righe per ogni executemany delle importazioni in blocco
+IMPORT_BATCH_SIZE = 5000
+
+# Righe lette per ogni fetchmany durante le esportazioni in streaming
+EXPORT_FETCH_SIZE = 2000
+
+# Ricerca full-text: peso del titolo rispetto al testo nel punteggio BM25 e
+# numero di token degli snippet
+SEARCH_TITLE_WEIGHT = 5.0
+SEARCH_SNIPPET_TOKENS = 24
+
+# Chiave di ordinamento di list_documents: i documenti senza data (righe legacy o inserite
+# a mano) vanno in fondo e restano raggiungibili dai cursori, perché NULL non soddisfa
+# nessun confronto. Deve coincidere con l'espressione degli indici idx_documents_*listing.
+LISTING_DATE = "COALESCE(date_created, '')"
+
+INSERT_ACTIVITY = """
+    INSERT INTO user_activity
+    (id, user_id, action_type, document_id, annotation_id, timestamp, details)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Le righe scritte in blocchi possono essere reinserite dopo un arresto (vedi activity_logger)
+INSERT_ACTIVITY_IGNORE = INSERT_ACTIVITY.replace("INSERT INTO", "INSERT OR IGNORE INTO", 1)
+
+
+class ConnectionPool:
+    """
+    Pool di connessioni SQLite persistenti.
+
+    Ogni connessione viene aperta una sola volta con WAL, synchronous=NORMAL, I/O
+    memory-mapped e busy timeout, e conserva la cache delle istruzioni preparate di
+    sqlite3 tra un'operazione e l'altra. Un thread tiene la stessa connessione per tutta
+    la durata del contesto più esterno, quindi le operazioni annidate (es. il log delle
+    attività dentro save_annotation) la riusano invece di aprirne un'altra e fanno parte
+    della stessa transazione: la conferma (o l'annullamento, se un'eccezione arriva fino
+    al contesto più esterno) spetta solo a quest'ultimo. Con max_idle=0 nessuna
+    connessione resta aperta tra un'operazione e l'altra.
+    """
+
+    def __init__(self, db_path, max_idle: int = DEFAULT_POOL_SIZE):
+        self.db_path = str(db_path)
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        # Necessario perché INSERT OR REPLACE attivi i trigger di cancellazione delle statistiche
+        conn.execute("PRAGMA recursive_triggers=ON")
+        return conn
+
+    def acquire(self) -> Tuple[sqlite3.Connection, bool]:
+        """
+        Restituisce la connessione del thread corrente.
+
+        Returns:
+            (connessione, True se è il contesto più esterno del thread)
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.depth += 1
+            return conn, False
+
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._connect()
+        self._local.conn = conn
+        self._local.depth = 1
+        return conn, True
+
+    def release(self) -> None:
+        """Rilascia un livello di contesto; al più esterno la connessione torna al pool."""
+        self._local.depth -= 1
+        if self._local.depth:
+            return
+        conn = self._local.conn
+        self._local.conn = None
+        with self._lock:
+            if not self._closed and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self) -> None:
+        """Chiude le connessioni inattive; quelle in uso vengono chiuse al rilascio."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class SchemaCapabilities:
+    """
+    Colonne disponibili nelle tabelle che le migrazioni possono modificare, lette una
+    sola volta con PRAGMA table_info, e istruzioni SQL precalcolate di conseguenza.
+    """
+    
+    TABLES = ('documents', 'annotations')
+    
+    def __init__(self, columns: Dict[str, Tuple[str, ...]]):
+        self.columns = columns
+        document_columns = columns.get('documents', ())
+        self.select_document = f"SELECT {', '.join(document_columns)} FROM documents WHERE id = ?"
+        
+        upsert_columns = ['id', 'title', 'text', 'word_count', 'date_created', 'date_modified', 'created_by', 'assigned_to']
+        if self.has('documents', 'metadata'):
+            upsert_columns.append('metadata')
+        self.document_upsert_columns = tuple(upsert_columns)
+        
+        # Le liste di documenti non includono il testo completo
+        self.document_listing_columns = tuple(col for col in document_columns if col != 'text')
+        self.upsert_document = (
+            f"INSERT OR REPLACE INTO documents ({', '.join(upsert_columns)}) "
+            f"VALUES ({', '.join('?' for _ in upsert_columns)})"
+        )
+    
+    @classmethod
+    def introspect(cls, cursor: sqlite3.Cursor) -> 'SchemaCapabilities':
+        columns = {}
+        for table in cls.TABLES:
+            cursor.execute(f"PRAGMA table_info({table})")
+            columns[table] = tuple(col[1] for col in cursor.fetchall())
+        return cls(columns)
+    
+    def has(self, table: str, column: str) -> bool:
+        return column in self.columns.get(table, ())
+
+
 class DBContextManager:
-    def __init__(self, db_path):
+    def __init__(self, db_path, pool: Optional[ConnectionPool] = None):
         self.db_path = db_path
+        self.pool = pool
+        self.owner = True
     
     def __enter__(self):
-        self.conn = sqlite3.connect(self.db_path)
-        self.conn.row_factory = sqlite3.Row
+        if self.pool is not None:
+            self.conn, self.owner = self.pool.acquire()
+        else:
+            self.conn = sqlite3.connect(self.db_path)
+            self.conn.row_factory = sqlite3.Row
+            self.conn.execute("PRAGMA recursive_triggers=ON")
         self.cursor = self.conn.cursor()
         return self.conn, self.cursor
     
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if (exc_type is None):
-            self.conn.commit()
-        else:
-            self.conn.rollback()
-        self.cursor.close()
-        self.conn.close()
+        try:
+            # I contesti annidati lasciano la transazione al contesto più esterno
+            if self.owner:
+                if (exc_type is None):
+                    self.conn.commit()
+                else:
+                    self.conn.rollback()
+            self.cursor.close()
+        finally:
+            if self.pool is not None:
+                self.pool.release()
+            else:
+                self.conn.close()
 
 class AnnotationDBManager:
     """
     Gestore della persistenza delle annotazioni tramite database SQLite.
     """
     
-    def __init__(self, db_path: str, backup_dir: str):
+    def __init__(self, db_path: str, backup_dir: str, pool_size: int = DEFAULT_POOL_SIZE):
         """
         Inizializza il gestore del database.
         
         Args:
             db_path: Percorso del file database SQLite.
             backup_dir: Directory per i backup.
+            pool_size: Connessioni inattive mantenute aperte; 0 apre una connessione per operazione.
         """
         self.logger = logging.getLogger("db_manager")
         
@@ -66,6 +237,16 @@ class AnnotationDBManager:
         os.makedirs(db_dir, exist_ok=True)
         os.makedirs(self.backup_dir, exist_ok=True)
         
+        self.pool = ConnectionPool(self.db_path, max_idle=pool_size)
+        
+        # Capacità dello schema, introspezionate al primo utilizzo e invalidate dalle migrazioni
+        self._schema: Optional[SchemaCapabilities] = None
+        self._schema_lock = threading.Lock()
+        register_schema_listener(self.db_path, self.invalidate_schema_cache)
+        
+        # ActivityLogger attivo: se presente, log_user_activity accoda invece di scrivere
+        self.activity_logger = None
+        
         self.logger.info(f"Database inizializzato: {self.db_path}")
         self.logger.info(f"Directory backup: {self.backup_dir}")
         
@@ -79,7 +260,33 @@ class AnnotationDBManager:
         Returns:
             DBContextManager instance
         """
-        return DBContextManager(self.db_path)
+        return DBContextManager(self.db_path, self.pool)
+    
+    @property
+    def schema(self) -> SchemaCapabilities:
+        """
+        Capacità dello schema corrente, calcolate una sola volta fino alla prossima migrazione.
+        """
+        schema = self._schema
+        if schema is None:
+            with self._schema_lock:
+                if self._schema is None:
+                    with self._get_db() as (conn, cursor):
+                        self._schema = SchemaCapabilities.introspect(cursor)
+                schema = self._schema
+        return schema
+    
+    def invalidate_schema_cache(self) -> None:
+        """
+        Scarta le capacità dello schema (chiamato da MigrationManager dopo le migrazioni).
+        """
+        self._schema = None
+    
+    def close(self) -> None:
+        """
+        Chiude le connessioni persistenti del pool.
+        """
+        self.pool.close()
     
     def _init_db(self) -> None:
         """
@@ -158,15 +365,32 @@ class AnnotationDBManager:
             # Crea indici per migliorare le prestazioni
             try:
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_annotations_doc_id ON annotations(doc_id)")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_annotations_doc_start ON annotations(doc_id, start)")
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_annotations_created_by ON annotations(created_by)")
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_annotations_type ON annotations(type)")
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_activity_user_id ON user_activity(user_id)")
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_activity_timestamp ON user_activity(timestamp)")
+                # Indici della paginazione per chiave di list_documents (vedi LISTING_DATE)
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_documents_listing ON documents({LISTING_DATE}, id)")
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_documents_assigned_listing ON documents(assigned_to, {LISTING_DATE}, id)")
             except Exception as e:
                 log.warning(f"Impossibile creare alcuni indici: {e}")
             
-            conn.commit()
+            # Statistiche materializzate; i trigger usano annotations.created_by, che nei
+            # database più vecchi viene aggiunta dalla migrazione 001 (che poi le crea)
+            cursor.execute("PRAGMA table_info(annotations)")
+            if any(col[1] == 'created_by' for col in cursor.fetchall()):
+                ensure_stats_schema(cursor)
+            
+            # Indici di ricerca full-text (richiedono SQLite con FTS5)
+            try:
+                ensure_search_schema(cursor)
+            except sqlite3.OperationalError as e:
+                log.warning(f"Ricerca full-text non disponibile: {e}")
+            
             log.debug("Schema del database inizializzato")
+        
+        self.invalidate_schema_cache()
        
     #--- Operazioni di gestione degli utenti ----
     def create_user(self, user_data: dict) -> dict:
@@ -214,7 +438,6 @@ class AnnotationDBManager:
                         user_data['date_created']
                     )
                 )
-                conn.commit()
                 logger.debug(f"Utente creato: {user_data['username']}")
                 
                 # Non restituire la password
@@ -268,7 +491,6 @@ class AnnotationDBManager:
                         "UPDATE users SET date_last_login = ? WHERE id = ?",
                         (now, user['id'])
                     )
-                    conn.commit()
             except Exception as e:
                 self.logger.error(f"Error updating last login time: {e}")
                 # Non bloccare il login se l'aggiornamento fallisce
@@ -338,7 +560,6 @@ class AnnotationDBManager:
                     f"UPDATE users SET {', '.join(set_clauses)} WHERE id = ?",
                     tuple(values)
                 )
-                conn.commit()
                 return True
         except Exception as e:
             logger.error(f"Errore nell'aggiornamento dell'utente: {e}")
@@ -382,39 +603,81 @@ class AnnotationDBManager:
             details: Dettagli aggiuntivi (opzionale)
                 
         Returns:
-            True se registrato con successo, False altrimenti
+            True se registrato (o accodato) con successo, False altrimenti
         """
+        activity_logger = self.activity_logger
+        if activity_logger is not None:
+            activity_logger.log(user_id, action_type, document_id, annotation_id, details)
+            return True
         try:
-            now = datetime.datetime.now().isoformat()
-            activity_id = f"act_{int(datetime.datetime.now().timestamp())}"
-            
             with self._get_db() as (conn, cursor):
-                cursor.execute(
-                    """
-                    INSERT INTO user_activity 
-                    (id, user_id, action_type, document_id, annotation_id, timestamp, details)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        activity_id,
-                        user_id,
-                        action_type,
-                        document_id,
-                        annotation_id,
-                        now,
-                        details
-                    )
-                )
-                conn.commit()
+                self._insert_activity(cursor, user_id, action_type, document_id, annotation_id, details)
                 return True
         except Exception as e:
             logger.error(f"Errore nella registrazione dell'attività: {e}")
             return False
     
+    def insert_activity_rows(self, rows: List[tuple]) -> int:
+        """
+        Scrive un blocco di righe di user_activity in un'unica transazione.
+        
+        Le righe già presenti (stesso ID) vengono ignorate, così un blocco può essere
+        riscritto senza duplicati.
+        
+        Args:
+            rows: Righe prodotte da _activity_row
+            
+        Returns:
+            Numero di righe inserite
+            
+        Raises:
+            sqlite3.Error: se la scrittura fallisce (la transazione viene annullata)
+        """
+        if not rows:
+            return 0
+        with self._get_db() as (conn, cursor):
+            cursor.executemany(INSERT_ACTIVITY_IGNORE, rows)
+            # rowcount esclude le righe scritte dai trigger delle statistiche
+            inserted = cursor.rowcount
+            return inserted
+    
+    @staticmethod
+    def _insert_activity(cursor: sqlite3.Cursor, user_id: str, action_type: str, document_id: str = None,
+                         annotation_id: str = None, details: str = None) -> None:
+        """
+        Inserisce una riga di attività con il cursore dato, nella transazione del chiamante.
+        """
+        cursor.execute(
+            INSERT_ACTIVITY,
+            AnnotationDBManager._activity_row(user_id, action_type, document_id, annotation_id, details)
+        )
+    
+    @staticmethod
+    def _activity_row(user_id: str, action_type: str, document_id: str = None,
+                      annotation_id: str = None, details: str = None, timestamp: str = None) -> tuple:
+        """
+        Valori di una riga di user_activity nell'ordine di INSERT_ACTIVITY.
+        """
+        # Un timestamp al secondo non basta: più attività nello stesso secondo collidevano
+        activity_id = f"act_{uuid.uuid4().hex}"
+        return (
+            activity_id,
+            user_id,
+            action_type,
+            document_id,
+            annotation_id,
+            timestamp or datetime.datetime.now().isoformat(),
+            details
+        )
+    
     def get_user_stats(self, user_id: str = None, days: int = 30) -> dict:
         """
         Ottiene statistiche sull'attività di un utente.
         
+        Le statistiche sono lette dalle tabelle stats_* mantenute dai trigger (vedi
+        db_stats), con granularità giornaliera: il periodo comprende gli ultimi `days`
+        giorni interi.
+        
         Args:
             user_id: ID dell'utente (opzionale, se None restituisce per tutti gli utenti)
             days: Numero di giorni precedenti da considerare
@@ -424,140 +687,107 @@ class AnnotationDBManager:
         """
         try:
             with self._get_db() as (conn, cursor):
-                # Data limite per il periodo
-                date_limit = (datetime.datetime.now() - datetime.timedelta(days=days)).isoformat()
+                # Primo giorno del periodo
+                day_limit = (datetime.date.today() - datetime.timedelta(days=days)).isoformat()
                 
-                stats = {}
-                
-                # Query base con il filtro della data
-                base_query = f"WHERE timestamp > '{date_limit}'"
-                
-                # Aggiungi filtro utente se specificato
+                # Filtro comune a tutte le tabelle giornaliere
+                where = "WHERE day >= ?"
+                params: List[Any] = [day_limit]
                 if user_id:
-                    base_query += f" AND user_id = '{user_id}'"
+                    where += " AND user_id = ?"
+                    params.append(user_id)
                 
-                # Conteggio totale annotazioni
-                try:
-                    # Check if created_by column exists in annotations table
-                    cursor.execute("PRAGMA table_info(annotations)")
-                    columns = cursor.fetchall()
-                    created_by_exists = any(col[1] == 'created_by' for col in columns)
-                    
-                    if created_by_exists:
-                        query = f"""
-                            SELECT COUNT(*) FROM annotations
-                            WHERE date_created > '{date_limit}'
-                            {"AND created_by = ?" if user_id else ""}
-                        """
-                        cursor.execute(query, (user_id,) if user_id else ())
-                    else:
-                        # Fallback if created_by column doesn't exist
-                        query = f"""
-                            SELECT COUNT(*) FROM annotations
-                            WHERE date_created > '{date_limit}'
-                        """
-                        cursor.execute(query)
-                        
-                    stats['total_annotations'] = cursor.fetchone()[0]
-                except Exception as e:
-                    self.logger.error(f"Errore nel conteggio delle annotazioni: {e}")
-                    stats['total_annotations'] = 0
+                stats = {}
                 
-                # Conteggio per tipo di entità
-                try:
-                    if created_by_exists and user_id:
-                        query = f"""
-                            SELECT type, COUNT(*) as count FROM annotations
-                            WHERE date_created > '{date_limit}'
-                            AND created_by = ?
-                            GROUP BY type
-                        """
-                        cursor.execute(query, (user_id,))
-                    else:
-                        query = f"""
-                            SELECT type, COUNT(*) as count FROM annotations
-                            WHERE date_created > '{date_limit}'
-                            GROUP BY type
-                        """
-                        cursor.execute(query)
-                        
-                    stats['annotations_by_type'] = {row['type']: row['count'] for row in cursor.fetchall()}
-                except Exception as e:
-                    self.logger.error(f"Errore nel conteggio dei tipi di entità: {e}")
-                    stats['annotations_by_type'] = {}
+                cursor.execute(f"SELECT type, SUM(count) AS count FROM stats_annotations_daily {where} GROUP BY type", params)
+                stats['annotations_by_type'] = {row['type']: row['count'] for row in cursor.fetchall()}
+                stats['total_annotations'] = sum(stats['annotations_by_type'].values())
                 
-                # Attività per giorno
-                try:
-                    cursor.execute(f"""
-                        SELECT substr(timestamp, 1, 10) as day, COUNT(*) as count
-                        FROM user_activity
-                        {base_query}
-                        GROUP BY day
-                        ORDER BY day
-                    """)
-                    stats['activity_by_day'] = {row['day']: row['count'] for row in cursor.fetchall()}
-                except Exception as e:
-                    self.logger.error(f"Errore nel recupero dell'attività per giorno: {e}")
-                    stats['activity_by_day'] = {}
+                cursor.execute(f"SELECT day, SUM(count) AS count FROM stats_activity_daily {where} GROUP BY day ORDER BY day", params)
+                stats['activity_by_day'] = {row['day']: row['count'] for row in cursor.fetchall()}
                 
-                # Conteggio attività per tipo di azione
-                try:
-                    cursor.execute(f"""
-                        SELECT action_type, COUNT(*) as count
-                        FROM user_activity
-                        {base_query}
-                        GROUP BY action_type
-                    """)
-                    stats['actions_by_type'] = {row['action_type']: row['count'] for row in cursor.fetchall()}
-                except Exception as e:
-                    self.logger.error(f"Errore nel conteggio dei tipi di azione: {e}")
-                    stats['actions_by_type'] = {}
+                cursor.execute(f"SELECT action_type, SUM(count) AS count FROM stats_activity_daily {where} GROUP BY action_type", params)
+                stats['actions_by_type'] = {row['action_type']: row['count'] for row in cursor.fetchall()}
                 
-                # Documenti modificati
-                try:
-                    cursor.execute(f"""
-                        SELECT COUNT(DISTINCT document_id) as count
-                        FROM user_activity
-                        WHERE document_id IS NOT NULL
-                        AND timestamp > '{date_limit}'
-                        {"AND user_id = ?" if user_id else ""}
-                    """, (user_id,) if user_id else ())
-                    stats['documents_modified'] = cursor.fetchone()[0]
-                except Exception as e:
-                    self.logger.error(f"Errore nel conteggio dei documenti modificati: {e}")
-                    stats['documents_modified'] = 0
+                cursor.execute(f"SELECT COUNT(DISTINCT document_id) FROM stats_activity_documents {where}", params)
+                stats['documents_modified'] = cursor.fetchone()[0]
                 
                 # Se richiedono statistiche globali (senza user_id specifico)
                 if not user_id:
-                    try:
-                        # Statistiche per utente
-                        # Check if annotations table has created_by column
-                        if created_by_exists:
-                            cursor.execute(f"""
-                                SELECT u.id, u.username, u.full_name, COUNT(a.id) as annotations_count
-                                FROM users u
-                                LEFT JOIN annotations a ON u.id = a.created_by AND a.date_created > '{date_limit}'
-                                GROUP BY u.id
-                                ORDER BY annotations_count DESC
-                            """)
-                        else:
-                            # Fallback if created_by column doesn't exist in annotations
-                            cursor.execute(f"""
-                                SELECT u.id, u.username, u.full_name, 0 as annotations_count
-                                FROM users u
-                                GROUP BY u.id
-                                ORDER BY u.username
-                            """)
-                        
-                        stats['users'] = [dict(row) for row in cursor.fetchall()]
-                    except Exception as e:
-                        self.logger.error(f"Errore nel recupero delle statistiche per utente: {e}")
-                        stats['users'] = []
+                    cursor.execute("""
+                        SELECT u.id, u.username, u.full_name, COALESCE(SUM(s.count), 0) AS annotations_count
+                        FROM users u
+                        LEFT JOIN stats_annotations_daily s ON s.user_id = u.id AND s.day >= ?
+                        GROUP BY u.id
+                        ORDER BY annotations_count DESC
+                    """, (day_limit,))
+                    stats['users'] = [dict(row) for row in cursor.fetchall()]
                 
                 return stats
         except Exception as e:
             logger.error(f"Errore nel recupero delle statistiche: {e}")
             return {}
+    
+    def get_annotation_stats(self) -> dict:
+        """
+        Ottiene le statistiche generali sulle annotazioni (per /api/annotation_stats).
+        
+        Returns:
+            Dizionario con 'general', 'entity_stats', 'document_stats' e 'temporal_stats'
+        """
+        with self._get_db() as (conn, cursor):
+            cursor.execute("""
+                SELECT COUNT(*) AS total_documents,
+                       COALESCE(SUM(annotation_count > 0), 0) AS annotated_documents
+                FROM stats_documents
+            """)
+            general = dict(cursor.fetchone())
+            
+            cursor.execute("SELECT type, count FROM stats_annotation_types ORDER BY type")
+            entity_stats = {row['type']: row['count'] for row in cursor.fetchall()}
+            general['total_annotations'] = sum(entity_stats.values())
+            general['annotation_coverage'] = (
+                general['annotated_documents'] / general['total_documents'] * 100
+                if general['total_documents'] > 0 else 0
+            )
+            
+            cursor.execute("""
+                SELECT doc_id AS id, COALESCE(title, 'Documento senza titolo') AS title,
+                       annotation_count, word_count
+                FROM stats_documents
+                WHERE annotation_count > 0
+            """)
+            document_stats = []
+            for row in cursor.fetchall():
+                doc = dict(row)
+                doc['word_count'] = doc['word_count'] or 0
+                doc['annotation_density'] = doc['annotation_count'] / (doc['word_count'] or 1) * 100
+                document_stats.append(doc)
+            
+            cursor.execute("""
+                SELECT day AS date, COUNT(*) AS documents, SUM(annotation_count) AS annotations
+                FROM stats_documents
+                WHERE day != ''
+                GROUP BY day
+                ORDER BY day
+            """)
+            temporal_stats = [dict(row) for row in cursor.fetchall()]
+        
+        return {
+            "general": general,
+            "entity_stats": entity_stats,
+            "document_stats": document_stats,
+            "temporal_stats": temporal_stats
+        }
+    
+    def rebuild_stats(self) -> None:
+        """
+        Ricalcola da zero le tabelle delle statistiche in un'unica transazione.
+        """
+        with self._get_db() as (conn, cursor):
+            ensure_stats_schema(cursor)
+            rebuild_stats_tables(cursor)
+        self.logger.info("Statistiche delle annotazioni ricostruite")
 
     def get_user_assignments(self, user_id: str) -> list:
         """
@@ -599,7 +829,6 @@ class AnnotationDBManager:
                     "UPDATE documents SET assigned_to = ? WHERE id = ?",
                     (user_id, doc_id)
                 )
-                conn.commit()
                 
                 # Log activity
                 self.log_user_activity(
@@ -614,6 +843,50 @@ class AnnotationDBManager:
             logger.error(f"Errore nell'assegnazione del documento: {e}")
             return False
 
+    def bulk_assign_documents(self, doc_ids: List[str], user_id: str, assigner_id: str) -> Dict[str, Any]:
+        """
+        Assegna più documenti a un utente in un'unica transazione.
+        
+        L'esistenza dei documenti è verificata con una sola query, l'assegnazione è un solo
+        UPDATE e le attività sono registrate con executemany.
+        
+        Args:
+            doc_ids: ID dei documenti (i duplicati sono ignorati)
+            user_id: ID dell'utente a cui assegnare
+            assigner_id: ID dell'utente che effettua l'assegnazione
+                
+        Returns:
+            Dizionario con 'assigned' (ID assegnati, nell'ordine della richiesta),
+            'not_found' (ID inesistenti) e 'previous_assignees' ({ID: assegnatario precedente})
+        """
+        requested = list(dict.fromkeys(doc_ids))
+        with self._get_db() as (conn, cursor):
+            cursor.execute(
+                "SELECT id, assigned_to FROM documents WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(requested),)
+            )
+            previous = {row['id']: row['assigned_to'] for row in cursor.fetchall()}
+            assigned = [doc_id for doc_id in requested if doc_id in previous]
+            
+            if assigned:
+                cursor.execute(
+                    "UPDATE documents SET assigned_to = ? WHERE id IN (SELECT value FROM json_each(?))",
+                    (user_id, json.dumps(assigned))
+                )
+                now = datetime.datetime.now().isoformat()
+                details = f"Documento assegnato all'utente {user_id}"
+                cursor.executemany(INSERT_ACTIVITY, [
+                    self._activity_row(assigner_id, "assign_document", doc_id, details=details, timestamp=now)
+                    for doc_id in assigned
+                ])
+        
+        logger.debug(f"Assegnati {len(assigned)} documenti a {user_id}")
+        return {
+            "assigned": assigned,
+            "not_found": [doc_id for doc_id in requested if doc_id not in previous],
+            "previous_assignees": {doc_id: previous[doc_id] for doc_id in assigned},
+        }
+
     def get_user_by_username(self, username: str) -> dict:
         """
         Ottiene un utente dal database tramite username.
@@ -641,9 +914,15 @@ class AnnotationDBManager:
     
     # ---- Operazioni di backup ----
     
-    def create_backup(self) -> str:
+    def create_backup(self, compress: bool = False) -> str:
             """
-            Crea un backup del database.
+            Crea un backup online del database con l'API di backup di sqlite3.
+            
+            La copia avviene a blocchi di pagine da una fotografia coerente del database,
+            senza bloccare le scritture concorrenti (vedi backup_service.backup_database).
+            
+            Args:
+                compress: True per comprimere il backup con gzip (.db.gz)
             
             Returns:
                 Percorso del file di backup
@@ -652,38 +931,30 @@ class AnnotationDBManager:
                 logger.warning("Impossibile creare backup: database non esistente")
                 return None
             
-            timestamp = int(datetime.datetime.now().timestamp())
-            backup_file = os.path.join(self.backup_dir, f"annotations_backup_{timestamp}.db")
-            
             try:
-                import shutil
-                shutil.copy2(self.db_path, backup_file)
+                backup_file = backup_database(self.db_path, self.backup_dir, compress=compress)
                 logger.info(f"Backup creato: {backup_file}")
                 return backup_file
             except Exception as e:
                 logger.error(f"Errore nella creazione del backup: {e}")
                 return None
     
-    def cleanup_backups(self, max_backups: int = 10) -> None:
+    def cleanup_backups(self, max_backups: int = KEEP_LAST, keep_daily: int = KEEP_DAILY,
+                        keep_weekly: int = KEEP_WEEKLY) -> None:
             """
-            Pulisce i vecchi backup mantenendo solo i più recenti.
+            Pulisce i vecchi backup secondo la politica di conservazione.
+            
+            Oltre ai max_backups più recenti si conserva l'ultimo backup di ciascuno degli
+            ultimi keep_daily giorni e di ciascuna delle ultime keep_weekly settimane.
             
             Args:
-                max_backups: Numero massimo di backup da mantenere
+                max_backups: Numero di backup più recenti da mantenere
+                keep_daily: Giorni per cui mantenere un backup giornaliero
+                keep_weekly: Settimane per cui mantenere un backup settimanale
             """
             try:
-                backup_files = []
-                for filename in os.listdir(self.backup_dir):
-                    if filename.startswith('annotations_backup_') and filename.endswith('.db'):
-                        filepath = os.path.join(self.backup_dir, filename)
-                        backup_files.append((filepath, os.path.getmtime(filepath)))
-                
-                backup_files.sort(key=lambda x: x[1], reverse=True)
-                
-                if len(backup_files) > max_backups:
-                    for filepath, _ in backup_files[max_backups:]:
-                        os.remove(filepath)
-                        logger.debug(f"Backup rimosso: {filepath}")
+                apply_retention(self.backup_dir, keep_last=max_backups,
+                                keep_daily=keep_daily, keep_weekly=keep_weekly)
             except Exception as e:
                 logger.error(f"Errore nella pulizia dei backup: {e}")
     
@@ -744,6 +1015,259 @@ class AnnotationDBManager:
             self.logger.exception(e)
             return []
 
+    @staticmethod
+    def encode_listing_cursor(date_created: str, doc_id: str) -> str:
+        """
+        Codifica la posizione (date_created, id) dell'ultimo documento di una pagina.
+        """
+        raw = json.dumps([date_created, doc_id]).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+    
+    @staticmethod
+    def decode_listing_cursor(cursor_token: str) -> Tuple[str, str]:
+        """
+        Decodifica un cursore prodotto da encode_listing_cursor.
+        
+        Raises:
+            ValueError: se il cursore non è valido
+        """
+        try:
+            date_created, doc_id = json.loads(base64.urlsafe_b64decode(cursor_token.encode('ascii')))
+        except Exception as e:
+            raise ValueError(f"Cursore di paginazione non valido: {cursor_token}") from e
+        return date_created, doc_id
+    
+    def list_documents(self, status: str = None, assigned_to: str = None, limit: int = 50,
+                       cursor_token: str = None) -> Dict[str, Any]:
+        """
+        Elenca i documenti dal più recente, una pagina alla volta, con il numero di annotazioni.
+        
+        La paginazione è per chiave (date_created, id), con i documenti senza data in
+        fondo: ogni pagina parte dalla posizione dell'ultimo documento della precedente,
+        quindi il costo non cresce con il numero di pagine già lette. I conteggi sono
+        calcolati con GROUP BY sui soli documenti della pagina e il testo completo non
+        viene letto.
+        
+        Args:
+            status: Filtra per stato (pending, completed, skipped)
+            assigned_to: Filtra per utente assegnato
+            limit: Numero massimo di documenti nella pagina
+            cursor_token: Cursore restituito dalla pagina precedente (None per la prima)
+            
+        Returns:
+            Dizionario con 'documents' (senza 'text', con 'annotation_count') e
+            'next_cursor' (None se non ci sono altre pagine)
+            
+        Raises:
+            ValueError: se il cursore non è valido
+        """
+        schema = self.schema
+        conditions = []
+        params: List[Any] = []
+        
+        if status and schema.has('documents', 'status'):
+            conditions.append("status = ?")
+            params.append(status)
+        if assigned_to:
+            conditions.append("assigned_to = ?")
+            params.append(assigned_to)
+        if cursor_token:
+            last_date, last_id = self.decode_listing_cursor(cursor_token)
+            last_date = last_date or ''
+            # Il primo confronto, ridondante, permette la ricerca per intervallo sull'indice
+            conditions.append(f"{LISTING_DATE} <= ? AND ({LISTING_DATE} < ? OR ({LISTING_DATE} = ? AND id < ?))")
+            params.extend([last_date, last_date, last_date, last_id])
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        columns = ', '.join(schema.document_listing_columns)
+        page_columns = ', '.join(f"page.{col}" for col in schema.document_listing_columns)
+        # Una riga in più per sapere se esiste una pagina successiva
+        params.append(limit + 1)
+        
+        with self._get_db() as (conn, cursor):
+            cursor.execute(f"""
+                WITH page AS (
+                    SELECT {columns} FROM documents
+                    {where}
+                    ORDER BY {LISTING_DATE} DESC, id DESC
+                    LIMIT ?
+                )
+                SELECT {page_columns}, COUNT(a.doc_id) AS annotation_count
+                FROM page
+                LEFT JOIN annotations a ON a.doc_id = page.id
+                GROUP BY page.id
+                ORDER BY COALESCE(page.date_created, '') DESC, page.id DESC
+            """, params)
+            rows = cursor.fetchall()
+        
+        documents = []
+        for row in rows[:limit]:
+            doc = dict(row)
+            if doc.get('metadata'):
+                try:
+                    doc['metadata'] = json.loads(doc['metadata'])
+                except json.JSONDecodeError:
+                    self.logger.warning(f"Error decoding metadata for document {doc['id']}")
+                    doc['metadata'] = {}
+            else:
+                doc['metadata'] = {}
+            documents.append(doc)
+        
+        next_cursor = None
+        if len(rows) > limit:
+            last = documents[-1]
+            next_cursor = self.encode_listing_cursor(last['date_created'], last['id'])
+        
+        return {"documents": documents, "next_cursor": next_cursor}
+
+    # ---- Ricerca full-text ----
+
+    @staticmethod
+    def _search_page(rows: List[sqlite3.Row], limit: int, offset: int, markup: Tuple[str, ...]) -> Dict[str, Any]:
+        results = []
+        for row in rows[:limit]:
+            result = dict(row)
+            # bm25 è negativo, più basso per i risultati migliori
+            result['score'] = round(-result['score'], 4)
+            for key in markup:
+                result[key] = render_highlight(result[key])
+            results.append(result)
+        next_offset = offset + limit if len(rows) > limit else None
+        return {"results": results, "next_offset": next_offset}
+
+    def search_documents(self, query: str, status: str = None, entity_type: str = None,
+                         assigned_to: str = None, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        """
+        Cerca nel titolo e nel testo dei documenti, in ordine di rilevanza (BM25).
+
+        La query interna ordina e pagina solo rowid e punteggio; titolo evidenziato e
+        snippet sono calcolati dopo, per i soli documenti della pagina.
+
+        Args:
+            query: Testo cercato (vedi db_search.build_match_query)
+            status: Filtra per stato del documento
+            entity_type: Solo documenti con almeno un'annotazione di questo tipo
+            assigned_to: Filtra per utente assegnato
+            limit: Numero massimo di risultati
+            offset: Risultati da saltare (next_offset della pagina precedente)
+
+        Returns:
+            Dizionario con 'results' (con 'title_highlight' e 'snippet' in HTML con <mark>
+            e 'score') e 'next_offset' (None se non ci sono altre pagine)
+
+        Raises:
+            ValueError: se la ricerca non contiene termini
+        """
+        schema = self.schema
+        conditions = ["search_documents MATCH ?"]
+        params: List[Any] = [build_match_query(query)]
+
+        has_status = schema.has('documents', 'status')
+        if status and has_status:
+            conditions.append("d.status = ?")
+            params.append(status)
+        if assigned_to:
+            conditions.append("d.assigned_to = ?")
+            params.append(assigned_to)
+        if entity_type:
+            # Lista calcolata una volta sola: un EXISTS correlato scandirebbe le annotazioni
+            # del tipo per ogni documento trovato
+            conditions.append("d.id IN (SELECT doc_id FROM annotations WHERE type = ?)")
+            params.append(entity_type)
+        # Una riga in più per sapere se esiste una pagina successiva
+        params.extend([limit + 1, offset])
+        params.extend([MATCH_START, MATCH_END, MATCH_START, MATCH_END, ELLIPSIS, SEARCH_SNIPPET_TOKENS, params[0]])
+        status_column = ", d.status" if has_status else ""
+
+        with self._get_db() as (conn, cursor):
+            cursor.execute(f"""
+                WITH hits AS (
+                    SELECT search_documents.rowid AS hit_rowid,
+                           bm25(search_documents, {SEARCH_TITLE_WEIGHT}, 1.0) AS score
+                    FROM search_documents
+                    JOIN documents d ON d.rowid = search_documents.rowid
+                    WHERE {' AND '.join(conditions)}
+                    ORDER BY score
+                    LIMIT ? OFFSET ?
+                )
+                SELECT d.id, d.title, d.word_count, d.date_created, d.assigned_to{status_column},
+                       highlight(search_documents, 0, ?, ?) AS title_highlight,
+                       snippet(search_documents, 1, ?, ?, ?, ?) AS snippet,
+                       hits.score
+                FROM hits
+                JOIN search_documents ON search_documents.rowid = hits.hit_rowid
+                JOIN documents d ON d.rowid = hits.hit_rowid
+                WHERE search_documents MATCH ?
+                ORDER BY hits.score
+            """, params)
+            rows = cursor.fetchall()
+
+        return self._search_page(rows, limit, offset, ('title_highlight', 'snippet'))
+
+    def search_annotations(self, query: str, entity_type: str = None, status: str = None,
+                           assigned_to: str = None, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        """
+        Cerca nel testo dei segmenti annotati, in ordine di rilevanza (BM25).
+
+        Args:
+            query: Testo cercato (vedi db_search.build_match_query)
+            entity_type: Filtra per tipo di entità
+            status: Filtra per stato del documento
+            assigned_to: Filtra per utente assegnato al documento
+            limit: Numero massimo di risultati
+            offset: Risultati da saltare (next_offset della pagina precedente)
+
+        Returns:
+            Dizionario con 'results' (annotazioni con 'document_title', 'text_highlight'
+            in HTML con <mark> e 'score') e 'next_offset' (None se non ci sono altre pagine)
+
+        Raises:
+            ValueError: se la ricerca non contiene termini
+        """
+        schema = self.schema
+        conditions = ["search_annotations MATCH ?"]
+        params: List[Any] = [build_match_query(query)]
+
+        has_status = schema.has('documents', 'status')
+        if entity_type:
+            conditions.append("a.type = ?")
+            params.append(entity_type)
+        if status and has_status:
+            conditions.append("d.status = ?")
+            params.append(status)
+        if assigned_to:
+            conditions.append("d.assigned_to = ?")
+            params.append(assigned_to)
+        params.extend([limit + 1, offset])
+        params.extend([MATCH_START, MATCH_END, params[0]])
+        status_column = ", d.status AS document_status" if has_status else ""
+
+        with self._get_db() as (conn, cursor):
+            cursor.execute(f"""
+                WITH hits AS (
+                    SELECT search_annotations.rowid AS hit_rowid, bm25(search_annotations) AS score
+                    FROM search_annotations
+                    JOIN annotations a ON a.rowid = search_annotations.rowid
+                    JOIN documents d ON d.id = a.doc_id
+                    WHERE {' AND '.join(conditions)}
+                    ORDER BY score
+                    LIMIT ? OFFSET ?
+                )
+                SELECT a.id, a.doc_id, a.start, a.end, a.text, a.type,
+                       d.title AS document_title{status_column},
+                       highlight(search_annotations, 0, ?, ?) AS text_highlight,
+                       hits.score
+                FROM hits
+                JOIN search_annotations ON search_annotations.rowid = hits.hit_rowid
+                JOIN annotations a ON a.rowid = hits.hit_rowid
+                JOIN documents d ON d.id = a.doc_id
+                WHERE search_annotations MATCH ?
+                ORDER BY hits.score
+            """, params)
+            rows = cursor.fetchall()
+
+        return self._search_page(rows, limit, offset, ('text_highlight',))
+
     def get_document(self, doc_id: str) -> Dict[str, Any]:
         """
         Ottiene un documento specifico dal database.
@@ -755,16 +1279,9 @@ class AnnotationDBManager:
             Documento o None se non trovato
         """
         try:
+            schema = self.schema
             with self._get_db() as (conn, cursor):
-                # Verifica se la tabella ha la colonna metadata
-                cursor.execute("PRAGMA table_info(documents)")
-                columns = [col[1] for col in cursor.fetchall()]
-                
-                # Adatta la query in base alle colonne disponibili
-                if 'metadata' in columns:
-                    cursor.execute("SELECT * FROM documents WHERE id = ?", (doc_id,))
-                else:
-                    cursor.execute("SELECT id, title, text, word_count, date_created, date_modified, created_by, assigned_to FROM documents WHERE id = ?", (doc_id,))
+                cursor.execute(schema.select_document, (doc_id,))
                 
                 row = cursor.fetchone()
                 if not row:
@@ -820,52 +1337,26 @@ class AnnotationDBManager:
                     # Se c'è un errore, mettiamo None per evitare problemi nel database
                     metadata_json = None
             
+            values = {
+                'id': document['id'],
+                'title': document['title'],
+                'text': document['text'],
+                'word_count': document.get('word_count', 0),
+                'date_created': document['date_created'],
+                'date_modified': document['date_modified'],
+                'created_by': document.get('created_by', user_id),
+                'assigned_to': document.get('assigned_to'),
+                'metadata': metadata_json
+            }
+            
+            schema = self.schema
             with self._get_db() as (conn, cursor):
-                # Verifica se la tabella ha la colonna metadata
-                cursor.execute("PRAGMA table_info(documents)")
-                columns = [col[1] for col in cursor.fetchall()]
-                
-                # Se la colonna metadata esiste
-                if 'metadata' in columns:
-                    cursor.execute(
-                        """
-                        INSERT OR REPLACE INTO documents 
-                        (id, title, text, word_count, date_created, date_modified, created_by, assigned_to, metadata)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """,
-                        (
-                            document['id'],
-                            document['title'],
-                            document['text'],
-                            document.get('word_count', 0),
-                            document['date_created'],
-                            document['date_modified'],
-                            document.get('created_by', user_id),
-                            document.get('assigned_to'),
-                            metadata_json
-                        )
-                    )
-                else:
-                    # Fallback se la colonna non esiste
-                    cursor.execute(
-                        """
-                        INSERT OR REPLACE INTO documents 
-                        (id, title, text, word_count, date_created, date_modified, created_by, assigned_to)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                        """,
-                        (
-                            document['id'],
-                            document['title'],
-                            document['text'],
-                            document.get('word_count', 0),
-                            document['date_created'],
-                            document['date_modified'],
-                            document.get('created_by', user_id),
-                            document.get('assigned_to')
-                        )
-                    )
+                # Le colonne dipendono dallo schema (metadata è aggiunta da una migrazione)
+                cursor.execute(
+                    schema.upsert_document,
+                    tuple(values[column] for column in schema.document_upsert_columns)
+                )
                 
-                conn.commit()
                 self.logger.debug(f"Documento salvato: {document['id']}")
                 
                 # Log activity
@@ -899,13 +1390,73 @@ class AnnotationDBManager:
                 cursor.execute("DELETE FROM annotations WHERE doc_id = ?", (doc_id,))
                 # Poi elimina il documento
                 cursor.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
-                conn.commit()
                 logger.debug(f"Documento eliminato: {doc_id}")
                 return True
         except Exception as e:
             logger.error(f"Errore nell'eliminazione del documento: {e}")
             return False
     
+    def bulk_delete_documents(self, doc_ids: List[str], user_id: str = None, is_admin: bool = False) -> Dict[str, Any]:
+        """
+        Elimina più documenti e le loro annotazioni in un'unica transazione.
+        
+        Permessi, conteggio delle annotazioni, cancellazioni e log delle attività sono poche
+        istruzioni sull'intero insieme di ID invece di una connessione e un commit per
+        documento. Chi non è admin può eliminare solo i documenti che ha creato o che gli
+        sono assegnati; gli altri sono riportati in 'forbidden' e non vengono toccati.
+        
+        Args:
+            doc_ids: ID dei documenti (i duplicati sono ignorati)
+            user_id: ID dell'utente che elimina (registrato nelle attività)
+            is_admin: True se l'utente può eliminare qualsiasi documento
+            
+        Returns:
+            Dizionario con 'deleted' (ID eliminati, nell'ordine della richiesta), 'not_found',
+            'forbidden' e 'annotations_deleted' ({ID: annotazioni eliminate})
+        """
+        requested = list(dict.fromkeys(doc_ids))
+        with self._get_db() as (conn, cursor):
+            cursor.execute(
+                """
+                SELECT d.id, d.created_by, d.assigned_to, COUNT(a.doc_id) AS annotation_count
+                FROM documents d
+                LEFT JOIN annotations a ON a.doc_id = d.id
+                WHERE d.id IN (SELECT value FROM json_each(?))
+                GROUP BY d.id
+                """,
+                (json.dumps(requested),)
+            )
+            found = {row['id']: dict(row) for row in cursor.fetchall()}
+            
+            deleted, forbidden = [], []
+            for doc_id in requested:
+                document = found.get(doc_id)
+                if document is None:
+                    continue
+                if is_admin or (user_id is not None and user_id in (document['created_by'], document['assigned_to'])):
+                    deleted.append(doc_id)
+                else:
+                    forbidden.append(doc_id)
+            
+            if deleted:
+                targets = (json.dumps(deleted),)
+                cursor.execute("DELETE FROM annotations WHERE doc_id IN (SELECT value FROM json_each(?))", targets)
+                cursor.execute("DELETE FROM documents WHERE id IN (SELECT value FROM json_each(?))", targets)
+                if user_id:
+                    now = datetime.datetime.now().isoformat()
+                    cursor.executemany(INSERT_ACTIVITY, [
+                        self._activity_row(user_id, "delete_document", doc_id, timestamp=now)
+                        for doc_id in deleted
+                    ])
+        
+        logger.debug(f"Eliminati {len(deleted)} documenti in blocco")
+        return {
+            "deleted": deleted,
+            "not_found": [doc_id for doc_id in requested if doc_id not in found],
+            "forbidden": forbidden,
+            "annotations_deleted": {doc_id: found[doc_id]['annotation_count'] for doc_id in deleted},
+        }
+    
     def update_document(self, doc_id: str, updates: Dict[str, Any]) -> bool:
         """
         Aggiorna un documento esistente.
@@ -1110,6 +1661,13 @@ class AnnotationDBManager:
         annotations = self.get_annotations(doc_id)
         return annotations.get(doc_id, [])
     
+    @staticmethod
+    def _new_annotation_id(doc_id: str) -> str:
+        """
+        Genera un ID di annotazione univoco anche per annotazioni create nello stesso istante.
+        """
+        return f"ann_{doc_id}_{uuid.uuid4().hex}"
+    
     def save_annotation(self, doc_id: str, annotation: Dict[str, Any], user_id: str = None) -> Dict[str, Any]:
         """
         Salva un'annotazione nel database.
@@ -1127,7 +1685,7 @@ class AnnotationDBManager:
             
             # Genera un ID se non presente
             if 'id' not in annotation or not annotation['id']:
-                annotation['id'] = f"ann_{doc_id}_{int(datetime.datetime.now().timestamp())}"
+                annotation['id'] = self._new_annotation_id(doc_id)
             
             # Aggiungi date se non presenti
             if 'date_created' not in annotation:
@@ -1164,7 +1722,6 @@ class AnnotationDBManager:
                         annotation.get('created_by')
                     )
                 )
-                conn.commit()
                 logger.debug(f"Annotazione salvata: {annotation['id']} per doc {doc_id}")
                 
                 # Log activity
@@ -1195,7 +1752,6 @@ class AnnotationDBManager:
         try:
             with self._get_db() as (conn, cursor):
                 cursor.execute("DELETE FROM annotations WHERE id = ?", (annotation_id,))
-                conn.commit()
                 logger.debug(f"Annotazione eliminata: {annotation_id}")
                 return True
         except Exception as e:
@@ -1221,7 +1777,6 @@ class AnnotationDBManager:
                 else:
                     cursor.execute("DELETE FROM annotations WHERE doc_id = ?", (doc_id,))
                     logger.debug(f"Tutte le annotazioni eliminate per doc {doc_id}")
-                conn.commit()
                 return True
         except Exception as e:
             logger.error(f"Errore nell'eliminazione delle annotazioni: {e}")
@@ -1229,6 +1784,58 @@ class AnnotationDBManager:
     
     # ---- Esportazione dati ----
     
+    def iter_export_documents(self, fetch_size: int = EXPORT_FETCH_SIZE
+                              ) -> Iterator[Tuple[str, Optional[str], List[Dict[str, Any]]]]:
+        """
+        Scorre le annotazioni raggruppate per documento, con il testo del documento.
+        
+        Usa una sola query ordinata (annotazioni unite ai documenti) letta a blocchi
+        di fetch_size righe, quindi la memoria resta limitata a un documento alla volta
+        e non servono letture separate per ogni documento.
+        
+        Args:
+            fetch_size: Righe lette dal cursore per ogni blocco
+            
+        Yields:
+            (doc_id, testo del documento o None se il documento non esiste, annotazioni)
+        """
+        columns = ', '.join(f"a.{col}" for col in self.schema.columns['annotations'])
+        with self._get_db() as (conn, cursor):
+            cursor.execute(f"""
+                SELECT {columns}, d.text AS document_text
+                FROM annotations a
+                LEFT JOIN documents d ON d.id = a.doc_id
+                ORDER BY a.doc_id, a.start
+            """)
+            
+            current_id = None
+            current_text = None
+            current_annotations: List[Dict[str, Any]] = []
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    annotation = dict(row)
+                    document_text = annotation.pop('document_text')
+                    if annotation['doc_id'] != current_id:
+                        if current_annotations:
+                            yield current_id, current_text, current_annotations
+                        current_id, current_text, current_annotations = annotation['doc_id'], document_text, []
+                    
+                    # Converti il metadata da JSON a dizionario
+                    if annotation.get('metadata'):
+                        try:
+                            annotation['metadata'] = json.loads(annotation['metadata'])
+                        except json.JSONDecodeError:
+                            annotation['metadata'] = {}
+                    else:
+                        annotation['metadata'] = {}
+                    current_annotations.append(annotation)
+            
+            if current_annotations:
+                yield current_id, current_text, current_annotations
+    
     def export_json(self) -> Dict[str, List[Dict[str, Any]]]:
         """
         Esporta tutte le annotazioni in formato JSON.
@@ -1236,7 +1843,7 @@ class AnnotationDBManager:
         Returns:
             Dizionario con le annotazioni in formato compatibile con il formato JSON dell'app
         """
-        return self.get_annotations()
+        return {doc_id: annotations for doc_id, _, annotations in self.iter_export_documents()}
     
     def export_spacy(self) -> List[Dict[str, Any]]:
         """
@@ -1245,41 +1852,147 @@ class AnnotationDBManager:
         Returns:
             Lista di documenti con entità in formato spaCy
         """
-        spacy_data = []
-        annotations = self.get_annotations()
+        return [
+            {"text": text, "entities": [(ann['start'], ann['end'], ann['type']) for ann in annotations]}
+            for _, text, annotations in self.iter_export_documents()
+            if text is not None
+        ]
+    
+    def validate_import(self, annotations_json: Dict[str, List[Dict[str, Any]]]) -> Tuple[List[tuple], List[str]]:
+        """
+        Valida in memoria un'importazione e prepara le righe da inserire.
         
-        for doc_id, doc_annotations in annotations.items():
-            document = self.get_document(doc_id)
-            if document:
-                text = document['text']
-                entities = []
+        Gli ID mancanti vengono generati nelle righe, senza modificare l'input; i documenti
+        referenziati devono esistere e gli ID non possono ripetersi nell'importazione.
+        
+        Args:
+            annotations_json: Dizionario {doc_id: [annotazioni]}
+            
+        Returns:
+            (righe per la tabella annotations, lista degli errori)
+        """
+        rows = []
+        errors = []
+        seen_ids = set()
+        now = datetime.datetime.now().isoformat()
+        
+        doc_ids = [doc_id for doc_id in annotations_json if doc_id]
+        existing_docs = set()
+        with self._get_db() as (conn, cursor):
+            # Verifica l'esistenza dei documenti a blocchi, entro il limite di parametri di SQLite
+            for i in range(0, len(doc_ids), 500):
+                chunk = doc_ids[i:i + 500]
+                cursor.execute(
+                    f"SELECT id FROM documents WHERE id IN ({', '.join('?' for _ in chunk)})", chunk
+                )
+                existing_docs.update(row[0] for row in cursor.fetchall())
+        
+        for doc_id, annotations in annotations_json.items():
+            if doc_id not in existing_docs:
+                errors.append(f"Documento non trovato: {doc_id}")
+                continue
+            if not isinstance(annotations, list):
+                errors.append(f"Le annotazioni del documento {doc_id} devono essere una lista")
+                continue
+            for position, annotation in enumerate(annotations):
+                where = f"{doc_id}[{position}]"
+                if not isinstance(annotation, dict):
+                    errors.append(f"{where}: l'annotazione deve essere un oggetto")
+                    continue
+                missing = [key for key in ('start', 'end', 'text', 'type') if annotation.get(key) in (None, '')]
+                if missing:
+                    errors.append(f"{where}: campi mancanti {', '.join(missing)}")
+                    continue
+                start, end = annotation['start'], annotation['end']
+                if not isinstance(start, int) or not isinstance(end, int) or isinstance(start, bool) or isinstance(end, bool):
+                    errors.append(f"{where}: start ed end devono essere interi")
+                    continue
+                if start < 0 or end <= start:
+                    errors.append(f"{where}: intervallo non valido ({start}, {end})")
+                    continue
                 
-                for ann in doc_annotations:
-                    entities.append((ann['start'], ann['end'], ann['type']))
+                annotation_id = annotation.get('id') or self._new_annotation_id(doc_id)
+                if annotation_id in seen_ids:
+                    errors.append(f"{where}: ID duplicato {annotation_id}")
+                    continue
+                seen_ids.add(annotation_id)
                 
-                spacy_data.append({"text": text, "entities": entities})
+                metadata = annotation.get('metadata')
+                rows.append((
+                    annotation_id,
+                    doc_id,
+                    start,
+                    end,
+                    annotation['text'],
+                    annotation['type'],
+                    json.dumps(metadata) if metadata else None,
+                    annotation.get('date_created') or now,
+                    now,
+                    annotation.get('created_by')
+                ))
         
-        return spacy_data
+        return rows, errors
     
-    def import_from_json(self, annotations_json: Dict[str, List[Dict[str, Any]]]) -> bool:
+    def bulk_import_annotations(self, annotations_json: Dict[str, List[Dict[str, Any]]], user_id: str = None,
+                                batch_size: int = IMPORT_BATCH_SIZE) -> Dict[str, Any]:
+        """
+        Importa annotazioni in blocco in un'unica transazione.
+        
+        L'input viene validato interamente prima di scrivere: in caso di errori non viene
+        importato nulla. Le righe sono inserite con executemany a blocchi di batch_size e
+        l'importazione registra una sola attività riepilogativa.
+        
+        Args:
+            annotations_json: Dizionario {doc_id: [annotazioni]}
+            user_id: ID dell'utente che esegue l'importazione (opzionale)
+            batch_size: Righe per ogni executemany
+            
+        Returns:
+            Dizionario con 'success', 'imported', 'documents' ed 'errors'
+        """
+        rows, errors = self.validate_import(annotations_json)
+        if errors:
+            logger.warning(f"Importazione rifiutata: {len(errors)} annotazioni non valide")
+            return {"success": False, "imported": 0, "documents": 0, "errors": errors}
+        
+        documents = len({row[1] for row in rows})
+        with self._get_db() as (conn, cursor):
+            for i in range(0, len(rows), batch_size):
+                cursor.executemany(
+                    """
+                    INSERT OR REPLACE INTO annotations
+                    (id, doc_id, start, end, text, type, metadata, date_created, date_modified, created_by)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    rows[i:i + batch_size]
+                )
+            if user_id:
+                self._insert_activity(
+                    cursor,
+                    user_id=user_id,
+                    action_type="import_annotations",
+                    details=json.dumps({"annotations": len(rows), "documents": documents})
+                )
+        
+        logger.info(f"Importate {len(rows)} annotazioni su {documents} documenti")
+        return {"success": True, "imported": len(rows), "documents": documents, "errors": []}
+    
+    def import_from_json(self, annotations_json: Dict[str, List[Dict[str, Any]]], user_id: str = None) -> bool:
         """
         Importa annotazioni da un dizionario in formato JSON.
         
         Args:
             annotations_json: Dizionario {doc_id: [annotazioni]}
+            user_id: ID dell'utente che esegue l'importazione (opzionale)
             
         Returns:
             True se importate con successo, False altrimenti
         """
         try:
-            with self._get_db() as (conn, cursor):
-                for doc_id, annotations in annotations_json.items():
-                    for annotation in annotations:
-                        self.save_annotation(doc_id, annotation)
-                
-                conn.commit()
-                logger.info(f"Importate {sum(len(anns) for anns in annotations_json.values())} annotazioni")
-                return True
+            result = self.bulk_import_annotations(annotations_json, user_id=user_id)
+            for error in result['errors'][:20]:
+                logger.warning(error)
+            return result['success']
         except Exception as e:
             logger.error(f"Errore nell'importazione delle annotazioni: {e}")
-            return False
\ No newline at end of file
+            return False
@@ -8,6 +8,8 @@ import os
 import sqlite3
 import logging
 import datetime
+import threading
+import weakref
 from pathlib import Path
 from typing import List, Dict, Callable, Any
 
@@ -18,6 +20,48 @@ handler = logging.StreamHandler()
 handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
 logger.addHandler(handler)
 
+# Callbacks to notify when migrations change the schema, keyed by database path
+_schema_listeners: Dict[str, List[weakref.ReferenceType]] = {}
+_listeners_lock = threading.Lock()
+
+
+def _listener_key(db_path) -> str:
+    return os.path.abspath(str(db_path))
+
+
+def register_schema_listener(db_path, callback: Callable[[], None]) -> None:
+    """
+    Register a callback invoked after migrations change the schema of db_path.
+
+    Bound methods are held weakly, so registering does not keep their owner alive.
+
+    Args:
+        db_path: Path to the SQLite database file
+        callback: Function without arguments (e.g. a cache invalidation method)
+    """
+    ref = weakref.WeakMethod(callback) if hasattr(callback, '__self__') else (lambda: callback)
+    with _listeners_lock:
+        _schema_listeners.setdefault(_listener_key(db_path), []).append(ref)
+
+
+def notify_schema_changed(db_path) -> None:
+    """
+    Invoke the schema listeners registered for db_path.
+
+    Args:
+        db_path: Path to the SQLite database file
+    """
+    key = _listener_key(db_path)
+    with _listeners_lock:
+        refs = _schema_listeners.get(key, [])
+        callbacks = [ref() for ref in refs]
+        # Drop references to managers that no longer exist
+        _schema_listeners[key] = [ref for ref, cb in zip(refs, callbacks) if cb is not None]
+    for callback in callbacks:
+        if callback is not None:
+            callback()
+
+
 class MigrationManager:
     """
     Manages database migrations to keep the schema updated.
@@ -58,6 +102,18 @@ class MigrationManager:
         "description": "Add a status column to the documents table",
         "function": self._migration_003_add_status_to_documents
     })
+
+        self.migrations.append({
+            "version": "004_add_annotation_stats",
+            "description": "Add trigger-maintained annotation statistics tables",
+            "function": self._migration_004_add_annotation_stats
+        })
+
+        self.migrations.append({
+            "version": "005_add_search_index",
+            "description": "Add trigger-maintained FTS5 search indexes on documents and annotations",
+            "function": self._migration_005_add_search_index
+        })
     
         logger.debug(f"Registered {len(self.migrations)} migrations.")
 
@@ -131,19 +187,23 @@ class MigrationManager:
         logger.info(f"Found {pending_count} pending migrations to apply")
         
         # Apply pending migrations
-        for migration in self.migrations:
-            version = migration['version']
-            if version not in applied_migrations:
-                logger.info(f"Applying migration: {version} - {migration['description']}")
-                try:
-                    # Run the migration function
-                    migration['function']()
-                    # Record the migration as applied
-                    self._record_migration(version, migration['description'])
-                    logger.info(f"Migration {version} applied successfully")
-                except Exception as e:
-                    logger.error(f"Error applying migration {version}: {e}")
-                    raise
+        try:
+            for migration in self.migrations:
+                version = migration['version']
+                if version not in applied_migrations:
+                    logger.info(f"Applying migration: {version} - {migration['description']}")
+                    try:
+                        # Run the migration function
+                        migration['function']()
+                        # Record the migration as applied
+                        self._record_migration(version, migration['description'])
+                        logger.info(f"Migration {version} applied successfully")
+                    except Exception as e:
+                        logger.error(f"Error applying migration {version}: {e}")
+                        raise
+        finally:
+            # Even a partial run may have altered tables: cached schema information is stale
+            notify_schema_changed(self.db_path)
         
         logger.info("All migrations applied successfully")
     
@@ -199,26 +259,60 @@ class MigrationManager:
             else:
                 logger.info("Column metadata already exists in documents table")
 
-    def _migration_003_add_status_to_documents(self, conn, cursor):
+    def _migration_003_add_status_to_documents(self):
         """Add status column to documents table for tracking completion state."""
-        self.logger.info("Running migration 003: Add status to documents")
-        
-        if not self._check_table_exists(cursor, 'documents'):
-            self.logger.error("Table 'documents' does not exist. Cannot apply migration 003.")
-            raise RuntimeError("Prerequisite table 'documents' missing for migration 003")
-
-        if not self._check_column_exists(cursor, 'documents', 'status'):
-            self.logger.info("Adding 'status' column to 'documents' table with default 'pending'")
-            cursor.execute("ALTER TABLE documents ADD COLUMN status TEXT DEFAULT 'pending'")
-            # Update existing rows to have the default status
-            cursor.execute("UPDATE documents SET status = 'pending' WHERE status IS NULL")
-            self.logger.info("Column 'status' added with default value 'pending'.")
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
             
-            # Create index for better query performance when filtering by status
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_status ON documents(status)")
-            self.logger.info("Index 'idx_documents_status' created.")
-        else:
-            self.logger.info("Column 'status' already exists in 'documents'.")
+            # Check if column already exists
+            cursor.execute("PRAGMA table_info(documents)")
+            columns = [col[1] for col in cursor.fetchall()]
+            
+            if not columns:
+                logger.error("Table 'documents' does not exist. Cannot apply migration 003.")
+                raise RuntimeError("Prerequisite table 'documents' missing for migration 003")
+            
+            if 'status' not in columns:
+                logger.info("Adding 'status' column to 'documents' table with default 'pending'")
+                cursor.execute("ALTER TABLE documents ADD COLUMN status TEXT DEFAULT 'pending'")
+                # Update existing rows to have the default status
+                cursor.execute("UPDATE documents SET status = 'pending' WHERE status IS NULL")
+                
+                # Create index for better query performance when filtering by status
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_status ON documents(status)")
+                conn.commit()
+                logger.info("Column 'status' added with default value 'pending'.")
+            else:
+                logger.info("Column 'status' already exists in 'documents'.")
+
+    def _migration_004_add_annotation_stats(self):
+        """Create the stats_* tables and triggers and populate them from existing data."""
+        # Imported here so the module still runs as a script (python db_migrations.py --db ...)
+        try:
+            from .db_stats import ensure_stats_schema
+        except ImportError:
+            from db_stats import ensure_stats_schema
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            if ensure_stats_schema(cursor):
+                logger.info("Annotation statistics tables created and populated")
+            else:
+                logger.info("Annotation statistics tables already exist")
+            conn.commit()
+
+    def _migration_005_add_search_index(self):
+        """Create the FTS5 search tables and triggers and index existing documents and annotations."""
+        try:
+            from .db_search import ensure_search_schema
+        except ImportError:
+            from db_search import ensure_search_schema
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            if ensure_search_schema(cursor):
+                logger.info("Full-text search indexes created and populated")
+            else:
+                logger.info("Full-text search indexes already exist")
+            conn.commit()
 
 def run_migrations(db_path: str):
     """
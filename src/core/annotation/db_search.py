@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+db_search.py
+Indici di ricerca full-text (SQLite FTS5) su documenti e annotazioni, mantenuti da trigger.
+
+Le tabelle virtuali sono "external content": non duplicano il testo ma indicizzano le
+righe di documents e annotations tramite il loro rowid, e i trigger aggiornano l'indice
+a ogni inserimento, modifica o cancellazione:
+
+* search_documents: titolo e testo dei documenti;
+* search_annotations: testo dei segmenti annotati.
+
+Come per le statistiche (db_stats), le connessioni che scrivono devono avere
+PRAGMA recursive_triggers=ON, perché INSERT OR REPLACE cancelli anche la vecchia riga
+dall'indice. VACUUM può rinumerare i rowid di tabelle senza INTEGER PRIMARY KEY: dopo
+un VACUUM, o in caso di dubbio, gli indici si ricostruiscono con:
+
+    python -m src.core.annotation.db_search --db percorso/annotations.db
+"""
+
+import html
+import logging
+import os
+import re
+import sqlite3
+
+# Setup del logger
+logger = logging.getLogger("db_search")
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+logger.addHandler(handler)
+
+# Tokenizzazione senza distinzione di maiuscole e accenti ("perché" trova "perche")
+TOKENIZE = "unicode61 remove_diacritics 2"
+
+SEARCH_TABLES = f'''
+CREATE VIRTUAL TABLE IF NOT EXISTS search_documents USING fts5(
+    title, text, content='documents', content_rowid='rowid', tokenize='{TOKENIZE}'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS search_annotations USING fts5(
+    text, content='annotations', content_rowid='rowid', tokenize='{TOKENIZE}'
+);
+'''
+
+# Con external content la cancellazione dall'indice richiede i valori indicizzati originali
+_DELETE_DOCUMENT = "INSERT INTO search_documents(search_documents, rowid, title, text) VALUES ('delete', OLD.rowid, OLD.title, OLD.text);"
+_INSERT_DOCUMENT = "INSERT INTO search_documents(rowid, title, text) VALUES (NEW.rowid, NEW.title, NEW.text);"
+_DELETE_ANNOTATION = "INSERT INTO search_annotations(search_annotations, rowid, text) VALUES ('delete', OLD.rowid, OLD.text);"
+_INSERT_ANNOTATION = "INSERT INTO search_annotations(rowid, text) VALUES (NEW.rowid, NEW.text);"
+
+SEARCH_TRIGGERS = {
+    "trg_search_documents_insert": f"AFTER INSERT ON documents BEGIN {_INSERT_DOCUMENT} END",
+    "trg_search_documents_delete": f"AFTER DELETE ON documents BEGIN {_DELETE_DOCUMENT} END",
+    "trg_search_documents_update": f"AFTER UPDATE OF title, text ON documents BEGIN {_DELETE_DOCUMENT} {_INSERT_DOCUMENT} END",
+    "trg_search_annotations_insert": f"AFTER INSERT ON annotations BEGIN {_INSERT_ANNOTATION} END",
+    "trg_search_annotations_delete": f"AFTER DELETE ON annotations BEGIN {_DELETE_ANNOTATION} END",
+    "trg_search_annotations_update": f"AFTER UPDATE OF text ON annotations BEGIN {_DELETE_ANNOTATION} {_INSERT_ANNOTATION} END",
+}
+
+# Marcatori dei termini trovati in snippet() e highlight(): caratteri di controllo che non
+# compaiono nei testi, sostituiti con <mark> dopo l'escape HTML (vedi render_highlight)
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+ELLIPSIS = "…"
+
+_QUERY_TERM = re.compile(r'"([^"]*)"(\*?)|(\S+)')
+
+
+def build_match_query(query: str) -> str:
+    """
+    Converte il testo cercato dall'utente in un'espressione MATCH di FTS5.
+
+    Ogni parola diventa un termine tra virgolette, così la punteggiatura dei testi giuridici
+    ("art. 2043", "c.c.") non viene interpretata come sintassi FTS5; le parole tra
+    virgolette doppie restano una frase e un asterisco finale indica una ricerca per
+    prefisso (risarc*). Tutti i termini devono essere presenti.
+
+    Args:
+        query: Testo cercato
+
+    Returns:
+        Espressione da passare a MATCH
+
+    Raises:
+        ValueError: se la ricerca non contiene termini
+    """
+    terms = []
+    for phrase, phrase_prefix, word in _QUERY_TERM.findall(query or ""):
+        if word:
+            prefix = word.endswith('*')
+            phrase, phrase_prefix = word.rstrip('*'), '*' if prefix else ''
+        # Solo i termini con almeno un carattere alfanumerico producono token
+        if not any(ch.isalnum() for ch in phrase):
+            continue
+        terms.append('"' + phrase.replace('"', '""') + '"' + phrase_prefix)
+    if not terms:
+        raise ValueError("La ricerca deve contenere almeno un termine.")
+    return " ".join(terms)
+
+
+def render_highlight(value: str) -> str:
+    """
+    Prepara per l'HTML il risultato di snippet() o highlight(): esegue l'escape del testo
+    e racchiude i termini trovati in <mark>.
+
+    Args:
+        value: Testo con i marcatori MATCH_START/MATCH_END
+
+    Returns:
+        HTML sicuro da inserire nella pagina
+    """
+    if value is None:
+        return None
+    return html.escape(value).replace(MATCH_START, "<mark>").replace(MATCH_END, "</mark>")
+
+
+def _run_script(cursor: sqlite3.Cursor, script: str) -> None:
+    # executescript farebbe COMMIT della transazione del chiamante: si eseguono le istruzioni una per una
+    for statement in script.split(';'):
+        if statement.strip():
+            cursor.execute(statement)
+
+
+def ensure_search_schema(cursor: sqlite3.Cursor) -> bool:
+    """
+    Crea tabelle FTS5 e trigger se mancano; se le tabelle sono nuove le popola.
+
+    Args:
+        cursor: Cursore su un database con le tabelle documents e annotations
+
+    Returns:
+        True se le tabelle sono state create (e quindi ricostruite)
+
+    Raises:
+        sqlite3.OperationalError: se SQLite è compilato senza FTS5
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_documents'")
+    created = cursor.fetchone() is None
+
+    _run_script(cursor, SEARCH_TABLES)
+    for name, body in SEARCH_TRIGGERS.items():
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+    if created:
+        rebuild_search_index(cursor)
+        logger.info("Indici di ricerca full-text creati e popolati")
+    return created
+
+
+def rebuild_search_index(cursor: sqlite3.Cursor, optimize: bool = False) -> None:
+    """
+    Ricostruisce gli indici FTS5 dal contenuto delle tabelle, nella transazione del chiamante.
+
+    Args:
+        cursor: Cursore sul database
+        optimize: True per fondere anche i segmenti degli indici (ricerche più rapide)
+    """
+    for table in ("search_documents", "search_annotations"):
+        cursor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+        if optimize:
+            cursor.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+
+
+def rebuild_database_search_index(db_path: str) -> None:
+    """
+    Ricostruisce e ottimizza gli indici di ricerca di un database in un'unica transazione.
+
+    Args:
+        db_path: Percorso del file database SQLite
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        ensure_search_schema(cursor)
+        rebuild_search_index(cursor, optimize=True)
+        conn.commit()
+        logger.info(f"Indici di ricerca ricostruiti per {db_path}")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ricostruisce gli indici di ricerca full-text delle annotazioni")
+    parser.add_argument("--db", type=str, required=True, help="Percorso del file database SQLite")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"Database non trovato: {args.db}")
+    rebuild_database_search_index(args.db)
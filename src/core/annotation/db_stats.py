@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+db_stats.py
+Statistiche materializzate sulle annotazioni, mantenute da trigger SQLite.
+
+Le tabelle stats_* sono aggiornate in modo incrementale dai trigger su annotations,
+documents e user_activity, quindi le dashboard leggono pochi aggregati invece di
+scandire tutte le annotazioni:
+
+* stats_annotation_types: annotazioni per tipo di entità;
+* stats_documents: per documento, titolo, parole, giorno di creazione e numero di annotazioni;
+* stats_annotations_daily: annotazioni per giorno di creazione, autore e tipo;
+* stats_activity_daily: attività per giorno, utente e tipo di azione;
+* stats_activity_documents: attività per giorno, utente e documento (per i documenti modificati).
+
+Le connessioni che scrivono devono avere PRAGMA recursive_triggers=ON: senza, le righe
+sostituite da INSERT OR REPLACE non attivano i trigger di cancellazione e i contatori
+divergono. In caso di dubbio le tabelle si ricostruiscono con:
+
+    python -m src.core.annotation.db_stats --db percorso/annotations.db
+"""
+
+import logging
+import os
+import sqlite3
+
+# Setup del logger
+logger = logging.getLogger("db_stats")
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+logger.addHandler(handler)
+
+# Giorno (YYYY-MM-DD) di un timestamp ISO; '' se assente, perché NULL non è una chiave utile
+DAY = "COALESCE(substr({}, 1, 10), '')"
+
+STATS_TABLES = '''
+CREATE TABLE IF NOT EXISTS stats_annotation_types (
+    type TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stats_documents (
+    doc_id TEXT PRIMARY KEY,
+    title TEXT,
+    word_count INTEGER,
+    day TEXT NOT NULL,
+    annotation_count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_stats_documents_day ON stats_documents(day);
+CREATE TABLE IF NOT EXISTS stats_annotations_daily (
+    day TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (day, user_id, type)
+);
+CREATE INDEX IF NOT EXISTS idx_stats_annotations_daily_user ON stats_annotations_daily(user_id, day);
+CREATE TABLE IF NOT EXISTS stats_activity_daily (
+    day TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    action_type TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (day, user_id, action_type)
+);
+CREATE INDEX IF NOT EXISTS idx_stats_activity_daily_user ON stats_activity_daily(user_id, day);
+CREATE TABLE IF NOT EXISTS stats_activity_documents (
+    day TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    document_id TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (day, user_id, document_id)
+);
+CREATE INDEX IF NOT EXISTS idx_stats_activity_documents_user ON stats_activity_documents(user_id, day);
+'''
+
+ANNOTATION_DAY = DAY.format("{row}.date_created")
+ANNOTATION_USER = "COALESCE({row}.created_by, '')"
+ACTIVITY_DAY = DAY.format("{row}.timestamp")
+
+
+def _add_annotation(row: str) -> str:
+    day, user = ANNOTATION_DAY.format(row=row), ANNOTATION_USER.format(row=row)
+    return f'''
+        INSERT INTO stats_annotation_types (type, count) VALUES ({row}.type, 1)
+            ON CONFLICT(type) DO UPDATE SET count = count + 1;
+        UPDATE stats_documents SET annotation_count = annotation_count + 1 WHERE doc_id = {row}.doc_id;
+        INSERT INTO stats_annotations_daily (day, user_id, type, count) VALUES ({day}, {user}, {row}.type, 1)
+            ON CONFLICT(day, user_id, type) DO UPDATE SET count = count + 1;
+    '''
+
+
+def _remove_annotation(row: str) -> str:
+    day, user = ANNOTATION_DAY.format(row=row), ANNOTATION_USER.format(row=row)
+    return f'''
+        UPDATE stats_annotation_types SET count = count - 1 WHERE type = {row}.type;
+        DELETE FROM stats_annotation_types WHERE type = {row}.type AND count <= 0;
+        UPDATE stats_documents SET annotation_count = annotation_count - 1 WHERE doc_id = {row}.doc_id;
+        UPDATE stats_annotations_daily SET count = count - 1
+            WHERE day = {day} AND user_id = {user} AND type = {row}.type;
+        DELETE FROM stats_annotations_daily
+            WHERE day = {day} AND user_id = {user} AND type = {row}.type AND count <= 0;
+    '''
+
+
+def _add_activity(row: str) -> str:
+    day = ACTIVITY_DAY.format(row=row)
+    return f'''
+        INSERT INTO stats_activity_daily (day, user_id, action_type, count) VALUES ({day}, {row}.user_id, {row}.action_type, 1)
+            ON CONFLICT(day, user_id, action_type) DO UPDATE SET count = count + 1;
+        INSERT INTO stats_activity_documents (day, user_id, document_id, count)
+            SELECT {day}, {row}.user_id, {row}.document_id, 1 WHERE {row}.document_id IS NOT NULL
+            ON CONFLICT(day, user_id, document_id) DO UPDATE SET count = count + 1;
+    '''
+
+
+def _remove_activity(row: str) -> str:
+    day = ACTIVITY_DAY.format(row=row)
+    return f'''
+        UPDATE stats_activity_daily SET count = count - 1
+            WHERE day = {day} AND user_id = {row}.user_id AND action_type = {row}.action_type;
+        DELETE FROM stats_activity_daily
+            WHERE day = {day} AND user_id = {row}.user_id AND action_type = {row}.action_type AND count <= 0;
+        UPDATE stats_activity_documents SET count = count - 1
+            WHERE day = {day} AND user_id = {row}.user_id AND document_id = {row}.document_id;
+        DELETE FROM stats_activity_documents
+            WHERE day = {day} AND user_id = {row}.user_id AND document_id = {row}.document_id AND count <= 0;
+    '''
+
+
+def _add_document(row: str) -> str:
+    return f'''
+        INSERT OR REPLACE INTO stats_documents (doc_id, title, word_count, day, annotation_count)
+        VALUES ({row}.id, {row}.title, {row}.word_count, {DAY.format(row + '.date_created')},
+                (SELECT COUNT(*) FROM annotations WHERE doc_id = {row}.id));
+    '''
+
+
+STATS_TRIGGERS = {
+    "trg_stats_annotations_insert": f"AFTER INSERT ON annotations BEGIN {_add_annotation('NEW')} END",
+    "trg_stats_annotations_delete": f"AFTER DELETE ON annotations BEGIN {_remove_annotation('OLD')} END",
+    "trg_stats_annotations_update": (
+        "AFTER UPDATE OF doc_id, type, date_created, created_by ON annotations "
+        f"BEGIN {_remove_annotation('OLD')} {_add_annotation('NEW')} END"
+    ),
+    "trg_stats_documents_insert": f"AFTER INSERT ON documents BEGIN {_add_document('NEW')} END",
+    "trg_stats_documents_delete": "AFTER DELETE ON documents BEGIN DELETE FROM stats_documents WHERE doc_id = OLD.id; END",
+    "trg_stats_documents_update": (
+        "AFTER UPDATE OF id, title, word_count, date_created ON documents "
+        f"BEGIN DELETE FROM stats_documents WHERE doc_id = OLD.id; {_add_document('NEW')} END"
+    ),
+    "trg_stats_activity_insert": f"AFTER INSERT ON user_activity BEGIN {_add_activity('NEW')} END",
+    "trg_stats_activity_delete": f"AFTER DELETE ON user_activity BEGIN {_remove_activity('OLD')} END",
+}
+
+REBUILD = f'''
+DELETE FROM stats_annotation_types;
+DELETE FROM stats_documents;
+DELETE FROM stats_annotations_daily;
+DELETE FROM stats_activity_daily;
+DELETE FROM stats_activity_documents;
+
+INSERT INTO stats_annotation_types (type, count)
+    SELECT type, COUNT(*) FROM annotations GROUP BY type;
+INSERT INTO stats_documents (doc_id, title, word_count, day, annotation_count)
+    SELECT d.id, d.title, d.word_count, {DAY.format('d.date_created')}, COUNT(a.doc_id)
+    FROM documents d LEFT JOIN annotations a ON a.doc_id = d.id
+    GROUP BY d.id;
+INSERT INTO stats_annotations_daily (day, user_id, type, count)
+    SELECT {ANNOTATION_DAY.format(row='annotations')}, {ANNOTATION_USER.format(row='annotations')}, type, COUNT(*)
+    FROM annotations GROUP BY 1, 2, 3;
+INSERT INTO stats_activity_daily (day, user_id, action_type, count)
+    SELECT {ACTIVITY_DAY.format(row='user_activity')}, user_id, action_type, COUNT(*)
+    FROM user_activity GROUP BY 1, 2, 3;
+INSERT INTO stats_activity_documents (day, user_id, document_id, count)
+    SELECT {ACTIVITY_DAY.format(row='user_activity')}, user_id, document_id, COUNT(*)
+    FROM user_activity WHERE document_id IS NOT NULL GROUP BY 1, 2, 3;
+'''
+
+
+def _run_script(cursor: sqlite3.Cursor, script: str) -> None:
+    # executescript farebbe COMMIT della transazione del chiamante: si eseguono le istruzioni una per una
+    for statement in script.split(';'):
+        if statement.strip():
+            cursor.execute(statement)
+
+
+def ensure_stats_schema(cursor: sqlite3.Cursor) -> bool:
+    """
+    Crea tabelle e trigger delle statistiche se mancano; se le tabelle sono nuove le popola.
+    
+    Args:
+        cursor: Cursore su un database con le tabelle annotations, documents e user_activity
+        
+    Returns:
+        True se le tabelle sono state create (e quindi ricostruite)
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stats_documents'")
+    created = cursor.fetchone() is None
+    
+    _run_script(cursor, STATS_TABLES)
+    for name, body in STATS_TRIGGERS.items():
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    
+    if created:
+        rebuild_stats(cursor)
+        logger.info("Tabelle delle statistiche create e popolate")
+    return created
+
+
+def rebuild_stats(cursor: sqlite3.Cursor) -> None:
+    """
+    Ricalcola da zero tutte le tabelle delle statistiche, nella transazione del chiamante.
+    
+    Args:
+        cursor: Cursore sul database
+    """
+    _run_script(cursor, REBUILD)
+
+
+def rebuild_database_stats(db_path: str) -> None:
+    """
+    Ricostruisce le statistiche di un database in un'unica transazione.
+    
+    Args:
+        db_path: Percorso del file database SQLite
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        ensure_stats_schema(cursor)
+        rebuild_stats(cursor)
+        conn.commit()
+        logger.info(f"Statistiche ricostruite per {db_path}")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Ricostruisce le statistiche materializzate delle annotazioni")
+    parser.add_argument("--db", type=str, required=True, help="Percorso del file database SQLite")
+    args = parser.parse_args()
+    
+    if not os.path.exists(args.db):
+        parser.error(f"Database non trovato: {args.db}")
+    rebuild_database_stats(args.db)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+export_stream.py
+Serializzazione incrementale delle esportazioni di annotazioni.
+
+Ogni formato consuma AnnotationDBManager.iter_export_documents (un documento alla volta,
+da un'unica query ordinata) e produce blocchi di testo da inviare come risposta HTTP
+chunked, senza costruire l'intera esportazione in memoria:
+
+* jsonl: una riga {"doc_id", "annotations"} per documento;
+* json: l'oggetto {doc_id: [annotazioni]} del formato JSON dell'app;
+* spacy: la lista [{"text", "entities"}] del formato spaCy.
+
+Il formato DocBin (.spacy) non è serializzabile a pezzi: write_docbin aggiunge ogni
+documento a un unico DocBin, che ne conserva solo gli array compatti (i Doc non restano
+in memoria), e lo scrive su file alla fine.
+"""
+
+import json
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Setup del logger
+logger = logging.getLogger("export_stream")
+
+# Dimensione indicativa dei blocchi inviati al client
+CHUNK_SIZE = 64 * 1024
+
+ExportDocument = Tuple[str, Optional[str], List[Dict[str, Any]]]
+
+
+def _chunked(pieces: Iterable[str], chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Raggruppa piccoli frammenti di testo in blocchi di circa chunk_size caratteri."""
+    buffer: List[str] = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _spacy_record(text: str, annotations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"text": text, "entities": [(ann['start'], ann['end'], ann['type']) for ann in annotations]}
+
+
+def stream_jsonl(documents: Iterable[ExportDocument]) -> Iterator[str]:
+    """
+    Esporta in JSON Lines, un documento per riga.
+
+    Args:
+        documents: Tuple (doc_id, testo, annotazioni) da iter_export_documents
+
+    Yields:
+        Blocchi di testo
+    """
+    return _chunked(
+        json.dumps({"doc_id": doc_id, "annotations": annotations}, ensure_ascii=False) + "\n"
+        for doc_id, _, annotations in documents
+    )
+
+
+def stream_json(documents: Iterable[ExportDocument]) -> Iterator[str]:
+    """
+    Esporta nel formato JSON dell'app, {doc_id: [annotazioni]}.
+
+    Args:
+        documents: Tuple (doc_id, testo, annotazioni) da iter_export_documents
+
+    Yields:
+        Blocchi di testo che insieme formano un unico oggetto JSON
+    """
+    def pieces() -> Iterator[str]:
+        yield "{"
+        for i, (doc_id, _, annotations) in enumerate(documents):
+            yield ("," if i else "") + json.dumps(doc_id, ensure_ascii=False) + ":"
+            yield json.dumps(annotations, ensure_ascii=False)
+        yield "}"
+    return _chunked(pieces())
+
+
+def stream_spacy_json(documents: Iterable[ExportDocument], wrap: bool = False) -> Iterator[str]:
+    """
+    Esporta nel formato spaCy, [{"text", "entities"}], saltando i documenti inesistenti.
+
+    Args:
+        documents: Tuple (doc_id, testo, annotazioni) da iter_export_documents
+        wrap: True per racchiudere la lista in {"status": "success", "data": [...]}
+
+    Yields:
+        Blocchi di testo che insieme formano un unico documento JSON
+    """
+    def pieces() -> Iterator[str]:
+        yield '{"status": "success", "data": [' if wrap else "["
+        first = True
+        for _, text, annotations in documents:
+            if text is None:
+                continue
+            yield ("" if first else ",") + json.dumps(_spacy_record(text, annotations), ensure_ascii=False)
+            first = False
+        yield "]}" if wrap else "]"
+    return _chunked(pieces())
+
+
+def write_docbin(documents: Iterable[ExportDocument], path: str, lang: str = "it") -> int:
+    """
+    Costruisce un file DocBin di spaCy un documento alla volta.
+
+    Le entità che non cadono su confini di token o che si sovrappongono vengono scartate,
+    come in NERTrainer.
+
+    Args:
+        documents: Tuple (doc_id, testo, annotazioni) da iter_export_documents
+        path: File .spacy di destinazione
+        lang: Lingua della pipeline vuota usata per la tokenizzazione
+
+    Returns:
+        Numero di documenti scritti
+
+    Raises:
+        ImportError: se spaCy non è installato
+    """
+    import spacy
+    from spacy.tokens import DocBin
+    from spacy.util import filter_spans
+
+    nlp = spacy.blank(lang)
+    doc_bin = DocBin(store_user_data=False)
+    written = 0
+    skipped_spans = 0
+
+    for _, text, annotations in documents:
+        if text is None:
+            continue
+        doc = nlp.make_doc(text)
+        spans = []
+        for ann in annotations:
+            span = doc.char_span(ann['start'], ann['end'], label=ann['type'])
+            if span is None:
+                skipped_spans += 1
+            else:
+                spans.append(span)
+        doc.ents = filter_spans(spans)
+        # DocBin.add copia gli attributi dei token: il Doc può essere liberato subito
+        doc_bin.add(doc)
+        written += 1
+
+    doc_bin.to_disk(path)
+
+    if skipped_spans:
+        logger.warning(f"Esportazione DocBin: {skipped_spans} entità scartate (confini non allineati ai token)")
+    logger.info(f"Esportazione DocBin: {written} documenti scritti in {path}")
+    return written
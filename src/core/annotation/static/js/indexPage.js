@@ -240,8 +240,11 @@ async function handleBulkDelete() {
         const result = await api.bulkDeleteDocuments(Array.from(selectedDocIds));
         
         if (result.status === 'success') {
+            // Solo i documenti effettivamente eliminati (esito per ID in result.results)
+            const deletedIds = new Set(result.results.success);
+            
             // Rimuovi gli elementi dal DOM
-            for (const docId of selectedDocIds) {
+            for (const docId of deletedIds) {
                 const cardToRemove = document.querySelector(`.doc-card-col[data-doc-id="${docId}"]`);
                 if (cardToRemove) {
                     cardToRemove.remove();
@@ -252,14 +255,18 @@ async function handleBulkDelete() {
             const documentCountEl = document.getElementById('document-count');
             if (documentCountEl) {
                 const currentCount = parseInt(documentCountEl.textContent);
-                const newCount = Math.max(0, currentCount - selectedDocIds.size);
+                const newCount = Math.max(0, currentCount - deletedIds.size);
                 documentCountEl.textContent = `${newCount} Documenti`;
             }
             
-            showNotification(`${selectedDocIds.size} documenti eliminati con successo.`, 'success');
+            if (result.results.failed.length > 0) {
+                showNotification(result.message, 'warning');
+            } else {
+                showNotification(`${deletedIds.size} documenti eliminati con successo.`, 'success');
+            }
             
             // Aggiorna la lista documenti in memoria
-            documentsData = documentsData.filter(doc => !selectedDocIds.has(doc.id));
+            documentsData = documentsData.filter(doc => !deletedIds.has(doc.id));
             
             // Reset selezioni
             selectedDocIds.clear();
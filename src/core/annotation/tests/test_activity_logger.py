@@ -0,0 +1,247 @@
+"""
+Test unitari per il log delle attività utente in blocchi.
+Esegui con: python -m unittest src.core.annotation.tests.test_activity_logger
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+import unittest
+from unittest import mock
+
+from ..activity_logger import ActivityLogger
+from ..db_manager import AnnotationDBManager
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), *[os.pardir] * 4))
+
+
+def _wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+class ActivityLoggerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = os.path.join(self.tmp.name, "annotations.db")
+        self.spool_path = os.path.join(self.tmp.name, "activity_spool.jsonl")
+        self.manager = self._open_manager()
+
+    def _open_manager(self) -> AnnotationDBManager:
+        manager = AnnotationDBManager(db_path=self.db_path, backup_dir=os.path.join(self.tmp.name, "backup"))
+        self.addCleanup(manager.close)
+        return manager
+
+    def _activity_ids(self):
+        with self.manager._get_db() as (conn, cursor):
+            cursor.execute("SELECT id FROM user_activity")
+            return [row[0] for row in cursor.fetchall()]
+
+    def _spool_files(self):
+        return [os.path.join(self.tmp.name, name) for name in os.listdir(self.tmp.name)
+                if name.startswith("activity_spool.jsonl.")]
+
+    def _start(self, **kwargs) -> ActivityLogger:
+        activity_logger = ActivityLogger(self.manager, **kwargs).start()
+        self.addCleanup(activity_logger.close)
+        return activity_logger
+
+
+class TestActivityLogger(ActivityLoggerTestCase):
+    """Test per la scrittura in blocchi nello stesso processo."""
+
+    def test_log_user_activity_is_queued_while_logger_is_active(self):
+        activity_logger = self._start(batch_size=100, flush_interval=60)
+
+        self.assertTrue(self.manager.log_user_activity("u1", "login"))
+        self.assertEqual(activity_logger.pending(), 1)
+        self.assertEqual(self._activity_ids(), [])
+
+        activity_logger.close()
+        self.assertIsNone(self.manager.activity_logger)
+        self.assertEqual(len(self._activity_ids()), 1)
+
+        # Dopo close() il manager torna a scrivere direttamente
+        self.manager.log_user_activity("u1", "logout")
+        self.assertEqual(len(self._activity_ids()), 2)
+
+    def test_flush_when_batch_is_full(self):
+        activity_logger = self._start(batch_size=10, flush_interval=60)
+        for i in range(10):
+            self.manager.log_user_activity("u1", "create_annotation", annotation_id=f"ann_{i}")
+        self.assertTrue(_wait_for(lambda: activity_logger.written == 10))
+
+        # Sotto la soglia gli eventi restano in memoria fino all'intervallo
+        for i in range(10, 15):
+            self.manager.log_user_activity("u1", "create_annotation", annotation_id=f"ann_{i}")
+        time.sleep(0.1)
+        self.assertEqual(activity_logger.pending(), 5)
+        self.assertEqual(len(self._activity_ids()), 10)
+
+    def test_flush_after_interval(self):
+        activity_logger = self._start(batch_size=1000, flush_interval=0.05)
+        self.manager.log_user_activity("u1", "login")
+
+        self.assertTrue(_wait_for(lambda: activity_logger.written == 1))
+        self.assertEqual(len(self._activity_ids()), 1)
+
+    def test_timestamp_is_taken_when_logging(self):
+        activity_logger = self._start(batch_size=100, flush_interval=60)
+        before = time.time()
+        self.manager.log_user_activity("u1", "login")
+        time.sleep(0.2)
+        activity_logger.flush()
+
+        with self.manager._get_db() as (conn, cursor):
+            cursor.execute("SELECT timestamp FROM user_activity")
+            logged_at = time.mktime(time.strptime(cursor.fetchone()[0][:19], "%Y-%m-%dT%H:%M:%S"))
+        self.assertLess(logged_at, before + 0.2)
+
+    def test_failed_flush_keeps_rows_in_order(self):
+        activity_logger = self._start(batch_size=100, flush_interval=60, spool_path=self.spool_path)
+        for i in range(3):
+            self.manager.log_user_activity("u1", "create_annotation", annotation_id=f"ann_{i}")
+
+        with mock.patch.object(self.manager, "insert_activity_rows", side_effect=RuntimeError("database is locked")):
+            self.assertEqual(activity_logger.flush(), 0)
+        self.assertEqual(activity_logger.pending(), 3)
+        self.assertEqual(activity_logger.failures, 1)
+
+        self.manager.log_user_activity("u1", "create_annotation", annotation_id="ann_3")
+        self.assertEqual(activity_logger.flush(), 4)
+        with self.manager._get_db() as (conn, cursor):
+            cursor.execute("SELECT annotation_id FROM user_activity ORDER BY timestamp")
+            self.assertEqual([row[0] for row in cursor.fetchall()], [f"ann_{i}" for i in range(4)])
+        # Scritte tutte le righe, non resta nulla da recuperare
+        self.assertEqual([name for name in os.listdir(self.tmp.name) if name.endswith(".pending")], [])
+
+    def test_replaying_written_rows_does_not_duplicate(self):
+        activity_logger = self._start(batch_size=100, flush_interval=60, spool_path=self.spool_path)
+        for i in range(10):
+            self.manager.log_user_activity("u1", "create_annotation", annotation_id=f"ann_{i}")
+        with open(activity_logger.spool_file, encoding="utf-8") as spool:
+            lines = spool.readlines()
+        activity_logger.flush()
+        activity_logger.close()
+
+        # Arresto tra il commit e la rimozione del file ruotato: le righe vengono riproposte
+        pending_file = f"{activity_logger.spool_file}.0.pending"
+        with open(pending_file, "w", encoding="utf-8") as pending:
+            pending.writelines(lines)
+        self._start(spool_path=self.spool_path)
+
+        self.assertEqual(len(self._activity_ids()), 10)
+        self.assertFalse(os.path.exists(pending_file))
+
+    def test_deleted_spool_does_not_lose_events(self):
+        activity_logger = self._start(batch_size=100, flush_interval=60, spool_path=self.spool_path)
+        for i in range(5):
+            self.manager.log_user_activity("u1", "create_annotation", annotation_id=f"ann_{i}")
+        os.remove(activity_logger.spool_file)
+
+        self.assertEqual(activity_logger.flush(), 5)
+        self.assertEqual(len(self._activity_ids()), 5)
+
+        # Lo spool viene ricreato e la registrazione continua, anche dal thread in background
+        self.assertTrue(self.manager.log_user_activity("u1", "logout"))
+        self.assertTrue(os.path.exists(activity_logger.spool_file))
+        os.remove(activity_logger.spool_file)
+        activity_logger.batch_size = 2
+        self.manager.log_user_activity("u1", "login")
+        self.assertTrue(_wait_for(lambda: activity_logger.written == 7))
+        self.assertTrue(activity_logger._thread.is_alive())
+
+    def test_unwritable_spool_keeps_events_in_memory(self):
+        activity_logger = self._start(batch_size=100, flush_interval=60, spool_path=self.spool_path)
+        activity_logger._spool.close()
+
+        self.assertTrue(self.manager.log_user_activity("u1", "login"))
+        self.assertEqual(activity_logger.pending(), 1)
+        self.assertEqual(activity_logger.flush(), 1)
+
+    def test_spool_of_live_process_is_left_alone(self):
+        # Un altro processo attivo (come il reloader di Flask) sullo stesso prefisso
+        other_spool = f"{self.spool_path}.{os.getppid()}"
+        row = self.manager._activity_row("u2", "login")
+        with open(other_spool, "w", encoding="utf-8") as spool:
+            spool.write(json.dumps(row) + "\n")
+
+        activity_logger = self._start(spool_path=self.spool_path)
+        self.manager.log_user_activity("u1", "login")
+        activity_logger.close()
+
+        self.assertTrue(os.path.exists(other_spool))
+        self.assertEqual(len(self._activity_ids()), 1)
+
+
+class TestActivityLoggerCrash(ActivityLoggerTestCase):
+    """Test di durabilità con un processo terminato con os._exit (nessun atexit, nessun flush)."""
+
+    def _run_and_crash(self, body: str) -> None:
+        script = textwrap.dedent(f"""
+            import os
+            from src.core.annotation.activity_logger import ActivityLogger
+            from src.core.annotation.db_manager import AnnotationDBManager
+
+            manager = AnnotationDBManager(db_path={self.db_path!r}, backup_dir={os.path.join(self.tmp.name, "backup")!r})
+        """) + textwrap.dedent(body) + "\nos._exit(0)\n"
+        result = subprocess.run([sys.executable, "-c", script], cwd=PROJECT_ROOT,
+                                capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_written_batches_survive_crash_without_spool(self):
+        self._run_and_crash("""
+            activity_logger = ActivityLogger(manager, batch_size=1000, flush_interval=60).start()
+            for i in range(20):
+                manager.log_user_activity("u1", "create_annotation", annotation_id=f"ann_{i}")
+            activity_logger.flush()
+            for i in range(20, 25):
+                manager.log_user_activity("u1", "create_annotation", annotation_id=f"ann_{i}")
+        """)
+
+        # Senza spool si perdono solo gli eventi non ancora scritti; il database resta integro
+        self.assertEqual(len(self._activity_ids()), 20)
+        with self.manager._get_db() as (conn, cursor):
+            cursor.execute("PRAGMA integrity_check")
+            self.assertEqual(cursor.fetchone()[0], "ok")
+
+    def test_spooled_events_are_recovered_after_crash(self):
+        self._run_and_crash(f"""
+            activity_logger = ActivityLogger(manager, batch_size=40, flush_interval=60,
+                                             spool_path={self.spool_path!r}).start()
+            for i in range(100):
+                manager.log_user_activity("u1", "create_annotation", annotation_id=f"ann_{{i}}")
+        """)
+
+        spool_files = self._spool_files()
+        self.assertGreater(len(spool_files), 0)
+        expected = set()
+        for path in spool_files:
+            with open(path, encoding="utf-8") as spool:
+                expected.update(json.loads(line)[0] for line in spool)
+        expected.update(self._activity_ids())
+        self.assertEqual(len(expected), 100)
+
+        self._start(spool_path=self.spool_path).close()
+        ids = self._activity_ids()
+        self.assertEqual(len(ids), 100)
+        self.assertEqual(set(ids), expected)
+        self.assertEqual(self._spool_files(), [])
+
+        # Un secondo avvio non trova nulla da recuperare e non duplica
+        self._start(spool_path=self.spool_path).close()
+        self.assertEqual(len(self._activity_ids()), 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
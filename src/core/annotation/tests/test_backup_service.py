@@ -0,0 +1,143 @@
+"""
+Test unitari per il backup online e la politica di conservazione dei backup.
+Esegui con: python -m unittest src.core.annotation.tests.test_backup_service
+"""
+
+import datetime
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from .. import backup_service
+from ..backup_service import BACKUP_PREFIX, apply_retention, backup_database
+
+
+class TestApplyRetention(unittest.TestCase):
+
+    # Mercoledì a mezzogiorno: il lunedì è nella stessa settimana ISO, la domenica nella precedente
+    NOW = datetime.datetime(2026, 10, 14, 12, 0)
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.backup_dir = self.tmp.name
+
+    def _backup(self, name, age, suffix=".db"):
+        path = os.path.join(self.backup_dir, f"{BACKUP_PREFIX}{name}{suffix}")
+        with open(path, "wb") as f:
+            f.write(b"backup")
+        mtime = (self.NOW - age).timestamp()
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def _survivors(self):
+        return sorted(os.listdir(self.backup_dir))
+
+    def test_keep_last(self):
+        for i in range(5):
+            self._backup(f"{i}", datetime.timedelta(minutes=i))
+        removed = apply_retention(self.backup_dir, keep_last=2, keep_daily=0, keep_weekly=0)
+
+        self.assertEqual(len(removed), 3)
+        self.assertEqual(self._survivors(), [f"{BACKUP_PREFIX}0.db", f"{BACKUP_PREFIX}1.db"])
+
+    def test_daily_and_weekly(self):
+        hour, day = datetime.timedelta(hours=1), datetime.timedelta(days=1)
+        self._backup("wed_12", 0 * hour, suffix=".db.gz")
+        self._backup("wed_11", 1 * hour)        # tenuto da keep_last
+        self._backup("wed_10", 2 * hour)
+        self._backup("tue_12", day)             # giornaliero
+        self._backup("tue_10", day + 2 * hour)
+        self._backup("mon_12", 2 * day)         # giornaliero
+        self._backup("sun_12", 3 * day)         # settimanale: settimana precedente
+        self._backup("sat_12", 4 * day)
+        self._backup("old", 10 * day)           # oltre le due settimane
+        # File estranei e backup incompleti non vengono toccati
+        for name in ("notes.txt", f"{BACKUP_PREFIX}999.db.partial"):
+            with open(os.path.join(self.backup_dir, name), "w") as f:
+                f.write("x")
+
+        apply_retention(self.backup_dir, keep_last=2, keep_daily=3, keep_weekly=2)
+
+        self.assertEqual(self._survivors(), sorted([
+            f"{BACKUP_PREFIX}wed_12.db.gz", f"{BACKUP_PREFIX}wed_11.db", f"{BACKUP_PREFIX}tue_12.db",
+            f"{BACKUP_PREFIX}mon_12.db", f"{BACKUP_PREFIX}sun_12.db",
+            "notes.txt", f"{BACKUP_PREFIX}999.db.partial",
+        ]))
+
+
+class TestBackupDatabase(unittest.TestCase):
+
+    ROWS = 2000
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = os.path.join(self.tmp.name, "annotations.db")
+        self.backup_dir = os.path.join(self.tmp.name, "backup")
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE rows (id INTEGER PRIMARY KEY, payload TEXT)")
+        conn.executemany("INSERT INTO rows (payload) VALUES (?)", [("x" * 1000,)] * self.ROWS)
+        conn.commit()
+        conn.close()
+
+    def _count(self, path):
+        conn = sqlite3.connect(path)
+        try:
+            self.assertEqual(conn.execute("PRAGMA integrity_check").fetchone()[0], "ok")
+            return conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_backup_during_writes_is_consistent(self):
+        stop = threading.Event()
+        written = []
+
+        def writer():
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            while not stop.is_set():
+                conn.execute("INSERT INTO rows (payload) VALUES (?)", ("y" * 1000,))
+                conn.commit()
+                written.append(1)
+            conn.close()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            path = backup_database(self.db_path, self.backup_dir, pages_per_step=8, step_pause=0.001)
+        finally:
+            stop.set()
+            thread.join()
+
+        self.assertTrue(written)
+        self.assertGreaterEqual(self._count(path), self.ROWS)
+        self.assertLessEqual(self._count(path), self.ROWS + len(written))
+        self.assertEqual(os.listdir(self.backup_dir), [os.path.basename(path)])
+
+    def test_compressed_backup_round_trip(self):
+        path = backup_database(self.db_path, self.backup_dir, compress=True)
+        self.assertTrue(path.endswith(".db.gz"))
+
+        restored = os.path.join(self.tmp.name, "restored.db")
+        with gzip.open(path, "rb") as packed, open(restored, "wb") as raw:
+            shutil.copyfileobj(packed, raw)
+        self.assertEqual(self._count(restored), self.ROWS)
+
+    def test_partial_files_removed_on_failure(self):
+        for compress in (False, True):
+            with self.subTest(compress=compress):
+                with mock.patch.object(backup_service.os, "replace", side_effect=OSError("disco pieno")):
+                    with self.assertRaises(OSError):
+                        backup_database(self.db_path, self.backup_dir, compress=compress)
+                self.assertEqual(os.listdir(self.backup_dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+Test unitari per la validazione e l'importazione in blocco delle annotazioni.
+Esegui con: python -m unittest src.core.annotation.tests.test_bulk_import
+"""
+
+import copy
+import os
+import tempfile
+import unittest
+
+from ..db_manager import AnnotationDBManager
+
+
+def annotation(start, end, ann_id=None, **extra):
+    value = {"start": start, "end": end, "text": "art. 2043 c.c.", "type": "ARTICOLO_CODICE", **extra}
+    if ann_id:
+        value["id"] = ann_id
+    return value
+
+
+class TestBulkImport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.manager = AnnotationDBManager(
+            db_path=os.path.join(self.tmp.name, "annotations.db"), backup_dir=os.path.join(self.tmp.name, "backup")
+        )
+        self.addCleanup(self.manager.close)
+        for doc_id in ("doc_1", "doc_2"):
+            self.manager.save_document({"id": doc_id, "title": doc_id, "text": "testo " * 100})
+
+    def _annotation_ids(self):
+        with self.manager._get_db() as (conn, cursor):
+            cursor.execute("SELECT id FROM annotations ORDER BY id")
+            return [row[0] for row in cursor.fetchall()]
+
+    def _activities(self):
+        with self.manager._get_db() as (conn, cursor):
+            cursor.execute("SELECT action_type FROM user_activity")
+            return [row[0] for row in cursor.fetchall()]
+
+    def test_valid_import_is_written_with_one_activity(self):
+        payload = {
+            "doc_1": [annotation(0, 5, "a1"), annotation(10, 15, metadata={"fonte": "ner"})],
+            "doc_2": [annotation(3, 9, "a2")],
+        }
+        result = self.manager.bulk_import_annotations(payload, user_id="u1", batch_size=2)
+
+        self.assertEqual(result, {"success": True, "imported": 3, "documents": 2, "errors": []})
+        ids = self._annotation_ids()
+        self.assertEqual(len(ids), 3)
+        self.assertIn("a1", ids)
+        self.assertTrue(any(ann_id.startswith("ann_doc_1_") for ann_id in ids))
+        self.assertEqual(self._activities(), ["import_annotations"])
+
+    def test_validation_rules(self):
+        cases = {
+            "documento mancante": ({"doc_x": [annotation(0, 5)]}, "Documento non trovato: doc_x"),
+            "non una lista": ({"doc_1": annotation(0, 5)}, "devono essere una lista"),
+            "non un oggetto": ({"doc_1": ["art. 1"]}, "deve essere un oggetto"),
+            "campo mancante": ({"doc_1": [{"start": 0, "end": 5, "text": "x"}]}, "campi mancanti type"),
+            "start booleano": ({"doc_1": [annotation(True, 5)]}, "devono essere interi"),
+            "end stringa": ({"doc_1": [annotation(0, "5")]}, "devono essere interi"),
+            "end decimale": ({"doc_1": [annotation(0, 5.0)]}, "devono essere interi"),
+            "end uguale a start": ({"doc_1": [annotation(5, 5)]}, "intervallo non valido (5, 5)"),
+            "end prima di start": ({"doc_1": [annotation(9, 4)]}, "intervallo non valido (9, 4)"),
+            "start negativo": ({"doc_1": [annotation(-1, 4)]}, "intervallo non valido (-1, 4)"),
+            "ID duplicato": ({"doc_1": [annotation(0, 5, "a1")], "doc_2": [annotation(0, 5, "a1")]}, "doc_2[0]: ID duplicato a1"),
+        }
+        for name, (payload, message) in cases.items():
+            with self.subTest(name):
+                rows, errors = self.manager.validate_import(payload)
+                self.assertEqual(len(errors), 1, errors)
+                self.assertIn(message, errors[0])
+
+    def test_invalid_import_writes_nothing(self):
+        self.manager.bulk_import_annotations({"doc_1": [annotation(0, 5, "esistente")]})
+        payload = {
+            "doc_1": [annotation(0, 5, "nuova_1"), annotation(20, 30, "esistente", text="modificata")],
+            "doc_2": [annotation(8, 2, "nuova_2")],
+        }
+        result = self.manager.bulk_import_annotations(payload, user_id="u1")
+
+        self.assertFalse(result["success"])
+        self.assertEqual(result["imported"], 0)
+        self.assertEqual(len(result["errors"]), 1)
+        self.assertEqual(self._annotation_ids(), ["esistente"])
+        with self.manager._get_db() as (conn, cursor):
+            cursor.execute("SELECT text, start FROM annotations WHERE id = 'esistente'")
+            self.assertEqual(tuple(cursor.fetchone()), ("art. 2043 c.c.", 0))
+        self.assertEqual(self._activities(), [])
+        self.assertFalse(self.manager.import_from_json(payload))
+
+    def test_input_is_not_modified(self):
+        payload = {"doc_1": [annotation(0, 5), annotation(6, 9)], "doc_2": [annotation(4, 2)]}
+        original = copy.deepcopy(payload)
+
+        self.manager.bulk_import_annotations(payload)
+        self.assertEqual(payload, original)
+
+        del payload["doc_2"]
+        self.assertTrue(self.manager.bulk_import_annotations(payload)["success"])
+        self.assertEqual(payload, {"doc_1": original["doc_1"]})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,240 @@
+"""
+Test unitari per l'eliminazione e l'assegnazione in blocco dei documenti (manager e API).
+Esegui con: python -m unittest src.core.annotation.tests.test_bulk_operations
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from ..db_manager import AnnotationDBManager
+from ..db_stats import rebuild_stats
+from .test_db_search import assert_search_in_sync
+from .test_db_stats import STATS_TABLES
+
+
+class BulkOperationsTestCase(unittest.TestCase):
+    """Database con due annotatori, un admin e documenti creati o assegnati a ciascuno."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.manager = AnnotationDBManager(
+            db_path=os.path.join(self.tmp.name, "annotations.db"), backup_dir=os.path.join(self.tmp.name, "backup")
+        )
+        self.addCleanup(self.manager.close)
+        for user_id, role in (("u1", "annotator"), ("u2", "annotator"), ("admin", "admin")):
+            self.manager.create_user({"id": user_id, "username": user_id, "password": "pw", "role": role})
+
+        documents = {
+            "doc_1": ("u1", None),
+            "doc_2": ("u2", "u1"),
+            "doc_3": ("u2", None),
+            "doc_4": ("u2", "u2"),
+        }
+        for doc_id, (created_by, assigned_to) in documents.items():
+            self.manager.save_document({
+                "id": doc_id, "title": doc_id, "text": f"Danno ingiusto nel documento {doc_id}",
+                "created_by": created_by, "assigned_to": assigned_to,
+            })
+        self.manager.bulk_import_annotations({
+            "doc_1": [{"start": 0, "end": 14, "text": "Danno ingiusto", "type": "CONCETTO"},
+                      {"start": 15, "end": 18, "text": "nel", "type": "ALTRO"}],
+            "doc_2": [{"start": 0, "end": 5, "text": "Danno", "type": "CONCETTO"}],
+            "doc_3": [{"start": 0, "end": 5, "text": "Danno", "type": "CONCETTO"}],
+        })
+
+    def _document_ids(self):
+        with self.manager._get_db() as (conn, cursor):
+            cursor.execute("SELECT id FROM documents ORDER BY id")
+            return [row[0] for row in cursor.fetchall()]
+
+    def _activities(self, action_type):
+        with self.manager._get_db() as (conn, cursor):
+            cursor.execute(
+                "SELECT user_id, document_id FROM user_activity WHERE action_type = ? ORDER BY document_id",
+                (action_type,)
+            )
+            return [tuple(row) for row in cursor.fetchall()]
+
+    def assertDerivedTablesConsistent(self):
+        with self.manager._get_db() as (conn, cursor):
+            incremental = {table: sorted(map(tuple, cursor.execute(f"SELECT * FROM {table}"))) for table in STATS_TABLES}
+            rebuild_stats(cursor)
+            rebuilt = {table: sorted(map(tuple, cursor.execute(f"SELECT * FROM {table}"))) for table in STATS_TABLES}
+            conn.rollback()
+            self.assertEqual(incremental, rebuilt)
+            assert_search_in_sync(self, cursor)
+
+
+class TestBulkDeleteDocuments(BulkOperationsTestCase):
+
+    def test_per_id_outcomes(self):
+        outcome = self.manager.bulk_delete_documents(["doc_2", "doc_3", "doc_1", "doc_x", "doc_2"], user_id="u1")
+
+        self.assertEqual(outcome, {
+            "deleted": ["doc_2", "doc_1"],
+            "not_found": ["doc_x"],
+            "forbidden": ["doc_3"],
+            "annotations_deleted": {"doc_2": 1, "doc_1": 2},
+        })
+        self.assertEqual(self._document_ids(), ["doc_3", "doc_4"])
+        self.assertEqual(self._activities("delete_document"), [("u1", "doc_1"), ("u1", "doc_2")])
+
+    def test_annotations_cascade_with_stats_and_search(self):
+        self.manager.bulk_delete_documents(["doc_1", "doc_2"], user_id="admin", is_admin=True)
+
+        annotations = self.manager.get_annotations()
+        self.assertEqual(set(annotations), {"doc_3"})
+        stats = self.manager.get_annotation_stats()
+        self.assertEqual(stats["general"]["total_documents"], 2)
+        self.assertEqual(stats["general"]["total_annotations"], 1)
+        self.assertEqual(stats["entity_stats"], {"CONCETTO": 1})
+        self.assertEqual(
+            sorted(result["doc_id"] for result in self.manager.search_annotations("danno")["results"]), ["doc_3"]
+        )
+        self.assertEqual(
+            sorted(result["id"] for result in self.manager.search_documents("danno")["results"]), ["doc_3", "doc_4"]
+        )
+        self.assertDerivedTablesConsistent()
+
+    def test_without_user_nothing_is_deletable(self):
+        outcome = self.manager.bulk_delete_documents(["doc_1", "doc_2"])
+
+        self.assertEqual(outcome["deleted"], [])
+        self.assertEqual(outcome["forbidden"], ["doc_1", "doc_2"])
+        self.assertEqual(len(self._document_ids()), 4)
+
+
+class TestBulkAssignDocuments(BulkOperationsTestCase):
+
+    def test_per_id_outcomes(self):
+        outcome = self.manager.bulk_assign_documents(["doc_1", "doc_x", "doc_2", "doc_1"], "u2", "admin")
+
+        self.assertEqual(outcome, {
+            "assigned": ["doc_1", "doc_2"],
+            "not_found": ["doc_x"],
+            "previous_assignees": {"doc_1": None, "doc_2": "u1"},
+        })
+        self.assertEqual(self.manager.get_document("doc_2")["assigned_to"], "u2")
+        self.assertIsNone(self.manager.get_document("doc_3")["assigned_to"])
+        self.assertEqual(self._activities("assign_document"), [("admin", "doc_1"), ("admin", "doc_2")])
+        self.assertDerivedTablesConsistent()
+
+    def test_only_missing_documents(self):
+        outcome = self.manager.bulk_assign_documents(["doc_x"], "u2", "admin")
+
+        self.assertEqual(outcome, {"assigned": [], "not_found": ["doc_x"], "previous_assignees": {}})
+        self.assertEqual(self._activities("assign_document"), [])
+
+
+class TestBulkRoutes(BulkOperationsTestCase):
+    """Le rotte /api/bulk_delete_documents e /api/document_batch_assign sul database di test."""
+
+    @classmethod
+    def setUpClass(cls):
+        # L'app crea il proprio database all'importazione: viene importata solo da questi test
+        from .. import app as app_module
+        cls.app_module = app_module
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(self.app_module, "db_manager", self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        recorder = mock.patch.object(self.app_module, "record_database_change")
+        self.record_database_change = recorder.start()
+        self.addCleanup(recorder.stop)
+        # Backup e log delle attività in background restano spenti durante i test
+        services = mock.patch.object(self.app_module, "start_background_services")
+        services.start()
+        self.addCleanup(services.stop)
+        self.client = self.app_module.app.test_client()
+
+    def test_import_does_not_start_background_services(self):
+        self.assertFalse(self.app_module._services_started)
+        self.assertIsNone(self.app_module.backup_service._thread)
+        self.assertIsNone(self.app_module.activity_logger._thread)
+
+    def _login(self, user_id):
+        user = self.manager.get_user_by_id(user_id)
+        with self.client.session_transaction() as session:
+            session["user_id"] = user["id"]
+            session["username"] = user["username"]
+            session["user_role"] = user["role"]
+
+    def test_delete_reports_each_id(self):
+        self._login("u1")
+        response = self.client.post("/api/bulk_delete_documents", json={"doc_ids": ["doc_1", "doc_3", "doc_x"]})
+
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(body["status"], "success")
+        self.assertEqual(body["results"]["success"], ["doc_1"])
+        self.assertEqual(body["results"]["annotations_deleted"], {"doc_1": 2})
+        self.assertEqual(
+            [(failure["id"], failure["reason"]) for failure in body["results"]["failed"]],
+            [("doc_x", "Documento non trovato"),
+             ("doc_3", "Non hai l'autorizzazione per eliminare questo documento")],
+        )
+        self.record_database_change.assert_called_once_with(1)
+        self.assertDerivedTablesConsistent()
+
+    def test_delete_forbidden_only_when_nothing_is_deletable(self):
+        self._login("u1")
+        response = self.client.post("/api/bulk_delete_documents", json={"doc_ids": ["doc_3", "doc_4", "doc_x"]})
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.get_json()["status"], "error")
+        self.assertEqual(len(self._document_ids()), 4)
+
+        # Solo ID inesistenti: nessun permesso negato, quindi nessun 403
+        response = self.client.post("/api/bulk_delete_documents", json={"doc_ids": ["doc_x"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["status"], "error")
+
+    def test_admin_deletes_any_document(self):
+        self._login("admin")
+        response = self.client.post("/api/bulk_delete_documents", json={"doc_ids": ["doc_3", "doc_4"]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["results"]["success"], ["doc_3", "doc_4"])
+        self.assertEqual(self._document_ids(), ["doc_1", "doc_2"])
+
+    def test_delete_rejects_invalid_payload(self):
+        self._login("u1")
+        for payload in ({"doc_ids": []}, {"doc_ids": "doc_1"}):
+            with self.subTest(payload=payload):
+                response = self.client.post("/api/bulk_delete_documents", json=payload)
+                self.assertEqual(response.status_code, 400)
+
+    def test_batch_assign(self):
+        self._login("admin")
+        response = self.client.post(
+            "/api/document_batch_assign", json={"doc_ids": ["doc_3", "doc_x", "doc_3"], "user_id": "u1"}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        results = response.get_json()["results"]
+        self.assertEqual(results["success"], ["doc_3"])
+        self.assertEqual(results["failed"], [{"id": "doc_x", "reason": "Documento non trovato"}])
+        self.assertEqual(results["previous_assignees"], {"doc_3": None})
+        self.assertEqual(self.manager.get_document("doc_3")["assigned_to"], "u1")
+
+    def test_batch_assign_errors(self):
+        self._login("admin")
+        response = self.client.post("/api/document_batch_assign", json={"doc_ids": ["doc_1"], "user_id": "nessuno"})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post("/api/document_batch_assign", json={"doc_ids": "doc_1", "user_id": "u1"})
+        self.assertEqual(response.status_code, 400)
+
+        # Solo gli admin possono assegnare
+        self._login("u1")
+        response = self.client.post("/api/document_batch_assign", json={"doc_ids": ["doc_1"], "user_id": "u1"})
+        self.assertEqual(response.status_code, 302)
+        self.assertIsNone(self.manager.get_document("doc_1")["assigned_to"])
+
+
+if __name__ == "__main__":
+    unittest.main()
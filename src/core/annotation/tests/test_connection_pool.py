@@ -0,0 +1,141 @@
+"""
+Test unitari per il pool di connessioni e i contesti annidati di AnnotationDBManager.
+Esegui con: python -m unittest src.core.annotation.tests.test_connection_pool
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from ..db_manager import AnnotationDBManager, ConnectionPool
+
+
+class TestNestedContexts(unittest.TestCase):
+
+    POOL_SIZE = 4
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = os.path.join(self.tmp.name, "annotations.db")
+        self.manager = AnnotationDBManager(
+            db_path=self.db_path, backup_dir=os.path.join(self.tmp.name, "backup"), pool_size=self.POOL_SIZE
+        )
+        self.addCleanup(self.manager.close)
+
+    def _committed(self, query):
+        # Connessione indipendente: vede solo le transazioni confermate
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute(query).fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_nested_context_reuses_connection(self):
+        with self.manager._get_db() as (outer, _):
+            with self.manager._get_db() as (inner, _):
+                self.assertIs(inner, outer)
+
+    def test_only_outermost_context_commits(self):
+        with self.manager._get_db() as (conn, cursor):
+            cursor.execute("INSERT INTO documents (id, title, text) VALUES ('doc_1', 'titolo', 'testo')")
+            # Le operazioni annidate non confermano la transazione esterna
+            self.manager.save_annotation("doc_1", {"start": 0, "end": 5, "text": "testo", "type": "LEGGE"}, user_id="u1")
+            self.assertEqual(self._committed("SELECT COUNT(*) FROM documents"), 0)
+            self.assertEqual(self._committed("SELECT COUNT(*) FROM annotations"), 0)
+        self.assertEqual(self._committed("SELECT COUNT(*) FROM documents"), 1)
+        self.assertEqual(self._committed("SELECT COUNT(*) FROM annotations"), 1)
+        self.assertEqual(self._committed("SELECT COUNT(*) FROM user_activity"), 1)
+
+    def test_exception_rolls_back_nested_operations(self):
+        with self.assertRaises(RuntimeError):
+            with self.manager._get_db():
+                self.assertTrue(self.manager.save_document({"id": "doc_1", "title": "t", "text": "testo"}, user_id="u1"))
+                self.assertTrue(self.manager.delete_document("doc_1"))
+                self.assertTrue(self.manager.save_document({"id": "doc_2", "title": "t", "text": "testo"}, user_id="u1"))
+                raise RuntimeError("errore dopo le scritture")
+
+        self.assertEqual(self._committed("SELECT COUNT(*) FROM documents"), 0)
+        self.assertEqual(self._committed("SELECT COUNT(*) FROM user_activity"), 0)
+        self.assertIsNone(self.manager.get_document("doc_2"))
+
+
+class TestWithoutIdleConnections(TestNestedContexts):
+    """Gli stessi contratti con pool_size=0 (nessuna connessione inattiva tenuta aperta)."""
+
+    POOL_SIZE = 0
+
+    def test_no_connection_is_kept(self):
+        with self.manager._get_db() as (first, _):
+            pass
+        self.assertEqual(self.manager.pool._idle, [])
+        with self.assertRaises(sqlite3.ProgrammingError):
+            first.execute("SELECT 1")
+
+        with self.manager._get_db() as (second, _):
+            self.assertIsNot(second, first)
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = os.path.join(self.tmp.name, "pool.db")
+
+    def _hold_in_threads(self, pool, count):
+        """Ogni thread tiene una connessione finché tutti non l'hanno ottenuta, poi la rilascia."""
+        barrier = threading.Barrier(count)
+        connections = []
+
+        def worker():
+            conn, owner = pool.acquire()
+            connections.append((conn, owner))
+            barrier.wait()
+            pool.release()
+
+        threads = [threading.Thread(target=worker) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return connections
+
+    def test_idle_connections_are_reused_and_capped(self):
+        pool = ConnectionPool(self.db_path, max_idle=2)
+        self.addCleanup(pool.close)
+        connections = self._hold_in_threads(pool, 3)
+
+        self.assertEqual(len({id(conn) for conn, _ in connections}), 3)
+        self.assertTrue(all(owner for _, owner in connections))
+        self.assertEqual(len(pool._idle), 2)
+        idle = list(pool._idle)
+
+        conn, owner = pool.acquire()
+        self.assertTrue(owner)
+        self.assertIn(conn, idle)
+        pool.release()
+        self.assertEqual(len(pool._idle), 2)
+
+    def test_close_with_connections_in_use(self):
+        pool = ConnectionPool(self.db_path, max_idle=2)
+        self._hold_in_threads(pool, 2)
+        in_use, _ = pool.acquire()
+        idle = pool._idle[0]
+        self.assertIsNot(idle, in_use)
+
+        pool.close()
+        with self.assertRaises(sqlite3.ProgrammingError):
+            idle.execute("SELECT 1")
+        # La connessione in uso resta valida fino al rilascio, poi viene chiusa
+        self.assertEqual(in_use.execute("SELECT 1").fetchone()[0], 1)
+        pool.release()
+        with self.assertRaises(sqlite3.ProgrammingError):
+            in_use.execute("SELECT 1")
+        self.assertEqual(pool._idle, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+"""
+Test unitari per l'invalidazione della cache dello schema dopo le migrazioni.
+Esegui con: python -m unittest src.core.annotation.tests.test_db_migrations
+"""
+
+import gc
+import os
+import tempfile
+import unittest
+
+from .. import db_migrations
+from ..db_manager import AnnotationDBManager
+from ..db_migrations import notify_schema_changed, register_schema_listener, run_migrations
+
+
+class TestSchemaCacheInvalidation(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = os.path.join(self.tmp.name, "annotations.db")
+        self.addCleanup(db_migrations._schema_listeners.pop, db_migrations._listener_key(self.db_path), None)
+
+    def _manager(self):
+        manager = AnnotationDBManager(db_path=self.db_path, backup_dir=os.path.join(self.tmp.name, "backup"))
+        self.addCleanup(manager.close)
+        return manager
+
+    def _listeners(self):
+        return db_migrations._schema_listeners.get(db_migrations._listener_key(self.db_path), [])
+
+    def test_run_migrations_invalidates_cached_schema(self):
+        manager = self._manager()
+        manager.save_document({"id": "doc_1", "title": "Documento", "text": "testo"})
+        # Schema letto e messo in cache prima della migrazione 003
+        self.assertNotIn("status", manager.get_document("doc_1"))
+        self.assertNotIn("status", manager.list_documents()["documents"][0])
+
+        run_migrations(self.db_path)
+
+        self.assertTrue(manager.schema.has("documents", "status"))
+        self.assertEqual(manager.get_document("doc_1")["status"], "pending")
+        self.assertEqual(manager.list_documents()["documents"][0]["status"], "pending")
+        self.assertEqual([doc["id"] for doc in manager.list_documents(status="pending")["documents"]], ["doc_1"])
+
+    def test_collected_manager_listener_is_dropped(self):
+        calls = []
+
+        class Listener:
+            def invalidate(self):
+                calls.append(self)
+
+        kept, dropped = Listener(), Listener()
+        register_schema_listener(self.db_path, kept.invalidate)
+        register_schema_listener(self.db_path, dropped.invalidate)
+        self.assertEqual(len(self._listeners()), 2)
+
+        # Il riferimento debole non tiene in vita il proprietario del metodo
+        del dropped
+        gc.collect()
+        notify_schema_changed(self.db_path)
+
+        self.assertEqual(calls, [kept])
+        self.assertEqual(len(self._listeners()), 1)
+
+    def test_collected_manager_is_unregistered(self):
+        manager = AnnotationDBManager(db_path=self.db_path, backup_dir=os.path.join(self.tmp.name, "backup"))
+        self.assertEqual(len(self._listeners()), 1)
+        manager.close()
+
+        del manager
+        gc.collect()
+        # La migrazione non tiene in vita né richiama il manager raccolto
+        run_migrations(self.db_path)
+        self.assertEqual(self._listeners(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+"""
+Test unitari per la ricerca full-text (FTS5) su documenti e annotazioni.
+Esegui con: python -m unittest src.core.annotation.tests.test_db_search
+"""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from ..db_manager import AnnotationDBManager
+from ..db_migrations import run_migrations
+from ..db_search import MATCH_END, MATCH_START, build_match_query, rebuild_search_index, render_highlight
+
+SEARCH_TABLES = ("search_documents", "search_annotations")
+
+
+def assert_search_in_sync(test, cursor):
+    # Con rank = 1 l'integrity-check confronta l'indice con le tabelle di contenuto
+    for table in SEARCH_TABLES:
+        with test.subTest(table):
+            cursor.execute(f"INSERT INTO {table}({table}, rank) VALUES ('integrity-check', 1)")
+
+
+class TestBuildMatchQuery(unittest.TestCase):
+
+    def test_legal_punctuation_is_quoted(self):
+        self.assertEqual(build_match_query("art. 2043 c.c."), '"art." "2043" "c.c."')
+        self.assertEqual(build_match_query("a\"b"), '"a""b"')
+
+    def test_unbalanced_quote_is_a_plain_term(self):
+        self.assertEqual(build_match_query('danno "ingiusto'), '"danno" """ingiusto"')
+
+    def test_phrase_and_prefix(self):
+        self.assertEqual(build_match_query('"fatto illecito"'), '"fatto illecito"')
+        self.assertEqual(build_match_query("risarc*"), '"risarc"*')
+        self.assertEqual(build_match_query('"fatto illec"* danno'), '"fatto illec"* "danno"')
+
+    def test_queries_without_terms_are_rejected(self):
+        for query in ("", None, "   ", "*", "* ** \"\"", "... -"):
+            with self.subTest(query=query):
+                with self.assertRaises(ValueError):
+                    build_match_query(query)
+
+
+class TestRenderHighlight(unittest.TestCase):
+
+    def test_text_is_escaped_and_matches_marked(self):
+        value = f"<script>alert('x')</script> & {MATCH_START}danno{MATCH_END}"
+        self.assertEqual(
+            render_highlight(value),
+            "&lt;script&gt;alert(&#x27;x&#x27;)&lt;/script&gt; &amp; <mark>danno</mark>",
+        )
+
+    def test_none(self):
+        self.assertIsNone(render_highlight(None))
+
+
+class TestSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = os.path.join(self.tmp.name, "annotations.db")
+        self.manager = AnnotationDBManager(db_path=self.db_path, backup_dir=os.path.join(self.tmp.name, "backup"))
+        self.addCleanup(self.manager.close)
+        # La colonna status è aggiunta dalle migrazioni
+        run_migrations(self.db_path)
+        self.manager.invalidate_schema_cache()
+
+        documents = {
+            "doc_1": ("Codice civile", "Art. 2043 c.c. Qualunque fatto illecito che cagiona ad altri un danno ingiusto", "u1"),
+            "doc_2": ("Risarcimento", "Il risarcimento del danno da fatto illecito", "u2"),
+            "doc_3": ("<b>Nota</b>", "Danno patrimoniale & danno morale", "u1"),
+            "doc_4": ("Contratti", "La responsabilità contrattuale", None),
+        }
+        for doc_id, (title, text, assigned_to) in documents.items():
+            self.manager.save_document({"id": doc_id, "title": title, "text": text, "assigned_to": assigned_to})
+        self.manager.update_document_status("doc_2", "completed")
+        self.manager.bulk_import_annotations({
+            "doc_1": [{"id": "a1", "start": 0, "end": 14, "text": "Art. 2043 c.c.", "type": "ARTICOLO_CODICE"},
+                      {"id": "a2", "start": 54, "end": 67, "text": "danno ingiusto", "type": "CONCETTO"}],
+            "doc_2": [{"id": "a3", "start": 4, "end": 17, "text": "risarcimento del danno", "type": "CONCETTO"}],
+        })
+
+    def _ids(self, page):
+        return sorted(result["id"] for result in page["results"])
+
+    def test_legal_citation(self):
+        page = self.manager.search_documents("art. 2043 c.c.")
+        self.assertEqual(self._ids(page), ["doc_1"])
+        self.assertIn("<mark>2043</mark>", page["results"][0]["snippet"])
+
+    def test_phrase_prefix_and_unbalanced_quote(self):
+        self.assertEqual(self._ids(self.manager.search_documents('"fatto illecito"')), ["doc_1", "doc_2"])
+        self.assertEqual(self._ids(self.manager.search_documents('"illecito fatto"')), [])
+        self.assertEqual(self._ids(self.manager.search_documents("risarc*")), ["doc_2"])
+        self.assertEqual(self._ids(self.manager.search_documents('danno "ingiusto')), ["doc_1"])
+        with self.assertRaises(ValueError):
+            self.manager.search_documents("*")
+
+    def test_highlight_is_escaped(self):
+        result = self.manager.search_documents("nota patrimoniale")["results"][0]
+        self.assertEqual(result["title_highlight"], "&lt;b&gt;<mark>Nota</mark>&lt;/b&gt;")
+        self.assertIn("&amp;", result["snippet"])
+
+    def test_document_filters(self):
+        self.assertEqual(self._ids(self.manager.search_documents("danno", status="completed")), ["doc_2"])
+        self.assertEqual(self._ids(self.manager.search_documents("danno", status="pending")), ["doc_1", "doc_3"])
+        self.assertEqual(self._ids(self.manager.search_documents("danno", assigned_to="u1")), ["doc_1", "doc_3"])
+        self.assertEqual(self._ids(self.manager.search_documents("danno", entity_type="CONCETTO")), ["doc_1", "doc_2"])
+        self.assertEqual(self._ids(self.manager.search_documents("danno", entity_type="ARTICOLO_CODICE")), ["doc_1"])
+
+    def test_annotation_filters(self):
+        self.assertEqual(self._ids(self.manager.search_annotations("danno")), ["a2", "a3"])
+        self.assertEqual(self._ids(self.manager.search_annotations("danno", status="completed")), ["a3"])
+        self.assertEqual(self._ids(self.manager.search_annotations("danno", assigned_to="u1")), ["a2"])
+        self.assertEqual(self._ids(self.manager.search_annotations("c.c.", entity_type="ARTICOLO_CODICE")), ["a1"])
+        self.assertEqual(self._ids(self.manager.search_annotations("c.c.", entity_type="CONCETTO")), [])
+        result = self.manager.search_annotations("ingiusto")["results"][0]
+        self.assertEqual(result["document_title"], "Codice civile")
+        self.assertEqual(result["text_highlight"], "danno <mark>ingiusto</mark>")
+
+    def test_next_offset(self):
+        seen = []
+        offset = 0
+        pages = 0
+        while offset is not None:
+            page = self.manager.search_documents("danno", limit=2, offset=offset)
+            seen.extend(result["id"] for result in page["results"])
+            offset = page["next_offset"]
+            pages += 1
+        self.assertEqual(pages, 2)
+        self.assertEqual(sorted(seen), ["doc_1", "doc_2", "doc_3"])
+
+        page = self.manager.search_annotations("danno", limit=2)
+        self.assertEqual(len(page["results"]), 2)
+        self.assertIsNone(page["next_offset"])
+
+    def test_replace_keeps_index_consistent(self):
+        # INSERT OR REPLACE sullo stesso ID (documento e annotazione)
+        self.manager.save_document({"id": "doc_4", "title": "Contratti", "text": "Inadempimento delle obbligazioni"})
+        self.manager.save_annotation("doc_1", {"id": "a2", "start": 54, "end": 67, "text": "pregiudizio", "type": "CONCETTO"})
+
+        self.assertEqual(self._ids(self.manager.search_documents("responsabilità")), [])
+        self.assertEqual(self._ids(self.manager.search_documents("inadempimento")), ["doc_4"])
+        self.assertEqual(self._ids(self.manager.search_annotations("ingiusto")), [])
+        self.assertEqual(self._ids(self.manager.search_annotations("pregiudizio")), ["a2"])
+
+        self.manager.bulk_delete_documents(["doc_1"], is_admin=True)
+        self.assertEqual(self._ids(self.manager.search_annotations("pregiudizio")), [])
+        with self.manager._get_db() as (conn, cursor):
+            assert_search_in_sync(self, cursor)
+
+    def test_integrity_check_detects_drift(self):
+        with self.manager._get_db() as (conn, cursor):
+            assert_search_in_sync(self, cursor)
+
+        # Connessione esterna senza PRAGMA recursive_triggers: la vecchia riga resta nell'indice
+        conn = sqlite3.connect(self.db_path)
+        self.addCleanup(conn.close)
+        conn.execute("INSERT OR REPLACE INTO documents (id, title, text) VALUES ('doc_4', 'Contratti', 'Inadempimento')")
+        conn.commit()
+        with self.assertRaises(sqlite3.DatabaseError):
+            conn.execute("INSERT INTO search_documents(search_documents, rank) VALUES ('integrity-check', 1)")
+
+        rebuild_search_index(conn.cursor())
+        conn.commit()
+        assert_search_in_sync(self, conn.cursor())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+Test unitari per le statistiche materializzate mantenute dai trigger.
+Esegui con: python -m unittest src.core.annotation.tests.test_db_stats
+"""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from ..db_manager import AnnotationDBManager
+from ..db_stats import rebuild_stats
+
+STATS_TABLES = (
+    "stats_annotation_types",
+    "stats_documents",
+    "stats_annotations_daily",
+    "stats_activity_daily",
+    "stats_activity_documents",
+)
+
+
+def annotation(start, end, entity_type, ann_id=None):
+    value = {"start": start, "end": end, "text": "art. 2043 c.c.", "type": entity_type}
+    if ann_id:
+        value["id"] = ann_id
+    return value
+
+
+class TestStatsTriggers(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = os.path.join(self.tmp.name, "annotations.db")
+        self.manager = AnnotationDBManager(db_path=self.db_path, backup_dir=os.path.join(self.tmp.name, "backup"))
+        self.addCleanup(self.manager.close)
+        for doc_id in ("doc_1", "doc_2", "doc_3"):
+            self.manager.save_document({"id": doc_id, "title": doc_id, "text": "testo " * 50, "word_count": 50}, user_id="u1")
+
+    def _snapshot(self, cursor):
+        return {
+            table: sorted(tuple(row) for row in cursor.execute(f"SELECT * FROM {table}").fetchall())
+            for table in STATS_TABLES
+        }
+
+    def _assert_matches_rebuild(self):
+        with self.manager._get_db() as (conn, cursor):
+            incremental = self._snapshot(cursor)
+            rebuild_stats(cursor)
+            rebuilt = self._snapshot(cursor)
+            conn.rollback()
+        for table in STATS_TABLES:
+            with self.subTest(table):
+                self.assertEqual(incremental[table], rebuilt[table])
+        return incremental
+
+    def test_mixed_operations_match_rebuild(self):
+        self.manager.save_annotation("doc_1", annotation(0, 5, "LEGGE", "a1"), user_id="u1")
+        self.manager.save_annotation("doc_1", annotation(6, 9, "LEGGE", "a2"), user_id="u2")
+        self.manager.save_annotation("doc_2", annotation(0, 5, "ARTICOLO_CODICE", "a3"), user_id="u1")
+        # REPLACE con lo stesso ID: cambia tipo e autore
+        self.manager.save_annotation("doc_1", {**annotation(0, 5, "ARTICOLO_CODICE", "a1"), "created_by": "u2"}, user_id="u2")
+        self.manager.delete_annotation("a2")
+        self.manager.bulk_import_annotations({
+            "doc_2": [annotation(10, 15, "LEGGE", "a4"), annotation(20, 25, "LEGGE")],
+            "doc_3": [annotation(0, 5, "ARTICOLO_CODICE", "a3"), annotation(8, 12, "GIURISPRUDENZA")],
+        }, user_id="u1")
+        self.manager.clear_annotations("doc_2", entity_type="LEGGE")
+        self.manager.save_annotation("doc_2", annotation(30, 35, "LEGGE"), user_id="u1")
+        self.manager.bulk_delete_documents(["doc_3", "doc_x"], user_id="u1", is_admin=True)
+
+        stats = self._assert_matches_rebuild()
+        self.assertEqual(dict(stats["stats_annotation_types"]), {"ARTICOLO_CODICE": 1, "LEGGE": 1})
+        self.assertEqual(
+            {row[0]: row[4] for row in stats["stats_documents"]}, {"doc_1": 1, "doc_2": 1}
+        )
+
+    def test_without_recursive_triggers_replace_drifts(self):
+        self.manager.save_annotation("doc_1", annotation(0, 5, "LEGGE", "a1"))
+        self._assert_matches_rebuild()
+
+        # Connessione esterna senza PRAGMA recursive_triggers: REPLACE non attiva il trigger di cancellazione
+        conn = sqlite3.connect(self.db_path)
+        self.addCleanup(conn.close)
+        conn.execute(
+            "INSERT OR REPLACE INTO annotations (id, doc_id, start, end, text, type) "
+            "VALUES ('a1', 'doc_1', 0, 5, 'art. 2043 c.c.', 'ARTICOLO_CODICE')"
+        )
+        conn.commit()
+
+        stats = dict(conn.execute("SELECT type, count FROM stats_annotation_types").fetchall())
+        self.assertEqual(stats, {"LEGGE": 1, "ARTICOLO_CODICE": 1})
+        self.assertEqual(
+            conn.execute("SELECT annotation_count FROM stats_documents WHERE doc_id = 'doc_1'").fetchone()[0], 2
+        )
+
+        # La ricostruzione riallinea i contatori
+        rebuild_stats(conn.cursor())
+        conn.commit()
+        stats = dict(conn.execute("SELECT type, count FROM stats_annotation_types").fetchall())
+        self.assertEqual(stats, {"ARTICOLO_CODICE": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+Test unitari per la paginazione per chiave dell'elenco dei documenti.
+Esegui con: python -m unittest src.core.annotation.tests.test_document_listing
+"""
+
+import os
+import tempfile
+import unittest
+
+from ..db_manager import AnnotationDBManager
+from ..db_migrations import run_migrations
+
+
+class TestListDocuments(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        db_path = os.path.join(self.tmp.name, "annotations.db")
+        self.manager = AnnotationDBManager(db_path=db_path, backup_dir=os.path.join(self.tmp.name, "backup"))
+        self.addCleanup(self.manager.close)
+        run_migrations(db_path)
+
+        # Stesse date a coppie (stessa chiave, ordinati per id) e tre documenti legacy senza data
+        for i in range(8):
+            self.manager.save_document({
+                "id": f"doc_{i}",
+                "title": f"Documento {i}",
+                "text": "testo " * 50,
+                "date_created": f"2024-01-0{i // 2 + 1}T10:00:00",
+                "assigned_to": "u1" if i % 2 else "u2",
+            })
+        with self.manager._get_db() as (conn, cursor):
+            cursor.executemany(
+                "INSERT INTO documents (id, title, text, date_created, assigned_to) VALUES (?, ?, ?, NULL, ?)",
+                [("legacy_a", "Legacy A", "testo", "u1"), ("legacy_b", "Legacy B", "testo", "u2"), ("legacy_c", "Legacy C", "testo", "u1")],
+            )
+            cursor.execute("UPDATE documents SET status = 'completed' WHERE id IN ('doc_1', 'doc_4', 'legacy_b')")
+        self.manager.save_annotation("doc_3", {"id": "ann_1", "start": 0, "end": 5, "text": "testo", "type": "LEGGE"})
+        self.manager.save_annotation("doc_3", {"id": "ann_2", "start": 6, "end": 11, "text": "testo", "type": "LEGGE"})
+
+    def _all_pages(self, limit, **filters):
+        ids, pages, cursor_token = [], 0, None
+        while True:
+            page = self.manager.list_documents(limit=limit, cursor_token=cursor_token, **filters)
+            ids.extend(doc["id"] for doc in page["documents"])
+            pages += 1
+            cursor_token = page["next_cursor"]
+            if cursor_token is None:
+                return ids, pages
+
+    def test_cursor_round_trip(self):
+        token = AnnotationDBManager.encode_listing_cursor("2024-01-01T10:00:00", "doc_0")
+        self.assertEqual(AnnotationDBManager.decode_listing_cursor(token), ("2024-01-01T10:00:00", "doc_0"))
+        token = AnnotationDBManager.encode_listing_cursor(None, "legacy_a")
+        self.assertEqual(AnnotationDBManager.decode_listing_cursor(token), (None, "legacy_a"))
+        with self.assertRaises(ValueError):
+            self.manager.list_documents(cursor_token="non-un-cursore")
+
+    def test_pages_cover_every_document_once_in_order(self):
+        expected = [f"doc_{i}" for i in reversed(range(8))] + ["legacy_c", "legacy_b", "legacy_a"]
+        for limit in (1, 2, 3, 4, 11, 50):
+            with self.subTest(limit=limit):
+                ids, pages = self._all_pages(limit)
+                self.assertEqual(ids, expected)
+                self.assertEqual(pages, -(-len(expected) // limit))
+
+    def test_documents_without_date_are_reachable(self):
+        self.assertEqual(len(self.manager.get_documents()), 11)
+        page = self.manager.list_documents(limit=9)
+        self.assertEqual(page["documents"][-1]["id"], "legacy_c")
+        rest = self.manager.list_documents(limit=9, cursor_token=page["next_cursor"])
+        self.assertEqual([doc["id"] for doc in rest["documents"]], ["legacy_b", "legacy_a"])
+        self.assertIsNone(rest["next_cursor"])
+
+    def test_filters_apply_across_pages(self):
+        ids, _ = self._all_pages(2, assigned_to="u1")
+        self.assertEqual(ids, ["doc_7", "doc_5", "doc_3", "doc_1", "legacy_c", "legacy_a"])
+        ids, _ = self._all_pages(1, status="completed")
+        self.assertEqual(ids, ["doc_4", "doc_1", "legacy_b"])
+        ids, _ = self._all_pages(1, status="completed", assigned_to="u1")
+        self.assertEqual(ids, ["doc_1"])
+
+    def test_projection_has_counts_and_no_text(self):
+        documents = {doc["id"]: doc for doc in self.manager.list_documents(limit=50)["documents"]}
+        self.assertNotIn("text", documents["doc_3"])
+        self.assertEqual(documents["doc_3"]["annotation_count"], 2)
+        self.assertEqual(documents["doc_0"]["annotation_count"], 0)
+        self.assertEqual(documents["doc_3"]["title"], "Documento 3")
+        self.assertEqual(documents["doc_3"]["metadata"], {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+Test unitari per la serializzazione incrementale delle esportazioni.
+Esegui con: python -m unittest src.core.annotation.tests.test_export_stream
+"""
+
+import importlib.util
+import json
+import os
+import tempfile
+import unittest
+
+from ..export_stream import stream_json, stream_jsonl, stream_spacy_json, write_docbin
+
+HAS_SPACY = importlib.util.find_spec("spacy") is not None
+
+DOCUMENTS = [
+    ("doc_1", "Vedi articolo 2043 del codice civile",
+     [{"id": "a1", "start": 5, "end": 18, "type": "ARTICOLO"},
+      {"id": "a2", "start": 23, "end": 36, "type": "FONTE"}]),
+    ("doc_2", None, [{"id": "a3", "start": 0, "end": 4, "type": "FONTE"}]),
+    ("doc_3", "Danno ingiusto",
+     # "anno" non è allineato ai token; le due entità successive si sovrappongono
+     [{"id": "a4", "start": 1, "end": 5, "type": "CONCETTO"},
+      {"id": "a5", "start": 0, "end": 14, "type": "CONCETTO"},
+      {"id": "a6", "start": 6, "end": 14, "type": "ALTRO"}]),
+]
+
+
+class TestStreams(unittest.TestCase):
+
+    def test_json_formats(self):
+        self.assertEqual(
+            json.loads("".join(stream_json(DOCUMENTS))),
+            {doc_id: annotations for doc_id, _, annotations in DOCUMENTS},
+        )
+        lines = "".join(stream_jsonl(DOCUMENTS)).splitlines()
+        self.assertEqual([json.loads(line)["doc_id"] for line in lines], ["doc_1", "doc_2", "doc_3"])
+
+    def test_spacy_json_skips_missing_documents(self):
+        data = json.loads("".join(stream_spacy_json(DOCUMENTS, wrap=True)))["data"]
+        self.assertEqual([record["text"] for record in data], [DOCUMENTS[0][1], DOCUMENTS[2][1]])
+        self.assertEqual(data[0]["entities"], [[5, 18, "ARTICOLO"], [23, 36, "FONTE"]])
+
+
+@unittest.skipUnless(HAS_SPACY, "spaCy non installato")
+class TestWriteDocBin(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "export.spacy")
+
+    def _read(self):
+        import spacy
+        from spacy.tokens import DocBin
+
+        nlp = spacy.blank("it")
+        return list(DocBin().from_disk(self.path).get_docs(nlp.vocab))
+
+    def test_round_trip(self):
+        self.assertEqual(write_docbin(iter(DOCUMENTS), self.path), 2)
+
+        docs = self._read()
+        self.assertEqual([doc.text for doc in docs], [DOCUMENTS[0][1], DOCUMENTS[2][1]])
+        self.assertEqual(
+            [(ent.start_char, ent.end_char, ent.label_) for ent in docs[0].ents],
+            [(5, 18, "ARTICOLO"), (23, 36, "FONTE")],
+        )
+        # Entità non allineata scartata, sovrapposizione risolta a favore dello span più lungo
+        self.assertEqual([(ent.text, ent.label_) for ent in docs[1].ents], [("Danno ingiusto", "CONCETTO")])
+
+    def test_many_documents(self):
+        documents = (
+            (f"doc_{i}", f"Documento numero {i}", [{"start": 0, "end": 9, "type": "TIPO"}])
+            for i in range(1200)
+        )
+        self.assertEqual(write_docbin(documents, self.path), 1200)
+
+        docs = self._read()
+        self.assertEqual(len(docs), 1200)
+        self.assertEqual(docs[-1].text, "Documento numero 1199")
+        self.assertTrue(all(len(doc.ents) == 1 for doc in docs))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,15 +10,22 @@ from quart import Quart, request, jsonify, render_template, send_file, Response,
 from quart_cors import cors
 import structlog
 
-from .tools.config import HISTORY_LIMIT, RATE_LIMIT, RATE_LIMIT_WINDOW
+from .tools.config import (
+    HISTORY_LIMIT, RATE_LIMIT, RATE_LIMIT_WINDOW, ACT_FETCH_MIN_ARTICLES, ARTICLE_FETCH_CONCURRENCY, STREAM_PREFETCH
+)
 from .tools.norma import Norma, NormaVisitata
 from .services.brocardi_scraper import BrocardiScraper
 from .services.normattiva_scraper import NormattivaScraper
 from .services.eurlex_scraper import EurlexScraper
 from .services.pdfextractor import extract_pdf
-from .tools.sys_op import WebDriverManager
+from .tools.webdriver_pool import get_webdriver_pool
+from .tools.http_session import default_session_manager
+from .tools.cache import get_document_cache
+from .tools.brocardi_index import get_brocardi_index
+from .tools.outbound import get_outbound_governor
 from .tools.urngenerator import complete_date_or_parse, urn_to_filename
 from .tools.treextractor import get_tree
+from .tools.streaming import stream_concurrently
 from .tools.text_op import format_date_to_extended, parse_article_input
 
 # Configurazione del logging
@@ -56,11 +63,13 @@ def count_tokens(data):
 request_counts = defaultdict(lambda: {'count': 0, 'time': time()})
 history = deque(maxlen=HISTORY_LIMIT)
 
-# Inizializzazione degli scraper e del driver manager
-brocardi_scraper = BrocardiScraper()
-normattiva_scraper = NormattivaScraper()
-eurlex_scraper = EurlexScraper()
-driver_manager = WebDriverManager()
+# Inizializzazione degli scraper e del driver manager.
+# Gli scraper condividono un'unica sessione HTTP, aperta e chiusa insieme all'app.
+session_manager = default_session_manager
+brocardi_scraper = BrocardiScraper(session_manager=session_manager)
+normattiva_scraper = NormattivaScraper(session_manager=session_manager)
+eurlex_scraper = EurlexScraper(session_manager=session_manager)
+webdriver_pool = get_webdriver_pool()
 
 
 class NormaController:
@@ -68,6 +77,10 @@ class NormaController:
         self.app = Quart(__name__)
         self.app = cors(self.app, allow_origin="http://localhost:3000")
         
+        # Ciclo di vita della sessione HTTP condivisa dagli scraper
+        self.app.before_serving(self.startup)
+        self.app.after_serving(self.shutdown)
+
         # Middleware per registrare il tempo di inizio della richiesta
         self.app.before_request(self.record_start_time)
         # Middleware per il rate limiting
@@ -82,38 +95,64 @@ class NormaController:
     async def stream_article_text(self):
         """
         Endpoint che invia in streaming i risultati della ricerca degli articoli.
-        I risultati vengono inviati man mano che vengono trovati.
+        Fino a STREAM_PREFETCH articoli vengono recuperati in parallelo e inviati appena pronti:
+        nell'ordine della richiesta ('order': 'original', predefinito) oppure in ordine di
+        completamento ('order': 'completion'). Ogni risultato riporta la posizione ('index')
+        dell'articolo nella richiesta.
         """
         data = await request.get_json()
         log.info("Received data for stream_article_text", data=data)
+        order = data.get('order', 'original')
+        if order not in ('original', 'completion'):
+            return jsonify({'error': "'order' must be 'original' or 'completion'"}), 400
         normavisitate = await self.create_norma_visitata_from_data(data)
         log.info("NormaVisitata instances created", normavisitate=[nv.to_dict() for nv in normavisitate])
-        
+
+        async def fetch_result(item):
+            index, nv = item
+            scraper = self.get_scraper_for_norma(nv)
+            if scraper is None:
+                return {'error': 'Unsupported act type', 'norma_data': nv.to_dict(), 'index': index}
+            try:
+                article_text, url = await scraper.get_document(nv)
+                return {
+                    'article_text': article_text,
+                    'norma_data': nv.to_dict(),
+                    'url': url,
+                    'index': index
+                }
+            except Exception as exc:
+                return {'error': str(exc), 'norma_data': nv.to_dict(), 'index': index}
+
         async def result_generator():
-            for nv in normavisitate:
-                scraper = self.get_scraper_for_norma(nv)
-                if scraper is None:
-                    result = {'error': 'Unsupported act type', 'norma_data': nv.to_dict()}
+            # Se il client si disconnette Quart chiude il generatore e i fetch in corso vengono annullati
+            results = stream_concurrently(
+                list(enumerate(normavisitate)), fetch_result, prefetch=STREAM_PREFETCH, ordered=(order == 'original')
+            )
+            try:
+                async for result in results:
                     yield json.dumps(result) + "\n"
-                    continue
+            finally:
+                await results.aclose()
 
-                try:
-                    article_text, url = await scraper.get_document(nv)
-                    result = {
-                        'article_text': article_text,
-                        'norma_data': nv.to_dict(),
-                        'url': url
-                    }
-                except Exception as exc:
-                    result = {'error': str(exc), 'norma_data': nv.to_dict()}
-                # Invia subito il risultato corrente
-                yield json.dumps(result) + "\n"
-                # Se vuoi dare una piccola pausa tra un risultato e l'altro:
-                await asyncio.sleep(0.05)
-        
         # Restituisce una Response in streaming
         return Response(result_generator(), mimetype="application/json")
 
+    async def startup(self):
+        await session_manager.start()
+        log.info("Shared HTTP session started")
+        purged = await asyncio.to_thread(get_document_cache().disk.purge_expired)
+        log.info("Document cache ready", purged_expired=purged)
+        # Avvio dei browser in background: il primo export PDF non paga l'avvio di Chrome
+        asyncio.get_running_loop().run_in_executor(None, webdriver_pool.start)
+
+    async def shutdown(self):
+        await session_manager.close()
+        log.info("Shared HTTP session closed")
+        get_document_cache().close()
+        get_brocardi_index().close()
+        await asyncio.to_thread(webdriver_pool.close)
+
     async def record_start_time(self):
         g.start_time = time()
 
@@ -161,6 +200,8 @@ class NormaController:
         self.app.add_url_rule('/fetch_all_data', view_func=self.fetch_all_data, methods=['POST'])
         self.app.add_url_rule('/fetch_tree', view_func=self.fetch_tree, methods=['POST'])
         self.app.add_url_rule('/history', view_func=self.get_history, methods=['GET'])
+        self.app.add_url_rule('/cache_stats', view_func=self.get_cache_stats, methods=['GET'])
+        self.app.add_url_rule('/upstream_stats', view_func=self.get_upstream_stats, methods=['GET'])
         self.app.add_url_rule('/export_pdf', view_func=self.export_pdf, methods=['POST'])
 
 
@@ -176,7 +217,9 @@ class NormaController:
         act_type = data.get('act_type')
         if act_type in allowed_types:
             log.info("Act type is allowed", act_type=act_type)
-            data_completa = complete_date_or_parse(
+            # Il completamento della data può richiedere una richiesta HTTP: non blocca l'event loop
+            data_completa = await asyncio.to_thread(
+                complete_date_or_parse,
                 date=data.get('date'),
                 act_type=act_type,
                 act_number=data.get('act_number')
@@ -244,6 +287,9 @@ class NormaController:
             normavisitate = await self.create_norma_visitata_from_data(data)
             log.info("NormaVisitata instances created", normavisitate=[nv.to_dict() for nv in normavisitate])
 
+            act_documents = await self.prefetch_from_act(normavisitate)
+            semaphore = asyncio.Semaphore(ARTICLE_FETCH_CONCURRENCY)
+
             async def fetch_text(nv):
                 scraper = self.get_scraper_for_norma(nv)
                 if scraper is None:
@@ -251,7 +297,7 @@ class NormaController:
                     return {'error': 'Unsupported act type', 'norma_data': nv.to_dict()}
 
                 try:
-                    article_text, url = await scraper.get_document(nv)
+                    article_text, url = await self.get_article_document(scraper, nv, act_documents, semaphore)
                     log.info("Document fetched successfully", article_text=article_text, url=url)
                     return {
                         'article_text': article_text,
@@ -276,6 +322,30 @@ class NormaController:
             log.error("Error in fetch_article_text", error=str(e))
             return jsonify({'error': str(e)}), 500
 
+    async def prefetch_from_act(self, normavisitate):
+        """
+        Per le richieste con molti articoli di Normattiva, scarica l'atto intero una sola volta
+        e restituisce i testi trovati nel suo indice (NormaVisitata -> (testo, url)).
+        """
+        normattiva_nvs = [nv for nv in normavisitate if self.get_scraper_for_norma(nv) is normattiva_scraper]
+        if len(normattiva_nvs) < ACT_FETCH_MIN_ARTICLES:
+            return {}
+        try:
+            documents = await normattiva_scraper.get_documents_from_act(normattiva_nvs)
+        except Exception as exc:
+            log.warning("Whole-act fetch failed, using per-article requests", error=str(exc))
+            return {}
+        act_documents = {nv: doc for nv, doc in zip(normattiva_nvs, documents) if doc is not None}
+        log.info("Articles answered from the act index", found=len(act_documents), requested=len(normattiva_nvs))
+        return act_documents
+
+    async def get_article_document(self, scraper, nv, act_documents, semaphore):
+        """Testo e URL dell'articolo: dall'indice dell'atto se disponibile, altrimenti con una richiesta dedicata."""
+        if nv in act_documents:
+            return act_documents[nv]
+        async with semaphore:
+            return await scraper.get_document(nv)
+
     async def fetch_tree(self):
         try:
             data = await request.get_json()
@@ -356,6 +426,9 @@ class NormaController:
 
             normavisitate = await self.create_norma_visitata_from_data(data)
 
+            act_documents = await self.prefetch_from_act(normavisitate)
+            semaphore = asyncio.Semaphore(ARTICLE_FETCH_CONCURRENCY)
+
             async def fetch_data(nv):
                 scraper = self.get_scraper_for_norma(nv)
                 if scraper is None:
@@ -363,7 +436,7 @@ class NormaController:
                     return {'error': 'Unsupported act type', 'norma_data': nv.to_dict()}
 
                 try:
-                    article_text, url = await scraper.get_document(nv)
+                    article_text, url = await self.get_article_document(scraper, nv, act_documents, semaphore)
                     brocardi_info = None
                     if scraper == normattiva_scraper:
                         try:
@@ -409,6 +482,20 @@ class NormaController:
             log.error("Error in get_history", error=str(e))
             return jsonify({'error': str(e)}), 500
 
+    async def get_upstream_stats(self):
+        try:
+            return jsonify(get_outbound_governor().metrics())
+        except Exception as e:
+            log.error("Error in get_upstream_stats", error=str(e))
+            return jsonify({'error': str(e)}), 500
+
+    async def get_cache_stats(self):
+        try:
+            return jsonify(get_document_cache().metrics())
+        except Exception as e:
+            log.error("Error in get_cache_stats", error=str(e))
+            return jsonify({'error': str(e)}), 500
+
     async def export_pdf(self):
         try:
             data = await request.get_json()
@@ -434,12 +521,9 @@ class NormaController:
                     log.info(f"File PDF presente ma vuoto: {pdf_path}. Rimuovo e rigenero.")
                     await asyncio.to_thread(os.remove, pdf_path)
 
-            driver = await asyncio.to_thread(driver_manager.setup_driver)
-            try:
+            async with webdriver_pool.driver_async() as driver:
                 extracted_pdf_path = await asyncio.to_thread(extract_pdf, driver, urn)
                 log.info(f"PDF estratto: {extracted_pdf_path}")
-            finally:
-                await asyncio.to_thread(driver_manager.close_drivers)
 
             exists_extracted = await asyncio.to_thread(os.path.exists, extracted_pdf_path)
             size_extracted = await asyncio.to_thread(os.path.getsize, extracted_pdf_path) if exists_extracted else 0
@@ -0,0 +1,154 @@
+"""
+Benchmark della sessione HTTP condivisa rispetto a una sessione per richiesta.
+
+Avvia un server aiohttp locale che simula una pagina di Normattiva con una latenza
+configurabile e conta le connessioni TCP accettate. Lo stesso carico (N richieste con
+concorrenza C, come un fan-out di /fetch_article_text) viene eseguito:
+
+* creando una nuova ClientSession per ogni richiesta (comportamento precedente);
+* usando BaseScraper.request_document con un HttpSessionManager condiviso.
+
+Esempio:
+    python -m src.experts.rules.tools.visualex_api.benchmark_session --requests 500 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import functools
+import logging
+import statistics
+import time
+from typing import Dict, List
+
+import aiohttp
+from aiohttp import web
+
+from .tools.http_session import HttpSessionManager
+from .tools.outbound import OutboundGovernor
+from .tools.sys_op import BaseScraper
+
+PAGE = "<html><body><div class='bodyTesto'>" + "Lorem ipsum dolor sit amet. " * 400 + "</div></body></html>"
+
+
+class LocalServer:
+    """Server aiohttp locale che conta le connessioni TCP distinte aperte dai client."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self._peers = set()
+        self._runner = None
+        self.url = None
+
+    @property
+    def connections(self) -> int:
+        return len(self._peers)
+
+    def reset(self) -> None:
+        self._peers.clear()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        # Ogni connessione TCP ha una porta sorgente diversa lato client
+        self._peers.add(request.transport.get_extra_info("peername"))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.Response(text=PAGE, content_type="text/html")
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/uri-res/N2Ls", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://127.0.0.1:{port}/uri-res/N2Ls?urn:nir:stato:legge:1990-08-07;241~art"
+
+    async def stop(self) -> None:
+        await self._runner.cleanup()
+
+
+async def _run(fetch, urls: List[str], concurrency: int) -> List[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    timings: List[float] = []
+
+    async def one(url):
+        async with semaphore:
+            start = time.perf_counter()
+            await fetch(url)
+            timings.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(url) for url in urls))
+    return timings
+
+
+async def _fetch_new_session(url: str) -> str:
+    # Riproduce il vecchio BaseScraper.request_document
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=False)) as session:
+        async with session.get(url, timeout=30) as response:
+            response.raise_for_status()
+            return await response.text()
+
+
+def _summary(name: str, wall: float, timings: List[float], connections: int) -> Dict[str, object]:
+    ordered = sorted(timings)
+    return {
+        "strategia": name,
+        "req/s": len(timings) / wall,
+        "p50 ms": ordered[len(ordered) // 2] * 1000,
+        "p95 ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "media ms": statistics.mean(ordered) * 1000,
+        "connessioni": connections,
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> List[Dict[str, object]]:
+    server = LocalServer(args.latency)
+    await server.start()
+    urls = [f"{server.url}{i % 50 + 1}" for i in range(args.requests)]
+    results = []
+    try:
+        server.reset()
+        start = time.perf_counter()
+        timings = await _run(_fetch_new_session, urls, args.concurrency)
+        results.append(_summary("per-richiesta", time.perf_counter() - start, timings, server.connections))
+
+        manager = HttpSessionManager(limit_per_host=args.limit_per_host)
+        # Nessun limite in uscita: si confronta solo la gestione delle connessioni
+        governor = OutboundGovernor({"default": {"rate": 1e6, "burst": 1e6, "max_concurrency": args.concurrency}})
+        scraper = BaseScraper(session_manager=manager, governor=governor)
+        await manager.start()
+        try:
+            server.reset()
+            start = time.perf_counter()
+            # Si misura il solo trasporto, escludendo la cache dei documenti
+            fetch = functools.partial(BaseScraper.request_document.__wrapped__, scraper)
+            timings = await _run(fetch, urls, args.concurrency)
+            results.append(_summary("condivisa", time.perf_counter() - start, timings, server.connections))
+        finally:
+            await manager.close()
+    finally:
+        await server.stop()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark sessione HTTP condivisa vs sessione per richiesta")
+    parser.add_argument("--requests", type=int, default=500, help="Numero totale di richieste")
+    parser.add_argument("--concurrency", type=int, default=50, help="Richieste contemporanee")
+    parser.add_argument("--latency", type=float, default=0.005, help="Latenza simulata del server (secondi)")
+    parser.add_argument("--limit-per-host", type=int, default=50, help="limit_per_host del connettore condiviso")
+    args = parser.parse_args()
+
+    # Il logging per singola richiesta falserebbe le misure
+    logging.disable(logging.INFO)
+    results = asyncio.run(run_benchmark(args))
+
+    columns = ["strategia", "req/s", "p50 ms", "p95 ms", "media ms", "connessioni"]
+    print(" | ".join(f"{c:>13}" for c in columns))
+    print("-" * (16 * len(columns)))
+    for row in results:
+        print(" | ".join(f"{row[c]:>13.2f}" if isinstance(row[c], float) else f"{row[c]:>13}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
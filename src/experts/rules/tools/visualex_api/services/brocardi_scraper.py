@@ -1,19 +1,18 @@
 import logging
-import re
 import os
-from typing import Optional, Tuple, Union, Dict, Any, List
+from typing import Optional, Tuple, Union, Dict, Any
 
 import aiohttp
 import asyncio
-import requests
 from bs4 import BeautifulSoup
-from aiocache import cached, Cache
-from aiocache.serializers import JsonSerializer
 
 from ..tools.map import BROCARDI_CODICI
+from ..tools.brocardi_index import BrocardiArticleIndex, CodeDirectory, get_brocardi_index
 from ..tools.norma import NormaVisitata
 from ..tools.text_op import normalize_act_type
 from ..tools.sys_op import BaseScraper
+from ..tools.http_session import HttpSessionManager
+from ..tools.cache import cached_document
 
 # Configurazione del logger di modulo
 logger = logging.getLogger(__name__)
@@ -31,11 +30,16 @@ BASE_URL: str = "https://brocardi.it"
 
 
 class BrocardiScraper(BaseScraper):
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        session_manager: Optional[HttpSessionManager] = None,
+        article_index: Optional[BrocardiArticleIndex] = None,
+    ) -> None:
+        super().__init__(session_manager)
         logger.info("Initializing BrocardiScraper")
-        self.knowledge: List[Dict[str, Any]] = [BROCARDI_CODICI]
+        self.knowledge = CodeDirectory(BROCARDI_CODICI)
+        self.article_index = article_index
 
-    @cached(ttl=86400, cache=Cache.MEMORY, serializer=JsonSerializer())
     async def do_know(self, norma_visitata: NormaVisitata) -> Optional[Tuple[str, str]]:
         logger.info(f"Checking if knowledge exists for norma: {norma_visitata}")
 
@@ -44,16 +48,20 @@ class BrocardiScraper(BaseScraper):
             logger.error("Invalid norma format")
             raise ValueError("Invalid norma format")
 
-        search_str = norma_str.lower()
-        for txt, link in self.knowledge[0].items():
-            if search_str in txt.lower():
-                logger.info(f"Knowledge found for norma: {norma_visitata}")
-                return txt, link
+        knowledge = self.knowledge.find(norma_str)
+        if knowledge:
+            logger.info(f"Knowledge found for norma: {norma_visitata}")
+            return knowledge
 
         logger.warning(f"No knowledge found for norma: {norma_visitata}")
         return None
 
-    @cached(ttl=86400, cache=Cache.MEMORY, serializer=JsonSerializer())
+    @cached_document(
+        namespace="brocardi_link",
+        ttl=86400,
+        key=lambda self, norma_visitata: self._cache_key(norma_visitata),
+        cache_if=lambda link: link is not None,
+    )
     async def look_up(self, norma_visitata: NormaVisitata) -> Optional[str]:
         logger.info(f"Looking up norma: {norma_visitata}")
 
@@ -61,82 +69,33 @@ class BrocardiScraper(BaseScraper):
         if not norma_info:
             return None
 
-        link: str = norma_info[1]
-        # Recupera il contenuto della pagina principale
-        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=False)) as session:
-            try:
-                logger.info(f"Requesting main link: {link}")
-                async with session.get(link) as response:
-                    response.raise_for_status()
-                    html_text: str = await response.text()
-                    soup: BeautifulSoup = BeautifulSoup(html_text, 'html.parser')
-            except aiohttp.ClientError as e:
-                logger.error(f"Failed to retrieve content for norma link: {link}: {e}")
-                return None
-
-        numero_articolo: Optional[str] = (
-            norma_visitata.numero_articolo.replace('-', '')
-            if norma_visitata.numero_articolo else None
-        )
-        if numero_articolo:
-            article_link = await self._find_article_link(soup, BASE_URL, numero_articolo)
-            return article_link
-        logger.info("No article number provided")
-        return None
+        if not norma_visitata.numero_articolo:
+            logger.info("No article number provided")
+            return None
 
-    async def _find_article_link(self, soup: BeautifulSoup, base_url: str, numero_articolo: str) -> Optional[str]:
-        pattern = re.compile(rf'href=["\']([^"\']*art{re.escape(numero_articolo)}\.html)["\']')
-        logger.info("Searching for target link in the main page content")
-
-        matches = pattern.findall(str(soup))
-        if matches:
-            target_link = requests.compat.urljoin(base_url, matches[0])
-            logger.info(f"Direct match found: {target_link}")
-            return target_link
-
-        logger.info("No direct match found, searching in 'section-title' divs")
-        section_titles = soup.find_all('div', class_='section-title')
-        
-        async def check_sub_link(a_tag, session: aiohttp.ClientSession) -> Optional[str]:
-            sub_link = requests.compat.urljoin(base_url, a_tag.get('href', ''))
-            if not sub_link:
-                return None
-                
-            try:
-                # Assicurati che la sessione sia valida
-                if session.closed:
-                    logger.warning(f"Session closed for sub-link {sub_link}, skipping")
-                    return None
-                    
-                async with session.get(sub_link, timeout=15) as sub_response:
-                    if sub_response.status == 200:
-                        sub_html = await sub_response.text()
-                        sub_soup = BeautifulSoup(sub_html, 'html.parser')
-                        sub_matches = pattern.findall(str(sub_soup))
-                        if sub_matches:
-                            return requests.compat.urljoin(base_url, sub_matches[0])
-            except Exception as e:
-                logger.error(f"Error processing sub-link {sub_link}: {str(e)}", exc_info=True)
+        # L'indice del codice viene scaricato una sola volta e poi aggiornato in modo incrementale
+        link: str = norma_info[1]
+        numero_articolo: str = norma_visitata.numero_articolo.replace('-', '')
+        article_index = self.article_index or get_brocardi_index()
+        session = await self.get_session()
+        try:
+            article_link = await article_index.get_article_url(link, numero_articolo, session)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Failed to retrieve Brocardi index for norma link: {link}: {e}")
             return None
 
-        async with aiohttp.ClientSession(
-            connector=aiohttp.TCPConnector(ssl=False, limit=10),
-            timeout=aiohttp.ClientTimeout(total=30)
-        ) as session:
-            tasks = []
-            for section in section_titles:
-                for a_tag in section.find_all('a', href=True):
-                    tasks.append(check_sub_link(a_tag, session))
-
-            if tasks:
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-                for result in results:
-                    if isinstance(result, str):  # Valid result
-                        return result
-                    
-        logger.info(f"No matching article found for article number: {numero_articolo}")
-        return None
-    
+        if article_link:
+            logger.info(f"Article link found in index: {article_link}")
+        else:
+            logger.info(f"No matching article found for article number: {numero_articolo}")
+        return article_link
+
+    @cached_document(
+        namespace="brocardi_info",
+        ttl=86400,
+        key=lambda self, norma_visitata: self._cache_key(norma_visitata),
+        cache_if=lambda info: info[2] is not None,
+    )
     async def get_info(self, norma_visitata: NormaVisitata) -> Tuple[Optional[str], Dict[str, Any], Optional[str]]:
         logger.info(f"Getting info for norma: {norma_visitata}")
 
@@ -144,15 +103,12 @@ class BrocardiScraper(BaseScraper):
         if not norma_link:
             return None, {}, None
 
-        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=False)) as session:
-            try:
-                async with session.get(norma_link) as response:
-                    response.raise_for_status()
-                    html_text = await response.text()
-                    soup = BeautifulSoup(html_text, 'html.parser')
-            except aiohttp.ClientError as e:
-                logger.error(f"Failed to retrieve content for norma link: {norma_link}: {e}")
-                return None, {}, None
+        try:
+            html_text = await self.fetch_text(norma_link)
+            soup = BeautifulSoup(html_text, 'html.parser')
+        except aiohttp.ClientError as e:
+            logger.error(f"Failed to retrieve content for norma link: {norma_link}: {e}")
+            return None, {}, None
 
         info: Dict[str, Any] = {}
         info['Position'] = self._extract_position(soup)
@@ -195,6 +151,9 @@ class BrocardiScraper(BaseScraper):
             if massime_content:
                 info['Massime'] = [massima.get_text(strip=False) for massima in massime_content]
 
+    def _cache_key(self, norma_visitata: NormaVisitata) -> str:
+        return f"{self._build_norma_string(norma_visitata)}|{norma_visitata.numero_articolo}"
+
     def _build_norma_string(self, norma_visitata: Union[NormaVisitata, str]) -> Optional[str]:
         if isinstance(norma_visitata, NormaVisitata):
             norma = norma_visitata.norma
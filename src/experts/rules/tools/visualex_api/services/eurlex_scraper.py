@@ -1,9 +1,10 @@
+import json
 import logging
 import os
-from aiocache import cached, Cache
-from aiocache.serializers import JsonSerializer
 from ..tools.map import EURLEX
 from ..tools.sys_op import BaseScraper
+from ..tools.cache import cached_document
+from ..tools.singleflight import document_flight_key
 
 # Configure logging
 logging.basicConfig(level=logging.INFO,
@@ -11,8 +12,16 @@ logging.basicConfig(level=logging.INFO,
                     handlers=[logging.FileHandler("eurlex_scraper.log"),
                               logging.StreamHandler()])
 
+def _document_cache_key(self, normavisitata=None, act_type=None, article=None, year=None, num=None, urn=None):
+    # L'URN degli atti EUR-Lex non contiene l'articolo, che va quindi aggiunto alla chiave
+    if normavisitata:
+        return f"{document_flight_key(normavisitata.urn, normavisitata.data_versione)}|{normavisitata.numero_articolo}"
+    return json.dumps([act_type, article, year, num, urn])
+
+
 class EurlexScraper(BaseScraper):
-    def __init__(self):
+    def __init__(self, session_manager=None):
+        super().__init__(session_manager)
         self.base_url = 'https://eur-lex.europa.eu/eli'
         logging.info("EurlexScraper initialized")
 
@@ -28,7 +37,7 @@ class EurlexScraper(BaseScraper):
         
         return uri
 
-    @cached(ttl=86400, cache=Cache.MEMORY, serializer=JsonSerializer())
+    @cached_document(namespace="eurlex_article", ttl=86400, key=_document_cache_key)
     async def get_document(self, normavisitata=None, act_type=None, article=None, year=None, num=None, urn=None):
         logging.info(f"Fetching EUR-Lex document with parameters {normavisitata.to_dict()}: act_type={act_type}, article={article}, year={year}, num={num}, urn={urn}")
 
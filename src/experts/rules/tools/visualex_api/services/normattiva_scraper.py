@@ -1,13 +1,16 @@
 import logging
 import re
-from typing import Tuple, Optional, Union, Dict, Any
+from typing import Tuple, Optional, Union, Dict, Any, List
+from urllib.parse import urljoin
 
-from bs4 import BeautifulSoup, NavigableString, Tag
-from aiocache import cached, Cache
-from aiocache.serializers import JsonSerializer
+from bs4 import BeautifulSoup, NavigableString, SoupStrainer, Tag
 
 from ..tools.norma import NormaVisitata
-from ..tools.sys_op import BaseScraper
+from ..tools.sys_op import BaseScraper, HTML_PARSER
+from ..tools.http_session import HttpSessionManager
+from ..tools.cache import cached_document
+from ..tools.singleflight import document_flight_key
+from ..tools.urngenerator import generate_urn
 
 # Configurazione del logger di modulo
 logger = logging.getLogger(__name__)
@@ -20,13 +23,53 @@ stream_handler.setFormatter(formatter)
 logger.addHandler(file_handler)
 logger.addHandler(stream_handler)
 
+# Prefissi dei messaggi restituiti da estrai_da_html quando l'estrazione fallisce
+EXTRACTION_ERRORS = (
+    "Body of the document not found",
+    "Unknown formatting structure",
+    "Generic error",
+    "Error in _estrai_testo",
+)
+
+
+def _is_extracted_document(result: Tuple[str, str]) -> bool:
+    """Evita di memorizzare in cache gli esiti di un'estrazione fallita."""
+    text = result[0]
+    return not (isinstance(text, str) and text.startswith(EXTRACTION_ERRORS))
+
+
+def article_key(numero_articolo: Optional[str], allegato: Optional[str] = None) -> str:
+    """
+    Chiave normalizzata di un articolo nell'indice dell'atto.
+
+    "Art. 3-bis", "3 bis" e "3bis" producono tutti "3bis"; gli articoli degli allegati
+    sono prefissati dal numero dell'allegato (es. "1:3bis").
+    """
+    numero = re.sub(r'^\s*(articolo|art\.?)\s*', '', str(numero_articolo or ''), flags=re.IGNORECASE)
+    numero = re.sub(r'[\s\-]+', '', numero).lower().rstrip('.')
+    allegato = str(allegato).strip().lower() if allegato else ''
+    return f"{allegato}:{numero}" if allegato else numero
+
+
+# Limita il parsing al corpo dell'articolo: header, menu e sidebar della pagina non vengono costruiti
+BODY_STRAINER = SoupStrainer('div', class_='bodyTesto')
+
+# Intestazioni degli allegati nel testo completo dell'atto (es. "Allegato 1", "ALLEGATO A")
+ANNEX_HEADING = re.compile(r'^\s*allegato\s+([\w.]+)', re.IGNORECASE)
+
 
 class NormattivaScraper(BaseScraper):
-    def __init__(self) -> None:
+    def __init__(self, session_manager: Optional[HttpSessionManager] = None) -> None:
+        super().__init__(session_manager)
         self.base_url: str = "https://www.normattiva.it/"
         logger.info("NormattivaScraper initialized")
 
-    @cached(ttl=86400, cache=Cache.MEMORY, serializer=JsonSerializer())
+    @cached_document(
+        namespace="normattiva_article",
+        ttl=86400,
+        key=lambda self, normavisitata: document_flight_key(normavisitata.urn, normavisitata.data_versione),
+        cache_if=_is_extracted_document,
+    )
     async def get_document(self, normavisitata: NormaVisitata) -> Tuple[str, str]:
         logger.info(f"Fetching Normattiva document for: {normavisitata}")
         urn: str = normavisitata.urn
@@ -48,21 +91,28 @@ class NormattivaScraper(BaseScraper):
         self, atto: str, comma: Optional[str] = None, get_link_dict: bool = False
     ) -> Union[str, Dict[str, Any]]:
         try:
-            soup: BeautifulSoup = self.parse_document(atto)
+            soup: BeautifulSoup = self.parse_document(atto, only_body=True)
             corpo: Optional[Tag] = soup.find('div', class_='bodyTesto')
             if corpo is None:
                 logger.warning("Body of the document not found")
                 return "Body of the document not found"
+            return self._estrai_da_corpo(corpo, link=get_link_dict)
+        except Exception as e:
+            logger.error(f"Generic error: {e}", exc_info=True)
+            return f"Generic error: {e}"
 
+    def _estrai_da_corpo(self, corpo: Tag, link: bool = False) -> Union[str, Dict[str, Any]]:
+        """Sceglie lo scenario di estrazione in base alla formattazione del corpo dell'articolo."""
+        try:
             if corpo.find(class_='art-comma-div-akn'):
                 # SCENARIO 1: Formattazione AKN Dettagliata
-                return self._estrai_testo_akn_dettagliato(corpo, link=get_link_dict)
+                return self._estrai_testo_akn_dettagliato(corpo, link=link)
             elif corpo.find(class_='art-just-text-akn'):
                 # SCENARIO 2: Formattazione Semplice con `akn-just-text`
-                return self._estrai_testo_akn_semplice(corpo, link=get_link_dict)
+                return self._estrai_testo_akn_semplice(corpo, link=link)
             elif corpo.find(class_='attachment-just-text'):
                 # SCENARIO 3: Allegato o Testo senza Formattazione AKN
-                return self._estrai_testo_allegato(corpo, link=get_link_dict)
+                return self._estrai_testo_allegato(corpo, link=link)
             else:
                 logger.warning("Unknown formatting structure")
                 return "Unknown formatting structure"
@@ -70,9 +120,151 @@ class NormattivaScraper(BaseScraper):
             logger.error(f"Generic error: {e}", exc_info=True)
             return f"Generic error: {e}"
 
+    # --- Recupero dell'atto intero e indice degli articoli ---
+
+    @staticmethod
+    def act_urn(normavisitata: NormaVisitata) -> str:
+        """URN dell'atto (senza articolo né allegato) nella versione richiesta."""
+        norma = normavisitata.norma
+        return generate_urn(
+            act_type=norma.tipo_atto_urn,
+            date=norma.data,
+            act_number=norma.numero_atto,
+            version=normavisitata.versione,
+            version_date=normavisitata.data_versione,
+        )
+
+    def _find_full_act_url(self, soup: BeautifulSoup) -> Optional[str]:
+        """Individua nella pagina dell'atto il link alla visualizzazione dell'atto completo."""
+        link = soup.find('a', href=re.compile(r'attoCompleto'))
+        if link:
+            return urljoin(self.base_url, link['href'])
+        data_gu = soup.find('input', attrs={'name': 'atto.dataPubblicazioneGazzetta'})
+        codice = soup.find('input', attrs={'name': 'atto.codiceRedazionale'})
+        if data_gu and codice and data_gu.get('value') and codice.get('value'):
+            return urljoin(
+                self.base_url,
+                f"esporta/attoCompleto?atto.dataPubblicazioneGazzetta={data_gu['value']}"
+                f"&atto.codiceRedazionale={codice['value']}",
+            )
+        return None
+
+    def build_article_index(self, html: str) -> Dict[str, str]:
+        """
+        Costruisce l'indice articolo -> testo dal testo completo di un atto.
+
+        Ogni intestazione `article-num-akn` apre un articolo: il suo blocco è il più ampio
+        antenato che non contiene altre intestazioni, ed è estratto con gli stessi scenari
+        AKN di estrai_da_html. Le intestazioni "Allegato N" incontrate lungo il documento
+        assegnano gli articoli successivi a quell'allegato.
+        """
+        soup = self.parse_document(html)
+        index: Dict[str, str] = {}
+        current_annex: Optional[str] = None
+
+        def is_marker(tag: Tag) -> bool:
+            if 'article-num-akn' in (tag.get('class') or []):
+                return True
+            return tag.name in ('h1', 'h2', 'h3', 'h4') and bool(ANNEX_HEADING.match(tag.get_text(' ', strip=True)))
+
+        for marker in soup.find_all(is_marker):
+            if 'article-num-akn' not in (marker.get('class') or []):
+                current_annex = ANNEX_HEADING.match(marker.get_text(' ', strip=True)).group(1)
+                continue
+
+            block = marker.parent
+            while block.parent is not None and len(block.parent.find_all(class_='article-num-akn', limit=2)) == 1:
+                block = block.parent
+            text = self._estrai_da_corpo(block)
+            if isinstance(text, str) and not text.startswith(EXTRACTION_ERRORS):
+                key = article_key(marker.get_text(' ', strip=True), current_annex)
+                index.setdefault(key, text)
+
+        logger.info(f"Built article index with {len(index)} entries")
+        return index
+
+    @cached_document(
+        namespace="normattiva_act_index",
+        ttl=86400,
+        key=lambda self, act_urn, version_date=None: document_flight_key(act_urn, version_date),
+        cache_if=lambda index: bool(index),
+    )
+    async def get_act_index(self, act_urn: str, version_date: Optional[str] = None) -> Dict[str, str]:
+        """Scarica una sola volta il testo completo dell'atto e ne restituisce l'indice degli articoli."""
+        logger.info(f"Fetching whole act for article index: {act_urn}")
+        act_page = await self.request_document(act_urn)
+        full_act_url = self._find_full_act_url(self.parse_document(act_page))
+        if not full_act_url:
+            logger.warning(f"Full act link not found for {act_urn}")
+            return {}
+        return self.build_article_index(await self.request_document(full_act_url))
+
+    async def get_documents_from_act(
+        self, normavisitate: List[NormaVisitata]
+    ) -> List[Optional[Tuple[str, str]]]:
+        """
+        Risponde a più richieste di articoli dallo stesso indice dell'atto.
+
+        Returns:
+            Per ogni NormaVisitata, (testo, urn) se l'articolo è nell'indice, altrimenti None
+            (il chiamante ricade su get_document per quell'articolo)
+        """
+        indexes: Dict[Tuple[str, Optional[str]], Dict[str, str]] = {}
+        results: List[Optional[Tuple[str, str]]] = []
+        for nv in normavisitate:
+            act_key = (self.act_urn(nv), nv.data_versione)
+            if act_key not in indexes:
+                try:
+                    indexes[act_key] = await self.get_act_index(*act_key)
+                except Exception as e:
+                    logger.warning(f"Whole-act fetch failed for {act_key[0]}, falling back to per-article requests: {e}")
+                    indexes[act_key] = {}
+            text = indexes[act_key].get(article_key(nv.numero_articolo, nv.allegato))
+            results.append((text, nv.urn) if text else None)
+        return results
+
+    def extract_text(
+        self, element: Tag, link: bool = False, link_dict: Optional[Dict[str, str]] = None
+    ) -> Tuple[str, Dict[str, str]]:
+        """
+        Estrae il testo di un elemento con una visita iterativa dell'albero.
+
+        Produce lo stesso testo di extract_text_recursive (a capo per <br> e <p>, " - " per
+        le voci di elenco, link raccolti in link_dict) senza ricorsione né stringhe
+        intermedie per ogni nodo.
+        """
+        if link_dict is None:
+            link_dict = {}
+        text_parts: List[str] = []
+        # La pila contiene nodi da visitare oppure testo da emettere alla chiusura di un elemento
+        stack: List[Any] = list(reversed(element.contents))
+
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                # Include sia le NavigableString che i separatori inseriti nella pila
+                text_parts.append(str(node))
+                continue
+            if not isinstance(node, Tag):
+                continue
+            if node.name == 'br':
+                text_parts.append('\n')
+                continue
+            if node.name == 'p':
+                stack.append('\n')
+            elif node.name == 'li':
+                text_parts.append(' - ')
+                stack.append('\n')
+            elif node.name == 'a' and link:
+                link_dict[''.join(node.stripped_strings)] = node.get('href', '').strip()
+            stack.extend(reversed(node.contents))
+
+        return ''.join(text_parts), link_dict
+
     def extract_text_recursive(
         self, element: Tag, link: bool = False, link_dict: Optional[Dict[str, str]] = None
     ) -> Tuple[str, Dict[str, str]]:
+        """Versione ricorsiva di extract_text, mantenuta come riferimento per i test di equivalenza."""
         if link_dict is None:
             link_dict = {}
         text_parts = []
@@ -117,7 +309,7 @@ class NormattivaScraper(BaseScraper):
             # Estrazione dei commi
             commi = corpo.find_all('div', class_='art-comma-div-akn')
             for comma_div in commi:
-                comma_text, _ = self.extract_text_recursive(comma_div, link=link, link_dict=link_dict)
+                comma_text, _ = self.extract_text(comma_div, link=link, link_dict=link_dict)
                 final_text += comma_text.strip() + '\n\n'
 
             # Pulizia finale del testo
@@ -146,7 +338,7 @@ class NormattivaScraper(BaseScraper):
             # Estrazione del contenuto del testo semplice
             just_text = corpo.find('span', class_='art-just-text-akn')
             if just_text:
-                content_text, _ = self.extract_text_recursive(just_text, link=link, link_dict=link_dict)
+                content_text, _ = self.extract_text(just_text, link=link, link_dict=link_dict)
                 final_text += content_text.strip()
 
             final_text = re.sub(r'\n{3,}', '\n\n', final_text).strip()
@@ -167,13 +359,13 @@ class NormattivaScraper(BaseScraper):
             attachment_text = corpo.find('span', class_='attachment-just-text')
             final_text = ""
             if attachment_text:
-                content_text, _ = self.extract_text_recursive(attachment_text, link=link, link_dict=link_dict)
+                content_text, _ = self.extract_text(attachment_text, link=link, link_dict=link_dict)
                 final_text += content_text.strip()
 
             # Estrazione degli aggiornamenti (se presenti)
             aggiornamenti = corpo.find_all('div', class_='art_aggiornamento-akn')
             for aggiornamento in aggiornamenti:
-                agg_text, _ = self.extract_text_recursive(aggiornamento, link=link, link_dict=link_dict)
+                agg_text, _ = self.extract_text(aggiornamento, link=link, link_dict=link_dict)
                 final_text += '\n\n' + agg_text.strip()
 
             final_text = re.sub(r'\n{3,}', '\n\n', final_text).strip()
@@ -186,5 +378,12 @@ class NormattivaScraper(BaseScraper):
             logger.error(f"Error in _estrai_testo_allegato: {e}", exc_info=True)
             return f"Error in _estrai_testo_allegato: {e}"
 
-    def parse_document(self, atto: str) -> BeautifulSoup:
-        return BeautifulSoup(atto, 'html.parser')
+    def parse_document(self, atto: str, only_body: bool = False) -> BeautifulSoup:
+        """
+        Esegue il parsing della pagina con lxml (se installato) o con html.parser.
+
+        Args:
+            atto: HTML della pagina
+            only_body: Se True costruisce solo il sottoalbero di div.bodyTesto
+        """
+        return BeautifulSoup(atto, HTML_PARSER, parse_only=BODY_STRAINER if only_body else None)
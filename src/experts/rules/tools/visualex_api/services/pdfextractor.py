@@ -25,6 +25,9 @@ def extract_pdf(driver, urn, timeout=30):
 
     Returns:
     str -- Path to the downloaded PDF file
+
+    The driver is not quit here: it belongs to the caller (usually the WebDriverPool,
+    which also closes the export window when the driver is released).
     """
     logging.info(f"Extracting PDF for URN: {urn} with timeout: {timeout}")
     
@@ -65,9 +68,6 @@ def extract_pdf(driver, urn, timeout=30):
     except Exception as e:
         logging.error(f"Error extracting PDF: {e}", exc_info=True)
         raise
-    finally:
-        logging.info("Closing the driver")
-        driver.quit()
 
 def _wait_for_pdf_download(download_dir, timeout):
     """
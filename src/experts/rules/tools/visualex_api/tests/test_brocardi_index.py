@@ -0,0 +1,183 @@
+"""
+Test unitari per l'indice articolo -> URL di Brocardi e per la mappa delle denominazioni.
+Esegui con: python -m unittest src.experts.rules.tools.visualex_api.tests.test_brocardi_index
+"""
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from ..tools.brocardi_index import BrocardiArticleIndex, CodeDirectory, denomination_keys
+from ..tools.map import BROCARDI_CODICI
+from ..tools.outbound import OutboundGovernor
+
+SECTIONS = {
+    "libro-primo": ["1", "2", "2bis"],
+    "libro-secondo": ["3", "4"],
+    "libro-terzo": ["5", "5ter"],
+}
+
+
+def linear_scan(norma_str):
+    """Vecchia ricerca di do_know, usata come riferimento."""
+    for txt, link in BROCARDI_CODICI.items():
+        if norma_str.lower() in txt.lower():
+            return txt, link
+    return None
+
+
+class FakeBrocardi:
+    """Sito Brocardi minimo: indice del codice con un articolo diretto e tre sezioni."""
+
+    def __init__(self):
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.sections = {name: list(articles) for name, articles in SECTIONS.items()}
+
+    async def index(self, request):
+        self.requests.append(request.path)
+        links = "".join(
+            f'<div class="section-title"><a href="/codice-test/{name}/">{name}</a></div>' for name in self.sections
+        )
+        return web.Response(
+            text=f'<html><body><a href="/codice-test/art0.html">Art. 0</a>'
+                 f'<a href="/altro-codice/art1.html">Altro</a>{links}</body></html>',
+            content_type="text/html",
+        )
+
+    async def section(self, request):
+        self.requests.append(request.path)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.01)
+            name = request.match_info["name"]
+            links = "".join(f'<a href="art{number}.html">Art. {number}</a>' for number in self.sections[name])
+            return web.Response(text=f"<html><body>{links}</body></html>", content_type="text/html")
+        finally:
+            self.active -= 1
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/codice-test/", self.index)
+        app.router.add_get("/codice-test/{name}/", self.section)
+        return app
+
+
+class TestCodeDirectory(unittest.TestCase):
+    def test_matches_linear_scan(self):
+        directory = CodeDirectory(BROCARDI_CODICI)
+        queries = ["codice civile", "Codice Penale", "costituzione", "L. 7 agosto 1990, n. 241",
+                   "D.lgs. 30 aprile 1992, n. 285", "preleggi", "codice inesistente"]
+        for name in BROCARDI_CODICI:
+            queries.extend(denomination_keys(name))
+        for query in queries:
+            with self.subTest(query=query):
+                self.assertEqual(directory.find(query), linear_scan(query))
+
+    def test_normalizes_spacing_and_case(self):
+        directory = CodeDirectory(BROCARDI_CODICI)
+        self.assertEqual(directory.find("  CODICE   civile "), linear_scan("codice civile"))
+        self.assertEqual(directory.find("D. lgs. 30 aprile 1992, n. 285"), linear_scan("D.lgs. 30 aprile 1992, n. 285"))
+
+
+class TestBrocardiArticleIndex(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "index.sqlite3")
+        self.site = FakeBrocardi()
+        self.server = TestServer(self.site.app())
+        await self.server.start_server()
+        self.code_url = str(self.server.make_url("/codice-test/"))
+        self.session = aiohttp.ClientSession()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.server.close()
+        self.tmpdir.cleanup()
+
+    def make_index(self, **kwargs):
+        governor = OutboundGovernor({"default": {"rate": 1000, "burst": 1000, "max_concurrency": 10}})
+        index = BrocardiArticleIndex(db_path=self.db_path, governor=governor, **kwargs)
+        self.addCleanup(index.close)
+        return index
+
+    async def test_crawls_once_with_bounded_concurrency(self):
+        index = self.make_index(concurrency=2)
+        url = await index.get_article_url(self.code_url, "2bis", self.session)
+        self.assertEqual(url, str(self.server.make_url("/codice-test/libro-primo/art2bis.html")))
+        self.assertEqual(len(self.site.requests), 1 + len(SECTIONS))
+        self.assertLessEqual(self.site.max_active, 2)
+
+        # Articoli successivi dello stesso codice: nessuna nuova richiesta
+        self.assertTrue(await index.get_article_url(self.code_url, "5ter", self.session))
+        self.assertTrue(await index.get_article_url(self.code_url, "0", self.session))
+        self.assertEqual(len(self.site.requests), 1 + len(SECTIONS))
+        self.assertEqual(index.stats["crawls"], 1)
+
+    async def test_ignores_links_to_other_codes(self):
+        index = self.make_index()
+        articles = await index.crawl(self.code_url, self.session)
+        self.assertTrue(all(url.startswith(self.code_url) for url in articles.values()))
+
+    async def test_index_is_persisted(self):
+        await self.make_index().get_article_url(self.code_url, "3", self.session)
+        fetched = len(self.site.requests)
+
+        url = await self.make_index().get_article_url(self.code_url, "4", self.session)
+        self.assertTrue(url.endswith("/libro-secondo/art4.html"))
+        self.assertEqual(len(self.site.requests), fetched)
+
+    async def test_concurrent_lookups_share_one_crawl(self):
+        index = self.make_index()
+        urls = await asyncio.gather(*(index.get_article_url(self.code_url, n, self.session) for n in ["1", "3", "5"]))
+        self.assertTrue(all(urls))
+        self.assertEqual(self.site.requests.count("/codice-test/"), 1)
+
+    async def test_incremental_refresh_fetches_only_stale_sections(self):
+        index = self.make_index()
+        await index.crawl(self.code_url, self.session)
+        self.site.requests.clear()
+
+        # Una sezione nuova compare nell'indice del codice
+        self.site.sections["libro-quarto"] = ["6"]
+        await index.crawl(self.code_url, self.session)
+        self.assertEqual(self.site.requests, ["/codice-test/", "/codice-test/libro-quarto/"])
+        self.assertTrue(await index.get_article_url(self.code_url, "6", self.session))
+
+    async def test_unknown_article_refresh_is_throttled(self):
+        index = self.make_index(miss_refresh_interval=3600)
+        await index.crawl(self.code_url, self.session)
+        self.site.requests.clear()
+
+        self.assertIsNone(await index.get_article_url(self.code_url, "999", self.session))
+        self.assertEqual(self.site.requests, [])
+
+        # Trascorso l'intervallo, un articolo aggiunto a una sezione esistente viene trovato
+        self.site.sections["libro-secondo"].append("4bis")
+        index._crawled_at[self.code_url] = time.time() - 7200
+        for name in SECTIONS:
+            await asyncio.to_thread(self._age_section, name, 7200)
+        self.assertTrue(await index.get_article_url(self.code_url, "4-bis", self.session))
+        self.assertEqual(index.stats["misses"], 1)
+
+    def _age_section(self, name, seconds):
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.execute(
+                "UPDATE brocardi_sections SET crawled_at = crawled_at - ? WHERE section_url LIKE ?",
+                (seconds, f"%/{name}/"),
+            )
+        conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+"""
+Test unitari per la cache a due livelli dei documenti.
+Esegui con: python -m unittest src.experts.rules.tools.visualex_api.tests.test_cache
+"""
+
+import os
+import tempfile
+import time
+import unittest
+
+from ..tools.cache import LRUCache, MISSING, SQLiteCache, TwoTierCache, cached_document, set_document_cache
+
+
+class TestTwoTierCache(unittest.IsolatedAsyncioTestCase):
+    """Test per serializzazione dei valori e limite del livello SQLite."""
+
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "cache.sqlite3")
+        self.cache = TwoTierCache(memory=LRUCache(100), disk=SQLiteCache(self.db_path))
+        set_document_cache(self.cache)
+
+    async def asyncTearDown(self):
+        set_document_cache(None)
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    async def test_tuples_round_trip_from_memory_and_disk(self):
+        value = ("testo dell'articolo", "https://www.normattiva.it/uri-res/N2Ls", [("a", 1)], {"note": ("x", None)})
+        await self.cache.set("article", "k", value, ttl=60)
+
+        self.assertEqual(await self.cache.get("article", "k"), value)
+        # Nuova memoria: il valore arriva dal disco
+        self.cache.memory.clear()
+        from_disk = await self.cache.get("article", "k")
+        self.assertEqual(from_disk, value)
+        self.assertIsInstance(from_disk, tuple)
+        self.assertEqual(self.cache.metrics()["namespaces"]["article"]["disk_hits"], 1)
+
+    async def test_non_serialisable_result_is_returned_but_not_cached(self):
+        calls = []
+
+        @cached_document(namespace="article", ttl=60, key=lambda urn: urn)
+        async def get_document(urn):
+            calls.append(urn)
+            return {"urn": urn, "fetched_at": object()}
+
+        with self.assertLogs("src.experts.rules.tools.visualex_api.tools.cache", level="WARNING"):
+            result = await get_document("urn:art1")
+        self.assertEqual(result["urn"], "urn:art1")
+        self.assertIs(await self.cache.get("article", "urn:art1"), MISSING)
+
+    async def test_expired_entry_is_a_miss(self):
+        await self.cache.set("article", "k", "valore", ttl=0.01)
+        time.sleep(0.02)
+        self.assertIs(await self.cache.get("article", "k"), MISSING)
+
+
+class TestSQLiteCacheEviction(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.disk = SQLiteCache(os.path.join(self.tmp_dir.name, "cache.sqlite3"), max_entries=20, eviction_interval=10)
+        self.addCleanup(self.disk.close)
+
+    def _count(self):
+        with self.disk._lock:
+            return self.disk._connect().execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+
+    def test_disk_tier_stays_bounded(self):
+        for i in range(105):
+            self.disk.set("html", f"k{i}", f"pagina {i}", None)
+        # Pulizia ogni 10 scritture: al massimo max_entries + eviction_interval voci
+        self.assertEqual(self._count(), 25)
+        self.assertEqual(self.disk.evict(), 5)
+        self.assertEqual(self._count(), 20)
+        # Restano le voci scritte per ultime
+        self.assertIsNone(self.disk.get("html", "k84"))
+        self.assertEqual(self.disk.get("html", "k104")[0], "pagina 104")
+
+    def test_eviction_purges_expired_entries(self):
+        self.disk.set("html", "scaduta", "x", time.time() - 1)
+        self.disk.set("html", "valida", "y", time.time() + 60)
+        self.assertEqual(self.disk.evict(), 1)
+        self.assertEqual(self._count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+"""
+Test unitari per il completamento delle date degli atti (ActDateResolver).
+Esegui con: python -m unittest src.experts.rules.tools.visualex_api.tests.test_date_resolver
+"""
+
+import os
+import tempfile
+import unittest
+
+import requests
+
+from ..tools.date_resolver import ActDateResolver, iter_seed_dates, urn_act_type
+
+ACT_PAGES = {
+    "decreto.legge:2003;777": "<h2>DECRETO-LEGGE 14 marzo 2003, n. 777</h2>",
+    "decreto.del.presidente.della.repubblica:2001;778": "<p>DECRETO DEL PRESIDENTE DELLA REPUBBLICA 3 luglio 2001, n. 778</p>",
+    "decreto.legislativo:1999;779": "<div>DECRETO LEGISLATIVO 30 <b>novembre</b> 1999, n. 779</div>",
+}
+
+
+class FakeResponse:
+
+    def __init__(self, text, status=200):
+        self.text = text
+        self.status = status
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise requests.HTTPError(f"{self.status} Error")
+
+
+class FakeSession:
+    """Resolver URN di Normattiva: risponde solo agli URN con tipo di atto in forma puntata."""
+
+    def __init__(self):
+        self.urls = []
+
+    def get(self, url, timeout=None):
+        self.urls.append(url)
+        for urn, page in ACT_PAGES.items():
+            if url.endswith(f"urn:nir:stato:{urn}"):
+                return FakeResponse(page)
+        return FakeResponse("Not found", status=404)
+
+    def close(self):
+        pass
+
+
+class TestActDateResolver(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = os.path.join(self.tmp.name, "act_dates.sqlite3")
+        self.browser_calls = []
+        self.resolver = self._resolver()
+
+    def _resolver(self, browser_date=None):
+        def browser_lookup(act_type, act_number, year):
+            self.browser_calls.append((act_type, act_number, year))
+            return browser_date
+
+        resolver = ActDateResolver(db_path=self.db_path, browser_lookup=browser_lookup)
+        resolver._http = FakeSession()
+        self.addCleanup(resolver.close)
+        return resolver
+
+    def test_urn_act_type(self):
+        cases = {
+            "legge": "legge",
+            "decreto legge": "decreto.legge",
+            "d.l.": "d.l.",
+            "d.lgs.": "decreto.legislativo",
+            "decreto legislativo": "decreto.legislativo",
+            "d.p.r.": "decreto.del.presidente.della.repubblica",
+            "decreto del presidente della repubblica": "decreto.del.presidente.della.repubblica",
+            "regio decreto": "regio.decreto",
+        }
+        for act_type, expected in cases.items():
+            with self.subTest(act_type):
+                self.assertEqual(urn_act_type(act_type), expected)
+
+    def test_seed_table_hit(self):
+        act_type, number, year, iso_date = next(
+            seed for seed in iter_seed_dates() if seed[0] == "regio.decreto"
+        )
+        self.assertEqual(self.resolver.resolve(act_type.replace(".", " "), number, year), iso_date)
+        self.assertEqual(self.resolver._http.urls, [])
+        self.assertEqual(self.browser_calls, [])
+        self.assertEqual(self.resolver.stats["table"], 1)
+
+    def test_http_lookup_uses_urn_act_type(self):
+        cases = [
+            ("decreto legge", "777", "2003", "2003-03-14"),
+            ("d.p.r.", "778", "2001", "2001-07-03"),
+            ("d.lgs.", "779", "1999", "1999-11-30"),
+        ]
+        for act_type, number, year, iso_date in cases:
+            with self.subTest(act_type):
+                self.assertIsNone(self.resolver.get_stored(act_type, number, year))
+                self.assertEqual(self.resolver.resolve(act_type, number, year), iso_date)
+        self.assertEqual(self.resolver.stats["http"], 3)
+        self.assertEqual(self.browser_calls, [])
+        self.assertTrue(all(" " not in url for url in self.resolver._http.urls))
+
+    def test_resolved_dates_are_persisted(self):
+        self.resolver.resolve("decreto legislativo", "779", "1999")
+        self.resolver.close()
+
+        # Nuovo processo: la data arriva dalla tabella, senza richieste
+        resolver = self._resolver()
+        self.assertEqual(resolver.resolve("d.lgs.", "779", "1999"), "1999-11-30")
+        self.assertEqual(resolver._http.urls, [])
+        self.assertEqual(resolver.stats["table"], 1)
+
+    def test_browser_fallback_only_on_miss(self):
+        resolver = self._resolver(browser_date="2005-05-05")
+        self.assertEqual(resolver.resolve("decreto legge", "777", "2003"), "2003-03-14")
+        self.assertEqual(self.browser_calls, [])
+
+        self.assertEqual(resolver.resolve("decreto legge", "999", "2005"), "2005-05-05")
+        self.assertEqual(self.browser_calls, [("decreto legge", "999", "2005")])
+        self.assertEqual(resolver.get_stored("decreto legge", "999", "2005"), "2005-05-05")
+
+    def test_unresolvable_act(self):
+        with self.assertRaises(ValueError):
+            self.resolver.resolve("decreto legge", "999", "2005")
+        self.assertEqual(self.resolver.stats["failures"], 1)
+        self.assertIsNone(self.resolver.get_stored("decreto legge", "999", "2005"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+"""
+Test di equivalenza del parsing di Normattiva (lxml + SoupStrainer + estrazione iterativa)
+con l'estrattore originale (html.parser sull'intera pagina + estrazione ricorsiva), e test
+dell'indice degli articoli costruito dal testo completo dell'atto.
+Esegui con: python -m unittest src.experts.rules.tools.visualex_api.tests.test_normattiva_parsing
+"""
+
+import asyncio
+import os
+import tempfile
+import unittest
+
+from bs4 import BeautifulSoup
+
+from ..services.normattiva_scraper import NormattivaScraper, article_key
+from ..tools.cache import LRUCache, SQLiteCache, TwoTierCache, set_document_cache
+from ..tools.norma import Norma, NormaVisitata
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "normattiva")
+FIXTURES = ["akn_dettagliato.html", "akn_semplice.html", "allegato.html"]
+
+
+class ReferenceNormattivaScraper(NormattivaScraper):
+    """Percorso di estrazione precedente, usato come riferimento."""
+
+    def parse_document(self, atto, only_body=False):
+        return BeautifulSoup(atto, 'html.parser')
+
+    def extract_text(self, element, link=False, link_dict=None):
+        return self.extract_text_recursive(element, link=link, link_dict=link_dict)
+
+
+def load_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+class FixtureNormattivaScraper(NormattivaScraper):
+    """Scraper che risponde con le fixture dell'atto completo e conta le richieste."""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    async def request_document(self, url):
+        self.requests.append(url)
+        if "attoCompleto" in url:
+            return load_fixture("atto_completo.html")
+        if "~art" in url:
+            return load_fixture("akn_semplice.html")
+        return load_fixture("atto.html")
+
+
+class TestNormattivaParsing(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.scraper = NormattivaScraper()
+        self.reference = ReferenceNormattivaScraper()
+
+    async def test_same_text_as_reference_extractor(self):
+        for name in FIXTURES:
+            with self.subTest(fixture=name):
+                html = load_fixture(name)
+                expected = await self.reference.estrai_da_html(html)
+                self.assertFalse(expected.startswith("Body of the document not found"))
+                self.assertEqual(await self.scraper.estrai_da_html(html), expected)
+
+    async def test_same_links_as_reference_extractor(self):
+        for name in FIXTURES:
+            with self.subTest(fixture=name):
+                html = load_fixture(name)
+                expected = await self.reference.estrai_da_html(html, get_link_dict=True)
+                self.assertEqual(await self.scraper.estrai_da_html(html, get_link_dict=True), expected)
+
+    async def test_each_fixture_uses_its_scenario(self):
+        detailed = await self.scraper.estrai_da_html(load_fixture("akn_dettagliato.html"))
+        self.assertTrue(detailed.startswith("Art. 1453\n(Risolubilità del contratto per inadempimento)."))
+        self.assertIn(" - nei casi previsti dall'articolo 1455;", detailed)
+
+        simple = await self.scraper.estrai_da_html(load_fixture("akn_semplice.html"))
+        self.assertTrue(simple.startswith("Art. 3\n\nTutti i cittadini"))
+
+        annex = await self.scraper.estrai_da_html(load_fixture("allegato.html"), get_link_dict=True)
+        self.assertTrue(annex["testo"].startswith("ALLEGATO A"))
+        self.assertIn("AGGIORNAMENTO (3)", annex["testo"])
+        self.assertIn("D.L. 25 giugno 2008, n. 112", annex["link"])
+
+    def test_strainer_keeps_only_article_body(self):
+        soup = self.scraper.parse_document(load_fixture("akn_dettagliato.html"), only_body=True)
+        self.assertIsNotNone(soup.find('div', class_='bodyTesto'))
+        self.assertIsNone(soup.find('footer'))
+        self.assertIsNone(soup.find(id='mySidebarRight'))
+
+    def test_iterative_extractor_handles_deep_nesting(self):
+        # Oltre il limite di ricorsione di Python l'estrattore ricorsivo fallirebbe
+        depth = 2000
+        html = "<div>" + "<span>" * depth + "testo" + "</span>" * depth + "</div>"
+        element = BeautifulSoup(html, 'html.parser').div
+        text, _ = self.scraper.extract_text(element)
+        self.assertEqual(text, "testo")
+
+
+class TestArticleKey(unittest.TestCase):
+
+    def test_bis_spellings_share_one_key(self):
+        for numero in ("2-bis", "2 bis", "2bis", "Art. 2-bis", "articolo 2 BIS", "2 - bis."):
+            with self.subTest(numero=numero):
+                self.assertEqual(article_key(numero), "2bis")
+        self.assertEqual(article_key("14-quater"), "14quater")
+
+    def test_annex_articles_are_prefixed(self):
+        self.assertEqual(article_key("Art. 1", "1"), "1:1")
+        self.assertEqual(article_key("3-ter", " A "), "a:3ter")
+        self.assertNotEqual(article_key("1", "1"), article_key("1"))
+
+
+class TestActIndex(unittest.IsolatedAsyncioTestCase):
+    """Test dell'indice articolo -> testo costruito dal testo completo dell'atto."""
+
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = TwoTierCache(memory=LRUCache(100), disk=SQLiteCache(os.path.join(self.tmp_dir.name, "cache.sqlite3")))
+        set_document_cache(self.cache)
+        self.scraper = FixtureNormattivaScraper()
+
+    async def asyncTearDown(self):
+        set_document_cache(None)
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    @staticmethod
+    def visit(numero_articolo, allegato=None):
+        return NormaVisitata(Norma("legge", "1990-08-07", "241"), numero_articolo=numero_articolo, allegato=allegato)
+
+    def test_index_separates_main_body_and_annex(self):
+        index = self.scraper.build_article_index(load_fixture("atto_completo.html"))
+
+        self.assertEqual(set(index), {"1", "2", "2bis", "1:1", "1:2bis"})
+        self.assertIn("fini determinati dalla legge", index["1"])
+        self.assertIn("Termini dei procedimenti", index["1:1"])
+        self.assertNotIn("Termini", index["1"])
+        self.assertIn("risarcimento del danno ingiusto", index["2bis"])
+        self.assertIn("procedimenti complessi", index["1:2bis"])
+
+    async def test_articles_answered_from_one_act_fetch(self):
+        requested = [self.visit("1"), self.visit("2 bis"), self.visit("2bis", allegato="1"), self.visit("1", allegato="1")]
+        documents = await self.scraper.get_documents_from_act(requested)
+
+        self.assertIn("fini determinati dalla legge", documents[0][0])
+        self.assertIn("risarcimento del danno ingiusto", documents[1][0])
+        self.assertIn("procedimenti complessi", documents[2][0])
+        self.assertIn("Termini dei procedimenti", documents[3][0])
+        self.assertEqual([url for _, url in documents], [nv.urn for nv in requested])
+        # Pagina dell'atto e testo completo, una sola volta per tutti gli articoli
+        self.assertEqual(len(self.scraper.requests), 2)
+
+    async def test_missing_article_falls_back_to_per_article_fetch(self):
+        from ..app import NormaController
+
+        requested = [self.visit("2"), self.visit("99"), self.visit("2-ter")]
+        documents = await self.scraper.get_documents_from_act(requested)
+        self.assertIsNotNone(documents[0])
+        self.assertEqual(documents[1:], [None, None])
+
+        act_documents = {nv: doc for nv, doc in zip(requested, documents) if doc is not None}
+        semaphore = asyncio.Semaphore(1)
+        text, url = await NormaController.get_article_document(None, self.scraper, requested[1], act_documents, semaphore)
+        self.assertTrue(text.startswith("Art. 3"))
+        self.assertEqual(url, requested[1].urn)
+        self.assertEqual(self.scraper.requests[-1], requested[1].urn)
+
+        # L'articolo trovato nell'indice non genera altre richieste
+        before = len(self.scraper.requests)
+        await NormaController.get_article_document(None, self.scraper, requested[0], act_documents, semaphore)
+        self.assertEqual(len(self.scraper.requests), before)
+
+    async def test_failed_act_fetch_falls_back_for_every_article(self):
+        async def unavailable(url):
+            raise ConnectionError("Normattiva non raggiungibile")
+        self.scraper.request_document = unavailable
+
+        documents = await self.scraper.get_documents_from_act([self.visit("1"), self.visit("2")])
+        self.assertEqual(documents, [None, None])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+"""
+Test unitari per il governo delle richieste in uscita (token bucket, concorrenza, circuit breaker).
+Esegui con: python -m unittest src.experts.rules.tools.visualex_api.tests.test_outbound
+"""
+
+import asyncio
+import unittest
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from ..tools.http_session import HttpSessionManager
+from ..tools.outbound import CLOSED, HALF_OPEN, OPEN, CircuitOpenError, HostGovernor, OutboundGovernor
+from ..tools.sys_op import BaseScraper
+
+
+def server_error():
+    return aiohttp.ClientResponseError(None, (), status=503)
+
+
+async def run_request(governor, exc=None, delay=0.0):
+    async with governor.request():
+        if delay:
+            await asyncio.sleep(delay)
+        if exc is not None:
+            raise exc
+
+
+class TestHostGovernor(unittest.IsolatedAsyncioTestCase):
+    def make_governor(self, **kwargs):
+        settings = {"rate": 1000, "burst": 1000, "max_concurrency": 10, "failure_threshold": 3, "reset_timeout": 0.05}
+        settings.update(kwargs)
+        return HostGovernor("upstream.test", **settings)
+
+    async def test_token_bucket_limits_rate(self):
+        governor = self.make_governor(rate=50, burst=2)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await asyncio.gather(*(run_request(governor) for _ in range(7)))
+        # 2 richieste dalla raffica, le altre 5 a 50/s
+        self.assertGreaterEqual(loop.time() - started, 0.09)
+
+    async def test_concurrency_cap_and_queue_metrics(self):
+        governor = self.make_governor(max_concurrency=2)
+        tasks = [asyncio.ensure_future(run_request(governor, delay=0.05)) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        metrics = governor.metrics()
+        self.assertEqual(metrics["in_flight"], 2)
+        self.assertEqual(metrics["queued"], 3)
+        await asyncio.gather(*tasks)
+        self.assertEqual(governor.metrics()["in_flight"], 0)
+        self.assertEqual(governor.stats["requests"], 5)
+
+    async def test_cancelled_waiter_leaves_queue(self):
+        governor = self.make_governor(max_concurrency=1)
+        holder = asyncio.ensure_future(run_request(governor, delay=0.05))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(run_request(governor))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        await holder
+        self.assertEqual(governor.metrics()["queued"], 0)
+        self.assertEqual(governor.in_flight, 0)
+
+    async def test_circuit_opens_after_consecutive_failures(self):
+        governor = self.make_governor(reset_timeout=10)
+        for _ in range(3):
+            with self.assertRaises(aiohttp.ClientResponseError):
+                await run_request(governor, server_error())
+        self.assertEqual(governor.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            await run_request(governor)
+        self.assertEqual(governor.stats["rejected"], 1)
+        self.assertEqual(governor.stats["circuit_opened"], 1)
+
+    async def test_client_errors_do_not_open_circuit(self):
+        governor = self.make_governor()
+        for _ in range(5):
+            with self.assertRaises(aiohttp.ClientResponseError):
+                await run_request(governor, aiohttp.ClientResponseError(None, (), status=404))
+        self.assertEqual(governor.state, CLOSED)
+
+    async def test_half_open_probe_closes_circuit(self):
+        governor = self.make_governor()
+        for _ in range(3):
+            with self.assertRaises(aiohttp.ClientResponseError):
+                await run_request(governor, server_error())
+        await asyncio.sleep(0.06)
+
+        probe = asyncio.ensure_future(run_request(governor, delay=0.02))
+        await asyncio.sleep(0)
+        self.assertEqual(governor.state, HALF_OPEN)
+        # Una sola richiesta di prova alla volta
+        with self.assertRaises(CircuitOpenError):
+            await run_request(governor)
+        await probe
+        self.assertEqual(governor.state, CLOSED)
+        await run_request(governor)
+
+    async def test_failed_probe_reopens_circuit(self):
+        governor = self.make_governor()
+        for _ in range(3):
+            with self.assertRaises(aiohttp.ClientResponseError):
+                await run_request(governor, server_error())
+        await asyncio.sleep(0.06)
+        with self.assertRaises(asyncio.TimeoutError):
+            await run_request(governor, asyncio.TimeoutError())
+        self.assertEqual(governor.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            await run_request(governor)
+
+    async def test_cancelled_probe_is_retried(self):
+        governor = self.make_governor()
+        for _ in range(3):
+            with self.assertRaises(aiohttp.ClientResponseError):
+                await run_request(governor, server_error())
+        await asyncio.sleep(0.06)
+        probe = asyncio.ensure_future(run_request(governor, delay=10))
+        await asyncio.sleep(0)
+        probe.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await probe
+        await run_request(governor)
+        self.assertEqual(governor.state, CLOSED)
+
+
+class TestScraperIntegration(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.status = 503
+        self.hits = 0
+
+        async def handler(request):
+            self.hits += 1
+            return web.Response(text="ok", status=self.status)
+
+        app = web.Application()
+        app.router.add_get("/{tail:.*}", handler)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.session_manager = HttpSessionManager()
+        self.governor = OutboundGovernor({"default": {"rate": 1000, "burst": 1000, "max_concurrency": 5}})
+        self.scraper = BaseScraper(session_manager=self.session_manager, governor=self.governor)
+
+    async def asyncTearDown(self):
+        await self.session_manager.close()
+        await self.server.close()
+
+    async def test_fetch_text_fails_fast_once_circuit_is_open(self):
+        host_governor = self.governor.for_host("127.0.0.1")
+        host_governor.failure_threshold = 2
+        host_governor.reset_timeout = 10
+
+        url = str(self.server.make_url("/articolo"))
+        for _ in range(2):
+            with self.assertRaises(aiohttp.ClientResponseError):
+                await self.scraper.fetch_text(url)
+        with self.assertRaises(CircuitOpenError):
+            await self.scraper.fetch_text(url)
+        self.assertEqual(self.hits, 2)
+        self.assertEqual(self.governor.metrics()["open_circuits"], ["127.0.0.1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+"""
+Test unitari per la coalescenza delle richieste (single-flight).
+Esegui con: python -m unittest src.experts.rules.tools.visualex_api.tests.test_singleflight
+"""
+
+import asyncio
+import os
+import tempfile
+import unittest
+
+from ..tools.cache import LRUCache, SQLiteCache, TwoTierCache, cached_document, set_document_cache
+from ..tools.singleflight import SingleFlight, document_flight_key
+
+
+class CountingUpstream:
+    """Fonte esterna finta che conta le chiamate e si blocca finché non viene rilasciata."""
+
+    def __init__(self, fail_times: int = 0):
+        self.calls = 0
+        self.cancelled = 0
+        self.fail_times = fail_times
+        self.release = asyncio.Event()
+
+    async def fetch(self, urn: str) -> str:
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.calls <= self.fail_times:
+            raise ValueError(f"Upstream error for {urn}")
+        return f"testo di {urn}"
+
+
+async def _settle():
+    # Lascia partire i task in attesa prima di rilasciare la fonte
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+    """Test per SingleFlight con una fonte esterna che conta le chiamate."""
+
+    async def asyncSetUp(self):
+        self.flights = SingleFlight()
+        self.key = document_flight_key("https://www.normattiva.it/uri-res/N2Ls?urn:nir:stato:legge:1990-08-07;241~art3", "2024-01-01")
+
+    async def test_concurrent_callers_share_one_fetch(self):
+        upstream = CountingUpstream()
+        tasks = [asyncio.create_task(self.flights.do(self.key, lambda: upstream.fetch("art3"))) for _ in range(20)]
+        await _settle()
+        upstream.release.set()
+        results = await asyncio.gather(*tasks)
+
+        self.assertEqual(upstream.calls, 1)
+        self.assertEqual(set(results), {"testo di art3"})
+        self.assertEqual(self.flights.coalesced, 19)
+        self.assertFalse(self.flights.in_flight(self.key))
+
+    async def test_different_keys_are_not_coalesced(self):
+        upstream = CountingUpstream()
+        upstream.release.set()
+        await asyncio.gather(
+            self.flights.do("a", lambda: upstream.fetch("a")),
+            self.flights.do("b", lambda: upstream.fetch("b")),
+        )
+        self.assertEqual(upstream.calls, 2)
+
+    async def test_error_is_shared_and_does_not_poison_key(self):
+        upstream = CountingUpstream(fail_times=1)
+        tasks = [asyncio.create_task(self.flights.do(self.key, lambda: upstream.fetch("art3"))) for _ in range(5)]
+        await _settle()
+        upstream.release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.assertEqual(upstream.calls, 1)
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+        self.assertFalse(self.flights.in_flight(self.key))
+
+        # La richiesta successiva riprova invece di ricevere l'errore precedente
+        result = await self.flights.do(self.key, lambda: upstream.fetch("art3"))
+        self.assertEqual(result, "testo di art3")
+        self.assertEqual(upstream.calls, 2)
+
+    async def test_cancelled_caller_does_not_cancel_others(self):
+        upstream = CountingUpstream()
+        leader = asyncio.create_task(self.flights.do(self.key, lambda: upstream.fetch("art3")))
+        await _settle()
+        follower = asyncio.create_task(self.flights.do(self.key, lambda: upstream.fetch("art3")))
+        await _settle()
+
+        leader.cancel()
+        await _settle()
+        upstream.release.set()
+
+        self.assertEqual(await follower, "testo di art3")
+        self.assertTrue(leader.cancelled())
+        self.assertEqual(upstream.calls, 1)
+        self.assertEqual(upstream.cancelled, 0)
+
+    async def test_all_callers_cancelled_releases_key(self):
+        upstream = CountingUpstream()
+        tasks = [asyncio.create_task(self.flights.do(self.key, lambda: upstream.fetch("art3"))) for _ in range(3)]
+        await _settle()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await _settle()
+
+        self.assertEqual(upstream.cancelled, 1)
+        self.assertFalse(self.flights.in_flight(self.key))
+
+        upstream.release.set()
+        result = await self.flights.do(self.key, lambda: upstream.fetch("art3"))
+        self.assertEqual(result, "testo di art3")
+        self.assertEqual(upstream.calls, 2)
+
+    def test_flight_key_normalization(self):
+        self.assertEqual(
+            document_flight_key(" HTTPS://WWW.normattiva.it/uri-res/N2Ls?urn:nir:stato:legge:1990-08-07;241~art3!vig=", "2024-01-01"),
+            document_flight_key("https://www.normattiva.it/uri-res/N2Ls?urn:nir:stato:legge:1990-08-07;241~art3", "2024-01-01 "),
+        )
+        self.assertNotEqual(
+            document_flight_key("https://www.normattiva.it/uri-res/N2Ls?urn:nir:stato:legge:1990-08-07;241~art3", "2024-01-01"),
+            document_flight_key("https://www.normattiva.it/uri-res/N2Ls?urn:nir:stato:legge:1990-08-07;241~art3", "2020-01-01"),
+        )
+
+
+class TestCachedDocumentCoalescing(unittest.IsolatedAsyncioTestCase):
+    """Test dell'integrazione tra cache a due livelli e single-flight."""
+
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = TwoTierCache(memory=LRUCache(100), disk=SQLiteCache(os.path.join(self.tmp_dir.name, "cache.sqlite3")))
+        set_document_cache(self.cache)
+
+    async def asyncTearDown(self):
+        set_document_cache(None)
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    async def test_concurrent_misses_fetch_once_and_populate_cache(self):
+        upstream = CountingUpstream()
+
+        @cached_document(namespace="article", ttl=60, key=lambda urn: urn)
+        async def get_document(urn):
+            return await upstream.fetch(urn)
+
+        tasks = [asyncio.create_task(get_document("urn:art1")) for _ in range(10)]
+        await _settle()
+        upstream.release.set()
+        results = await asyncio.gather(*tasks)
+
+        self.assertEqual(set(results), {"testo di urn:art1"})
+        self.assertEqual(upstream.calls, 1)
+        self.assertEqual(await get_document("urn:art1"), "testo di urn:art1")
+        self.assertEqual(upstream.calls, 1)
+        self.assertEqual(self.cache.metrics()["namespaces"]["article"]["memory_hits"], 1)
+
+    async def test_failed_fetch_is_not_cached(self):
+        upstream = CountingUpstream(fail_times=1)
+        upstream.release.set()
+
+        @cached_document(namespace="article", ttl=60, key=lambda urn: urn)
+        async def get_document(urn):
+            return await upstream.fetch(urn)
+
+        with self.assertRaises(ValueError):
+            await get_document("urn:art2")
+        self.assertEqual(await get_document("urn:art2"), "testo di urn:art2")
+        self.assertEqual(upstream.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+Test unitari per il recupero concorrente usato da /stream_article_text.
+Esegui con: python -m unittest src.experts.rules.tools.visualex_api.tests.test_streaming
+"""
+
+import asyncio
+import unittest
+
+from ..tools.streaming import stream_concurrently
+
+
+class SlowFetcher:
+    """Fetch finto con ritardo per elemento, che registra concorrenza e annullamenti."""
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.active = 0
+        self.max_active = 0
+        self.started = []
+        self.cancelled = []
+
+    async def fetch(self, item):
+        self.started.append(item)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delays[item])
+            return f"articolo {item}"
+        except asyncio.CancelledError:
+            self.cancelled.append(item)
+            raise
+        finally:
+            self.active -= 1
+
+
+async def collect(stream):
+    return [result async for result in stream]
+
+
+class TestStreamConcurrently(unittest.IsolatedAsyncioTestCase):
+    async def test_original_order_with_reorder_buffer(self):
+        fetcher = SlowFetcher({0: 0.05, 1: 0.01, 2: 0.03, 3: 0.0})
+        results = await collect(stream_concurrently(list(range(4)), fetcher.fetch, prefetch=4, ordered=True))
+        self.assertEqual(results, [f"articolo {i}" for i in range(4)])
+        self.assertEqual(fetcher.max_active, 4)
+
+    async def test_completion_order(self):
+        fetcher = SlowFetcher({0: 0.05, 1: 0.01, 2: 0.03, 3: 0.0})
+        results = await collect(stream_concurrently(list(range(4)), fetcher.fetch, prefetch=4, ordered=False))
+        self.assertEqual(results, ["articolo 3", "articolo 1", "articolo 2", "articolo 0"])
+
+    async def test_prefetch_bounds_concurrency(self):
+        fetcher = SlowFetcher({i: 0.01 for i in range(20)})
+        for ordered in (True, False):
+            with self.subTest(ordered=ordered):
+                fetcher.max_active = 0
+                results = await collect(stream_concurrently(list(range(20)), fetcher.fetch, prefetch=3, ordered=ordered))
+                self.assertEqual(len(results), 20)
+                self.assertEqual(fetcher.max_active, 3)
+
+    async def test_ordered_window_includes_buffered_results(self):
+        # Il primo elemento è lento: gli altri restano nel buffer e non ne partono di nuovi oltre la finestra
+        fetcher = SlowFetcher({0: 0.1, **{i: 0.0 for i in range(1, 10)}})
+        stream = stream_concurrently(list(range(10)), fetcher.fetch, prefetch=3, ordered=True)
+        first = await stream.__anext__()
+        self.assertEqual(first, "articolo 0")
+        self.assertLessEqual(len(fetcher.started), 4)
+        self.assertEqual(len(await collect(stream)), 9)
+
+    async def test_faster_than_sequential(self):
+        fetcher = SlowFetcher({i: 0.05 for i in range(10)})
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await collect(stream_concurrently(list(range(10)), fetcher.fetch, prefetch=10))
+        self.assertLess(loop.time() - started, 0.25)
+
+    async def test_closing_stream_cancels_outstanding_fetches(self):
+        fetcher = SlowFetcher({0: 0.0, 1: 10, 2: 10, 3: 10})
+        stream = stream_concurrently(list(range(4)), fetcher.fetch, prefetch=4, ordered=True)
+        self.assertEqual(await stream.__anext__(), "articolo 0")
+        await stream.aclose()
+        self.assertEqual(sorted(fetcher.cancelled), [1, 2, 3])
+        self.assertEqual(fetcher.active, 0)
+
+    async def test_cancelling_consumer_cancels_outstanding_fetches(self):
+        fetcher = SlowFetcher({i: 10 for i in range(5)})
+        consumer = asyncio.ensure_future(collect(stream_concurrently(list(range(5)), fetcher.fetch, prefetch=5)))
+        await asyncio.sleep(0.01)
+        consumer.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await consumer
+        self.assertEqual(sorted(fetcher.cancelled), list(range(5)))
+
+    async def test_empty_input(self):
+        self.assertEqual(await collect(stream_concurrently([], SlowFetcher({}).fetch, prefetch=2)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,212 @@
+"""
+Test unitari per il pool di WebDriver, eseguiti con FakeWebDriver (senza browser).
+Esegui con: python -m unittest src.experts.rules.tools.visualex_api.tests.test_webdriver_pool
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+
+from ..tools.webdriver_pool import FakeWebDriver, PoolClosedError, PoolTimeoutError, WebDriverPool
+
+
+class FakeFactory:
+    """Factory che conta i driver creati e può essere fatta fallire."""
+
+    def __init__(self):
+        self.created = []
+        self.fail = False
+
+    def __call__(self):
+        if self.fail:
+            raise RuntimeError("Chrome failed to start")
+        driver = FakeWebDriver()
+        self.created.append(driver)
+        return driver
+
+
+class TestWebDriverPool(unittest.TestCase):
+    """Test della semantica del pool: riuso, limiti, health check, riciclo e code."""
+
+    def setUp(self):
+        self.factory = FakeFactory()
+
+    def make_pool(self, **kwargs):
+        options = {"factory": self.factory, "max_size": 2, "prewarm": 0, "max_uses": 10, "acquire_timeout": 1}
+        options.update(kwargs)
+        return WebDriverPool(**options)
+
+    def test_prewarm_and_reuse(self):
+        pool = self.make_pool(prewarm=1)
+        pool.start()
+        self.assertEqual(len(self.factory.created), 1)
+
+        with pool.driver() as first:
+            pass
+        with pool.driver() as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(len(self.factory.created), 1)
+        self.assertEqual(pool.metrics()["acquired"], 2)
+
+    def test_never_exceeds_max_size(self):
+        pool = self.make_pool()
+        first = pool.acquire()
+        second = pool.acquire()
+        with self.assertRaises(PoolTimeoutError):
+            pool.acquire(timeout=0.05)
+        self.assertEqual(len(self.factory.created), 2)
+        self.assertEqual(pool.metrics()["timeouts"], 1)
+        pool.release(first)
+        pool.release(second)
+
+    def test_waiter_is_served_when_driver_is_released(self):
+        pool = self.make_pool(max_size=1)
+        entry = pool.acquire()
+        result = {}
+
+        def waiter():
+            result["entry"] = pool.acquire(timeout=2)
+
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        time.sleep(0.05)
+        self.assertNotIn("entry", result)
+        pool.release(entry)
+        thread.join(2)
+        self.assertIs(result["entry"].driver, entry.driver)
+        pool.release(result["entry"])
+
+    def test_unhealthy_driver_is_replaced(self):
+        pool = self.make_pool()
+        with pool.driver() as driver:
+            pass
+        driver.healthy = False
+
+        with pool.driver() as replacement:
+            self.assertIsNot(replacement, driver)
+        self.assertTrue(driver.quit_called)
+        self.assertEqual(pool.metrics()["unhealthy"], 1)
+        self.assertEqual(pool.metrics()["size"], 1)
+
+    def test_recycled_after_max_uses(self):
+        pool = self.make_pool(max_uses=2)
+        drivers = []
+        for _ in range(3):
+            with pool.driver() as driver:
+                drivers.append(driver)
+        self.assertIs(drivers[0], drivers[1])
+        self.assertIsNot(drivers[1], drivers[2])
+        self.assertTrue(drivers[0].quit_called)
+        self.assertEqual(pool.metrics()["recycled"], 1)
+
+    def test_extra_windows_closed_on_release(self):
+        pool = self.make_pool()
+        with pool.driver() as driver:
+            driver.switch_to.window(driver.open_window())
+        self.assertEqual(driver.window_handles, ["main"])
+        self.assertEqual(driver.current_window_handle, "main")
+
+    def test_failed_creation_frees_slot(self):
+        pool = self.make_pool(max_size=1)
+        self.factory.fail = True
+        with self.assertRaises(RuntimeError):
+            pool.acquire()
+        self.factory.fail = False
+        with pool.driver():
+            pass
+        self.assertEqual(pool.metrics()["failed_creations"], 1)
+
+    def test_close_quits_idle_and_released_drivers(self):
+        pool = self.make_pool()
+        in_use = pool.acquire()
+        with pool.driver() as idle_driver:
+            pass
+        pool.close()
+        self.assertTrue(idle_driver.quit_called)
+        self.assertFalse(in_use.driver.quit_called)
+        pool.release(in_use)
+        self.assertTrue(in_use.driver.quit_called)
+        with self.assertRaises(PoolClosedError):
+            pool.acquire()
+
+    def test_close_wakes_queued_callers(self):
+        pool = self.make_pool(max_size=1)
+        entry = pool.acquire()
+        errors = []
+
+        def waiter():
+            try:
+                pool.acquire(timeout=5)
+            except PoolClosedError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        time.sleep(0.05)
+        pool.close()
+        thread.join(2)
+        self.assertEqual(len(errors), 1)
+        pool.release(entry)
+
+
+class TestWebDriverPoolAsync(unittest.IsolatedAsyncioTestCase):
+    """Test dell'API asincrona usata dagli handler Quart."""
+
+    async def test_async_queueing_with_timeout(self):
+        pool = WebDriverPool(factory=FakeFactory(), max_size=1, prewarm=0, acquire_timeout=1)
+        async with pool.driver_async() as driver:
+            with self.assertRaises(PoolTimeoutError):
+                async with pool.driver_async(timeout=0.05):
+                    pass
+        async with pool.driver_async() as again:
+            self.assertIs(again, driver)
+
+    async def test_concurrent_users_share_bounded_drivers(self):
+        factory = FakeFactory()
+        pool = WebDriverPool(factory=factory, max_size=2, prewarm=0, acquire_timeout=5)
+        active = 0
+        peak = 0
+
+        async def export(i):
+            nonlocal active, peak
+            async with pool.driver_async() as driver:
+                active += 1
+                peak = max(peak, active)
+                await asyncio.to_thread(driver.get, f"https://www.normattiva.it/{i}")
+                await asyncio.sleep(0.01)
+                active -= 1
+
+        await asyncio.gather(*(export(i) for i in range(40)))
+        self.assertLessEqual(peak, 2)
+        self.assertLessEqual(len(factory.created), 2)
+        self.assertEqual(sum(len(d.visited) for d in factory.created), 40)
+        self.assertEqual(pool.metrics()["waiting"], 0)
+
+    async def test_cancelled_waiter_does_not_leak_driver(self):
+        pool = WebDriverPool(factory=FakeFactory(), max_size=1, prewarm=0, acquire_timeout=2)
+        entry = await asyncio.to_thread(pool.acquire)
+
+        async def wait_for_driver():
+            async with pool.driver_async():
+                pass
+
+        task = asyncio.create_task(wait_for_driver())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        pool.release(entry)
+
+        # Il driver ottenuto dal thread del waiter annullato torna al pool
+        for _ in range(50):
+            if pool.metrics()["idle"] == 1:
+                break
+            await asyncio.sleep(0.02)
+        self.assertEqual(pool.metrics()["idle"], 1)
+        async with pool.driver_async(timeout=0.5):
+            pass
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,360 @@
+"""
+Indice articolo -> URL dei codici su Brocardi.
+
+Per trovare la pagina di un articolo, BrocardiScraper scaricava l'indice del codice e poi
+tutte le pagine di sezione. BrocardiArticleIndex esegue questo crawling una sola volta per
+codice, con concorrenza limitata, e salva il risultato su SQLite:
+
+* la ricerca di un articolo diventa un accesso a dizionario;
+* le sezioni vengono riscaricate solo quando sono più vecchie di BROCARDI_INDEX_TTL
+  (aggiornamento incrementale);
+* un articolo sconosciuto provoca al più un aggiornamento ogni
+  BROCARDI_MISS_REFRESH_INTERVAL secondi, limitato alle sezioni non aggiornate di recente.
+
+Il modulo contiene anche la mappa a chiavi normalizzate delle denominazioni di
+BROCARDI_CODICI usata da BrocardiScraper.do_know.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urljoin
+
+import aiohttp
+from bs4 import BeautifulSoup
+
+from .config import (
+    BROCARDI_INDEX_DB_PATH,
+    BROCARDI_CRAWL_CONCURRENCY,
+    BROCARDI_INDEX_TTL,
+    BROCARDI_MISS_REFRESH_INTERVAL,
+)
+from .outbound import OutboundGovernor, get_outbound_governor
+from .singleflight import upstream_flights
+from .sys_op import HTML_PARSER
+
+logger = logging.getLogger(__name__)
+
+ARTICLE_HREF = re.compile(r'art([0-9a-z]+)\.html$', re.IGNORECASE)
+
+
+# --- Denominazioni dei codici ---
+
+def normalize_denomination(text: str) -> str:
+    """Forma canonica di una denominazione: minuscole, spazi compattati, niente spazi dopo i punti."""
+    text = re.sub(r'\s+', ' ', text.lower()).strip()
+    return re.sub(r'\.\s+', '.', text)
+
+
+def denomination_keys(denominazione: str) -> Iterable[str]:
+    """Chiavi con cui una denominazione può essere cercata: titolo, estremi tra parentesi e intera stringa."""
+    yield denominazione
+    title = denominazione.split('(', 1)[0].strip(' ,')
+    if title:
+        yield title
+    for reference in re.findall(r'\(([^()]*)\)', denominazione):
+        yield reference
+    tail = denominazione.rsplit(')', 1)[-1].strip(' ,') if ')' in denominazione else ''
+    if tail:
+        yield tail
+
+
+class CodeDirectory:
+    """
+    Mappa le stringhe prodotte da BrocardiScraper._build_norma_string sul codice Brocardi.
+
+    Il risultato coincide con la vecchia scansione lineare (prima denominazione che contiene la
+    stringa cercata): per le chiavi note è precalcolato, per le altre la scansione viene
+    eseguita una volta e memorizzata.
+    """
+
+    def __init__(self, codici: Dict[str, str]):
+        self._entries: List[Tuple[str, str, str]] = [
+            (normalize_denomination(name), name, link) for name, link in codici.items()
+        ]
+        self._by_key: Dict[str, Tuple[str, str]] = {}
+        for name in codici:
+            for key in denomination_keys(name):
+                normalized = normalize_denomination(key)
+                if normalized and normalized not in self._by_key:
+                    match = self._scan(normalized)
+                    if match:
+                        self._by_key[normalized] = match
+
+    def _scan(self, normalized: str) -> Optional[Tuple[str, str]]:
+        for text, name, link in self._entries:
+            if normalized in text:
+                return name, link
+        return None
+
+    def find(self, norma_str: str) -> Optional[Tuple[str, str]]:
+        normalized = normalize_denomination(norma_str)
+        match = self._by_key.get(normalized)
+        if match is None:
+            match = self._scan(normalized)
+            if match:
+                self._by_key[normalized] = match
+        return match
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+
+# --- Indice degli articoli ---
+
+def parse_code_page(html: str, page_url: str, code_url: str) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Estrae da una pagina di Brocardi i link agli articoli del codice e quelli alle sezioni.
+
+    Returns:
+        (articolo -> URL, URL delle sezioni elencate nei div.section-title)
+    """
+    soup = BeautifulSoup(html, HTML_PARSER)
+    articles: Dict[str, str] = {}
+    for a_tag in soup.find_all('a', href=True):
+        url = urljoin(page_url, a_tag['href'].strip())
+        match = ARTICLE_HREF.search(url)
+        if match and url.startswith(code_url):
+            articles.setdefault(match.group(1).lower(), url)
+
+    sections: List[str] = []
+    for section in soup.find_all('div', class_='section-title'):
+        for a_tag in section.find_all('a', href=True):
+            url = urljoin(page_url, a_tag['href'].strip())
+            if url not in sections:
+                sections.append(url)
+    return articles, sections
+
+
+class BrocardiArticleIndex:
+    """Indice persistente articolo -> URL per ogni codice di Brocardi."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS brocardi_articles (
+        code_url TEXT NOT NULL,
+        article TEXT NOT NULL,
+        url TEXT NOT NULL,
+        section_url TEXT NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (code_url, article)
+    );
+    CREATE TABLE IF NOT EXISTS brocardi_sections (
+        code_url TEXT NOT NULL,
+        section_url TEXT NOT NULL,
+        crawled_at REAL NOT NULL,
+        PRIMARY KEY (code_url, section_url)
+    );
+    CREATE TABLE IF NOT EXISTS brocardi_codes (
+        code_url TEXT PRIMARY KEY,
+        crawled_at REAL NOT NULL
+    );
+    """
+
+    def __init__(
+        self,
+        db_path: str = BROCARDI_INDEX_DB_PATH,
+        concurrency: int = BROCARDI_CRAWL_CONCURRENCY,
+        ttl: float = BROCARDI_INDEX_TTL,
+        miss_refresh_interval: float = BROCARDI_MISS_REFRESH_INTERVAL,
+        request_timeout: float = 15,
+        governor: Optional[OutboundGovernor] = None,
+    ):
+        """
+        Args:
+            db_path: File SQLite dell'indice
+            concurrency: Pagine di sezione scaricate contemporaneamente durante il crawling
+            ttl: Età in secondi oltre la quale una sezione viene riscaricata
+            miss_refresh_interval: Intervallo minimo tra due aggiornamenti dovuti ad articoli sconosciuti
+            request_timeout: Timeout in secondi di ogni pagina scaricata
+            governor: Governo delle richieste in uscita (default: quello condiviso del processo)
+        """
+        self.db_path = db_path
+        self.concurrency = concurrency
+        self.ttl = ttl
+        self.miss_refresh_interval = miss_refresh_interval
+        self.request_timeout = request_timeout
+        self.governor = governor
+        self._articles: Dict[str, Dict[str, str]] = {}
+        self._crawled_at: Dict[str, float] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "crawls": 0, "pages_fetched": 0}
+
+    # --- Persistenza ---
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+            self._conn = conn
+            logger.info(f"Brocardi article index opened at {self.db_path}")
+        return self._conn
+
+    def _load_code(self, code_url: str) -> Tuple[Dict[str, str], Optional[float]]:
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                "SELECT article, url FROM brocardi_articles WHERE code_url = ?", (code_url,)
+            ).fetchall()
+            crawled = conn.execute(
+                "SELECT crawled_at FROM brocardi_codes WHERE code_url = ?", (code_url,)
+            ).fetchone()
+        return dict(rows), crawled[0] if crawled else None
+
+    def _section_ages(self, code_url: str) -> Dict[str, float]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT section_url, crawled_at FROM brocardi_sections WHERE code_url = ?", (code_url,)
+            ).fetchall()
+        return dict(rows)
+
+    def _store_page(self, code_url: str, page_url: str, articles: Dict[str, str], is_section: bool) -> None:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO brocardi_articles (code_url, article, url, section_url, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(code_url, article, url, page_url, now) for article, url in articles.items()],
+                )
+                if is_section:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO brocardi_sections (code_url, section_url, crawled_at) VALUES (?, ?, ?)",
+                        (code_url, page_url, now),
+                    )
+
+    def _mark_crawled(self, code_url: str, crawled_at: float) -> None:
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO brocardi_codes (code_url, crawled_at) VALUES (?, ?)",
+                    (code_url, crawled_at),
+                )
+
+    # --- Crawling ---
+
+    async def _fetch(self, session: aiohttp.ClientSession, url: str) -> str:
+        governor = self.governor or get_outbound_governor()
+        async with governor.request(url):
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=self.request_timeout)) as response:
+                response.raise_for_status()
+                self.stats["pages_fetched"] += 1
+                return await response.text()
+
+    async def crawl(self, code_url: str, session: aiohttp.ClientSession, max_section_age: Optional[float] = None) -> Dict[str, str]:
+        """
+        Aggiorna l'indice di un codice riscaricando solo le sezioni nuove o più vecchie di max_section_age.
+
+        Args:
+            code_url: URL dell'indice del codice (valore di BROCARDI_CODICI)
+            session: Sessione HTTP condivisa
+            max_section_age: Età massima in secondi di una sezione già indicizzata (default: ttl)
+
+        Returns:
+            L'indice aggiornato articolo -> URL del codice
+        """
+        return await upstream_flights.do(
+            ("brocardi_index", code_url),
+            lambda: self._crawl(code_url, session, self.ttl if max_section_age is None else max_section_age),
+        )
+
+    async def _crawl(self, code_url: str, session: aiohttp.ClientSession, max_section_age: float) -> Dict[str, str]:
+        started = time.time()
+        self.stats["crawls"] += 1
+        logger.info(f"Crawling Brocardi index for {code_url}")
+        articles, _ = await asyncio.to_thread(self._load_code, code_url)
+
+        index_html = await self._fetch(session, code_url)
+        direct_articles, sections = parse_code_page(index_html, code_url, code_url)
+        articles.update(direct_articles)
+        await asyncio.to_thread(self._store_page, code_url, code_url, direct_articles, False)
+
+        section_ages = await asyncio.to_thread(self._section_ages, code_url)
+        stale = [url for url in sections if started - section_ages.get(url, 0) > max_section_age]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        failures = 0
+
+        async def crawl_section(section_url: str) -> None:
+            nonlocal failures
+            async with semaphore:
+                try:
+                    html = await self._fetch(session, section_url)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    # La sezione resta "vecchia" e verrà ritentata al prossimo aggiornamento
+                    failures += 1
+                    logger.warning(f"Failed to crawl Brocardi section {section_url}: {e}")
+                    return
+            section_articles, _ = parse_code_page(html, section_url, code_url)
+            articles.update(section_articles)
+            await asyncio.to_thread(self._store_page, code_url, section_url, section_articles, True)
+
+        await asyncio.gather(*(crawl_section(url) for url in stale))
+        await asyncio.to_thread(self._mark_crawled, code_url, started)
+        self._articles[code_url] = articles
+        self._crawled_at[code_url] = started
+        logger.info(
+            f"Brocardi index for {code_url}: {len(articles)} articles, "
+            f"{len(stale) - failures}/{len(sections)} sections fetched, {failures} failed"
+        )
+        return articles
+
+    # --- Ricerca ---
+
+    async def _ensure_loaded(self, code_url: str, session: aiohttp.ClientSession) -> Dict[str, str]:
+        if code_url not in self._articles:
+            articles, crawled_at = await asyncio.to_thread(self._load_code, code_url)
+            if crawled_at is not None:
+                self._articles[code_url] = articles
+                self._crawled_at[code_url] = crawled_at
+        crawled_at = self._crawled_at.get(code_url)
+        if crawled_at is None or time.time() - crawled_at > self.ttl:
+            return await self.crawl(code_url, session)
+        return self._articles[code_url]
+
+    async def get_article_url(self, code_url: str, numero_articolo: str, session: aiohttp.ClientSession) -> Optional[str]:
+        """
+        Restituisce l'URL Brocardi dell'articolo, eseguendo il crawling del codice solo se necessario.
+
+        Args:
+            code_url: URL dell'indice del codice
+            numero_articolo: Numero dell'articolo senza trattini (es. "2043bis")
+            session: Sessione HTTP condivisa
+        """
+        article = numero_articolo.lower().replace('-', '').replace(' ', '')
+        articles = await self._ensure_loaded(code_url, session)
+        url = articles.get(article)
+        if url is None and time.time() - self._crawled_at.get(code_url, 0) > self.miss_refresh_interval:
+            logger.info(f"Article {article} not in Brocardi index for {code_url}, refreshing")
+            articles = await self.crawl(code_url, session, max_section_age=self.miss_refresh_interval)
+            url = articles.get(article)
+
+        self.stats["hits" if url else "misses"] += 1
+        return url
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_default_index: Optional[BrocardiArticleIndex] = None
+
+
+def get_brocardi_index() -> BrocardiArticleIndex:
+    """Restituisce l'indice condiviso del processo, creandolo al primo utilizzo."""
+    global _default_index
+    if _default_index is None:
+        _default_index = BrocardiArticleIndex()
+    return _default_index
@@ -0,0 +1,370 @@
+"""
+Cache a due livelli per i documenti recuperati dagli scraper.
+
+* Livello 1: LRU in memoria del processo, limitata a MAX_CACHE_SIZE voci.
+* Livello 2: database SQLite locale (in WAL, condiviso tra i worker ASGI e persistente
+  tra i riavvii) con payload JSON compressi con zlib e scadenza per voce.
+
+Le voci sono raggruppate per namespace (html, articolo, brocardi, albero) e le metriche
+di hit ratio sono raccolte sia per namespace che in totale. I valori sono serializzati in
+JSON (le tuple sono marcate e restituite come tuple); un valore non serializzabile non
+viene memorizzato. Il livello SQLite è limitato a CACHE_DB_MAX_ENTRIES voci: ogni
+CACHE_DB_EVICTION_INTERVAL scritture vengono rimosse le voci scadute e, oltre il limite,
+quelle scritte per prime.
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .config import MAX_CACHE_SIZE, CACHE_DB_PATH, CACHE_DB_MAX_ENTRIES, CACHE_DB_EVICTION_INTERVAL
+from .singleflight import upstream_flights
+
+logger = logging.getLogger(__name__)
+
+# Sentinella per distinguere un miss da un valore None memorizzato
+MISSING = object()
+
+# Chiave con cui le tuple vengono marcate nel JSON (json.dumps le scriverebbe come liste)
+TUPLE_TAG = "__tuple__"
+
+
+def _tag_tuples(value: Any) -> Any:
+    if isinstance(value, tuple):
+        return {TUPLE_TAG: [_tag_tuples(item) for item in value]}
+    if isinstance(value, list):
+        return [_tag_tuples(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _tag_tuples(item) for key, item in value.items()}
+    return value
+
+
+def _untag_tuples(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1 and TUPLE_TAG in obj:
+        return tuple(obj[TUPLE_TAG])
+    return obj
+
+
+def dumps_value(value: Any) -> str:
+    """Serializza un valore per la cache conservando le tuple. Solleva TypeError/ValueError se non serializzabile."""
+    return json.dumps(_tag_tuples(value), ensure_ascii=False)
+
+
+def loads_value(payload: str) -> Any:
+    """Inverso di dumps_value."""
+    return json.loads(payload, object_hook=_untag_tuples)
+
+
+class LRUCache:
+    """LRU in memoria con scadenza per voce. I valori sono conservati come stringhe JSON."""
+
+    def __init__(self, max_size: int = MAX_CACHE_SIZE):
+        self.max_size = max_size
+        self._data: "OrderedDict[str, Tuple[str, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            payload, expires_at = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return payload
+
+    def set(self, key: str, payload: str, expires_at: Optional[float]) -> None:
+        with self._lock:
+            self._data[key] = (payload, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCache:
+    """Livello persistente su SQLite con payload compressi e TTL."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS cache_entries (
+        namespace TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value BLOB NOT NULL,
+        expires_at REAL,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (namespace, key)
+    );
+    CREATE INDEX IF NOT EXISTS idx_cache_entries_expires ON cache_entries(expires_at);
+    CREATE INDEX IF NOT EXISTS idx_cache_entries_created ON cache_entries(created_at);
+    """
+
+    def __init__(
+        self,
+        path: str = CACHE_DB_PATH,
+        compression_level: int = 6,
+        max_entries: Optional[int] = CACHE_DB_MAX_ENTRIES,
+        eviction_interval: int = CACHE_DB_EVICTION_INTERVAL,
+    ):
+        """
+        Args:
+            path: Percorso del file SQLite
+            compression_level: Livello di compressione zlib dei payload
+            max_entries: Numero massimo di voci conservate (None = illimitato)
+            eviction_interval: Scritture tra due passate di pulizia (scadute ed eccedenti)
+        """
+        self.path = path
+        self.compression_level = compression_level
+        self.max_entries = max_entries
+        self.eviction_interval = max(1, eviction_interval)
+        self._writes_since_eviction = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.SCHEMA)
+            self._conn = conn
+            logger.info(f"Persistent cache opened at {self.path}")
+        return self._conn
+
+    def get(self, namespace: str, key: str) -> Optional[Tuple[str, Optional[float]]]:
+        """Restituisce (payload JSON, scadenza) oppure None se assente o scaduto."""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return zlib.decompress(value).decode("utf-8"), expires_at
+
+    def set(self, namespace: str, key: str, payload: str, expires_at: Optional[float]) -> None:
+        value = zlib.compress(payload.encode("utf-8"), self.compression_level)
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, value, expires_at, time.time()),
+            )
+            conn.commit()
+            self._writes_since_eviction += 1
+            if self._writes_since_eviction >= self.eviction_interval:
+                self._evict(conn)
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, key))
+            conn.commit()
+
+    def purge_expired(self) -> int:
+        """Rimuove le voci scadute e restituisce quante ne sono state eliminate."""
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute(
+                "DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+            )
+            conn.commit()
+            return cursor.rowcount
+
+    def evict(self) -> int:
+        """Rimuove le voci scadute e quelle oltre max_entries; restituisce quante ne sono state eliminate."""
+        with self._lock:
+            return self._evict(self._connect())
+
+    def _evict(self, conn: sqlite3.Connection) -> int:
+        # Chiamato con self._lock acquisito
+        self._writes_since_eviction = 0
+        removed = conn.execute(
+            "DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+        ).rowcount
+        if self.max_entries is not None:
+            (count,) = conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()
+            if count > self.max_entries:
+                removed += conn.execute(
+                    "DELETE FROM cache_entries WHERE rowid IN "
+                    "(SELECT rowid FROM cache_entries ORDER BY created_at LIMIT ?)",
+                    (count - self.max_entries,),
+                ).rowcount
+        conn.commit()
+        if removed:
+            logger.info(f"Persistent cache eviction removed {removed} entries")
+        return removed
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class TwoTierCache:
+    """Cache LRU in memoria davanti a un livello persistente su SQLite, con metriche di hit ratio."""
+
+    def __init__(self, memory: Optional[LRUCache] = None, disk: Optional[SQLiteCache] = None):
+        self.memory = memory if memory is not None else LRUCache()
+        self.disk = disk if disk is not None else SQLiteCache()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def _memory_key(namespace: str, key: str) -> str:
+        return f"{namespace}\x00{key}"
+
+    def _count(self, namespace: str, outcome: str) -> None:
+        with self._stats_lock:
+            stats = self._stats.setdefault(namespace, {"memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0})
+            stats[outcome] += 1
+
+    async def get(self, namespace: str, key: str) -> Any:
+        """Restituisce il valore memorizzato oppure MISSING."""
+        memory_key = self._memory_key(namespace, key)
+        payload = self.memory.get(memory_key)
+        if payload is not None:
+            self._count(namespace, "memory_hits")
+            return loads_value(payload)
+
+        try:
+            item = await asyncio.to_thread(self.disk.get, namespace, key)
+        except sqlite3.Error as e:
+            logger.warning(f"Persistent cache read failed for {namespace}:{key}: {e}")
+            item = None
+        if item is None:
+            self._count(namespace, "misses")
+            return MISSING
+
+        payload, expires_at = item
+        self.memory.set(memory_key, payload, expires_at)
+        self._count(namespace, "disk_hits")
+        return loads_value(payload)
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Memorizza il valore; se non è serializzabile in JSON viene solo registrato un avviso."""
+        try:
+            payload = dumps_value(value)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Value for {namespace}:{key} is not JSON serialisable, not cached: {e}")
+            return
+        expires_at = time.time() + ttl if ttl else None
+        self.memory.set(self._memory_key(namespace, key), payload, expires_at)
+        self._count(namespace, "sets")
+        try:
+            await asyncio.to_thread(self.disk.set, namespace, key, payload, expires_at)
+        except sqlite3.Error as e:
+            logger.warning(f"Persistent cache write failed for {namespace}:{key}: {e}")
+
+    async def delete(self, namespace: str, key: str) -> None:
+        self.memory.delete(self._memory_key(namespace, key))
+        await asyncio.to_thread(self.disk.delete, namespace, key)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Contatori e hit ratio (memoria, disco e complessivo) per namespace e in totale."""
+        with self._stats_lock:
+            namespaces = {name: dict(stats) for name, stats in self._stats.items()}
+        totals = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0}
+        for stats in namespaces.values():
+            for field, value in stats.items():
+                totals[field] += value
+        for stats in list(namespaces.values()) + [totals]:
+            lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+            stats["lookups"] = lookups
+            stats["memory_hit_ratio"] = stats["memory_hits"] / lookups if lookups else 0.0
+            stats["disk_hit_ratio"] = stats["disk_hits"] / lookups if lookups else 0.0
+            stats["hit_ratio"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return {"total": totals, "namespaces": namespaces, "memory_entries": len(self.memory), "memory_max_size": self.memory.max_size}
+
+    def reset_metrics(self) -> None:
+        with self._stats_lock:
+            self._stats.clear()
+
+    def close(self) -> None:
+        self.disk.close()
+
+
+_default_cache: Optional[TwoTierCache] = None
+
+
+def get_document_cache() -> TwoTierCache:
+    """Restituisce la cache condivisa del processo, creandola al primo utilizzo."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = TwoTierCache()
+    return _default_cache
+
+
+def set_document_cache(cache: Optional[TwoTierCache]) -> None:
+    """Sostituisce la cache condivisa (es. per puntare a un altro file o nei test)."""
+    global _default_cache
+    _default_cache = cache
+
+
+def cached_document(
+    namespace: str,
+    ttl: Optional[float],
+    key: Callable[..., str],
+    cache_if: Optional[Callable[[Any], bool]] = None,
+    coalesce: bool = True,
+):
+    """
+    Decoratore per coroutine che memorizza il risultato nella cache a due livelli.
+
+    In caso di miss, le chiamate concorrenti con la stessa chiave vengono unite in un
+    solo fetch (vedi singleflight.SingleFlight) che popola la cache per tutte.
+
+    Args:
+        namespace: Gruppo di voci (es. "html", "article", "brocardi", "tree")
+        ttl: Durata in secondi della voce (None = senza scadenza)
+        key: Funzione che riceve gli stessi argomenti della coroutine e restituisce la chiave
+        cache_if: Predicato sul risultato; se restituisce False il risultato non viene memorizzato
+        coalesce: Se True, i miss concorrenti sulla stessa chiave condividono un solo fetch
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            cache = get_document_cache()
+            cache_key = key(*args, **kwargs)
+            value = await cache.get(namespace, cache_key)
+            if value is not MISSING:
+                return value
+
+            async def fetch_and_store():
+                result = await func(*args, **kwargs)
+                if cache_if is None or cache_if(result):
+                    await cache.set(namespace, cache_key, result, ttl)
+                return result
+
+            if not coalesce:
+                return await fetch_and_store()
+            return await upstream_flights.do((namespace, cache_key), fetch_and_store)
+        return wrapper
+    return decorator
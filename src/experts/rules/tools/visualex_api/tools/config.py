@@ -1,4 +1,53 @@
+import os
+
 MAX_CACHE_SIZE = 10000
 HISTORY_LIMIT = 50
 RATE_LIMIT = 1000  # Limit to 100 requests per minute
 RATE_LIMIT_WINDOW = 600  # Window size in seconds
+
+# Shared HTTP connection pool used by the scrapers
+HTTP_POOL_LIMIT = 100  # Max open connections overall
+HTTP_POOL_LIMIT_PER_HOST = 10  # Max open connections per host
+HTTP_DNS_CACHE_TTL = 300  # DNS cache lifetime in seconds
+HTTP_KEEPALIVE_TIMEOUT = 30  # Idle seconds before a pooled connection is closed
+HTTP_REQUEST_TIMEOUT = 30  # Total timeout per request in seconds
+
+# Directory of the persistent SQLite files, independent of the working directory
+DATA_DIR = os.getenv("VISUALEX_DATA_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
+
+# Persistent (second tier) document cache, shared by all worker processes
+CACHE_DB_PATH = os.getenv("VISUALEX_CACHE_PATH", os.path.join(DATA_DIR, "visualex_cache.sqlite3"))
+CACHE_DB_MAX_ENTRIES = 50000  # Entries kept on disk; the oldest written are evicted beyond this
+CACHE_DB_EVICTION_INTERVAL = 500  # Writes between two passes removing expired and excess entries
+
+# Pool of reusable headless Chrome instances (PDF export and Selenium fallbacks)
+WEBDRIVER_POOL_SIZE = 2  # Max browsers alive at the same time
+WEBDRIVER_POOL_PREWARM = 1  # Browsers started with the app
+WEBDRIVER_MAX_USES = 50  # Uses after which a browser is restarted
+WEBDRIVER_ACQUIRE_TIMEOUT = 60  # Max seconds a request waits for a free browser
+
+# Persistent (act_type, number, year) -> date table used to complete incomplete dates
+DATE_RESOLVER_DB_PATH = os.getenv("VISUALEX_DATES_PATH", os.path.join(DATA_DIR, "visualex_dates.sqlite3"))
+
+# Multi-article requests on the same Normattiva act
+ACT_FETCH_MIN_ARTICLES = 3  # From this many articles, fetch the whole act once and slice it locally
+ARTICLE_FETCH_CONCURRENCY = 5  # Max per-article upstream fetches running at once per request
+
+# Brocardi article -> URL index, crawled once per code and refreshed incrementally
+BROCARDI_INDEX_DB_PATH = os.getenv("VISUALEX_BROCARDI_INDEX_PATH", os.path.join(DATA_DIR, "visualex_brocardi_index.sqlite3"))
+BROCARDI_CRAWL_CONCURRENCY = 4  # Section pages fetched at the same time while crawling a code
+BROCARDI_INDEX_TTL = 7 * 86400  # Age in seconds after which a crawled section is fetched again
+BROCARDI_MISS_REFRESH_INTERVAL = 3600  # Min seconds between refreshes triggered by an unknown article
+
+# Streaming endpoint (/stream_article_text)
+STREAM_PREFETCH = 8  # Articles fetched concurrently ahead of the client
+
+# Outbound governor: per-host token bucket, concurrency cap and circuit breaker
+UPSTREAM_LIMITS = {
+    "default": {"rate": 5, "burst": 10, "max_concurrency": 5},  # Requests per second, bucket size, parallel requests
+    "www.normattiva.it": {"rate": 5, "burst": 10, "max_concurrency": 8},
+    "www.brocardi.it": {"rate": 3, "burst": 6, "max_concurrency": 4},
+    "eur-lex.europa.eu": {"rate": 3, "burst": 6, "max_concurrency": 4},
+}
+CIRCUIT_FAILURE_THRESHOLD = 5  # Consecutive upstream failures that open a host's circuit
+CIRCUIT_RESET_TIMEOUT = 30  # Seconds an open circuit waits before a half-open probe
@@ -0,0 +1,273 @@
+"""
+Completamento della data degli atti normativi senza browser.
+
+Per generare l'URN di un atto indicato solo con anno e numero (es. "legge 241 1990")
+serve la data completa. ActDateResolver la ricava, in ordine, da:
+
+1. una tabella persistente (act_type, numero, anno) -> data su SQLite, pre-popolata con
+   gli atti presenti in map.py (NORMATTIVA_URN_CODICI e BROCARDI_CODICI);
+2. una richiesta HTTP al resolver URN di Normattiva con la sola data in anno, estraendo
+   la denominazione "<giorno> <mese> <anno>, n. <numero>" dalla pagina dell'atto;
+3. solo in ultima istanza, la ricerca su normattiva.it tramite Selenium con un driver
+   preso dal WebDriverPool condiviso.
+
+Ogni data trovata via HTTP o Selenium viene salvata nella tabella.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+import requests
+
+from .config import DATE_RESOLVER_DB_PATH
+from .map import NORMATTIVA_URN_CODICI, BROCARDI_CODICI
+from .text_op import normalize_act_type, parse_date, estrai_data_da_denominazione
+
+logger = logging.getLogger(__name__)
+
+NORMATTIVA_RESOLVER_URL = "https://www.normattiva.it/uri-res/N2Ls?urn:nir:stato:{act_type}:{year};{number}"
+
+MONTHS = "gennaio|febbraio|marzo|aprile|maggio|giugno|luglio|agosto|settembre|ottobre|novembre|dicembre"
+
+# Abbreviazioni usate nelle denominazioni di BROCARDI_CODICI, es. "(D.lgs. 30 aprile 1992, n. 285)"
+BROCARDI_ABBREVIATIONS = {
+    "l.": "legge",
+    "d.l.": "decreto legge",
+    "d.lgs.": "decreto legislativo",
+    "r.d.": "regio decreto",
+    "d.p.r.": "decreto del presidente della repubblica",
+}
+
+BROCARDI_DENOMINATION = re.compile(
+    rf"\((L\.|D\.L\.|D\.\s?lgs\.|R\.D\.|D\.P\.R\.)\s+(\d{{1,2}}\s+(?:{MONTHS})\s+\d{{4}}),\s*n\.\s*(\d+)\)",
+    re.IGNORECASE,
+)
+URN_CODE = re.compile(r"^([a-z.]+):(\d{4})-(\d{2})-(\d{2});(\d+)")
+
+
+def normalize_key(act_type: str, act_number, year) -> Tuple[str, str, str]:
+    """Chiave canonica (tipo atto per la ricerca, numero, anno) della tabella."""
+    act = normalize_act_type(str(act_type).replace(".", " ").strip(), search=True)
+    return act.lower(), str(act_number).strip().lstrip("0") or "0", str(year).strip()
+
+
+def iter_seed_dates() -> Iterator[Tuple[str, str, str, str]]:
+    """Produce (act_type, numero, anno, data ISO) per gli atti con data nota in map.py."""
+    for denominazione in BROCARDI_CODICI:
+        for abbreviation, extended_date, number in BROCARDI_DENOMINATION.findall(denominazione):
+            act_type = BROCARDI_ABBREVIATIONS.get(abbreviation.lower().replace(" ", ""))
+            if act_type:
+                iso_date = parse_date(extended_date)
+                yield act_type, number, iso_date[:4], iso_date
+    # Gli URN di Normattiva sono la fonte più affidabile: vengono applicati per ultimi
+    for urn in NORMATTIVA_URN_CODICI.values():
+        match = URN_CODE.match(urn)
+        if match:
+            act_type, year, month, day, number = match.groups()
+            yield act_type, number, year, f"{year}-{month}-{day}"
+
+
+def urn_act_type(act_type: str) -> str:
+    """Tipo di atto nella forma dell'URN NIR, es. "decreto legge" -> "decreto.legge"."""
+    return normalize_act_type(act_type).strip().replace(" ", ".")
+
+
+def extract_date_from_act_page(html: str, year, act_number) -> Optional[str]:
+    """Cerca nella pagina dell'atto la denominazione con anno e numero richiesti e ne restituisce la data ISO."""
+    text = re.sub(r"<[^>]+>", " ", html)
+    text = re.sub(r"\s+", " ", text)
+    pattern = re.compile(
+        rf"\b(\d{{1,2}})\s+({MONTHS})\s+{re.escape(str(year))}\s*,?\s*n\.\s*0*{re.escape(str(act_number))}\b",
+        re.IGNORECASE,
+    )
+    match = pattern.search(text)
+    if not match:
+        return None
+    return parse_date(f"{match.group(1)} {match.group(2).lower()} {year}")
+
+
+class ActDateResolver:
+    """Risolve la data completa di un atto a partire da tipo, numero e anno."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS act_dates (
+        act_type TEXT NOT NULL,
+        act_number TEXT NOT NULL,
+        year TEXT NOT NULL,
+        date TEXT NOT NULL,
+        source TEXT NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (act_type, act_number, year)
+    )
+    """
+
+    def __init__(
+        self,
+        db_path: str = DATE_RESOLVER_DB_PATH,
+        http_timeout: float = 10.0,
+        browser_lookup: Optional[Callable[[str, str, str], Optional[str]]] = None,
+        use_browser: bool = True,
+    ):
+        """
+        Args:
+            db_path: File SQLite della tabella delle date
+            http_timeout: Timeout in secondi della richiesta HTTP a Normattiva
+            browser_lookup: Funzione (act_type, numero, anno) -> data ISO usata come ultima istanza
+            use_browser: Se False il fallback Selenium è disattivato
+        """
+        self.db_path = db_path
+        self.http_timeout = http_timeout
+        self.browser_lookup = browser_lookup or selenium_lookup
+        self.use_browser = use_browser
+        self._memory: Dict[Tuple[str, str, str], str] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._http = requests.Session()
+        self.stats = {"memory": 0, "table": 0, "http": 0, "browser": 0, "failures": 0}
+
+    # --- Tabella persistente ---
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(self.SCHEMA)
+            self._conn = conn
+            self._seed()
+        return self._conn
+
+    def _seed(self) -> None:
+        rows = []
+        for act_type, number, year, iso_date in iter_seed_dates():
+            rows.append((*normalize_key(act_type, number, year), iso_date, "map", time.time()))
+        with self._conn:
+            # Le date già risolte da fonti esterne non vengono sovrascritte dal seed
+            self._conn.executemany(
+                "INSERT INTO act_dates (act_type, act_number, year, date, source, updated_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(act_type, act_number, year) DO UPDATE SET date = excluded.date, updated_at = excluded.updated_at "
+                "WHERE act_dates.source = 'map'",
+                rows,
+            )
+        logger.info(f"Act date table ready at {self.db_path} ({len(rows)} seeded entries)")
+
+    def get_stored(self, act_type: str, act_number, year) -> Optional[str]:
+        key = normalize_key(act_type, act_number, year)
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT date FROM act_dates WHERE act_type = ? AND act_number = ? AND year = ?", key
+            ).fetchone()
+        return row[0] if row else None
+
+    def store(self, act_type: str, act_number, year, iso_date: str, source: str) -> None:
+        key = normalize_key(act_type, act_number, year)
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO act_dates (act_type, act_number, year, date, source, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (*key, iso_date, source, time.time()),
+                )
+        self._memory[key] = iso_date
+
+    # --- Lookup esterni ---
+
+    def http_lookup(self, act_type: str, act_number, year) -> Optional[str]:
+        """Risolve la data tramite il resolver URN di Normattiva, senza browser."""
+        url = NORMATTIVA_RESOLVER_URL.format(act_type=urn_act_type(act_type), year=year, number=act_number)
+        logger.info(f"Resolving act date over HTTP: {url}")
+        try:
+            response = self._http.get(url, timeout=self.http_timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.warning(f"HTTP date lookup failed for {act_type} {act_number}/{year}: {e}")
+            return None
+        return extract_date_from_act_page(response.text, year, act_number)
+
+    def resolve(self, act_type: str, act_number, year) -> str:
+        """
+        Restituisce la data ISO (YYYY-MM-DD) dell'atto.
+
+        Raises:
+            ValueError: se nessuna fonte consente di determinare la data
+        """
+        key = normalize_key(act_type, act_number, year)
+        if key in self._memory:
+            self.stats["memory"] += 1
+            return self._memory[key]
+
+        stored = self.get_stored(act_type, act_number, year)
+        if stored:
+            self.stats["table"] += 1
+            self._memory[key] = stored
+            return stored
+
+        iso_date = self.http_lookup(act_type, act_number, year)
+        source = "http"
+        if not iso_date and self.use_browser:
+            logger.info(f"HTTP lookup gave no result for {act_type} {act_number}/{year}, falling back to Selenium")
+            try:
+                iso_date = self.browser_lookup(act_type, act_number, year)
+            except Exception as e:
+                logger.error(f"Selenium date lookup failed: {e}", exc_info=True)
+                iso_date = None
+            source = "browser"
+
+        if not iso_date:
+            self.stats["failures"] += 1
+            raise ValueError("Errore nel completamento della data, inserisci la data completa")
+
+        self.stats[source] += 1
+        self.store(act_type, act_number, year, iso_date, source)
+        return iso_date
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        self._http.close()
+
+
+# --- Fallback Selenium ---
+
+def selenium_lookup(act_type: str, act_number, year) -> Optional[str]:
+    """Ricerca la data sul sito di Normattiva con un driver preso dal WebDriverPool."""
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+    from .webdriver_pool import get_webdriver_pool
+
+    with get_webdriver_pool().driver() as driver:
+        driver.get("https://www.normattiva.it/")
+        search_box = driver.find_element(By.CSS_SELECTOR, "#testoRicerca")
+        search_criteria = f"{normalize_act_type(input_type=act_type, search=False, source='normattiva')} {act_number} {year}"
+        logger.info(f"Search criteria: {search_criteria}")
+        search_box.send_keys(search_criteria)
+        WebDriverWait(driver, 5).until(EC.element_to_be_clickable((By.XPATH, "//*[@id=\"button-3\"]"))).click()
+        element = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH, '//*[@id="heading_1"]/p[1]/a')))
+        element_text = element.text
+    logger.info(f"Element text found: {element_text}")
+    extended_date = estrai_data_da_denominazione(element_text)
+    return parse_date(extended_date)
+
+
+_default_resolver: Optional[ActDateResolver] = None
+_default_resolver_lock = threading.Lock()
+
+
+def get_date_resolver() -> ActDateResolver:
+    """Restituisce il resolver condiviso del processo, creandolo al primo utilizzo."""
+    global _default_resolver
+    with _default_resolver_lock:
+        if _default_resolver is None:
+            _default_resolver = ActDateResolver()
+        return _default_resolver
@@ -0,0 +1,113 @@
+"""
+Sessione HTTP condivisa per gli scraper di VisuaLex.
+
+Una sola aiohttp.ClientSession, con un TCPConnector configurato (limiti per host,
+keep-alive, cache DNS), vive per tutta la durata dell'applicazione: viene aperta
+all'avvio di Quart e chiusa allo shutdown. Le richieste successive verso lo stesso
+host riutilizzano le connessioni già aperte invece di ripetere DNS, TCP e TLS.
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+import aiohttp
+
+from .config import (
+    HTTP_POOL_LIMIT,
+    HTTP_POOL_LIMIT_PER_HOST,
+    HTTP_DNS_CACHE_TTL,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_REQUEST_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class HttpSessionManager:
+    """Gestisce il ciclo di vita di una ClientSession condivisa tra gli scraper."""
+
+    def __init__(
+        self,
+        limit: int = HTTP_POOL_LIMIT,
+        limit_per_host: int = HTTP_POOL_LIMIT_PER_HOST,
+        ttl_dns_cache: int = HTTP_DNS_CACHE_TTL,
+        keepalive_timeout: float = HTTP_KEEPALIVE_TIMEOUT,
+        request_timeout: float = HTTP_REQUEST_TIMEOUT,
+        verify_ssl: bool = False,
+    ) -> None:
+        """
+        Args:
+            limit: Numero massimo di connessioni aperte in totale
+            limit_per_host: Numero massimo di connessioni aperte verso lo stesso host
+            ttl_dns_cache: Durata (secondi) della cache delle risoluzioni DNS
+            keepalive_timeout: Secondi per cui una connessione inattiva resta nel pool
+            request_timeout: Timeout totale di default (secondi) per richiesta
+            verify_ssl: Se verificare i certificati (disattivato come negli scraper originali)
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self.verify_ssl = verify_ssl
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.ttl_dns_cache,
+            use_dns_cache=True,
+            keepalive_timeout=self.keepalive_timeout,
+            ssl=None if self.verify_ssl else False,
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+        )
+
+    @property
+    def is_open(self) -> bool:
+        return self._session is not None and not self._session.closed
+
+    async def start(self) -> aiohttp.ClientSession:
+        """Apre la sessione condivisa (idempotente). Da chiamare all'avvio dell'app."""
+        return await self.get_session()
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """
+        Restituisce la sessione condivisa, aprendola se necessario.
+
+        La sessione è legata all'event loop in cui è stata creata: se viene richiesta da
+        un loop diverso (es. script o test che usano asyncio.run più volte) ne viene
+        aperta una nuova.
+        """
+        loop = asyncio.get_running_loop()
+        if self.is_open and self._loop is loop:
+            return self._session
+        if self._lock is None or self._loop is not loop:
+            self._lock = asyncio.Lock()
+            self._loop = loop
+            self._session = None
+        async with self._lock:
+            if not self.is_open:
+                self._session = self._create_session()
+                logger.info(
+                    f"HTTP session opened (limit={self.limit}, limit_per_host={self.limit_per_host}, "
+                    f"ttl_dns_cache={self.ttl_dns_cache}s, keepalive={self.keepalive_timeout}s)"
+                )
+            return self._session
+
+    async def close(self) -> None:
+        """Chiude la sessione condivisa e il pool di connessioni. Da chiamare allo shutdown."""
+        if self.is_open:
+            await self._session.close()
+            logger.info("HTTP session closed")
+        self._session = None
+
+
+# Istanza condivisa di default, usata dagli scraper quando non ne viene iniettata una
+default_session_manager = HttpSessionManager()
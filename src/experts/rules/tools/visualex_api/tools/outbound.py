@@ -0,0 +1,279 @@
+"""
+Governo delle richieste in uscita verso le fonti esterne (Normattiva, Brocardi, EUR-Lex).
+
+Per ogni host upstream HostGovernor combina:
+
+* un token bucket (richieste al secondo con raffica massima), per non superare il ritmo
+  tollerato dal sito;
+* un limite di richieste contemporanee, con coda FIFO per quelle in eccesso;
+* un circuit breaker: dopo CIRCUIT_FAILURE_THRESHOLD errori consecutivi (timeout, errori di
+  connessione, risposte 5xx o 429) il circuito si apre e le richieste falliscono subito con
+  CircuitOpenError; trascorso CIRCUIT_RESET_TIMEOUT una sola richiesta di prova (half-open)
+  decide se richiuderlo o riaprirlo.
+
+Le risposte 4xx diverse da 429 non indicano un problema dell'host e non aprono il circuito.
+CircuitOpenError deriva da aiohttp.ClientError, quindi i gestori di errore HTTP esistenti la
+trattano come qualsiasi altro fallimento della richiesta.
+"""
+
+import asyncio
+import contextlib
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from .config import UPSTREAM_LIMITS, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(aiohttp.ClientError):
+    """L'host è considerato non disponibile: la richiesta non viene inviata."""
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f"Circuit open for {host}, retry in {retry_after:.0f}s")
+        self.host = host
+        self.retry_after = retry_after
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    """Indica se l'eccezione segnala un problema dell'host (e non della singola richiesta)."""
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status >= 500 or exc.status == 429
+    return isinstance(exc, (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ServerTimeoutError))
+
+
+class TokenBucket:
+    """Token bucket: `rate` token al secondo, al più `burst` accumulati."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self) -> float:
+        """Consuma un token e restituisce 0, oppure restituisce i secondi da attendere."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def take(self) -> None:
+        while True:
+            wait = self.try_take()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+class HostGovernor:
+    """Token bucket, limite di concorrenza e circuit breaker per un singolo host."""
+
+    def __init__(
+        self,
+        host: str,
+        rate: float,
+        burst: int,
+        max_concurrency: int,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_TIMEOUT,
+    ):
+        self.host = host
+        self.bucket = TokenBucket(rate, burst)
+        self.max_concurrency = max_concurrency
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.in_flight = 0
+        self._waiters: Deque["asyncio.Future"] = deque()
+        self._waiting_for_token = 0
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+        self.stats = {"requests": 0, "failures": 0, "rejected": 0, "circuit_opened": 0}
+
+    # --- Circuit breaker ---
+
+    def _check_circuit(self) -> bool:
+        """Solleva CircuitOpenError se la richiesta va rifiutata; restituisce True se è la prova half-open."""
+        if self.state == CLOSED:
+            return False
+        elapsed = time.monotonic() - self.opened_at
+        if self.state == OPEN and elapsed >= self.reset_timeout:
+            self.state = HALF_OPEN
+            logger.info(f"Circuit for {self.host} half-open, probing")
+        if self.state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        self.stats["rejected"] += 1
+        raise CircuitOpenError(self.host, max(0.0, self.reset_timeout - elapsed))
+
+    def _open(self) -> None:
+        if self.state != OPEN:
+            self.stats["circuit_opened"] += 1
+            logger.warning(f"Circuit for {self.host} opened after {self.consecutive_failures} consecutive failures")
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+
+    def record_success(self, probe: bool) -> None:
+        self.consecutive_failures = 0
+        if probe:
+            self._probe_in_flight = False
+        if self.state != CLOSED:
+            logger.info(f"Circuit for {self.host} closed")
+            self.state = CLOSED
+
+    def record_failure(self, probe: bool) -> None:
+        self.stats["failures"] += 1
+        self.consecutive_failures += 1
+        if probe:
+            self._probe_in_flight = False
+            self._open()
+        elif self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def abandon_probe(self) -> None:
+        """La prova è stata annullata prima dell'esito: la richiesta successiva la ripete."""
+        self._probe_in_flight = False
+
+    # --- Concorrenza ---
+
+    async def _acquire_slot(self) -> None:
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # Lo slot viene passato direttamente da chi lo rilascia: in_flight non cambia
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()
+            else:
+                with contextlib.suppress(ValueError):
+                    self._waiters.remove(waiter)
+            raise
+
+    def _release_slot(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @contextlib.asynccontextmanager
+    async def request(self) -> AsyncIterator[None]:
+        """Attende slot e token, poi registra l'esito della richiesta eseguita nel blocco."""
+        probe = self._check_circuit()
+        try:
+            await self._acquire_slot()
+        except BaseException:
+            if probe:
+                self.abandon_probe()
+            raise
+        if not probe and self.state != CLOSED:
+            # Il circuito si è aperto mentre la richiesta era in coda
+            self._release_slot()
+            self.stats["rejected"] += 1
+            raise CircuitOpenError(self.host, max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)))
+
+        succeeded: Optional[bool] = None  # None: annullata prima di un esito
+        try:
+            self._waiting_for_token += 1
+            try:
+                await self.bucket.take()
+            finally:
+                self._waiting_for_token -= 1
+            self.stats["requests"] += 1
+            try:
+                yield
+            except asyncio.CancelledError:
+                raise
+            except BaseException as exc:
+                succeeded = not is_upstream_failure(exc)
+                raise
+            succeeded = True
+        finally:
+            self._release_slot()
+            if succeeded is None:
+                if probe:
+                    self.abandon_probe()
+            elif succeeded:
+                self.record_success(probe)
+            else:
+                self.record_failure(probe)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters) + self._waiting_for_token,
+            "consecutive_failures": self.consecutive_failures,
+            "tokens": round(self.bucket.tokens, 2),
+            **self.stats,
+        }
+
+
+class OutboundGovernor:
+    """Registro dei HostGovernor, creati al primo utilizzo con i limiti di UPSTREAM_LIMITS."""
+
+    def __init__(self, limits: Optional[Dict[str, Dict[str, float]]] = None):
+        self.limits = limits if limits is not None else UPSTREAM_LIMITS
+        self._hosts: Dict[str, HostGovernor] = {}
+
+    def for_host(self, host: str) -> HostGovernor:
+        governor = self._hosts.get(host)
+        if governor is None:
+            settings = {**self.limits["default"], **self.limits.get(host, {})}
+            governor = HostGovernor(
+                host,
+                rate=settings["rate"],
+                burst=int(settings["burst"]),
+                max_concurrency=int(settings["max_concurrency"]),
+            )
+            self._hosts[host] = governor
+        return governor
+
+    def request(self, url: str):
+        """Context manager asincrono da usare attorno a ogni richiesta verso `url`."""
+        return self.for_host(urlsplit(url).hostname or "").request()
+
+    def metrics(self) -> Dict[str, Any]:
+        hosts = {host: governor.metrics() for host, governor in self._hosts.items()}
+        return {
+            "open_circuits": [host for host, m in hosts.items() if m["state"] != CLOSED],
+            "queued": sum(m["queued"] for m in hosts.values()),
+            "in_flight": sum(m["in_flight"] for m in hosts.values()),
+            "hosts": hosts,
+        }
+
+
+_default_governor: Optional[OutboundGovernor] = None
+
+
+def get_outbound_governor() -> OutboundGovernor:
+    """Restituisce il governor condiviso del processo, creandolo al primo utilizzo."""
+    global _default_governor
+    if _default_governor is None:
+        _default_governor = OutboundGovernor()
+    return _default_governor
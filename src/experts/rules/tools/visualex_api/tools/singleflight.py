@@ -0,0 +1,106 @@
+"""
+Coalescenza delle richieste identiche verso le fonti esterne (single-flight).
+
+Quando più utenti aprono lo stesso articolo prima che la cache sia popolata, ogni
+richiesta scatenerebbe il proprio fetch verso Normattiva/Brocardi. Con SingleFlight il
+primo chiamante avvia il fetch in un task dedicato e i chiamanti successivi con la stessa
+chiave ne attendono il risultato.
+
+* Un errore viene propagato a tutti i chiamanti in attesa, ma la chiave viene subito
+  liberata: la richiesta successiva riprova da capo.
+* La cancellazione di un chiamante interrompe solo la sua attesa; il fetch viene
+  annullato soltanto se non resta nessun chiamante interessato al risultato.
+"""
+
+import asyncio
+import logging
+import re
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Esegue al più un'operazione in volo per chiave e ne condivide il risultato."""
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def _release(self, key: Hashable, task: "asyncio.Task") -> None:
+        flight = self._flights.get(key)
+        if flight is not None and flight.task is task:
+            del self._flights[key]
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Esegue fn() oppure si accoda al fetch già in volo per la stessa chiave.
+
+        Args:
+            key: Chiave di coalescenza (es. URN normalizzato + data di versione)
+            fn: Funzione senza argomenti che restituisce la coroutine da eseguire
+
+        Returns:
+            Il risultato di fn(), condiviso tra tutti i chiamanti concorrenti
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            task = asyncio.ensure_future(fn())
+            flight = _Flight(task)
+            self._flights[key] = flight
+            # La chiave viene liberata appena il fetch termina, con qualsiasi esito
+            task.add_done_callback(lambda t, k=key: self._release(k, t))
+            self.started += 1
+        else:
+            self.coalesced += 1
+            logger.debug(f"Joining in-flight request for {key}")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            # Ultimo chiamante annullato mentre il fetch è ancora in corso: nessuno attende più il risultato
+            if flight.waiters == 1 and not flight.task.done():
+                logger.debug(f"No callers left for {key}, cancelling upstream request")
+                self._release(key, flight.task)
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+
+def normalize_urn(urn: Optional[str]) -> str:
+    """Normalizza un URN/URL per il confronto (spazi, schema e host in minuscolo, suffisso '!vig=' vuoto)."""
+    if not urn:
+        return ""
+    normalized = re.sub(r"\s+", "", urn)
+    parts = urlsplit(normalized)
+    if parts.scheme and parts.netloc:
+        normalized = urlunsplit(parts._replace(scheme=parts.scheme.lower(), netloc=parts.netloc.lower()))
+    if normalized.endswith("!vig="):
+        normalized = normalized[:-len("!vig=")]
+    return normalized
+
+def document_flight_key(urn: Optional[str], version_date: Optional[str] = None) -> str:
+    """Chiave di coalescenza per un documento: URN normalizzato più data di versione."""
+    return f"{normalize_urn(urn)}|{(version_date or '').strip()}"
+
+
+# Istanza condivisa dal processo
+upstream_flights = SingleFlight()
@@ -0,0 +1,82 @@
+"""
+Recupero concorrente per le risposte in streaming.
+
+stream_concurrently avvia fino a `prefetch` fetch alla volta e restituisce i risultati
+appena sono pronti:
+
+* ordered=False: in ordine di completamento;
+* ordered=True: nell'ordine originale, trattenendo in un buffer di riordino i risultati
+  arrivati in anticipo. La finestra (fetch in corso + risultati in attesa) resta limitata
+  a `prefetch` elementi, quindi un articolo lento non fa crescere il buffer senza limite.
+
+Se il consumatore smette di iterare (es. il client chiude la connessione e Quart chiude
+il generatore) tutti i fetch ancora in corso vengono annullati.
+"""
+
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Sequence, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+async def stream_concurrently(
+    items: Sequence[T],
+    fetch: Callable[[T], Awaitable[Any]],
+    prefetch: int,
+    ordered: bool = True,
+) -> AsyncIterator[Any]:
+    """
+    Esegue fetch(item) per ogni elemento con al più `prefetch` chiamate in volo.
+
+    Args:
+        items: Elementi da recuperare (es. istanze di NormaVisitata)
+        fetch: Coroutine che recupera un elemento; un'eccezione interrompe lo stream
+        prefetch: Numero massimo di elementi in volo (o in attesa nel buffer di riordino)
+        ordered: True per l'ordine originale, False per l'ordine di completamento
+
+    Yields:
+        I risultati di fetch
+    """
+    if prefetch < 1:
+        raise ValueError("prefetch must be at least 1")
+
+    pending: Dict["asyncio.Task", int] = {}
+    reorder_buffer: Dict[int, Any] = {}
+    next_to_start = 0
+    next_to_emit = 0
+
+    def fill_window() -> None:
+        nonlocal next_to_start
+        # Elementi avviati e non ancora emessi: in modalità ordinata include il buffer di riordino
+        while next_to_start < len(items) and next_to_start - next_to_emit < prefetch:
+            task = asyncio.ensure_future(fetch(items[next_to_start]))
+            pending[task] = next_to_start
+            next_to_start += 1
+
+    try:
+        fill_window()
+        while pending:
+            done, _ = await asyncio.wait(pending.keys(), return_when=asyncio.FIRST_COMPLETED)
+            if ordered:
+                for task in done:
+                    reorder_buffer[pending.pop(task)] = task.result()
+                while next_to_emit in reorder_buffer:
+                    result = reorder_buffer.pop(next_to_emit)
+                    next_to_emit += 1
+                    fill_window()
+                    yield result
+            else:
+                for task in done:
+                    pending.pop(task)
+                    next_to_emit += 1
+                    fill_window()
+                    yield task.result()
+    finally:
+        if pending:
+            logger.info(f"Stream closed early, cancelling {len(pending)} outstanding fetches")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
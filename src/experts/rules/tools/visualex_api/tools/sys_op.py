@@ -7,6 +7,18 @@ import requests
 import aiohttp
 from aiocache import Cache
 
+from .http_session import HttpSessionManager, default_session_manager
+from .cache import cached_document
+from .singleflight import normalize_urn
+from .outbound import get_outbound_governor
+
+# Parser HTML per BeautifulSoup: lxml se installato, altrimenti quello della libreria standard
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
 
 class WebDriverManager:
     def __init__(self):
@@ -15,7 +27,22 @@ class WebDriverManager:
 
     def setup_driver(self, download_dir=None):
         """
-        Creates a new WebDriver instance configured for handling downloads.
+        Creates a new WebDriver instance configured for handling downloads and tracks it.
+
+        Arguments:
+        download_dir -- Directory to save downloads (default is 'download' folder in the current directory)
+
+        Returns:
+        WebDriver -- A configured WebDriver instance
+        """
+        new_driver = self.build_driver(download_dir)
+        self.drivers.append(new_driver)
+        return new_driver
+
+    @staticmethod
+    def build_driver(download_dir=None):
+        """
+        Creates a new untracked WebDriver instance (used by the WebDriverPool).
 
         Arguments:
         download_dir -- Directory to save downloads (default is 'download' folder in the current directory)
@@ -42,7 +69,6 @@ class WebDriverManager:
         
         try:
             new_driver = webdriver.Chrome(options=chrome_options)
-            self.drivers.append(new_driver)
             logging.info("WebDriver initialized successfully")
             return new_driver
         except Exception as e:
@@ -64,16 +90,44 @@ class WebDriverManager:
         logging.info("All WebDriver instances closed and cleared")
 
 class BaseScraper:
+    def __init__(self, session_manager=None, governor=None):
+        """
+        Arguments:
+        session_manager -- Shared HttpSessionManager (default is the app-wide instance)
+        governor -- OutboundGovernor limiting requests per host (default is the app-wide instance)
+        """
+        self.session_manager: HttpSessionManager = session_manager or default_session_manager
+        self.governor = governor
+
+    async def get_session(self):
+        return await self.session_manager.get_session()
+
+    async def fetch_text(self, url, timeout=None):
+        """
+        Downloads a page through the outbound governor of its host (rate limit, concurrency cap, circuit breaker).
+
+        Arguments:
+        url -- URL to download
+        timeout -- Optional aiohttp.ClientTimeout overriding the session default
+
+        Raises:
+        aiohttp.ClientError -- On HTTP errors, or CircuitOpenError if the host is currently unavailable
+        """
+        session = await self.get_session()
+        governor = self.governor or get_outbound_governor()
+        async with governor.request(url):
+            async with session.get(url, timeout=timeout) as response:
+                response.raise_for_status()
+                return await response.text()
+
+    @cached_document(namespace="html", ttl=86400, key=lambda self, url: normalize_urn(url))
     async def request_document(self, url):
         logging.info(f"Consulting source - URL: {url}")
-        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=False)) as session:
-            try:
-                async with session.get(url, timeout=30) as response:
-                    response.raise_for_status()
-                    return await response.text()
-            except aiohttp.ClientError as e:
-                logging.error(f"Error during consultation: {e}")
-                raise ValueError(f"Problem with download: {e}")
+        try:
+            return await self.fetch_text(url)
+        except aiohttp.ClientError as e:
+            logging.error(f"Error during consultation: {e}")
+            raise ValueError(f"Problem with download: {e}")
 
     def parse_document(self, html_content):
         logging.info("Parsing document content")
@@ -3,7 +3,9 @@ import aiohttp
 from bs4 import BeautifulSoup
 import logging
 import re
-from aiocache import cached
+from .http_session import default_session_manager
+from .outbound import get_outbound_governor
+from .cache import cached_document
 
 # Configurazione del logging
 logging.basicConfig(level=logging.INFO,
@@ -11,7 +13,13 @@ logging.basicConfig(level=logging.INFO,
                     handlers=[logging.FileHandler("norma.log"),
                               logging.StreamHandler()])
 
-@cached(ttl=3600)
+@cached_document(
+    namespace="tree",
+    ttl=3600,
+    key=lambda normurn, link=False, details=False: f"{normurn}|{int(bool(link))}|{int(bool(details))}",
+    # Gli errori vengono restituiti come (messaggio, 0) e non vanno memorizzati
+    cache_if=lambda result: not isinstance(result[0], str),
+)
 async def get_tree(normurn, link=False, details=False):
     """
     Recupera l'albero degli articoli da un URN normativo e ne estrae le informazioni.
@@ -30,8 +38,9 @@ async def get_tree(normurn, link=False, details=False):
         return "Invalid URN provided", 0
 
     try:
-        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=False)) as session:
-            async with session.get(normurn, timeout=30) as response:
+        session = await default_session_manager.get_session()
+        async with get_outbound_governor().request(normurn):
+            async with session.get(normurn) as response:
                 response.raise_for_status()
                 text = await response.text()
     except aiohttp.ClientError as e:
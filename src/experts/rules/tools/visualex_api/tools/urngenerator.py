@@ -1,13 +1,10 @@
 import re
 import logging
 from functools import lru_cache
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
 from .config import MAX_CACHE_SIZE
-from .text_op import normalize_act_type, parse_date, estrai_data_da_denominazione
+from .text_op import normalize_act_type, parse_date
 from .map import NORMATTIVA_URN_CODICI, EURLEX
-from .sys_op import WebDriverManager
+from .date_resolver import get_date_resolver
 from ..services.eurlex_scraper import EurlexScraper
 
 # Configure logging
@@ -16,10 +13,14 @@ logging.basicConfig(level=logging.INFO,
                     handlers=[logging.FileHandler("norma.log"),
                               logging.StreamHandler()])
 
-lru_cache(maxsize=MAX_CACHE_SIZE)
+@lru_cache(maxsize=MAX_CACHE_SIZE)
 def complete_date(act_type, date, act_number):
     """
-    Completes the date of a legal norm using the Normattiva website.
+    Completes the date of a legal norm.
+
+    The date is looked up in the persistent act date table (pre-seeded from map.py),
+    then through Normattiva's URN resolver over plain HTTP, and only as a last resort
+    with a Selenium search (see date_resolver.ActDateResolver).
 
     Arguments:
     act_type -- Type of the legal act
@@ -27,32 +28,15 @@ def complete_date(act_type, date, act_number):
     act_number -- Number of the act
 
     Returns:
-    str -- Completed date or error message
+    str -- Completed date (YYYY-MM-DD)
+
+    Raises:
+    ValueError -- If the date cannot be completed (failures are not cached)
     """
     logging.info(f"Completing date for act_type: {act_type}, date: {date}, act_number: {act_number}")
-
-    driver_manager = WebDriverManager()
-    try:
-        driver = driver_manager.setup_driver()
-        driver.get("https://www.normattiva.it/")
-        search_box = driver.find_element(By.CSS_SELECTOR, "#testoRicerca")
-        search_criteria = f"{normalize_act_type(input_type=act_type, search=False, source='normattiva')} {act_number} {date}"
-        logging.info(f"Search criteria: {search_criteria}")
-        
-        search_box.send_keys(search_criteria)
-        WebDriverWait(driver, 5).until(EC.element_to_be_clickable((By.XPATH, "//*[@id=\"button-3\"]"))).click()
-        element = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH, '//*[@id="heading_1"]/p[1]/a')))
-        element_text = element.text
-        logging.info(f"Element text found: {element_text}")
-        
-        completed_date = estrai_data_da_denominazione(element_text)
-        logging.info(f"Completed date: {completed_date}")
-        return completed_date
-    except Exception as e:
-        logging.error(f"Error in complete_date: {e}", exc_info=True)
-        return f"Errore nel completamento della data, inserisci la data completa: {e}"
-    finally:
-        driver_manager.close_drivers()
+    completed_date = get_date_resolver().resolve(act_type, act_number, date)
+    logging.info(f"Completed date: {completed_date}")
+    return completed_date
 
 def generate_urn(act_type, date=None, act_number=None, article=None, annex=None, version=None, version_date=None, urn_flag=True):
     """
@@ -0,0 +1,439 @@
+"""
+Pool di istanze WebDriver riutilizzabili per l'export PDF e i fallback Selenium.
+
+Avviare Chrome headless costa secondi per richiesta e, sotto carico, molta memoria.
+WebDriverPool mantiene un numero limitato di driver già avviati:
+
+* al più max_size driver esistono contemporaneamente; le richieste in eccesso attendono
+  in coda fino a acquire_timeout secondi, poi ricevono PoolTimeoutError;
+* prima di ogni consegna il driver viene verificato (health check) e sostituito se
+  non risponde;
+* dopo max_uses utilizzi un driver viene chiuso e ricreato, per limitare la crescita
+  di memoria di Chrome;
+* al rilascio le finestre aperte durante l'uso vengono chiuse.
+
+Il pool è thread-safe: l'API sincrona (driver()) è usata dal codice bloccante eseguito
+in thread, quella asincrona (driver_async()) dagli handler Quart. I chiamanti in coda
+ricevono il driver direttamente al rilascio: un chiamante asincrono attende un future
+senza occupare un thread dell'executor né bloccare l'event loop. FakeWebDriver consente
+di verificarne la semantica senza un browser.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from .config import (
+    WEBDRIVER_POOL_SIZE,
+    WEBDRIVER_POOL_PREWARM,
+    WEBDRIVER_MAX_USES,
+    WEBDRIVER_ACQUIRE_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(TimeoutError):
+    """Nessun driver disponibile entro il timeout di acquisizione."""
+
+
+class PoolClosedError(RuntimeError):
+    """Il pool è stato chiuso."""
+
+
+# Marcatori consegnati ai chiamanti in coda
+SLOT = object()    # posto libero: il chiamante deve creare un nuovo driver
+CLOSED = object()  # il pool è stato chiuso durante l'attesa
+
+
+class PooledDriver:
+    """Driver gestito dal pool con il relativo contatore di utilizzi."""
+
+    __slots__ = ("driver", "uses", "created_at")
+
+    def __init__(self, driver: Any):
+        self.driver = driver
+        self.uses = 0
+        self.created_at = time.monotonic()
+
+
+def default_health_check(driver: Any) -> bool:
+    """Considera sano un driver che esegue uno script banale."""
+    return driver.execute_script("return 1") == 1
+
+
+def reset_windows(driver: Any) -> None:
+    """Chiude le finestre aperte durante l'uso e torna alla prima."""
+    handles = list(driver.window_handles)
+    if len(handles) > 1:
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+
+
+def default_driver_factory() -> Any:
+    from .sys_op import WebDriverManager
+    return WebDriverManager.build_driver()
+
+
+class _Waiter:
+    """Richiesta in coda: riceve direttamente un driver inattivo o un posto libero nel pool."""
+
+    __slots__ = ("result", "event", "loop", "future")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.result = None
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def deliver(self, result) -> bool:
+        """Consegna il risultato (chiamato con il lock del pool acquisito)."""
+        if self.loop is not None:
+            if self.loop.is_closed():
+                return False
+            self.result = result
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(None))
+        else:
+            self.result = result
+            self.event.set()
+        return True
+
+
+class WebDriverPool:
+    """Pool limitato e thread-safe di WebDriver riutilizzabili."""
+
+    def __init__(
+        self,
+        factory: Optional[Callable[[], Any]] = None,
+        max_size: int = WEBDRIVER_POOL_SIZE,
+        prewarm: int = WEBDRIVER_POOL_PREWARM,
+        max_uses: int = WEBDRIVER_MAX_USES,
+        acquire_timeout: float = WEBDRIVER_ACQUIRE_TIMEOUT,
+        health_check: Optional[Callable[[Any], bool]] = default_health_check,
+        reset: Optional[Callable[[Any], None]] = reset_windows,
+    ):
+        """
+        Args:
+            factory: Funzione che crea un nuovo driver (default: Chrome headless)
+            max_size: Numero massimo di driver esistenti contemporaneamente
+            prewarm: Driver da avviare in anticipo con start()
+            max_uses: Utilizzi dopo i quali un driver viene chiuso e ricreato
+            acquire_timeout: Attesa massima in coda (secondi) per ottenere un driver
+            health_check: Verifica eseguita prima di consegnare un driver inattivo
+            reset: Pulizia eseguita al rilascio del driver
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be >= 1")
+        self.factory = factory or default_driver_factory
+        self.max_size = max_size
+        self.prewarm = min(prewarm, max_size)
+        self.max_uses = max_uses
+        self.acquire_timeout = acquire_timeout
+        self.health_check = health_check
+        self.reset = reset
+        self._idle: Deque[PooledDriver] = deque()
+        self._waiters: Deque[_Waiter] = deque()
+        self._total = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {
+            "created": 0, "acquired": 0, "recycled": 0, "unhealthy": 0, "timeouts": 0, "failed_creations": 0,
+        }
+
+    # --- Gestione dei posti nel pool (sempre con self._lock acquisito) ---
+
+    def _reserve(self):
+        """Prende un driver inattivo o un posto libero; None se il pool è pieno."""
+        if self._closed:
+            raise PoolClosedError("WebDriver pool is closed")
+        if self._idle:
+            return self._idle.popleft()
+        if self._total < self.max_size:
+            self._total += 1
+            return SLOT
+        return None
+
+    def _hand_back(self, entry: Optional[PooledDriver]) -> None:
+        """
+        Restituisce un driver (o, se None, il posto di un driver chiuso): viene passato
+        al primo chiamante in coda oppure rimesso tra gli inattivi.
+        """
+        with self._lock:
+            result = entry if entry is not None else SLOT
+            while self._waiters and not self._closed:
+                if self._waiters.popleft().deliver(result):
+                    return
+            if entry is not None and not self._closed:
+                self._idle.append(entry)
+                return
+            if entry is None:
+                self._total -= 1
+        if entry is not None:
+            # Pool chiuso nel frattempo
+            self._discard(entry)
+
+    # --- Ciclo di vita dei driver ---
+
+    def _create(self) -> PooledDriver:
+        driver = self.factory()
+        with self._lock:
+            self.stats["created"] += 1
+        return PooledDriver(driver)
+
+    @staticmethod
+    def _quit(entry: PooledDriver) -> None:
+        try:
+            entry.driver.quit()
+        except Exception as e:
+            logger.warning(f"Failed to quit pooled WebDriver: {e}")
+
+    def _is_healthy(self, entry: PooledDriver) -> bool:
+        if self.health_check is None:
+            return True
+        try:
+            return bool(self.health_check(entry.driver))
+        except Exception as e:
+            logger.warning(f"Pooled WebDriver failed health check: {e}")
+            return False
+
+    def _discard(self, entry: PooledDriver) -> None:
+        """Chiude un driver e libera il suo posto nel pool."""
+        self._quit(entry)
+        self._hand_back(None)
+
+    def _prepare(self, reserved) -> PooledDriver:
+        """
+        Completa un'acquisizione (bloccante): crea il driver se è stato ottenuto un posto
+        libero, oppure verifica quello inattivo sostituendolo se non risponde.
+        """
+        entry = None if reserved is SLOT else reserved
+        if entry is not None and not self._is_healthy(entry):
+            with self._lock:
+                self.stats["unhealthy"] += 1
+            self._quit(entry)
+            entry = None
+        if entry is None:
+            try:
+                entry = self._create()
+            except Exception:
+                with self._lock:
+                    self.stats["failed_creations"] += 1
+                self._hand_back(None)
+                raise
+        entry.uses += 1
+        with self._lock:
+            self.stats["acquired"] += 1
+        return entry
+
+    def start(self) -> None:
+        """Avvia in anticipo `prewarm` driver (gli errori vengono solo registrati)."""
+        for _ in range(self.prewarm):
+            with self._lock:
+                if self._closed or self._total >= self.max_size:
+                    return
+                self._total += 1
+            try:
+                entry = self._create()
+            except Exception as e:
+                with self._lock:
+                    self.stats["failed_creations"] += 1
+                self._hand_back(None)
+                logger.error(f"Failed to pre-warm WebDriver: {e}")
+                return
+            self._hand_back(entry)
+        logger.info(f"WebDriver pool pre-warmed with {len(self._idle)} driver(s)")
+
+    # --- Acquisizione e rilascio ---
+
+    def _timeout_error(self, timeout: float) -> PoolTimeoutError:
+        self.stats["timeouts"] += 1
+        return PoolTimeoutError(f"No WebDriver available within {timeout}s")
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledDriver:
+        """
+        Ottiene un driver sano, attendendo in coda se il pool è pieno (bloccante).
+
+        Raises:
+            PoolTimeoutError: se nessun driver si libera entro il timeout
+            PoolClosedError: se il pool è stato chiuso
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        with self._lock:
+            reserved = self._reserve()
+            if reserved is None:
+                waiter = _Waiter()
+                self._waiters.append(waiter)
+        if reserved is None:
+            waiter.event.wait(timeout)
+            with self._lock:
+                reserved = waiter.result
+                if reserved is None:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                    if self._closed:
+                        raise PoolClosedError("WebDriver pool is closed")
+                    raise self._timeout_error(timeout)
+        return self._prepare(reserved)
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> PooledDriver:
+        """Come acquire(), ma attende in coda senza occupare thread né bloccare l'event loop."""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        with self._lock:
+            reserved = self._reserve()
+            if reserved is None:
+                waiter = _Waiter(asyncio.get_running_loop())
+                self._waiters.append(waiter)
+        if reserved is None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                with self._lock:
+                    reserved = waiter.result
+                    if reserved is None and waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                if reserved is not None and reserved is not CLOSED:
+                    # Consegnato proprio allo scadere: il driver (o il posto) torna al pool
+                    self._hand_back(None if reserved is SLOT else reserved)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                with self._lock:
+                    if self._closed:
+                        raise PoolClosedError("WebDriver pool is closed")
+                    raise self._timeout_error(timeout)
+            with self._lock:
+                reserved = waiter.result
+            if reserved is CLOSED:
+                raise PoolClosedError("WebDriver pool is closed")
+        future = asyncio.ensure_future(asyncio.to_thread(self._prepare, reserved))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # _prepare prosegue nel thread: il driver ottenuto va restituito al pool
+            future.add_done_callback(
+                lambda f: self.release(f.result()) if not f.cancelled() and f.exception() is None else None
+            )
+            raise
+
+    def release(self, entry: PooledDriver) -> None:
+        """Restituisce un driver al pool, ricreandolo se ha raggiunto max_uses."""
+        if self.reset is not None:
+            try:
+                self.reset(entry.driver)
+            except Exception as e:
+                logger.warning(f"Failed to reset pooled WebDriver, discarding it: {e}")
+                self._discard(entry)
+                return
+
+        with self._lock:
+            recycle = not self._closed and entry.uses >= self.max_uses
+            if recycle:
+                self.stats["recycled"] += 1
+        if recycle:
+            logger.info(f"Recycling WebDriver after {entry.uses} use(s)")
+            self._discard(entry)
+        else:
+            self._hand_back(entry)
+
+    @contextmanager
+    def driver(self, timeout: Optional[float] = None):
+        """Context manager sincrono: `with pool.driver() as driver: ...`"""
+        entry = self.acquire(timeout)
+        try:
+            yield entry.driver
+        finally:
+            self.release(entry)
+
+    @asynccontextmanager
+    async def driver_async(self, timeout: Optional[float] = None):
+        """Context manager asincrono: `async with pool.driver_async() as driver: ...`"""
+        entry = await self.acquire_async(timeout)
+        try:
+            yield entry.driver
+        finally:
+            await asyncio.to_thread(self.release, entry)
+
+    # --- Stato e chiusura ---
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats, "size": self._total, "idle": len(self._idle),
+                "waiting": len(self._waiters), "max_size": self.max_size,
+            }
+
+    def close(self) -> None:
+        """Chiude i driver inattivi e sveglia i chiamanti in coda; quelli in uso vengono chiusi al rilascio."""
+        with self._lock:
+            self._closed = True
+            idle: List[PooledDriver] = list(self._idle)
+            self._idle.clear()
+            waiters = list(self._waiters)
+            self._waiters.clear()
+            for waiter in waiters:
+                if waiter.loop is not None:
+                    waiter.deliver(CLOSED)
+                else:
+                    waiter.event.set()
+        for entry in idle:
+            self._discard(entry)
+        logger.info("WebDriver pool closed")
+
+
+class FakeWebDriver:
+    """
+    WebDriver finto per i test del pool: registra le pagine visitate, simula finestre
+    aggiuntive e può essere reso non sano impostando healthy = False.
+    """
+
+    _counter = 0
+
+    def __init__(self):
+        FakeWebDriver._counter += 1
+        self.id = FakeWebDriver._counter
+        self.healthy = True
+        self.quit_called = False
+        self.visited: List[str] = []
+        self.window_handles: List[str] = ["main"]
+        self.current_window_handle = "main"
+        self.switch_to = self
+
+    def get(self, url: str) -> None:
+        self.visited.append(url)
+
+    def execute_script(self, script: str, *args):
+        if not self.healthy or self.quit_called:
+            raise RuntimeError("Fake WebDriver is not responding")
+        return 1
+
+    def open_window(self) -> str:
+        handle = f"window-{len(self.window_handles)}"
+        self.window_handles.append(handle)
+        return handle
+
+    def window(self, handle: str) -> None:
+        self.current_window_handle = handle
+
+    def close(self) -> None:
+        self.window_handles.remove(self.current_window_handle)
+
+    def quit(self) -> None:
+        self.quit_called = True
+
+
+_default_pool: Optional[WebDriverPool] = None
+_default_pool_lock = threading.Lock()
+
+
+def get_webdriver_pool() -> WebDriverPool:
+    """Restituisce il pool condiviso del processo, creandolo al primo utilizzo."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = WebDriverPool()
+        return _default_pool
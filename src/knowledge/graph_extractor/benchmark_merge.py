@@ -0,0 +1,140 @@
+"""
+Benchmark della latenza di MERGE dei nodi al crescere del grafo.
+
+Confronta la strategia di upsert su label base indicizzata (:Entity {id}, usata da
+Neo4jGraphStorage) con il vecchio MERGE senza label su {id}, che non può usare
+alcun indice e degrada verso una scansione completa dei nodi.
+
+Esempio:
+    python -m src.knowledge.graph_extractor.benchmark_merge --password testtest --total 300000 --step 50000
+
+I nodi di benchmark hanno id con prefisso 'bench_' e vengono rimossi al termine
+(salvo --keep). Usare preferibilmente un database dedicato (--database).
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import time
+from typing import Dict, List
+
+from .src.neo4j_storage import Neo4jGraphStorage
+
+logger = logging.getLogger(__name__)
+
+ID_PREFIX = "bench_"
+ENTITY_LABELS = ["Norma", "ConcettoGiuridico", "SoggettoGiuridico", "AttoGiudiziario", "Dottrina"]
+
+LEGACY_MERGE_QUERY = """
+MERGE (n {id: $node_id})
+SET n += $props
+"""
+
+CLEANUP_QUERY = f"""
+MATCH (n)
+WHERE n.id STARTS WITH '{ID_PREFIX}'
+WITH n LIMIT 10000
+DETACH DELETE n
+"""
+
+
+def _node(i: int) -> Dict[str, str]:
+    return {
+        "name": f"{ID_PREFIX}{i}",
+        "entity_label": ENTITY_LABELS[i % len(ENTITY_LABELS)],
+        "description": f"Nodo sintetico di benchmark {i}",
+    }
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "mean": statistics.mean(ordered) * 1000,
+        "p50": ordered[len(ordered) // 2] * 1000,
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+    }
+
+
+async def _grow(storage: Neo4jGraphStorage, start: int, end: int, batch_size: int) -> None:
+    for batch_start in range(start, end, batch_size):
+        batch_end = min(end, batch_start + batch_size)
+        await storage.upsert_nodes([(f"{ID_PREFIX}{i}", _node(i)) for i in range(batch_start, batch_end)])
+
+
+async def _measure_indexed(storage: Neo4jGraphStorage, existing: int, samples: int) -> List[float]:
+    timings = []
+    for _ in range(samples):
+        i = random.randrange(existing)
+        start = time.perf_counter()
+        await storage.upsert_node(f"{ID_PREFIX}{i}", _node(i))
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def _measure_legacy(storage: Neo4jGraphStorage, existing: int, samples: int) -> List[float]:
+    timings = []
+    for _ in range(samples):
+        i = random.randrange(existing)
+        props = _node(i)
+        props.pop("entity_label")
+        start = time.perf_counter()
+        await storage._execute_write(LEGACY_MERGE_QUERY, {"node_id": f"{ID_PREFIX}{i}", "props": props})
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def _cleanup(storage: Neo4jGraphStorage) -> None:
+    # DETACH DELETE è una scrittura: va sul percorso di scrittura (leader nei cluster)
+    while True:
+        summary = await storage._execute_write(CLEANUP_QUERY)
+        if summary.counters.nodes_deleted == 0:
+            break
+
+
+async def run_benchmark(args: argparse.Namespace) -> None:
+    storage = Neo4jGraphStorage(args.uri, args.user, args.password, args.database, health_check_interval=0)
+    await storage.initialize()
+    try:
+        print(f"{'nodi':>10} | {'strategia':<12} | {'media ms':>9} | {'p50 ms':>8} | {'p95 ms':>8}")
+        print("-" * 60)
+        size = 0
+        while size < args.total:
+            next_size = min(args.total, size + args.step)
+            await _grow(storage, size, next_size, args.batch_size)
+            size = next_size
+
+            results = {"indicizzata": await _measure_indexed(storage, size, args.samples)}
+            if not args.skip_legacy:
+                results["legacy"] = await _measure_legacy(storage, size, args.samples)
+            for strategy, timings in results.items():
+                stats = _percentiles(timings)
+                print(f"{size:>10} | {strategy:<12} | {stats['mean']:>9.2f} | {stats['p50']:>8.2f} | {stats['p95']:>8.2f}")
+    finally:
+        if not args.keep:
+            await _cleanup(storage)
+        await storage.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark latenza MERGE dei nodi Neo4j al crescere del grafo")
+    parser.add_argument("--uri", default="bolt://localhost:7687")
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--database", default="neo4j")
+    parser.add_argument("--total", type=int, default=300000, help="Numero finale di nodi sintetici")
+    parser.add_argument("--step", type=int, default=50000, help="Nodi aggiunti tra due misurazioni")
+    parser.add_argument("--samples", type=int, default=200, help="MERGE misurati per strategia e passo")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Dimensione dei batch UNWIND per la crescita")
+    parser.add_argument("--skip-legacy", action="store_true", help="Non misura il MERGE senza label (lento su grafi grandi)")
+    parser.add_argument("--keep", action="store_true", help="Non rimuove i nodi di benchmark al termine")
+    args = parser.parse_args()
+
+    # Il logging INFO per singolo upsert falserebbe le misure
+    logging.getLogger(Neo4jGraphStorage.__module__).setLevel(logging.WARNING)
+    asyncio.run(run_benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,12 @@ import logging
 from typing import Dict, Any, List, Optional
 import argparse
 import json
-import random # Importa il modulo random per lo shuffle
 
 # Import delle classi dal modulo graph_extractor
 from .src.extractor import extract_entities
 from .src.neo4j_storage import Neo4jGraphStorage
+from .src.chunk_reader import ChunkReader, parse_shard
+from .src.aggregation_buffer import AggregationBufferFull, GraphAggregationBuffer
 # Rimuoviamo l'importazione diretta di PROMPTS qui se non serve più globalmente
 # from .src.prompt import PROMPTS 
 
@@ -64,6 +65,16 @@ DEFAULT_CONFIG = {
         "EMESSO_DA", 
         "FONTE"
     ],
+    # Buffer di aggregazione tra chunk: nodi e archi vengono uniti in memoria e scritti
+    # in blocco al superamento di una delle soglie (chunk, elementi o secondi); se i flush
+    # falliscono, oltre max_buffered_items elementi l'elaborazione si interrompe
+    "aggregation_buffer": {
+        "enabled": True,
+        "max_chunks": 20,
+        "max_pending_items": 5000,
+        "max_age_seconds": 120,
+        "max_buffered_items": 50000
+    },
     # Definiamo anche i delimitatori qui per coerenza
     "delimiters": {
         "tuple": "<|>",
@@ -77,7 +88,8 @@ async def process_chunk(
     chunk_data: Dict[str, Any], 
     config: Dict[str, Any], 
     graph_storage: Neo4jGraphStorage, 
-    llm_func: callable
+    llm_func: callable,
+    aggregation_buffer: Optional[GraphAggregationBuffer] = None
 ) -> None:
     """Elabora un singolo chunk per estrarre entità e relazioni e aggiungerle al grafo."""
 
@@ -97,25 +109,26 @@ async def process_chunk(
         "chunk_id": chunk_id
     }
 
-    # Verifica connessione al database (potrebbe essere ottimizzato facendolo una sola volta)
-    try:
-        await graph_storage._driver.verify_connectivity()
-    except Exception as e:
-        logger.error(f"Errore nella verifica della connessione Neo4j prima di elaborare il chunk {chunk_id}: {e}")
-        # Decidere se sollevare l'eccezione o solo loggare e continuare
-        raise # Rilancia l'errore per fermare l'elaborazione se il DB non è raggiungibile
+    # La connettività viene verificata una sola volta in initialize() e poi monitorata
+    # dall'health check in background dello storage: qui si legge solo lo stato.
+    if not graph_storage.is_healthy:
+        logger.error(f"Connessione Neo4j non disponibile (health check fallito), chunk {chunk_id} non elaborato.")
+        raise ConnectionError("Connessione Neo4j non disponibile.")
 
     # Estrai entità e relazioni dal testo del chunk
     try:
         # Modifica la chiamata a extract_entities per includere source_metadata
         # Nota: extract_entities dovrà essere modificata per accettare questo nuovo argomento
-        extraction_stats = await extract_entities(
-            text=text,
-            source_metadata=source_metadata, 
-            knowledge_graph_inst=graph_storage,
-            global_config=config,
-            llm_func=llm_func
-        )
+        # Tutte le operazioni sul grafo del chunk condividono una sessione e una transazione
+        async with graph_storage.unit_of_work():
+            extraction_stats = await extract_entities(
+                text=text,
+                source_metadata=source_metadata, 
+                knowledge_graph_inst=graph_storage,
+                global_config=config,
+                llm_func=llm_func,
+                aggregation_buffer=aggregation_buffer
+            )
         if extraction_stats:
              logger.info(f"Chunk {chunk_id} elaborato: {extraction_stats.get('nodes_count', 0)} nodi, {extraction_stats.get('edges_count', 0)} relazioni aggiornate/inserite.")
         else:
@@ -128,8 +141,10 @@ async def process_chunk(
 
 # --- Funzioni per Checkpointing --- 
 
-def get_checkpoint_filename(input_jsonl_path: str) -> str:
-    """Genera il nome del file di checkpoint basato sul file di input."""
+def get_checkpoint_filename(input_jsonl_path: str, shard: Optional[tuple] = None) -> str:
+    """Genera il nome del file di checkpoint basato sul file di input (e sull'eventuale shard)."""
+    if shard is not None:
+        return f"{input_jsonl_path}.shard{shard[0]}of{shard[1]}.processed"
     return input_jsonl_path + ".processed"
 
 def load_processed_chunks(checkpoint_file: str) -> set:
@@ -319,6 +334,8 @@ async def main():
                         help="Limita l'elaborazione ai primi N chunk (dopo shuffle se applicato).")
     parser.add_argument("--shuffle", action="store_true", 
                         help="Elabora i chunk in ordine casuale.")
+    parser.add_argument("--shard", type=str, default=None,
+                        help="Elabora solo lo shard i di N (formato 'i/N', es. '0/4') per distribuire il lavoro tra più worker.")
     args = parser.parse_args()
     
     # Imposta il livello di logging in base all'argomento
@@ -368,77 +385,104 @@ async def main():
             logger.error(f"File di input JSONL non trovato: {input_jsonl_path}")
             return
         
-        # Carica i chunk già processati
-        checkpoint_file = get_checkpoint_filename(input_jsonl_path)
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            logger.error(str(e))
+            return
+
+        # Carica i chunk già processati (checkpoint globale + checkpoint dello shard)
+        checkpoint_file = get_checkpoint_filename(input_jsonl_path, shard)
         processed_chunk_ids = load_processed_chunks(checkpoint_file)
-        
+        if shard is not None:
+            processed_chunk_ids |= load_processed_chunks(get_checkpoint_filename(input_jsonl_path))
+
         # Elabora il testo
         logger.info(f"Inizio elaborazione chunk dal file: {input_jsonl_path}")
         processed_chunks = 0
         chunks_skipped = 0
+        reader = ChunkReader(input_jsonl_path)
+        buffer_config = config.get("aggregation_buffer", {})
+        aggregation_buffer = None
+        if buffer_config.get("enabled", False):
+            aggregation_buffer = GraphAggregationBuffer(
+                storage,
+                max_chunks=buffer_config.get("max_chunks", 20),
+                max_pending_items=buffer_config.get("max_pending_items", 5000),
+                max_age_seconds=buffer_config.get("max_age_seconds", 120),
+                max_buffered_items=buffer_config.get("max_buffered_items", 50000),
+            )
+            logger.info(f"Buffer di aggregazione attivo (max {aggregation_buffer.max_chunks} chunk, {aggregation_buffer.max_pending_items} elementi, {aggregation_buffer.max_age_seconds}s).")
         try:
-            with open(input_jsonl_path, 'r', encoding='utf-8') as f:
-                # 1. Leggi tutti i chunk in memoria
-                all_chunks_data = []
-                logger.info(f"Lettura di tutti i chunk da {input_jsonl_path}...")
-                for line in f:
-                    try:
-                        chunk_data = json.loads(line)
-                        all_chunks_data.append(chunk_data)
-                    except json.JSONDecodeError as json_err:
-                         logger.error(f"Errore nel decodificare la riga JSON durante la lettura iniziale: {json_err}. Riga saltata: {line.strip()[:100]}...")
-                logger.info(f"Letti {len(all_chunks_data)} chunk totali.")
+            # 1. Indicizza i chunk (solo offset in memoria, il testo viene letto su richiesta)
+            reader.ensure_index()
+            logger.info(f"Indicizzati {len(reader)} chunk totali.")
+            if shard is not None:
+                logger.info(f"Elaborazione dello shard {shard[0]}/{shard[1]}.")
+            if args.shuffle:
+                logger.info("Randomizzazione dell'ordine dei chunk...")
+            if args.limit is not None and args.limit > 0:
+                logger.info(f"Applicazione limite: verranno elaborati al massimo {args.limit} chunk.")
 
-                # 2. Shuffle (se richiesto)
-                if args.shuffle:
-                    logger.info("Randomizzazione dell'ordine dei chunk...")
-                    random.shuffle(all_chunks_data)
-                    logger.info("Ordine dei chunk randomizzato.")
+            # 2. Selezione: shard, shuffle e limite operano sull'indice
+            entries = reader.select(shard=shard, shuffle=args.shuffle, limit=args.limit)
 
-                # 3. Limita (se richiesto)
-                chunks_to_process = all_chunks_data
-                if args.limit is not None and args.limit > 0:
-                    logger.info(f"Applicazione limite: verranno elaborati al massimo {args.limit} chunk.")
-                    chunks_to_process = all_chunks_data[:args.limit]
-                else:
-                    logger.info("Nessun limite applicato, elaborazione di tutti i chunk letti (o shuffled).")
+            # 3. I chunk già processati vengono scartati tramite l'indice, senza leggerli
+            chunks_skipped = sum(1 for entry in entries if entry.chunk_id in processed_chunk_ids)
+            total_to_process = len(entries)
+            logger.info(f"Inizio elaborazione di {total_to_process} chunk ({chunks_skipped} già processati verranno saltati)...")
 
-                # 4. Ciclo di elaborazione sulla lista filtrata/shuffled
-                total_to_process = len(chunks_to_process)
-                logger.info(f"Inizio elaborazione di {total_to_process} chunk...")
-                for i, chunk_data in enumerate(chunks_to_process):
+            # 4. Ciclo di elaborazione con lettura lazy dei chunk
+            for chunk_data in reader.iter_chunks(entries, skip_ids=processed_chunk_ids):
+                chunk_id = chunk_data.get("chunk_id")
+                if aggregation_buffer is not None:
+                    # Con il grafo non raggiungibile il buffer non può crescere senza limite
                     try:
-                        chunk_id = chunk_data.get("chunk_id")
-
-                        # >>> Checkpoint Check <<<
-                        if chunk_id and chunk_id in processed_chunk_ids:
-                            # logger.debug(f"Chunk {chunk_id} già processato, saltato.") # Potrebbe essere troppo verboso
-                            chunks_skipped += 1
-                            if (processed_chunks + chunks_skipped) % 100 == 0: # Logga progresso anche per skipped
-                                logger.info(f"Progresso: {processed_chunks} processati, {chunks_skipped} saltati di {total_to_process} previsti.")
-                            continue
-
-                        # Elabora il chunk se non è stato saltato
-                        await process_chunk(chunk_data, config, storage, llm_func)
+                        durable_chunk_ids = await aggregation_buffer.ensure_capacity()
+                    except AggregationBufferFull as full_err:
+                        logger.error(f"{full_err}: elaborazione interrotta, i chunk restanti verranno elaborati alla prossima esecuzione.")
+                        break
+                    if durable_chunk_ids:
+                        processed_chunk_ids.update(durable_chunk_ids)
+                        save_processed_chunks(processed_chunk_ids, checkpoint_file)
+                try:
+                    # Elabora il chunk
+                    await process_chunk(chunk_data, config, storage, llm_func, aggregation_buffer)
 
-                        # >>> Checkpoint Save <<<
-                        if chunk_id:
-                            processed_chunk_ids.add(chunk_id)
+                    # >>> Checkpoint Save <<<
+                    # Con il buffer attivo un chunk entra nel checkpoint solo dopo il flush dei suoi dati
+                    if chunk_id:
+                        if aggregation_buffer is not None:
+                            aggregation_buffer.register_chunk(chunk_id)
+                            durable_chunk_ids = await aggregation_buffer.maybe_flush()
+                        else:
+                            durable_chunk_ids = [chunk_id]
+                        if durable_chunk_ids:
+                            processed_chunk_ids.update(durable_chunk_ids)
                             save_processed_chunks(processed_chunk_ids, checkpoint_file)
-                            if (processed_chunks + 1) % 100 == 0: # Logga progresso meno frequentemente?
-                                logger.info(f"Progresso: {processed_chunks + 1} processati, {chunks_skipped} saltati di {total_to_process} previsti. Checkpoint salvato.")
+                        if (processed_chunks + 1) % 100 == 0: # Logga progresso meno frequentemente?
+                            logger.info(f"Progresso: {processed_chunks + 1} processati, {chunks_skipped} saltati di {total_to_process} previsti. Checkpoint salvato.")
 
-                        processed_chunks += 1 # Incrementa solo dopo successo
+                    processed_chunks += 1 # Incrementa solo dopo successo
 
-                    except Exception as chunk_err:
-                        logger.error(f"Errore imprevisto durante l'elaborazione del chunk {chunk_id or '(ID mancante)'}: {chunk_err}", exc_info=True)
-                        # Si potrebbe aggiungere logica per riprovare o fermare l'intero processo
+                except Exception as chunk_err:
+                    logger.error(f"Errore imprevisto durante l'elaborazione del chunk {chunk_id or '(ID mancante)'}: {chunk_err}", exc_info=True)
+                    # Si potrebbe aggiungere logica per riprovare o fermare l'intero processo
         except Exception as file_err:
             logger.error(f"Errore durante la lettura del file JSONL {input_jsonl_path}: {file_err}")
             return # Interrompi se non possiamo leggere il file
+        finally:
+            reader.close()
+            # Flush finale del buffer: i chunk non scritti restano fuori dal checkpoint e verranno rielaborati
+            if aggregation_buffer is not None:
+                durable_chunk_ids = await aggregation_buffer.flush()
+                if durable_chunk_ids:
+                    processed_chunk_ids.update(durable_chunk_ids)
+                    save_processed_chunks(processed_chunk_ids, checkpoint_file)
+                if aggregation_buffer.pending_chunks:
+                    logger.warning(f"{aggregation_buffer.pending_chunks} chunk non scritti nel grafo: verranno rielaborati alla prossima esecuzione.")
         
         # Salva lo stato finale (anche se potrebbe essere già stato salvato dopo l'ultimo chunk)
-        checkpoint_file = get_checkpoint_filename(input_jsonl_path)
         save_processed_chunks(processed_chunk_ids, checkpoint_file)
         logger.info(f"Checkpoint finale salvato.")
 
@@ -448,6 +492,8 @@ async def main():
         logger.info("Statistiche finali del grafo:")
         labels = await storage.get_all_labels()
         logger.info(f"Tipi di entità nel knowledge graph: {', '.join(labels)}")
+        for operation, stats in storage.get_metrics().items():
+            logger.info(f"Metriche Neo4j '{operation}': {stats['count']} esecuzioni, {stats['errors']} errori, media {stats['avg_seconds'] * 1000:.1f} ms, max {stats['max_seconds'] * 1000:.1f} ms")
         
     except Exception as e:
         logger.error(f"Errore durante l'elaborazione: {e}", exc_info=True)
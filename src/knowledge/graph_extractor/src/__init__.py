@@ -4,6 +4,8 @@ from .types import KnowledgeGraph, KnowledgeGraphNode, KnowledgeGraphEdge
 from .base import BaseGraphStorage
 from .extractor import extract_entities
 from .neo4j_storage import Neo4jGraphStorage
+from .chunk_reader import ChunkReader
+from .aggregation_buffer import GraphAggregationBuffer
 
 __all__ = [
     'KnowledgeGraph',
@@ -12,4 +14,6 @@ __all__ = [
     'BaseGraphStorage',
     'extract_entities',
     'Neo4jGraphStorage',
+    'ChunkReader',
+    'GraphAggregationBuffer',
 ] 
\ No newline at end of file
@@ -0,0 +1,164 @@
+"""
+Buffer di aggregazione di nodi e archi tra più chunk prima della scrittura nel grafo.
+
+Concetti citati di frequente (es. "Codice Civile", "buona fede") vengono estratti da
+quasi ogni chunk: invece di riscrivere lo stesso nodo ad ogni chunk, il buffer li unisce
+in memoria con le stesse regole di extract_entities e li scrive in blocco quando viene
+superata una soglia di chunk, di elementi o di tempo.
+
+I chunk registrati nel buffer diventano "durevoli" solo dopo un flush riuscito: il
+chiamante deve aggiungerli al checkpoint soltanto quando flush() li restituisce, così
+che in caso di crash i chunk non ancora scritti vengano rielaborati.
+
+Se i flush falliscono (es. Neo4j non raggiungibile) il buffer viene mantenuto per il
+tentativo successivo; oltre max_buffered_items elementi il buffer è pieno e
+ensure_capacity() solleva AggregationBufferFull, così il chiamante smette di accettare
+chunk invece di accumularli in memoria senza limite.
+"""
+
+import time
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from .base import BaseGraphStorage
+from .extractor import get_edge_key, merge_edge_data, merge_node_data
+
+logger = logging.getLogger(__name__)
+
+
+class AggregationBufferFull(RuntimeError):
+    """Il buffer ha superato max_buffered_items e il flush non è riuscito a svuotarlo."""
+
+
+class GraphAggregationBuffer:
+    """Accumula nodi/archi aggregati di più chunk e li scrive con upsert_batch."""
+
+    def __init__(
+        self,
+        storage: BaseGraphStorage,
+        max_chunks: int = 20,
+        max_pending_items: int = 5000,
+        max_age_seconds: float = 120.0,
+        max_buffered_items: int = 50000,
+    ):
+        """
+        Args:
+            storage: Storage su cui effettuare il flush
+            max_chunks: Numero di chunk registrati oltre il quale effettuare il flush
+            max_pending_items: Numero di nodi + archi in memoria oltre il quale effettuare il flush
+            max_age_seconds: Età massima (dal primo elemento accodato) prima di un flush
+            max_buffered_items: Numero di nodi + archi oltre il quale, dopo flush falliti,
+                il buffer non accetta altri chunk
+        """
+        self._storage = storage
+        self.max_chunks = max_chunks
+        self.max_pending_items = max_pending_items
+        self.max_age_seconds = max_age_seconds
+        self.max_buffered_items = max(max_buffered_items, max_pending_items)
+        self._nodes: Dict[str, Dict[str, Any]] = {}
+        self._edges: Dict[str, Dict[str, Any]] = {}
+        self._pending_chunk_ids: List[str] = []
+        self._oldest: Optional[float] = None
+        self.flush_count = 0
+        self.failed_flushes = 0
+
+    def add(
+        self,
+        nodes: List[Tuple[str, Dict[str, Any]]],
+        edges: List[Tuple[str, str, Dict[str, Any]]],
+    ) -> None:
+        """Unisce nel buffer i nodi e gli archi aggregati di un chunk."""
+        for node_id, node_data in nodes:
+            if node_id in self._nodes:
+                merge_node_data(self._nodes[node_id], node_data)
+            else:
+                self._nodes[node_id] = node_data
+        for _, _, edge_data in edges:
+            edge_key = get_edge_key(edge_data)
+            if edge_key in self._edges:
+                merge_edge_data(self._edges[edge_key], edge_data)
+            else:
+                self._edges[edge_key] = edge_data
+        if self._oldest is None and (nodes or edges):
+            self._oldest = time.monotonic()
+
+    def register_chunk(self, chunk_id: str) -> None:
+        """Segna un chunk come elaborato ma non ancora scritto nel grafo."""
+        self._pending_chunk_ids.append(chunk_id)
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+
+    @property
+    def pending_items(self) -> int:
+        return len(self._nodes) + len(self._edges)
+
+    @property
+    def pending_chunks(self) -> int:
+        return len(self._pending_chunk_ids)
+
+    @property
+    def is_full(self) -> bool:
+        return self.pending_items >= self.max_buffered_items
+
+    def should_flush(self) -> bool:
+        """True se è stata superata almeno una delle soglie di dimensione o di tempo."""
+        if not self._pending_chunk_ids and not self.pending_items:
+            return False
+        if len(self._pending_chunk_ids) >= self.max_chunks or self.pending_items >= self.max_pending_items:
+            return True
+        return self._oldest is not None and time.monotonic() - self._oldest >= self.max_age_seconds
+
+    async def maybe_flush(self) -> List[str]:
+        """Effettua il flush solo se una soglia è stata superata; restituisce i chunk resi durevoli."""
+        if self.should_flush():
+            return await self.flush()
+        return []
+
+    async def ensure_capacity(self) -> List[str]:
+        """
+        Da chiamare prima di elaborare un nuovo chunk: se il buffer è pieno tenta un flush.
+
+        Returns:
+            Gli ID dei chunk resi durevoli dal flush (vuoto se il buffer non era pieno)
+
+        Raises:
+            AggregationBufferFull: se il buffer resta pieno dopo il flush
+        """
+        if not self.is_full:
+            return []
+        flushed_chunk_ids = await self.flush()
+        if self.is_full:
+            raise AggregationBufferFull(
+                f"Buffer di aggregazione pieno ({self.pending_items} elementi, {self.pending_chunks} chunk) "
+                f"dopo {self.failed_flushes} flush falliti"
+            )
+        return flushed_chunk_ids
+
+    async def flush(self) -> List[str]:
+        """
+        Scrive il contenuto del buffer in un'unica chiamata a upsert_batch.
+
+        Returns:
+            Gli ID dei chunk i cui dati sono ora nel grafo. In caso di errore il buffer
+            viene mantenuto (verrà ritentato al flush successivo) e si restituisce [].
+        """
+        if not self._pending_chunk_ids and not self.pending_items:
+            return []
+
+        nodes = list(self._nodes.items())
+        edges = [(edge_data['src_id'], edge_data['tgt_id'], edge_data) for edge_data in self._edges.values()]
+        try:
+            await self._storage.upsert_batch(nodes, edges)
+        except Exception as e:
+            self.failed_flushes += 1
+            logger.error(f"Flush del buffer di aggregazione fallito ({len(nodes)} nodi, {len(edges)} archi, {len(self._pending_chunk_ids)} chunk): {e}", exc_info=True)
+            return []
+
+        flushed_chunk_ids = self._pending_chunk_ids
+        logger.info(f"Flush del buffer di aggregazione: {len(nodes)} nodi, {len(edges)} archi da {len(flushed_chunk_ids)} chunk")
+        self._nodes = {}
+        self._edges = {}
+        self._pending_chunk_ids = []
+        self._oldest = None
+        self.flush_count += 1
+        return flushed_chunk_ids
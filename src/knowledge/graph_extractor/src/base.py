@@ -1,5 +1,11 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+
+# Proprietà dei nodi creati implicitamente come estremi di una relazione
+PLACEHOLDER_NODE_PROPERTIES = {
+    "description": "Entità estratta implicitamente da relazione",
+    "is_placeholder": True,
+}
 
 class BaseGraphStorage(ABC):
     """Base class for graph storage implementations"""
@@ -44,6 +50,28 @@ class BaseGraphStorage(ABC):
         """Insert or update an edge"""
         pass
 
+    async def upsert_nodes(self, nodes: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Insert or update multiple nodes given as (node_id, node_data) pairs"""
+        for node_id, node_data in nodes:
+            await self.upsert_node(node_id, node_data)
+
+    async def upsert_edges(self, edges: List[Tuple[str, str, Dict[str, Any]]]) -> None:
+        """Insert or update multiple edges given as (source_id, target_id, edge_data), creating missing endpoints as placeholders"""
+        for source_node_id, target_node_id, edge_data in edges:
+            for endpoint_id in (source_node_id, target_node_id):
+                if not await self.has_node(endpoint_id):
+                    await self.upsert_node(endpoint_id, {"label": "Node", "name": endpoint_id, **PLACEHOLDER_NODE_PROPERTIES})
+            await self.upsert_edge(source_node_id, target_node_id, edge_data)
+
+    async def upsert_batch(
+        self,
+        nodes: List[Tuple[str, Dict[str, Any]]],
+        edges: List[Tuple[str, str, Dict[str, Any]]],
+    ) -> None:
+        """Insert or update the nodes and edges extracted from one chunk"""
+        await self.upsert_nodes(nodes)
+        await self.upsert_edges(edges)
+
     @abstractmethod
     async def delete_node(self, node_id: str) -> None:
         """Delete a node"""
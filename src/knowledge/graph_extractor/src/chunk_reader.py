@@ -0,0 +1,253 @@
+"""
+Lettura in streaming dei chunk JSONL prodotti dal pdf_chunker.
+
+Il file di input non viene mai caricato interamente in memoria: i record sono
+letti uno alla volta e un indice laterale (``<input>.idx``) memorizza per ogni
+chunk la posizione in byte all'interno del file. L'indice consente accesso
+casuale per ``chunk_id`` tramite mmap, suddivisione in shard tra più worker e
+salto dei chunk già processati senza decodificarne il JSON.
+"""
+
+import os
+import json
+import mmap
+import random
+import logging
+import tempfile
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+
+@dataclass
+class ChunkIndexEntry:
+    """Posizione di un singolo chunk all'interno del file JSONL."""
+    ordinal: int
+    offset: int
+    length: int
+    chunk_id: Optional[str]
+
+
+def parse_shard(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    """
+    Interpreta una specifica di shard nel formato ``i/N`` (con 0 <= i < N).
+
+    Args:
+        value: Stringa passata da linea di comando (es. "0/4")
+
+    Returns:
+        Tupla (indice_shard, numero_shard) oppure None se value è vuoto
+    """
+    if not value:
+        return None
+    try:
+        index_str, total_str = value.split("/", 1)
+        shard_index, shard_total = int(index_str), int(total_str)
+    except ValueError:
+        raise ValueError(f"Formato shard non valido: '{value}'. Atteso 'i/N', es. '0/4'.")
+    if shard_total <= 0 or not 0 <= shard_index < shard_total:
+        raise ValueError(f"Shard non valido: '{value}'. Deve valere 0 <= i < N.")
+    return shard_index, shard_total
+
+
+class ChunkReader:
+    """Lettore lazy di un file JSONL di chunk con indice di offset su file laterale."""
+
+    def __init__(self, jsonl_path: str, index_path: Optional[str] = None):
+        """
+        Args:
+            jsonl_path: Percorso al file JSONL dei chunk
+            index_path: Percorso dell'indice laterale (default: ``<jsonl_path>.idx``)
+        """
+        self.jsonl_path = jsonl_path
+        self.index_path = index_path or jsonl_path + ".idx"
+        self._entries: Optional[List[ChunkIndexEntry]] = None
+        self._by_id: Dict[str, ChunkIndexEntry] = {}
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+
+    # --- Lettura sequenziale ---
+
+    def iter_records(self) -> Iterator[Tuple[int, int, Dict[str, Any]]]:
+        """
+        Legge il file riga per riga restituendo (offset, lunghezza, record).
+        Le righe vuote o con JSON non valido vengono saltate con un log.
+        """
+        with open(self.jsonl_path, "rb") as f:
+            offset = 0
+            for raw_line in f:
+                length = len(raw_line)
+                line = raw_line.strip()
+                if line:
+                    try:
+                        yield offset, length, json.loads(line)
+                    except json.JSONDecodeError as json_err:
+                        logger.error(f"Errore nel decodificare la riga JSON all'offset {offset}: {json_err}. Riga saltata: {line[:100]!r}...")
+                offset += length
+
+    # --- Indice laterale ---
+
+    def _source_signature(self) -> Dict[str, int]:
+        stat = os.stat(self.jsonl_path)
+        return {"source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns}
+
+    def build_index(self) -> List[ChunkIndexEntry]:
+        """Scansiona il file JSONL e scrive l'indice laterale degli offset."""
+        logger.info(f"Costruzione indice dei chunk per {self.jsonl_path}...")
+        entries: List[ChunkIndexEntry] = []
+        for offset, length, record in self.iter_records():
+            chunk_id = record.get("chunk_id") if isinstance(record, dict) else None
+            entries.append(ChunkIndexEntry(len(entries), offset, length, chunk_id))
+
+        header = {"version": INDEX_VERSION, **self._source_signature()}
+        tmp_path = None
+        try:
+            # File temporaneo univoco nella stessa directory: più worker --shard possono
+            # costruire l'indice contemporaneamente senza scrivere sullo stesso file
+            fd, tmp_path = tempfile.mkstemp(
+                prefix=os.path.basename(self.index_path) + ".",
+                suffix=".tmp",
+                dir=os.path.dirname(os.path.abspath(self.index_path)),
+            )
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(json.dumps(header) + "\n")
+                for entry in entries:
+                    f.write(f"{entry.offset}\t{entry.length}\t{entry.chunk_id or ''}\n")
+            os.replace(tmp_path, self.index_path)
+            tmp_path = None
+            logger.info(f"Indice salvato in {self.index_path} con {len(entries)} chunk.")
+        except IOError as e:
+            logger.error(f"Errore durante il salvataggio dell'indice {self.index_path}: {e}. Indice mantenuto solo in memoria.")
+        finally:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return entries
+
+    def _load_index(self) -> Optional[List[ChunkIndexEntry]]:
+        """Carica l'indice laterale se esiste ed è coerente con il file sorgente."""
+        if not os.path.exists(self.index_path):
+            return None
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                header = json.loads(f.readline())
+                if header.get("version") != INDEX_VERSION or any(
+                    header.get(key) != value for key, value in self._source_signature().items()
+                ):
+                    logger.info(f"Indice {self.index_path} non aggiornato rispetto al file sorgente, verrà ricostruito.")
+                    return None
+                entries = []
+                for line in f:
+                    offset, length, chunk_id = line.rstrip("\n").split("\t", 2)
+                    entries.append(ChunkIndexEntry(len(entries), int(offset), int(length), chunk_id or None))
+            logger.info(f"Caricato indice con {len(entries)} chunk da {self.index_path}")
+            return entries
+        except (ValueError, IOError) as e:
+            logger.warning(f"Indice {self.index_path} illeggibile ({e}), verrà ricostruito.")
+            return None
+
+    def ensure_index(self) -> List[ChunkIndexEntry]:
+        """Restituisce l'indice, caricandolo da disco o ricostruendolo se necessario."""
+        if self._entries is None:
+            self._entries = self._load_index()
+            if self._entries is None:
+                self._entries = self.build_index()
+            self._by_id = {entry.chunk_id: entry for entry in self._entries if entry.chunk_id}
+        return self._entries
+
+    def __len__(self) -> int:
+        return len(self.ensure_index())
+
+    # --- Accesso casuale ---
+
+    def _get_mmap(self) -> Optional[mmap.mmap]:
+        if self._mmap is None:
+            if os.path.getsize(self.jsonl_path) == 0:
+                return None
+            self._file = open(self.jsonl_path, "rb")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def read_entry(self, entry: ChunkIndexEntry) -> Dict[str, Any]:
+        """Decodifica il record puntato da una voce dell'indice."""
+        mm = self._get_mmap()
+        return json.loads(mm[entry.offset:entry.offset + entry.length])
+
+    def get(self, chunk_id: str) -> Optional[Dict[str, Any]]:
+        """Recupera un chunk per ID tramite l'indice, senza scandire il file."""
+        self.ensure_index()
+        entry = self._by_id.get(chunk_id)
+        return self.read_entry(entry) if entry else None
+
+    def __contains__(self, chunk_id: str) -> bool:
+        self.ensure_index()
+        return chunk_id in self._by_id
+
+    # --- Selezione ed iterazione ---
+
+    def select(
+        self,
+        shard: Optional[Tuple[int, int]] = None,
+        shuffle: bool = False,
+        limit: Optional[int] = None,
+        seed: Optional[int] = None,
+    ) -> List[ChunkIndexEntry]:
+        """
+        Seleziona le voci dell'indice da elaborare.
+
+        Args:
+            shard: Tupla (i, N): vengono mantenuti solo i chunk con ordinale % N == i
+            shuffle: Se True, randomizza l'ordine (vengono mescolati solo gli offset)
+            limit: Numero massimo di voci restituite (applicato dopo lo shuffle)
+            seed: Seed opzionale per uno shuffle riproducibile
+
+        Returns:
+            Lista di voci dell'indice nell'ordine di elaborazione
+        """
+        entries = self.ensure_index()
+        if shard is not None:
+            shard_index, shard_total = shard
+            entries = [entry for entry in entries if entry.ordinal % shard_total == shard_index]
+        else:
+            entries = list(entries)
+        if shuffle:
+            random.Random(seed).shuffle(entries)
+        if limit is not None and limit > 0:
+            entries = entries[:limit]
+        return entries
+
+    def iter_chunks(
+        self,
+        entries: Optional[List[ChunkIndexEntry]] = None,
+        skip_ids: Optional[Set[str]] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Itera lazy sui chunk indicati (di default tutti, in ordine di file).
+        I chunk il cui ID è in skip_ids vengono saltati senza decodificarne il JSON.
+        """
+        if entries is None:
+            entries = self.ensure_index()
+        for entry in entries:
+            if skip_ids and entry.chunk_id in skip_ids:
+                continue
+            try:
+                yield self.read_entry(entry)
+            except json.JSONDecodeError as json_err:
+                logger.error(f"Errore nel decodificare il chunk all'offset {entry.offset}: {json_err}. Chunk saltato.")
+
+    def close(self) -> None:
+        """Rilascia la mappatura in memoria e il file sottostante."""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
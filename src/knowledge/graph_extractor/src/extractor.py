@@ -80,6 +80,51 @@ def get_normalized_relationship_type(keywords: str) -> str:
     
     return rel_type if rel_type else "RELATED_TO"
 
+def _to_aggregated_node(entity_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Converte un'entità estratta nel formato aggregato (proprietà di tracciabilità come liste)."""
+    node = dict(entity_data)
+    node["source_doc_paths"] = [node.pop("source_doc_path")]
+    node["chunk_ids"] = [node.pop("chunk_id")]
+    node["all_entity_types_original"] = [node["entity_type_original"]]
+    return node
+
+def _to_aggregated_edge(relationship_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Converte una relazione estratta nel formato aggregato (proprietà di tracciabilità come liste)."""
+    edge = dict(relationship_data)
+    edge["source_doc_paths"] = [edge.pop("source_doc_path")]
+    edge["chunk_ids"] = [edge.pop("chunk_id")]
+    return edge
+
+def _extend_unique(target: List[Any], values: List[Any]) -> None:
+    for value in values:
+        if value not in target:
+            target.append(value)
+
+def merge_node_data(existing_node: Dict[str, Any], new_node: Dict[str, Any]) -> None:
+    """
+    Arricchisce un nodo aggregato con un altro nodo aggregato con lo stesso ID.
+    Le liste di tracciabilità vengono unite senza duplicati; la descrizione resta la prima.
+    """
+    _extend_unique(existing_node.setdefault("source_doc_paths", []), new_node.get("source_doc_paths", []))
+    _extend_unique(existing_node.setdefault("chunk_ids", []), new_node.get("chunk_ids", []))
+    _extend_unique(existing_node.setdefault("all_entity_types_original", []), new_node.get("all_entity_types_original", []))
+    # Decidi strategia per descrizione (es. mantieni la prima)
+    existing_node["description"] = existing_node.get("description", new_node.get("description"))
+
+def merge_edge_data(existing_edge: Dict[str, Any], new_edge: Dict[str, Any]) -> None:
+    """
+    Arricchisce una relazione aggregata con un'altra relazione aggregata con la stessa chiave.
+    Le liste di tracciabilità vengono unite; vince l'ultima descrizione e il peso massimo.
+    """
+    _extend_unique(existing_edge.setdefault("source_doc_paths", []), new_edge.get("source_doc_paths", []))
+    _extend_unique(existing_edge.setdefault("chunk_ids", []), new_edge.get("chunk_ids", []))
+    existing_edge["description"] = new_edge["description"] # Sovrascrivi con ultima descrizione
+    existing_edge["weight"] = max(existing_edge.get("weight", 0.0), new_edge.get("weight", 0.0)) # Esempio: prendi peso massimo
+
+def get_edge_key(edge_data: Dict[str, Any]) -> str:
+    """Chiave di aggregazione di una relazione: sorgente, tipo giuridico e destinazione."""
+    return f"{edge_data['src_id']}-{edge_data.get('legal_relation_type', 'RELATED_TO')}-{edge_data['tgt_id']}"
+
 async def _handle_single_entity_extraction(
     record_attributes: List[str],
     chunk_key: str,
@@ -218,8 +263,13 @@ async def extract_entities(
     global_config: Dict[str, Any],
     llm_func: callable,
     llm_response_cache: Optional[Any] = None,
+    aggregation_buffer: Optional[Any] = None,
 ) -> Dict[str, Any]:
-    """Estrae entità e relazioni giuridiche dal testo usando LLM"""
+    """
+    Estrae entità e relazioni giuridiche dal testo usando LLM.
+    Se aggregation_buffer è fornito (vedi GraphAggregationBuffer), nodi e archi vengono
+    accumulati nel buffer tra più chunk invece di essere scritti subito nel grafo.
+    """
     logger.info("Inizio estrazione entità e relazioni giuridiche dal testo")
     logger.debug(f"Lunghezza testo: {len(text)} caratteri")
     logger.debug(f"Metadati sorgente: {source_metadata}")
@@ -293,29 +343,13 @@ async def extract_entities(
                 entity_type = entity_data["entity_type_original"]
                 
                 # --- Logica di Aggregazione Nodi --- 
+                new_node = _to_aggregated_node(entity_data)
                 if entity_name not in aggregated_nodes:
-                    # Nodo nuovo per questa esecuzione: inizializza proprietà lista
-                    aggregated_nodes[entity_name] = entity_data
-                    aggregated_nodes[entity_name]["source_doc_paths"] = [entity_data["source_doc_path"]]
-                    aggregated_nodes[entity_name]["chunk_ids"] = [entity_data["chunk_id"]]
-                    aggregated_nodes[entity_name]["all_entity_types_original"] = [entity_data["entity_type_original"]]
-                    # Rimuovi le chiavi singole ora che sono nelle liste
-                    del aggregated_nodes[entity_name]["source_doc_path"]
-                    del aggregated_nodes[entity_name]["chunk_id"]
-                    # entity_type_original rimane per ora, poi aggregata
+                    # Nodo nuovo per questa esecuzione
+                    aggregated_nodes[entity_name] = new_node
                 else:
                     # Nodo già visto: arricchisci
-                    existing_node = aggregated_nodes[entity_name]
-                    # Aggiungi source e chunk se non presenti
-                    if entity_data["source_doc_path"] not in existing_node["source_doc_paths"]:
-                        existing_node["source_doc_paths"].append(entity_data["source_doc_path"])
-                    if entity_data["chunk_id"] not in existing_node["chunk_ids"]:
-                        existing_node["chunk_ids"].append(entity_data["chunk_id"])
-                    # Aggiorna tipi originali
-                    if entity_data["entity_type_original"] not in existing_node["all_entity_types_original"]:
-                        existing_node["all_entity_types_original"].append(entity_data["entity_type_original"])
-                    # Decidi strategia per descrizione (es. mantieni la prima)
-                    existing_node["description"] = existing_node.get("description", entity_data["description"])
+                    merge_node_data(aggregated_nodes[entity_name], new_node)
 
                 # Traccia tipi di entità (usa label mappata)
                 entity_types_found.add(entity_data.get("entity_label", "Unknown"))
@@ -333,25 +367,14 @@ async def extract_entities(
                 legal_relation_type = relationship_data.get('legal_relation_type', 'RELATED_TO')
                 
                 # --- Logica di Aggregazione Relazioni --- 
-                edge_key = f"{src_id}-{legal_relation_type}-{tgt_id}" # Chiave più specifica
+                edge_key = get_edge_key(relationship_data) # Chiave più specifica
+                new_edge = _to_aggregated_edge(relationship_data)
                 if edge_key not in aggregated_edges:
-                     # Relazione nuova: inizializza liste
-                    aggregated_edges[edge_key] = relationship_data
-                    aggregated_edges[edge_key]["source_doc_paths"] = [relationship_data["source_doc_path"]]
-                    aggregated_edges[edge_key]["chunk_ids"] = [relationship_data["chunk_id"]]
-                    # Rimuovi chiavi singole
-                    del aggregated_edges[edge_key]["source_doc_path"]
-                    del aggregated_edges[edge_key]["chunk_id"]
+                    # Relazione nuova
+                    aggregated_edges[edge_key] = new_edge
                 else:
                     # Relazione già vista: arricchisci
-                    existing_edge = aggregated_edges[edge_key]
-                    if relationship_data["source_doc_path"] not in existing_edge["source_doc_paths"]:
-                        existing_edge["source_doc_paths"].append(relationship_data["source_doc_path"])
-                    if relationship_data["chunk_id"] not in existing_edge["chunk_ids"]:
-                        existing_edge["chunk_ids"].append(relationship_data["chunk_id"])
-                    # Aggiorna altre proprietà (es. peso medio? ultima descrizione?)
-                    existing_edge["description"] = relationship_data["description"] # Sovrascrivi con ultima descrizione
-                    existing_edge["weight"] = max(existing_edge.get("weight", 0.0), relationship_data.get("weight", 0.0)) # Esempio: prendi peso massimo
+                    merge_edge_data(aggregated_edges[edge_key], new_edge)
 
                 # Traccia tipi di relazione per statistiche
                 relationship_types_found.add(legal_relation_type)
@@ -408,25 +431,13 @@ async def extract_entities(
                 entity_name = entity_data["name"]
                 entity_type = entity_data["entity_type_original"]
                 
+                # Stessa logica di aggregazione dell'estrazione iniziale
+                new_node = _to_aggregated_node(entity_data)
                 if entity_name not in aggregated_nodes:
-                    # Stessa logica di aggregazione dell'estrazione iniziale
-                    aggregated_nodes[entity_name] = entity_data
-                    aggregated_nodes[entity_name]["source_doc_paths"] = [entity_data["source_doc_path"]]
-                    aggregated_nodes[entity_name]["chunk_ids"] = [entity_data["chunk_id"]]
-                    aggregated_nodes[entity_name]["all_entity_types_original"] = [entity_data["entity_type_original"]]
-                    del aggregated_nodes[entity_name]["source_doc_path"]
-                    del aggregated_nodes[entity_name]["chunk_id"]
+                    aggregated_nodes[entity_name] = new_node
                     new_entities += 1
                 else:
-                    # Arricchisci nodo esistente (stessa logica di prima)
-                    existing_node = aggregated_nodes[entity_name]
-                    if entity_data["source_doc_path"] not in existing_node["source_doc_paths"]:
-                        existing_node["source_doc_paths"].append(entity_data["source_doc_path"])
-                    if entity_data["chunk_id"] not in existing_node["chunk_ids"]:
-                        existing_node["chunk_ids"].append(entity_data["chunk_id"])
-                    if entity_data["entity_type_original"] not in existing_node["all_entity_types_original"]:
-                        existing_node["all_entity_types_original"].append(entity_data["entity_type_original"])
-                    existing_node["description"] = existing_node.get("description", entity_data["description"])
+                    merge_node_data(aggregated_nodes[entity_name], new_node)
 
                 entity_types_found.add(entity_data.get("entity_label", "Unknown"))
                 logger.debug(f"Gleaning: Entità processata/aggregata: {entity_name} (Label: {entity_data.get('entity_label', 'Unknown')})")
@@ -438,25 +449,14 @@ async def extract_entities(
                 tgt_id = relationship_data['tgt_id']
                 legal_relation_type = relationship_data.get('legal_relation_type', 'RELATED_TO')
                 
-                edge_key = f"{src_id}-{legal_relation_type}-{tgt_id}"
-                
+                # Stessa logica di aggregazione dell'estrazione iniziale
+                edge_key = get_edge_key(relationship_data)
+                new_edge = _to_aggregated_edge(relationship_data)
                 if edge_key not in aggregated_edges:
-                    # Stessa logica di aggregazione dell'estrazione iniziale
-                    aggregated_edges[edge_key] = relationship_data
-                    aggregated_edges[edge_key]["source_doc_paths"] = [relationship_data["source_doc_path"]]
-                    aggregated_edges[edge_key]["chunk_ids"] = [relationship_data["chunk_id"]]
-                    del aggregated_edges[edge_key]["source_doc_path"]
-                    del aggregated_edges[edge_key]["chunk_id"]
+                    aggregated_edges[edge_key] = new_edge
                     new_relationships += 1
                 else:
-                    # Arricchisci relazione esistente (stessa logica di prima)
-                    existing_edge = aggregated_edges[edge_key]
-                    if relationship_data["source_doc_path"] not in existing_edge["source_doc_paths"]:
-                        existing_edge["source_doc_paths"].append(relationship_data["source_doc_path"])
-                    if relationship_data["chunk_id"] not in existing_edge["chunk_ids"]:
-                        existing_edge["chunk_ids"].append(relationship_data["chunk_id"])
-                    existing_edge["description"] = relationship_data["description"]
-                    existing_edge["weight"] = max(existing_edge.get("weight", 0.0), relationship_data.get("weight", 0.0))
+                    merge_edge_data(aggregated_edges[edge_key], new_edge)
 
                 relationship_types_found.add(legal_relation_type)
                 logger.debug(f"Gleaning: Relazione processata/aggregata: {src_id} -> {tgt_id} ({legal_relation_type})")
@@ -474,61 +474,22 @@ async def extract_entities(
     # Aggiornamento del knowledge graph
     logger.info(f"Aggiornamento knowledge graph con {len(aggregated_nodes)} entità e {len(aggregated_edges)} relazioni aggregate")
     
-    # Aggiunta nodi al grafo
-    for node_id, node_data in aggregated_nodes.items():
-        logger.debug(f"Aggiunta/aggiornamento nodo: {node_id}")
-        
-        # Ora passiamo direttamente il dizionario aggregato (node_data) a upsert_node
-        # Assicurati che `upsert_node` in `neo4j_storage.py` gestisca correttamente
-        # le chiavi come `source_doc_paths` e `chunk_ids`.
-
-        logger.debug(f"Proprietà nodo: {node_data}")
-        await knowledge_graph_inst.upsert_node(
-            node_id, # L'ID è la chiave del dizionario aggregated_nodes
-            node_data # Passiamo il dizionario aggregato
-        )
-
-    # Aggiunta archi al grafo
-    for edge_key, edge_data in aggregated_edges.items():
-        # Prendiamo i dati dal primo elemento estratto per questo arco
-        src_id = edge_data['src_id']
-        tgt_id = edge_data['tgt_id']
-
-        logger.debug(f"Aggiunta/aggiornamento arco: {src_id} -> {tgt_id}")
-
-        # Usa il tipo di relazione giuridica normalizzato
-        relation_type = edge_data.get("legal_relation_type", "RELATED_TO")
-        
-        # Verifica se l'entità di origine e destinazione esistono
-        src_exists = await knowledge_graph_inst.has_node(src_id)
-        tgt_exists = await knowledge_graph_inst.has_node(tgt_id)
-        
-        if not src_exists:
-            logger.warning(f"Entità origine '{src_id}' non trovata nel grafo. Creazione di un nodo placeholder.")
-            await knowledge_graph_inst.upsert_node(
-                src_id, 
-                {"label": "Node", "name": src_id, "description": "Entità estratta implicitamente da relazione", "is_placeholder": True}
-            )
-            
-        if not tgt_exists:
-            logger.warning(f"Entità destinazione '{tgt_id}' non trovata nel grafo. Creazione di un nodo placeholder.")
-            await knowledge_graph_inst.upsert_node(
-                tgt_id, 
-                {"label": "Node", "name": tgt_id, "description": "Entità estratta implicitamente da relazione", "is_placeholder": True}
-            )
-
-        edge_properties = {
-            # Passiamo direttamente il dizionario aggregato edge_data.
-            # Il `relation_type` per la query MERGE verrà preso da edge_data["legal_relation_type"]
-            # Assicurati che `upsert_edge` gestisca questo.
-        }
-
-        logger.debug(f"Proprietà arco: {edge_properties}")
-        await knowledge_graph_inst.upsert_edge(
-            src_id,
-            tgt_id,
-            edge_data # Passiamo il dizionario aggregato
-        )
+    # Aggiunta di nodi e archi al grafo in un'unica scrittura batch per chunk.
+    # A upsert_batch viene passato l'intero dizionario aggregato, incluse le liste
+    # di tracciabilità (`source_doc_paths`, `chunk_ids`); il tipo di relazione per il
+    # MERGE viene preso da edge_data["legal_relation_type"]. Gli estremi degli archi
+    # non estratti come entità vengono creati come nodi placeholder dallo storage.
+    nodes_to_upsert = list(aggregated_nodes.items())
+    edges_to_upsert = [
+        (edge_data['src_id'], edge_data['tgt_id'], edge_data)
+        for edge_data in aggregated_edges.values()
+    ]
+    if aggregation_buffer is not None:
+        logger.debug(f"Accodamento nel buffer di aggregazione di {len(nodes_to_upsert)} nodi e {len(edges_to_upsert)} archi")
+        aggregation_buffer.add(nodes_to_upsert, edges_to_upsert)
+    else:
+        logger.debug(f"Scrittura batch di {len(nodes_to_upsert)} nodi e {len(edges_to_upsert)} archi")
+        await knowledge_graph_inst.upsert_batch(nodes_to_upsert, edges_to_upsert)
 
     # Statistiche finali
     nodes_count = len(aggregated_nodes)
@@ -0,0 +1,53 @@
+"""
+Metriche di temporizzazione in-process per le operazioni sul grafo.
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict
+
+
+class OperationMetrics:
+    """Accumula, per nome di operazione, numero di chiamate, errori e tempi di esecuzione."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, operation: str, elapsed: float, error: bool = False) -> None:
+        """Registra una singola esecuzione di un'operazione (elapsed in secondi)."""
+        with self._lock:
+            stats = self._stats.setdefault(operation, {
+                "count": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0,
+            })
+            stats["count"] += 1
+            stats["total_seconds"] += elapsed
+            stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+            if error:
+                stats["errors"] += 1
+
+    @contextmanager
+    def timed(self, operation: str):
+        """Context manager che misura il blocco e lo registra sotto `operation`."""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.record(operation, time.perf_counter() - start, error=True)
+            raise
+        self.record(operation, time.perf_counter() - start)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Restituisce una copia delle metriche con la durata media per operazione."""
+        with self._lock:
+            result = {}
+            for operation, stats in self._stats.items():
+                entry = dict(stats)
+                entry["avg_seconds"] = stats["total_seconds"] / stats["count"] if stats["count"] else 0.0
+                result[operation] = entry
+            return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
@@ -2,6 +2,22 @@
 Modulo per la gestione dei constraint Neo4j specifici per il knowledge graph giuridico.
 """
 
+# Label base comune a tutti i nodi del grafo: ogni MERGE avviene su (:Entity {id}),
+# coperto dal constraint di unicità seguente, e le label di tipo vengono applicate dopo.
+BASE_LABEL = "Entity"
+
+# Constraint di unicità (e relativo indice) sulla chiave di MERGE
+BASE_LABEL_CONSTRAINT_QUERY = f"CREATE CONSTRAINT entity_id_unique IF NOT EXISTS FOR (n:{BASE_LABEL}) REQUIRE n.id IS UNIQUE"
+
+# Migrazione dei nodi creati prima dell'introduzione della label base (eseguita a blocchi)
+BASE_LABEL_BACKFILL_QUERY = f"""
+MATCH (n)
+WHERE n.id IS NOT NULL AND NOT n:{BASE_LABEL}
+WITH n LIMIT $batch_size
+SET n:{BASE_LABEL}
+RETURN count(n) AS updated
+"""
+
 # Query per creare constraint generici
 # Modificato ASSERT con REQUIRE per compatibilità con versioni Neo4j recenti
 GENERIC_CONSTRAINT_QUERY = "CREATE CONSTRAINT node_id_unique IF NOT EXISTS FOR (n:Node) REQUIRE n.id IS UNIQUE"
@@ -30,6 +46,19 @@ LEGAL_INDEX_QUERIES = [
     # "CALL db.index.fulltext.createNodeIndex('description_fulltext', ['Norma', 'ConcettoGiuridico', 'AttoGiudiziario'], ['description'])" # Commentato: richiede Enterprise Edition o configurazione specifica
 ]
 
+# Indici che devono esistere (ed essere ONLINE) per upsert e lookup efficienti: (label, proprietà)
+REQUIRED_INDEXES = [
+    (BASE_LABEL, ["id"]),
+    ("Norma", ["name"]),
+    ("ConcettoGiuridico", ["name"]),
+]
+
+# Query per verificare gli indici esistenti e il loro stato
+SHOW_INDEXES_QUERY = """
+SHOW INDEXES YIELD name, type, state, labelsOrTypes, properties
+RETURN name, type, state, labelsOrTypes, properties
+"""
+
 # Query di esempio per verificare lo schema dopo la creazione
 SCHEMA_CHECK_QUERY = """
 CALL db.schema.visualization()
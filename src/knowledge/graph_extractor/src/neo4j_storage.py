@@ -1,10 +1,23 @@
+import asyncio
 import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from typing import Any, Dict, List, Optional, Tuple
-from neo4j import AsyncGraphDatabase, AsyncDriver, AsyncSession, Record, Query
-from neo4j.exceptions import Neo4jError
+from neo4j import AsyncGraphDatabase, AsyncDriver, AsyncSession, AsyncTransaction, Record, Query, ResultSummary
+from neo4j.exceptions import Neo4jError, TransientError, ServiceUnavailable, SessionExpired
 import re
-from .base import BaseGraphStorage
-from .neo4j_constraints import GENERIC_CONSTRAINT_QUERY, LEGAL_ENTITY_CONSTRAINTS, LEGAL_INDEX_QUERIES
+from .base import BaseGraphStorage, PLACEHOLDER_NODE_PROPERTIES
+from .metrics import OperationMetrics
+from .neo4j_constraints import (
+    BASE_LABEL,
+    BASE_LABEL_BACKFILL_QUERY,
+    BASE_LABEL_CONSTRAINT_QUERY,
+    GENERIC_CONSTRAINT_QUERY,
+    LEGAL_ENTITY_CONSTRAINTS,
+    LEGAL_INDEX_QUERIES,
+    REQUIRED_INDEXES,
+    SHOW_INDEXES_QUERY,
+)
 
 # Configurazione di logging con livello INFO di default
 logging.basicConfig(
@@ -13,10 +26,119 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Errori per cui ha senso ripetere la transazione
+RETRYABLE_ERRORS = (TransientError, ServiceUnavailable, SessionExpired)
+
+
+class Neo4jUnitOfWork:
+    """
+    Unità di lavoro legata ad una singola sessione e ad una singola transazione.
+
+    La transazione viene aperta in modo lazy alla prima query e confermata all'uscita
+    dal context manager (vedi Neo4jGraphStorage.unit_of_work). Le scritture eseguite
+    vengono registrate: in caso di errore transitorio la transazione viene annullata,
+    riaperta e le scritture precedenti vengono rieseguite (sono tutte MERGE/SET
+    idempotenti) prima di ripetere l'operazione fallita.
+    """
+
+    def __init__(self, session: AsyncSession, metrics: OperationMetrics, max_retries: int = 3, retry_delay: float = 0.5):
+        self._session = session
+        self._metrics = metrics
+        self._max_retries = max_retries
+        self._retry_delay = retry_delay
+        self._tx: Optional[AsyncTransaction] = None
+        self._writes: List[Tuple[str, Dict[str, Any]]] = []
+
+    async def _discard_transaction(self) -> None:
+        if self._tx is not None:
+            try:
+                await self._tx.close()
+            except Exception as e:
+                logger.debug(f"Errore ignorato durante la chiusura della transazione: {e}")
+            self._tx = None
+
+    async def _ensure_transaction(self) -> AsyncTransaction:
+        if self._tx is None:
+            self._tx = await self._session.begin_transaction()
+            if self._writes:
+                logger.debug(f"Riesecuzione di {len(self._writes)} scritture nella nuova transazione")
+                for query, params in self._writes:
+                    result = await self._tx.run(query, params)
+                    await result.consume()
+        return self._tx
+
+    async def _with_retry(self, operation: str, work):
+        for attempt in range(self._max_retries + 1):
+            try:
+                with self._metrics.timed(operation):
+                    tx = await self._ensure_transaction()
+                    return await work(tx)
+            except RETRYABLE_ERRORS as e:
+                await self._discard_transaction()
+                if attempt >= self._max_retries:
+                    raise
+                delay = self._retry_delay * (2 ** attempt)
+                logger.warning(f"Errore transitorio Neo4j durante '{operation}' (tentativo {attempt + 1}/{self._max_retries}): {e}. Nuovo tentativo tra {delay:.1f}s")
+                await asyncio.sleep(delay)
+            except Exception:
+                # La transazione non è più utilizzabile: verrà riaperta (con replay) alla prossima operazione
+                await self._discard_transaction()
+                raise
+
+    async def read(self, query: str, params: Dict[str, Any] = None) -> List[Record]:
+        """Esegue una query di lettura nella transazione corrente."""
+        async def _work(tx):
+            result = await tx.run(query, params)
+            return [record async for record in result]
+        return await self._with_retry("read", _work)
+
+    async def write(self, query: str, params: Dict[str, Any] = None) -> ResultSummary:
+        """
+        Esegue una query di scrittura nella transazione corrente e la registra per un eventuale replay.
+
+        Returns:
+            Riepilogo della query (contatori di nodi e relazioni creati o eliminati)
+        """
+        async def _work(tx):
+            result = await tx.run(query, params)
+            return await result.consume()
+        summary = await self._with_retry("write", _work)
+        self._writes.append((query, params))
+        return summary
+
+    async def commit(self) -> None:
+        """Conferma la transazione (se aperta), ripetendola da capo in caso di errore transitorio."""
+        if self._tx is None and not self._writes:
+            return
+        async def _work(tx):
+            await tx.commit()
+        await self._with_retry("commit", _work)
+        self._tx = None
+        self._writes = []
+
+    async def rollback(self) -> None:
+        """Annulla la transazione corrente e scarta le scritture registrate."""
+        if self._tx is not None:
+            try:
+                await self._tx.rollback()
+            except Exception as e:
+                logger.debug(f"Errore ignorato durante il rollback: {e}")
+        await self._discard_transaction()
+        self._writes = []
+
+
 class Neo4jGraphStorage(BaseGraphStorage):
     """Implementazione di BaseGraphStorage per Neo4j specializzata per knowledge graph giuridico."""
 
-    def __init__(self, uri: str, user: str, password: str, database: str = "neo4j"):
+    def __init__(
+        self,
+        uri: str,
+        user: str,
+        password: str,
+        database: str = "neo4j",
+        health_check_interval: float = 30.0,
+        max_retries: int = 3,
+    ):
         """
         Inizializza la connessione a Neo4j.
 
@@ -25,12 +147,20 @@ class Neo4jGraphStorage(BaseGraphStorage):
             user: Nome utente per la connessione.
             password: Password per la connessione.
             database: Nome del database a cui connettersi.
+            health_check_interval: Secondi tra due verifiche di connettività in background (0 disabilita il monitor).
+            max_retries: Numero massimo di tentativi per transazione in caso di errori transitori.
         """
         self._uri = uri
         self._user = user
         self._password = password
         self._database = database
         self._driver: Optional[AsyncDriver] = None
+        self._health_check_interval = health_check_interval
+        self._max_retries = max_retries
+        self._healthy = False
+        self._health_task: Optional[asyncio.Task] = None
+        self._current_uow: ContextVar[Optional[Neo4jUnitOfWork]] = ContextVar(f"neo4j_uow_{id(self)}", default=None)
+        self.metrics = OperationMetrics()
         logger.info(f"Inizializzazione Neo4jGraphStorage per Knowledge Graph Giuridico: {database} su {uri}")
         logger.debug(f"Parametri di connessione configurati: uri={uri}, user={user}, database={database}")
 
@@ -44,13 +174,16 @@ class Neo4jGraphStorage(BaseGraphStorage):
             logger.debug(f"Creazione di un nuovo driver Neo4j per {self._uri}")
             self._driver = AsyncGraphDatabase.driver(self._uri, auth=(self._user, self._password))
             logger.debug("Verifica della connettività in corso...")
-            await self._driver.verify_connectivity()
+            with self.metrics.timed("verify_connectivity"):
+                await self._driver.verify_connectivity()
+            self._healthy = True
             logger.info("Connessione a Neo4j stabilita e verificata.")
             
             # Creazione dei constraint e indici per il knowledge graph giuridico
             logger.debug("Creazione constraint e indici per migliorare le prestazioni...")
             await self._create_constraints()
             logger.info("Schema del Knowledge Graph giuridico inizializzato con successo.")
+            self._start_health_monitor()
         except Neo4jError as e:
             logger.error(f"Errore durante la connessione o l'inizializzazione dello schema Neo4j: {e}")
             self._driver = None
@@ -60,6 +193,11 @@ class Neo4jGraphStorage(BaseGraphStorage):
         """Crea constraint e indici per lo schema del knowledge graph giuridico."""
         async with self._driver.session(database=self._database) as session:
             try:
+                # 0. Constraint sulla label base usata come unica chiave di MERGE
+                logger.debug(f"Creazione constraint label base: {BASE_LABEL_CONSTRAINT_QUERY}")
+                await session.run(BASE_LABEL_CONSTRAINT_QUERY)
+                logger.info(f"Constraint 'entity_id_unique' su :{BASE_LABEL}(id) creato/verificato.")
+
                 # 1. Creiamo constraint generico (fallback)
                 logger.debug(f"Creazione constraint generico: {GENERIC_CONSTRAINT_QUERY}")
                 await session.run(GENERIC_CONSTRAINT_QUERY)
@@ -94,8 +232,143 @@ class Neo4jGraphStorage(BaseGraphStorage):
                 logger.warning(f"Errore durante la creazione degli schema per il knowledge graph: {e}")
                 logger.info("Il knowledge graph funzionerà comunque, ma potrebbe avere prestazioni non ottimali.")
 
+        # 4. Aggiunge la label base ai nodi preesistenti e verifica gli indici necessari
+        await self._backfill_base_label()
+        await self.verify_schema()
+
+    async def _backfill_base_label(self, batch_size: int = 10000) -> int:
+        """Aggiunge la label base ai nodi creati prima della sua introduzione, a blocchi di batch_size."""
+        total = 0
+        try:
+            async with self._driver.session(database=self._database) as session:
+                while True:
+                    result = await session.run(BASE_LABEL_BACKFILL_QUERY, {"batch_size": batch_size})
+                    record = await result.single()
+                    updated = record["updated"] if record else 0
+                    total += updated
+                    if updated < batch_size:
+                        break
+        except Neo4jError as e:
+            logger.warning(f"Errore durante la migrazione alla label base :{BASE_LABEL}: {e}")
+        if total:
+            logger.info(f"Label :{BASE_LABEL} aggiunta a {total} nodi preesistenti.")
+        return total
+
+    async def verify_schema(self) -> Dict[str, Any]:
+        """
+        Verifica che gli indici richiesti (REQUIRED_INDEXES) esistano e siano ONLINE.
+
+        Returns:
+            Dizionario con le liste 'online', 'not_online' e 'missing' di "Label(prop, ...)"
+        """
+        report = {"online": [], "not_online": [], "missing": []}
+        try:
+            records = await self._execute_read(SHOW_INDEXES_QUERY)
+        except Neo4jError as e:
+            logger.warning(f"Impossibile verificare gli indici Neo4j: {e}")
+            return report
+
+        states = {}
+        for record in records:
+            for label in record["labelsOrTypes"] or []:
+                states[(label, tuple(record["properties"] or []))] = record["state"]
+
+        for label, properties in REQUIRED_INDEXES:
+            key = f"{label}({', '.join(properties)})"
+            state = states.get((label, tuple(properties)))
+            if state is None:
+                report["missing"].append(key)
+                logger.warning(f"Indice mancante su :{key}: gli upsert/lookup degraderanno a label scan.")
+            elif state != "ONLINE":
+                report["not_online"].append(key)
+                logger.warning(f"Indice su :{key} non ancora utilizzabile (stato: {state}).")
+            else:
+                report["online"].append(key)
+        logger.info(f"Verifica indici completata: {len(report['online'])} online, {len(report['not_online'])} non online, {len(report['missing'])} mancanti.")
+        return report
+
+    # --- Monitoraggio della connessione ---
+
+    @property
+    def is_healthy(self) -> bool:
+        """Esito dell'ultima verifica di connettività (iniziale o del monitor)."""
+        return self._driver is not None and self._healthy
+
+    async def health_check(self) -> bool:
+        """Verifica la connettività con il database e aggiorna lo stato di salute."""
+        if not self._driver:
+            self._healthy = False
+            return False
+        try:
+            with self.metrics.timed("health_check"):
+                await self._driver.verify_connectivity()
+            if not self._healthy:
+                logger.info("Connessione a Neo4j ripristinata.")
+            self._healthy = True
+        except Exception as e:
+            if self._healthy:
+                logger.error(f"Health check Neo4j fallito: {e}")
+            self._healthy = False
+        return self._healthy
+
+    async def _health_monitor(self) -> None:
+        while True:
+            await asyncio.sleep(self._health_check_interval)
+            await self.health_check()
+
+    def _start_health_monitor(self) -> None:
+        if self._health_check_interval and self._health_check_interval > 0 and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_monitor())
+            logger.debug(f"Monitor di connettività avviato (intervallo {self._health_check_interval}s)")
+
+    async def _stop_health_monitor(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    def get_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Metriche di temporizzazione per tipo di operazione (read, write, commit, health_check, ...)."""
+        return self.metrics.snapshot()
+
+    # --- Unità di lavoro ---
+
+    @asynccontextmanager
+    async def unit_of_work(self):
+        """
+        Context manager asincrono che riusa una sola sessione ed una sola transazione
+        per tutte le operazioni eseguite al suo interno (es. l'elaborazione di un chunk).
+        La transazione viene confermata all'uscita, annullata in caso di eccezione.
+        Le chiamate annidate riusano l'unità di lavoro già attiva.
+        """
+        current = self._current_uow.get()
+        if current is not None:
+            yield current
+            return
+        if not self._driver:
+            logger.error("Tentativo di aprire un'unità di lavoro senza driver inizializzato")
+            raise ConnectionError("Driver Neo4j non inizializzato.")
+
+        session = self._driver.session(database=self._database)
+        uow = Neo4jUnitOfWork(session, self.metrics, max_retries=self._max_retries)
+        token = self._current_uow.set(uow)
+        try:
+            yield uow
+            await uow.commit()
+        except BaseException:
+            await uow.rollback()
+            raise
+        finally:
+            self._current_uow.reset(token)
+            await session.close()
+
     async def close(self) -> None:
         """Chiude la connessione al driver Neo4j."""
+        await self._stop_health_monitor()
+        self._healthy = False
         if self._driver:
             logger.info("Chiusura della connessione Neo4j.")
             logger.debug("Chiamata al metodo close() del driver Neo4j")
@@ -104,36 +377,25 @@ class Neo4jGraphStorage(BaseGraphStorage):
             logger.debug("Driver Neo4j chiuso con successo.")
 
     async def _execute_read(self, query: str, params: Dict[str, Any] = None) -> List[Record]:
-        """Esegue una query Cypher di lettura."""
-        if not self._driver:
-            logger.error("Tentativo di eseguire query senza driver inizializzato")
-            raise ConnectionError("Driver Neo4j non inizializzato.")
-        
+        """Esegue una query Cypher di lettura (nell'unità di lavoro attiva, se presente)."""
         logger.debug(f"Esecuzione query di lettura: {query}, params: {params}")
-        async with self._driver.session(database=self._database) as session:
-            result = await session.run(query, params)
-            # Raccolta dei record usando un loop asincrono invece di result.list()
-            records = []
-            async for record in result:
-                records.append(record)
-            logger.debug(f"Query di lettura completata, {len(records)} record restituiti")
-            return records
+        async with self.unit_of_work() as uow:
+            records = await uow.read(query, params)
+        logger.debug(f"Query di lettura completata, {len(records)} record restituiti")
+        return records
 
-    async def _execute_write(self, query: str, params: Dict[str, Any] = None) -> None:
-        """Esegue una query Cypher di scrittura."""
-        if not self._driver:
-            logger.error("Tentativo di eseguire query senza driver inizializzato")
-            raise ConnectionError("Driver Neo4j non inizializzato.")
-        
+    async def _execute_write(self, query: str, params: Dict[str, Any] = None) -> ResultSummary:
+        """Esegue una query Cypher di scrittura (nell'unità di lavoro attiva, se presente)."""
         logger.debug(f"Esecuzione query di scrittura: {query}, params: {params}")
-        async with self._driver.session(database=self._database) as session:
-            await session.run(query, params) # run() in scrittura non restituisce dati direttamente
-            logger.debug("Query di scrittura completata con successo")
+        async with self.unit_of_work() as uow:
+            summary = await uow.write(query, params)
+        logger.debug("Query di scrittura completata con successo")
+        return summary
 
     async def has_node(self, node_id: str) -> bool:
         """Verifica se un nodo esiste."""
         logger.debug(f"Verifica esistenza nodo con id: {node_id}")
-        query = "MATCH (n {id: $node_id}) RETURN n LIMIT 1"
+        query = f"MATCH (n:{BASE_LABEL} {{id: $node_id}}) RETURN n LIMIT 1"
         result = await self._execute_read(query, {"node_id": node_id})
         exists = len(result) > 0
         logger.debug(f"Nodo {node_id} {'trovato' if exists else 'non trovato'}")
@@ -148,12 +410,12 @@ class Neo4jGraphStorage(BaseGraphStorage):
         
         if relation_type:
             query = f"""
-            MATCH (n1 {{id: $source_id}})-[r:{relation_type}]->(n2 {{id: $target_id}})
+            MATCH (n1:{BASE_LABEL} {{id: $source_id}})-[r:{relation_type}]->(n2:{BASE_LABEL} {{id: $target_id}})
             RETURN r LIMIT 1
             """
         else:
-            query = """
-            MATCH (n1 {id: $source_id})-[r]->(n2 {id: $target_id})
+            query = f"""
+            MATCH (n1:{BASE_LABEL} {{id: $source_id}})-[r]->(n2:{BASE_LABEL} {{id: $target_id}})
             RETURN r LIMIT 1
             """
             
@@ -166,8 +428,8 @@ class Neo4jGraphStorage(BaseGraphStorage):
     async def get_node(self, node_id: str) -> Optional[Dict[str, Any]]:
         """Recupera un nodo per ID insieme alle sue label."""
         logger.debug(f"Recupero nodo con id: {node_id}")
-        query = """
-        MATCH (n {id: $node_id}) 
+        query = f"""
+        MATCH (n:{BASE_LABEL} {{id: $node_id}}) 
         RETURN properties(n) as props, labels(n) as labels
         """
         result = await self._execute_read(query, {"node_id": node_id})
@@ -190,12 +452,12 @@ class Neo4jGraphStorage(BaseGraphStorage):
         
         if relation_type:
             query = f"""
-            MATCH (n1 {{id: $source_id}})-[r:{relation_type}]->(n2 {{id: $target_id}})
+            MATCH (n1:{BASE_LABEL} {{id: $source_id}})-[r:{relation_type}]->(n2:{BASE_LABEL} {{id: $target_id}})
             RETURN properties(r) as props, type(r) as type LIMIT 1
             """
         else:
-            query = """
-            MATCH (n1 {id: $source_id})-[r]->(n2 {id: $target_id})
+            query = f"""
+            MATCH (n1:{BASE_LABEL} {{id: $source_id}})-[r]->(n2:{BASE_LABEL} {{id: $target_id}})
             RETURN properties(r) as props, type(r) as type LIMIT 1
             """
             
@@ -221,12 +483,12 @@ class Neo4jGraphStorage(BaseGraphStorage):
         
         if relation_type:
             query = f"""
-            MATCH (n1 {{id: $source_id}})-[r:{relation_type}]->(n2)
+            MATCH (n1:{BASE_LABEL} {{id: $source_id}})-[r:{relation_type}]->(n2)
             RETURN n1.id AS source_id, type(r) as relation_type, n2.id AS target_id
             """
         else:
-            query = """
-            MATCH (n1 {id: $source_id})-[r]->(n2)
+            query = f"""
+            MATCH (n1:{BASE_LABEL} {{id: $source_id}})-[r]->(n2)
             RETURN n1.id AS source_id, type(r) as relation_type, n2.id AS target_id
             """
             
@@ -272,32 +534,10 @@ class Neo4jGraphStorage(BaseGraphStorage):
         # Rimuovi la label dal dizionario delle proprietà da impostare
         props_to_set = node_properties # node_properties è già una copia senza entity_label
 
-        # Adatta la query in base alla label
-        if label == 'Node':
-            # Se la label è 'Node', cerca/crea :Node e aggiorna props.
-            # Non rimuovere altre label specifiche eventualmente già presenti.
-            query = f"""
-            MERGE (n:Node {{id: $node_id}})
-            SET n += $props
-            """
-            params = {"node_id": node_id, "props": props_to_set}
-            logger.debug(f"Esecuzione upsert per :Node con ID {node_id}")
-        else:
-            # Se la label è specifica, cerca/crea il nodo per ID,
-            # rimuovi la label :Node (se esiste) e imposta la nuova label specifica,
-            # poi aggiorna le proprietà.
-            # Assicurati che la label sia sicura (già fatto dalla sanificazione precedente)
-            query = f"""
-            MERGE (n {{id: $node_id}})
-            ON CREATE SET n = $props, n:{label} 
-            ON MATCH SET n += $props, n:{label}
-            WITH n
-            REMOVE n:Node
-            """ 
-            # Nota: SET n:{label} aggiunge la label se non c'è, non serve ON CREATE/ON MATCH separato per la label.
-            # L'ordine è: trova/crea, imposta/aggiorna props e label specifica, Rimuovi :Node.
-            params = {"node_id": node_id, "props": props_to_set}
-            logger.debug(f"Esecuzione upsert per label specifica :{label} con ID {node_id}, rimuovendo :Node se presente.")
+        # MERGE sempre sulla label base indicizzata; la label di tipo viene applicata dopo
+        query = self._node_upsert_query(label)
+        params = {"rows": [{"id": node_id, "props": props_to_set}]}
+        logger.debug(f"Esecuzione upsert per :{BASE_LABEL} con ID {node_id}, label di tipo :{label}")
 
         await self._execute_write(query, params)
         logger.info(f"Nodo {node_id} di tipo {label} creato/aggiornato con successo")
@@ -332,7 +572,7 @@ class Neo4jGraphStorage(BaseGraphStorage):
 
         # Query MERGE per creare o aggiornare l'arco
         query = f"""
-        MATCH (n1 {{id: $source_id}}), (n2 {{id: $target_id}})
+        MATCH (n1:{BASE_LABEL} {{id: $source_id}}), (n2:{BASE_LABEL} {{id: $target_id}})
         MERGE (n1)-[r:{relation_type}]->(n2)
         SET r += $props
         """
@@ -349,8 +589,8 @@ class Neo4jGraphStorage(BaseGraphStorage):
             # Fallback: prova a creare una relazione generica in caso di problemi
             if "RELATED_TO" != relation_type:
                 logger.warning(f"Tentativo fallback con relazione generica RELATED_TO")
-                fallback_query = """
-                MATCH (n1 {id: $source_id}), (n2 {id: $target_id})
+                fallback_query = f"""
+                MATCH (n1:{BASE_LABEL} {{id: $source_id}}), (n2:{BASE_LABEL} {{id: $target_id}})
                 MERGE (n1)-[r:RELATED_TO]->(n2)
                 SET r += $props
                 """
@@ -364,10 +604,119 @@ class Neo4jGraphStorage(BaseGraphStorage):
             else:
                 raise  # Rilancia l'errore se anche il tipo di default fallisce
 
+    # --- Scritture in batch (UNWIND) ---
+
+    @staticmethod
+    def _sanitize_identifier(value: Any, fallback: str) -> str:
+        """Riduce una label/tipo di relazione a caratteri sicuri per Cypher."""
+        if not isinstance(value, str):
+            return fallback
+        value = re.sub(r'[^a-zA-Z0-9_]', '', value.replace(" ", ""))
+        return value or fallback
+
+    def _build_node_batch_queries(self, nodes: List[Tuple[str, Dict[str, Any]]]) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Raggruppa i nodi per label e prepara una query UNWIND per ciascun gruppo.
+        Le regole di label e proprietà sono le stesse di upsert_node.
+        """
+        rows_by_label: Dict[str, List[Dict[str, Any]]] = {}
+        for node_id, node_data in nodes:
+            props = dict(node_data)
+            label = self._sanitize_identifier(props.pop('entity_label', 'Node'), 'Node')
+            rows_by_label.setdefault(label, []).append({"id": node_id, "props": props})
+
+        return [(self._node_upsert_query(label), {"rows": rows}) for label, rows in rows_by_label.items()]
+
+    @staticmethod
+    def _node_upsert_query(label: str) -> str:
+        """
+        Query UNWIND di upsert per un gruppo di nodi con la stessa label di tipo.
+
+        Il MERGE avviene solo su (:Entity {id}), coperto dal constraint di unicità,
+        così il costo resta quello di un index seek anche con grafi molto grandi.
+        La label di tipo viene aggiunta dopo il MERGE; i nodi senza tipo ricevono :Node
+        solo alla creazione, mentre i nodi tipizzati perdono l'eventuale :Node.
+        """
+        if label == 'Node':
+            return f"""
+            UNWIND $rows AS row
+            MERGE (n:{BASE_LABEL} {{id: row.id}})
+            ON CREATE SET n:Node
+            SET n += row.props
+            """
+        return f"""
+        UNWIND $rows AS row
+        MERGE (n:{BASE_LABEL} {{id: row.id}})
+        SET n += row.props, n:`{label}`
+        REMOVE n:Node
+        """
+
+    def _build_edge_batch_queries(self, edges: List[Tuple[str, str, Dict[str, Any]]]) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Raggruppa gli archi per tipo di relazione e prepara una query UNWIND per ciascun gruppo.
+        Gli estremi mancanti vengono creati nella query stessa come nodi placeholder :Node,
+        senza verifiche preliminari con has_node.
+        """
+        rows_by_type: Dict[str, List[Dict[str, Any]]] = {}
+        for source_node_id, target_node_id, edge_data in edges:
+            props = dict(edge_data)
+            raw_type = props.pop("legal_relation_type", None) or props.pop("relation_type", None)
+            relation_type = self._sanitize_identifier(raw_type, "RELATED_TO")
+            if raw_type and relation_type != raw_type:
+                props["original_relation_type"] = raw_type
+            rows_by_type.setdefault(relation_type, []).append({
+                "source_id": source_node_id,
+                "target_id": target_node_id,
+                "props": props,
+            })
+
+        queries = []
+        for relation_type, rows in rows_by_type.items():
+            query = f"""
+            UNWIND $rows AS row
+            MERGE (n1:{BASE_LABEL} {{id: row.source_id}})
+            ON CREATE SET n1:Node, n1 += $placeholder, n1.name = row.source_id, n1.label = 'Node'
+            MERGE (n2:{BASE_LABEL} {{id: row.target_id}})
+            ON CREATE SET n2:Node, n2 += $placeholder, n2.name = row.target_id, n2.label = 'Node'
+            MERGE (n1)-[r:`{relation_type}`]->(n2)
+            SET r += row.props
+            """
+            queries.append((query, {"rows": rows, "placeholder": PLACEHOLDER_NODE_PROPERTIES}))
+        return queries
+
+    async def _execute_write_batch(self, queries: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Esegue più query di scrittura in un'unica transazione (quella dell'unità di lavoro attiva, se presente)."""
+        if not queries:
+            return
+        logger.debug(f"Esecuzione di {len(queries)} query di scrittura in batch in una singola transazione")
+        async with self.unit_of_work() as uow:
+            for query, params in queries:
+                await uow.write(query, params)
+
+    async def upsert_nodes(self, nodes: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Inserisce o aggiorna più nodi con una query UNWIND per label."""
+        await self._execute_write_batch(self._build_node_batch_queries(nodes))
+        logger.info(f"{len(nodes)} nodi creati/aggiornati in batch")
+
+    async def upsert_edges(self, edges: List[Tuple[str, str, Dict[str, Any]]]) -> None:
+        """Inserisce o aggiorna più archi con una query UNWIND per tipo di relazione."""
+        await self._execute_write_batch(self._build_edge_batch_queries(edges))
+        logger.info(f"{len(edges)} archi creati/aggiornati in batch")
+
+    async def upsert_batch(
+        self,
+        nodes: List[Tuple[str, Dict[str, Any]]],
+        edges: List[Tuple[str, str, Dict[str, Any]]],
+    ) -> None:
+        """Scrive nodi e archi di un chunk in un'unica transazione: prima i nodi, poi gli archi."""
+        queries = self._build_node_batch_queries(nodes) + self._build_edge_batch_queries(edges)
+        await self._execute_write_batch(queries)
+        logger.info(f"Batch scritto in una transazione: {len(nodes)} nodi, {len(edges)} archi ({len(queries)} query)")
+
     async def delete_node(self, node_id: str) -> None:
         """Elimina un nodo e tutti i suoi archi."""
         logger.info(f"Eliminazione nodo {node_id} e relativi archi")
-        query = "MATCH (n {id: $node_id}) DETACH DELETE n"
+        query = f"MATCH (n:{BASE_LABEL} {{id: $node_id}}) DETACH DELETE n"
         await self._execute_write(query, {"node_id": node_id})
         logger.info(f"Nodo {node_id} eliminato con successo")
 
@@ -375,7 +724,7 @@ class Neo4jGraphStorage(BaseGraphStorage):
         """Elimina una lista di nodi."""
         # Esegui l'eliminazione in batch per efficienza, se possibile
         logger.info(f"Eliminazione di {len(nodes)} nodi: {nodes}")
-        query = "MATCH (n) WHERE n.id IN $node_ids DETACH DELETE n"
+        query = f"MATCH (n:{BASE_LABEL}) WHERE n.id IN $node_ids DETACH DELETE n"
         await self._execute_write(query, {"node_ids": nodes})
         logger.info(f"{len(nodes)} nodi eliminati con successo")
 
@@ -390,12 +739,12 @@ class Neo4jGraphStorage(BaseGraphStorage):
         for source_id, relation_type, target_id in edges:
             if relation_type:
                 query = f"""
-                MATCH (n1 {{id: $source_id}})-[r:{relation_type}]->(n2 {{id: $target_id}})
+                MATCH (n1:{BASE_LABEL} {{id: $source_id}})-[r:{relation_type}]->(n2:{BASE_LABEL} {{id: $target_id}})
                 DELETE r
                 """
             else:
-                query = """
-                MATCH (n1 {id: $source_id})-[r]->(n2 {id: $target_id})
+                query = f"""
+                MATCH (n1:{BASE_LABEL} {{id: $source_id}})-[r]->(n2:{BASE_LABEL} {{id: $target_id}})
                 DELETE r
                 """
                 
@@ -545,22 +894,22 @@ class Neo4jGraphStorage(BaseGraphStorage):
         # Costruisci la query in base ai parametri
         if relation_type and target_type:
             query = f"""
-            MATCH (n {{id: $entity_id}})-[r:{relation_type}]->(m:{target_type})
+            MATCH (n:{BASE_LABEL} {{id: $entity_id}})-[r:{relation_type}]->(m:{target_type})
             RETURN m, type(r) as relation_type
             """
         elif relation_type:
             query = f"""
-            MATCH (n {{id: $entity_id}})-[r:{relation_type}]->(m)
+            MATCH (n:{BASE_LABEL} {{id: $entity_id}})-[r:{relation_type}]->(m)
             RETURN m, type(r) as relation_type
             """
         elif target_type:
             query = f"""
-            MATCH (n {{id: $entity_id}})-[r]->(m:{target_type})
+            MATCH (n:{BASE_LABEL} {{id: $entity_id}})-[r]->(m:{target_type})
             RETURN m, type(r) as relation_type
             """
         else:
-            query = """
-            MATCH (n {id: $entity_id})-[r]->(m)
+            query = f"""
+            MATCH (n:{BASE_LABEL} {{id: $entity_id}})-[r]->(m)
             RETURN m, type(r) as relation_type
             """
             
@@ -0,0 +1,153 @@
+"""
+Test unitari per il buffer di aggregazione tra chunk e le regole di unione di nodi e archi.
+Esegui con: python -m unittest src.knowledge.graph_extractor.tests.test_aggregation_buffer
+"""
+
+import time
+import unittest
+
+from ..src.aggregation_buffer import AggregationBufferFull, GraphAggregationBuffer, logger as buffer_logger
+from ..src.extractor import merge_edge_data, merge_node_data
+
+
+def node(name, chunk_id, description="descrizione", entity_type="CONCETTO_GIURIDICO"):
+    return name, {
+        "description": description,
+        "source_doc_paths": [f"{chunk_id}.txt"],
+        "chunk_ids": [chunk_id],
+        "all_entity_types_original": [entity_type],
+    }
+
+
+def edge(src, tgt, chunk_id, description="relazione", weight=1.0, relation_type="CITA"):
+    return src, tgt, {
+        "src_id": src,
+        "tgt_id": tgt,
+        "legal_relation_type": relation_type,
+        "description": description,
+        "weight": weight,
+        "source_doc_paths": [f"{chunk_id}.txt"],
+        "chunk_ids": [chunk_id],
+    }
+
+
+class FakeStorage:
+    """Storage che registra le chiamate a upsert_batch e fallisce le prime `failures`."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+
+    async def upsert_batch(self, nodes, edges):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Neo4j non raggiungibile")
+        self.batches.append((dict(nodes), {(src, tgt): data for src, tgt, data in edges}))
+
+
+class TestMergeRules(unittest.TestCase):
+
+    def test_merge_node_data(self):
+        existing = node("Codice Civile", "c1", description="prima")[1]
+        merge_node_data(existing, node("Codice Civile", "c2", description="seconda", entity_type="FONTE")[1])
+        merge_node_data(existing, node("Codice Civile", "c1")[1])
+
+        self.assertEqual(existing["description"], "prima")
+        self.assertEqual(existing["chunk_ids"], ["c1", "c2"])
+        self.assertEqual(existing["source_doc_paths"], ["c1.txt", "c2.txt"])
+        self.assertEqual(existing["all_entity_types_original"], ["CONCETTO_GIURIDICO", "FONTE"])
+
+    def test_merge_edge_data(self):
+        existing = edge("a", "b", "c1", description="prima", weight=3.0)[2]
+        merge_edge_data(existing, edge("a", "b", "c2", description="seconda", weight=1.0)[2])
+
+        self.assertEqual(existing["description"], "seconda")
+        self.assertEqual(existing["weight"], 3.0)
+        self.assertEqual(existing["chunk_ids"], ["c1", "c2"])
+
+
+class TestGraphAggregationBuffer(unittest.IsolatedAsyncioTestCase):
+
+    def _buffer(self, storage, **limits):
+        limits = {"max_chunks": 100, "max_pending_items": 100, "max_age_seconds": 1000, **limits}
+        return GraphAggregationBuffer(storage, **limits)
+
+    async def test_chunks_are_merged_and_written_once(self):
+        storage = FakeStorage()
+        buffer = self._buffer(storage)
+        buffer.add([node("Codice Civile", "c1"), node("buona fede", "c1")], [edge("buona fede", "Codice Civile", "c1")])
+        buffer.register_chunk("c1")
+        buffer.add([node("Codice Civile", "c2")], [edge("buona fede", "Codice Civile", "c2", weight=2.0)])
+        buffer.register_chunk("c2")
+
+        self.assertEqual(buffer.pending_items, 3)
+        self.assertEqual(await buffer.flush(), ["c1", "c2"])
+        nodes, edges = storage.batches[0]
+        self.assertEqual(nodes["Codice Civile"]["chunk_ids"], ["c1", "c2"])
+        self.assertEqual(edges[("buona fede", "Codice Civile")]["weight"], 2.0)
+        self.assertEqual((buffer.pending_items, buffer.pending_chunks, buffer.flush_count), (0, 0, 1))
+        self.assertEqual(await buffer.flush(), [])
+
+    async def test_flush_thresholds(self):
+        buffer = self._buffer(FakeStorage(), max_chunks=2)
+        self.assertFalse(buffer.should_flush())
+        buffer.register_chunk("c1")
+        self.assertEqual(await buffer.maybe_flush(), [])
+        buffer.register_chunk("c2")
+        self.assertEqual(await buffer.maybe_flush(), ["c1", "c2"])
+
+        buffer = self._buffer(FakeStorage(), max_pending_items=3)
+        buffer.add([node("a", "c1"), node("b", "c1")], [])
+        self.assertFalse(buffer.should_flush())
+        buffer.add([node("c", "c2")], [])
+        self.assertTrue(buffer.should_flush())
+
+        buffer = self._buffer(FakeStorage(), max_age_seconds=60)
+        buffer.register_chunk("c1")
+        buffer._oldest = time.monotonic() - 50
+        self.assertFalse(buffer.should_flush())
+        buffer._oldest = time.monotonic() - 70
+        self.assertTrue(buffer.should_flush())
+
+    async def test_failed_flush_keeps_buffer_and_checkpoints_only_flushed_chunks(self):
+        storage = FakeStorage(failures=1)
+        buffer = self._buffer(storage)
+        buffer.add([node("a", "c1")], [])
+        buffer.register_chunk("c1")
+
+        with self.assertLogs(buffer_logger, level="ERROR"):
+            self.assertEqual(await buffer.flush(), [])
+        self.assertEqual((buffer.pending_items, buffer.pending_chunks, buffer.failed_flushes), (1, 1, 1))
+
+        buffer.add([node("b", "c2")], [])
+        buffer.register_chunk("c2")
+        self.assertEqual(await buffer.flush(), ["c1", "c2"])
+        self.assertEqual(set(storage.batches[0][0]), {"a", "b"})
+
+        buffer.add([node("c", "c3")], [])
+        buffer.register_chunk("c3")
+        self.assertEqual(await buffer.flush(), ["c3"])
+
+    async def test_buffer_is_bounded_while_flushes_fail(self):
+        storage = FakeStorage(failures=100)
+        buffer = self._buffer(storage, max_pending_items=2, max_buffered_items=4)
+        with self.assertLogs(buffer_logger, level="ERROR"):
+            for i in range(4):
+                self.assertEqual(await buffer.ensure_capacity(), [])
+                buffer.add([node(f"n{i}", f"c{i}")], [])
+                buffer.register_chunk(f"c{i}")
+                self.assertEqual(await buffer.maybe_flush(), [])
+
+            self.assertTrue(buffer.is_full)
+            with self.assertRaises(AggregationBufferFull):
+                await buffer.ensure_capacity()
+        self.assertEqual(buffer.pending_chunks, 4)
+
+        # Con il grafo di nuovo raggiungibile il buffer si svuota e accetta altri chunk
+        storage.failures = 0
+        self.assertEqual(await buffer.ensure_capacity(), ["c0", "c1", "c2", "c3"])
+        self.assertFalse(buffer.is_full)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+"""
+Test unitari per il lettore in streaming dei chunk JSONL e il suo indice laterale.
+Esegui con: python -m unittest src.knowledge.graph_extractor.tests.test_chunk_reader
+"""
+
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from ..src.chunk_reader import ChunkReader, parse_shard
+
+
+def write_chunks(path, count, extra_lines=()):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            f.write(json.dumps({"chunk_id": f"c{i}", "text": f"testo del chunk {i} è qui"}, ensure_ascii=False) + "\n")
+        for line in extra_lines:
+            f.write(line + "\n")
+
+
+class TestParseShard(unittest.TestCase):
+
+    def test_valid_shard(self):
+        self.assertEqual(parse_shard("1/4"), (1, 4))
+        self.assertIsNone(parse_shard(""))
+        self.assertIsNone(parse_shard(None))
+
+    def test_invalid_shard(self):
+        for value in ("4/4", "-1/4", "0/0", "a/b", "3"):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_shard(value)
+
+
+class TestChunkReader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "chunks.jsonl")
+        write_chunks(self.path, 10, extra_lines=["", "{non json"])
+
+    def _reader(self):
+        reader = ChunkReader(self.path)
+        self.addCleanup(reader.close)
+        return reader
+
+    def test_build_index_skips_blank_and_invalid_lines(self):
+        reader = self._reader()
+        self.assertEqual(len(reader), 10)
+        self.assertTrue(os.path.exists(self.path + ".idx"))
+        self.assertEqual(reader.get("c7")["text"], "testo del chunk 7 è qui")
+        self.assertIsNone(reader.get("assente"))
+        self.assertIn("c0", reader)
+        self.assertEqual([c["chunk_id"] for c in reader.iter_chunks()], [f"c{i}" for i in range(10)])
+
+    def test_index_is_reused(self):
+        self._reader().ensure_index()
+        reader = self._reader()
+        reader.build_index = lambda: self.fail("indice ricostruito invece che riutilizzato")
+        self.assertEqual(len(reader), 10)
+        self.assertEqual(reader.get("c3")["chunk_id"], "c3")
+
+    def test_index_rebuilt_when_size_changes(self):
+        self._reader().ensure_index()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"chunk_id": "c10", "text": "nuovo"}) + "\n")
+        reader = self._reader()
+        self.assertEqual(len(reader), 11)
+        self.assertEqual(reader.get("c10")["text"], "nuovo")
+
+    def test_index_rebuilt_when_mtime_changes(self):
+        self._reader().ensure_index()
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        reader = self._reader()
+        rebuilt = []
+        build_index = reader.build_index
+        reader.build_index = lambda: rebuilt.append(True) or build_index()
+        self.assertEqual(len(reader), 10)
+        self.assertEqual(rebuilt, [True])
+
+    def test_concurrent_builds_leave_a_valid_index(self):
+        write_chunks(self.path, 20000)
+        errors = []
+
+        def build():
+            try:
+                ChunkReader(self.path).build_index()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=build) for _ in range(8)]
+        # Un errore di salvataggio viene solo registrato nel log: non deve essercene nessuno
+        with self.assertNoLogs("src.knowledge.graph_extractor.src.chunk_reader", level="ERROR"):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ["chunks.jsonl", "chunks.jsonl.idx"])
+        reader = self._reader()
+        self.assertIsNotNone(reader._load_index())
+        self.assertEqual(len(reader), 20000)
+
+    def test_shards_partition_the_chunks(self):
+        reader = self._reader()
+        shards = [[entry.chunk_id for entry in reader.select(shard=(i, 3))] for i in range(3)]
+        self.assertEqual(sorted(sum(shards, [])), sorted(f"c{i}" for i in range(10)))
+        self.assertEqual(shards[1], ["c1", "c4", "c7"])
+
+    def test_select_shuffle_and_limit(self):
+        reader = self._reader()
+        first = [entry.chunk_id for entry in reader.select(shuffle=True, seed=42)]
+        again = [entry.chunk_id for entry in reader.select(shuffle=True, seed=42)]
+        self.assertEqual(first, again)
+        self.assertEqual(sorted(first), sorted(f"c{i}" for i in range(10)))
+        self.assertEqual(len(reader.select(limit=4)), 4)
+
+    def test_skip_ids(self):
+        reader = self._reader()
+        chunks = reader.iter_chunks(reader.select(shard=(0, 2)), skip_ids={"c2", "c4"})
+        self.assertEqual([c["chunk_id"] for c in chunks], ["c0", "c6", "c8"])
+
+    def test_empty_file(self):
+        write_chunks(self.path, 0)
+        reader = self._reader()
+        self.assertEqual(len(reader), 0)
+        self.assertEqual(list(reader.iter_chunks()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
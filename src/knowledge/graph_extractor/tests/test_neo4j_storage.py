@@ -0,0 +1,240 @@
+"""
+Test unitari per lo storage Neo4j, senza un server Neo4j.
+Esegui con: python -m unittest src.knowledge.graph_extractor.tests.test_neo4j_storage
+"""
+
+import unittest
+
+from neo4j.exceptions import ClientError, TransientError
+
+from ..src.base import PLACEHOLDER_NODE_PROPERTIES
+from ..src.metrics import OperationMetrics
+from ..src.neo4j_constraints import BASE_LABEL
+from ..src.neo4j_storage import Neo4jGraphStorage, Neo4jUnitOfWork
+
+
+class FakeResult:
+
+    def __init__(self, query):
+        self.query = query
+
+    async def consume(self):
+        return f"summary {self.query}"
+
+    def __aiter__(self):
+        return self._records()
+
+    async def _records(self):
+        yield {"query": self.query}
+
+
+class FakeTransaction:
+
+    def __init__(self, session, number):
+        self.session = session
+        self.number = number
+
+    async def run(self, query, params=None):
+        self.session.log.append(("run", self.number, query))
+        failures = self.session.run_failures
+        if failures.get(query):
+            failures[query] -= 1
+            raise self.session.error("errore su " + query)
+        return FakeResult(query)
+
+    async def commit(self):
+        self.session.log.append(("commit", self.number))
+        if self.session.commit_failures:
+            self.session.commit_failures -= 1
+            raise self.session.error("errore al commit")
+
+    async def rollback(self):
+        self.session.log.append(("rollback", self.number))
+
+    async def close(self):
+        self.session.log.append(("close", self.number))
+
+
+class FakeSession:
+    """AsyncSession che registra ogni chiamata e fallisce le query indicate in run_failures."""
+
+    def __init__(self, run_failures=None, commit_failures=0, error=TransientError):
+        self.log = []
+        self.transactions = 0
+        self.run_failures = dict(run_failures or {})
+        self.commit_failures = commit_failures
+        self.error = error
+
+    async def begin_transaction(self):
+        self.transactions += 1
+        self.log.append(("begin", self.transactions))
+        return FakeTransaction(self, self.transactions)
+
+
+class TestNeo4jUnitOfWork(unittest.IsolatedAsyncioTestCase):
+
+    def _unit_of_work(self, session, max_retries=3):
+        return Neo4jUnitOfWork(session, OperationMetrics(), max_retries=max_retries, retry_delay=0)
+
+    async def test_transaction_is_lazy(self):
+        session = FakeSession()
+        uow = self._unit_of_work(session)
+        await uow.commit()
+        self.assertEqual(session.log, [])
+
+        self.assertEqual(await uow.write("W1"), "summary W1")
+        self.assertEqual(await uow.read("R1"), [{"query": "R1"}])
+        await uow.commit()
+        self.assertEqual(session.log, [("begin", 1), ("run", 1, "W1"), ("run", 1, "R1"), ("commit", 1)])
+
+    async def test_transient_write_replays_previous_writes(self):
+        session = FakeSession(run_failures={"W3": 1})
+        uow = self._unit_of_work(session)
+        for query in ("W1", "W2", "W3", "W4"):
+            await uow.write(query)
+        await uow.commit()
+
+        self.assertEqual(session.log, [
+            ("begin", 1), ("run", 1, "W1"), ("run", 1, "W2"), ("run", 1, "W3"), ("close", 1),
+            ("begin", 2), ("run", 2, "W1"), ("run", 2, "W2"), ("run", 2, "W3"),
+            ("run", 2, "W4"), ("commit", 2),
+        ])
+
+    async def test_transient_commit_replays_everything_and_commits_once(self):
+        session = FakeSession(commit_failures=1)
+        uow = self._unit_of_work(session)
+        await uow.write("W1")
+        await uow.write("W2")
+        await uow.commit()
+
+        self.assertEqual(session.log, [
+            ("begin", 1), ("run", 1, "W1"), ("run", 1, "W2"), ("commit", 1), ("close", 1),
+            ("begin", 2), ("run", 2, "W1"), ("run", 2, "W2"), ("commit", 2),
+        ])
+        self.assertEqual(uow._writes, [])
+
+        # Dopo il commit le scritture confermate non vengono più rieseguite
+        await uow.write("W3")
+        await uow.commit()
+        self.assertEqual(session.log[-3:], [("begin", 3), ("run", 3, "W3"), ("commit", 3)])
+
+    async def test_non_retryable_error_discards_transaction(self):
+        session = FakeSession(run_failures={"W2": 1}, error=ClientError)
+        uow = self._unit_of_work(session)
+        await uow.write("W1")
+        with self.assertRaises(ClientError):
+            await uow.write("W2")
+
+        self.assertEqual(session.log[-2:], [("run", 1, "W2"), ("close", 1)])
+        self.assertIsNone(uow._tx)
+        self.assertEqual(uow._writes, [("W1", None)])
+
+    async def test_rollback_drops_recorded_writes(self):
+        session = FakeSession()
+        uow = self._unit_of_work(session)
+        await uow.write("W1")
+        await uow.rollback()
+        self.assertEqual(uow._writes, [])
+
+        await uow.write("W2")
+        await uow.commit()
+        self.assertEqual(session.log, [
+            ("begin", 1), ("run", 1, "W1"), ("rollback", 1), ("close", 1),
+            ("begin", 2), ("run", 2, "W2"), ("commit", 2),
+        ])
+
+    async def test_retries_are_capped(self):
+        session = FakeSession(run_failures={"W1": 10})
+        uow = self._unit_of_work(session, max_retries=2)
+        with self.assertRaises(TransientError):
+            await uow.write("W1")
+
+        self.assertEqual(session.transactions, 3)
+        self.assertEqual(uow._writes, [])
+
+        session = FakeSession(commit_failures=10)
+        uow = self._unit_of_work(session, max_retries=2)
+        await uow.write("W1")
+        with self.assertRaises(TransientError):
+            await uow.commit()
+        self.assertEqual([entry for entry in session.log if entry[0] == "commit"], [("commit", 1), ("commit", 2), ("commit", 3)])
+        # Le scritture restano registrate: un nuovo commit le riesegue
+        self.assertEqual(uow._writes, [("W1", None)])
+
+
+class TestBatchQueries(unittest.TestCase):
+    """Query UNWIND di upsert_batch, costruite senza connessione al database."""
+
+    def setUp(self):
+        self.storage = Neo4jGraphStorage("neo4j://localhost:7687", "neo4j", "password")
+
+    def test_nodes_grouped_by_label(self):
+        queries = self.storage._build_node_batch_queries([
+            ("art. 2043 c.c.", {"entity_label": "Articolo", "name": "art. 2043 c.c."}),
+            ("buona fede", {"entity_label": "Concetto Giuridico", "name": "buona fede"}),
+            ("art. 1337 c.c.", {"entity_label": "Articolo", "name": "art. 1337 c.c."}),
+            ("senza tipo", {"name": "senza tipo"}),
+            ("tipo non valido", {"entity_label": "!!!", "name": "tipo non valido"}),
+        ])
+
+        self.assertEqual(len(queries), 3)
+        (articoli, articoli_params), (concetti, concetti_params), (generici, generici_params) = queries
+        self.assertIn("n:`Articolo`", articoli)
+        self.assertEqual(articoli_params["rows"], [
+            {"id": "art. 2043 c.c.", "props": {"name": "art. 2043 c.c."}},
+            {"id": "art. 1337 c.c.", "props": {"name": "art. 1337 c.c."}},
+        ])
+        self.assertIn("n:`ConcettoGiuridico`", concetti)
+        self.assertEqual([row["id"] for row in concetti_params["rows"]], ["buona fede"])
+        # Nodi senza label (o con label non valida) ricevono :Node solo alla creazione
+        self.assertIn("ON CREATE SET n:Node", generici)
+        self.assertEqual([row["id"] for row in generici_params["rows"]], ["senza tipo", "tipo non valido"])
+        for query, _ in queries:
+            self.assertIn(f"MERGE (n:{BASE_LABEL} {{id: row.id}})", query)
+
+    def test_edges_grouped_by_relation_type(self):
+        queries = self.storage._build_edge_batch_queries([
+            ("a", "b", {"legal_relation_type": "CITA", "weight": 1.0}),
+            ("b", "c", {"relation_type": "MODIFICA", "weight": 2.0}),
+            ("c", "a", {"legal_relation_type": "CITA", "weight": 3.0}),
+        ])
+
+        self.assertEqual(len(queries), 2)
+        (cita, cita_params), (modifica, modifica_params) = queries
+        self.assertIn("MERGE (n1)-[r:`CITA`]->(n2)", cita)
+        self.assertEqual(cita_params["rows"], [
+            {"source_id": "a", "target_id": "b", "props": {"weight": 1.0}},
+            {"source_id": "c", "target_id": "a", "props": {"weight": 3.0}},
+        ])
+        self.assertIn("MERGE (n1)-[r:`MODIFICA`]->(n2)", modifica)
+        self.assertEqual(modifica_params["rows"], [{"source_id": "b", "target_id": "c", "props": {"weight": 2.0}}])
+
+    def test_unsafe_relation_type(self):
+        queries = self.storage._build_edge_batch_queries([
+            ("a", "b", {"legal_relation_type": "`]->() DETACH DELETE n //"}),
+            ("a", "c", {"legal_relation_type": "!!!"}),
+            ("b", "c", {}),
+        ])
+
+        self.assertEqual(len(queries), 2)
+        (sanitized, sanitized_params), (fallback, fallback_params) = queries
+        self.assertIn("[r:`DETACHDELETEn`]", sanitized)
+        self.assertEqual(sanitized_params["rows"][0]["props"], {"original_relation_type": "`]->() DETACH DELETE n //"})
+        self.assertIn("[r:`RELATED_TO`]", fallback)
+        self.assertEqual(fallback_params["rows"], [
+            {"source_id": "a", "target_id": "c", "props": {"original_relation_type": "!!!"}},
+            {"source_id": "b", "target_id": "c", "props": {}},
+        ])
+
+    def test_missing_endpoints_are_merged_as_placeholders(self):
+        [(query, params)] = self.storage._build_edge_batch_queries([("a", "b", {"legal_relation_type": "CITA"})])
+
+        for var, field in (("n1", "source_id"), ("n2", "target_id")):
+            self.assertIn(f"MERGE ({var}:{BASE_LABEL} {{id: row.{field}}})", query)
+            self.assertIn(f"ON CREATE SET {var}:Node, {var} += $placeholder, {var}.name = row.{field}", query)
+        self.assertNotIn("MATCH", query)
+        self.assertEqual(params["placeholder"], PLACEHOLDER_NODE_PROPERTIES)
+
+
+if __name__ == "__main__":
+    unittest.main()